@@ -1,33 +1,45 @@
-import asyncio
+import base64
+import binascii
 import json
 import logging
 import os
+from collections import defaultdict
 from collections import namedtuple
+from datetime import datetime
 from enum import Enum
+from typing import Dict
 from typing import List
 from typing import Optional
 from typing import Tuple
 from uuid import UUID
 from uuid import uuid4 as get_uuid
 
+import sqlalchemy as sa
 from fastapi import HTTPException
-from sqlalchemy import and_
 from sqlalchemy import or_
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.orm import Session
 
+from . import scoreboard
+from . import shot_images
 from . import ticker_message_dispatcher as tk
-from .asyncio_triggers import get_trigger_event
 from .asyncio_triggers import trigger_update_event
 from .circles import trigger_circle_update
 from .database_scope_provider import DatabaseScopeProvider
+from .image_cache import CROSS
+from .image_cache import get_image_cache
 from .image_processing import annotate_image_with_stats
-from .image_processing import draw_cross_on_image
 from .items import ItemModel
+from .location_history import positions_at
+from .location_history import snapshots
+from .location_store import Fix
+from .location_store import get_location_store
 from .model import AI_REVIEW_STATE_ERROR
 from .model import DEFAULT_SHOT_TIMEOUT
 from .model import Game
 from .model import GameModel
 from .model import ItemType
+from .model import QueuedShotModel
 from .model import Shot
 from .model import ShotModel
 from .model import Team
@@ -35,6 +47,11 @@ from .model import TeamModel
 from .model import TickerEntry
 from .model import User
 from .model import UserModel
+from .model import UserStats
+from .shot_images import ShotImage
+from .shot_vision import HIT_PLAYER
+from .shot_vision import MISS
+from .spatial import points_within
 from .ticker import Ticker
 from .user_interface import UserInterface
 from .utils import add_params_to_url
@@ -50,10 +67,69 @@ db_scoped = AdminScopeWrapper.db_scoped
 # queue -- deliberately not a ShotModel, so image_base64 is never loaded.
 QueueHead = namedtuple(
     "QueueHead",
-    ["id", "user_id", "ai_review_state", "ai_review", "location_context"],
+    [
+        "id",
+        "user_id",
+        "game_id",
+        "ai_review_state",
+        "ai_review",
+        "location_context",
+        "location_time",
+    ],
 )
 
 
+class _ShotWithImage:
+    """A Shot as far as ShotModel.model_validate can tell, but with a
+    different image_base64: saves reading the original photo just to replace
+    it"""
+
+    def __init__(self, shot: Shot, image_base64: str) -> None:
+        self._shot = shot
+        self.image_base64 = image_base64
+
+    def __getattr__(self, name):
+        return getattr(self._shot, name)
+
+
+def _queue_cursor(time_created: datetime, shot_id: UUID) -> str:
+    """An opaque marker for a place in the shot queue, just after this shot"""
+    raw = json.dumps([time_created.isoformat(), str(shot_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _parse_queue_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    try:
+        time_created, shot_id = json.loads(base64.urlsafe_b64decode(cursor))
+        return datetime.fromisoformat(time_created), UUID(shot_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(400, f"Bad queue cursor {cursor!r}")
+
+
+# Shots are timestamped by the database's clock, which SQLite stores to the
+# second: bind cursor times in the same format, or a cursor would sort after
+# the shots fired in its own second
+_QueueTime = sa.DateTime().with_variant(
+    sqlite.DATETIME(truncate_microseconds=True), "sqlite"
+)
+
+
+def _ai_verdict(
+    review: Optional[str],
+) -> Tuple[Optional[str], Optional[bool], Optional[float]]:
+    """The outcome, is_hit and confidence of a stored AI review, if it has any"""
+    if not review:
+        return None, None, None
+    try:
+        review = json.loads(review)
+    except ValueError:
+        # An "error" state stores a plain message, not JSON
+        return None, None, None
+    if not isinstance(review, dict):
+        return None, None, None
+    return review.get("outcome"), review.get("is_hit"), review.get("confidence")
+
+
 class CircleTypes(str, Enum):
     EXCLUSION = "EXCLUSION"
     NEXT = "NEXT"
@@ -96,7 +172,30 @@ class AdminInterface:
     @db_scoped
     def get_shot_model(self, shot_id) -> ShotModel:
         s = self._get_shot_orm(shot_id)
-        return ShotModel.model_validate(s)
+        return self._add_location_contexts([ShotModel.model_validate(s)])[0]
+
+    @db_scoped
+    def _add_location_contexts(self, shot_models: List[ShotModel]) -> List[ShotModel]:
+        """Fill in where everyone was when each shot was taken, for those with a
+        location_time rather than their own snapshot: two queries per game"""
+        by_game = defaultdict(list)
+        for shot_model in shot_models:
+            if (
+                shot_model.location_context is None
+                and shot_model.location_time is not None
+            ):
+                by_game[shot_model.game_id].append(shot_model)
+
+        for game_id, game_shots in by_game.items():
+            locations = snapshots(
+                self._session, game_id, [s.location_time for s in game_shots]
+            )
+            for shot_model in game_shots:
+                shot_model.location_context = json.dumps(
+                    locations[shot_model.location_time], default=str
+                )
+
+        return shot_models
 
     @db_scoped
     def get_shot_game_id(self, shot_id) -> UUID:
@@ -114,16 +213,19 @@ class AdminInterface:
         Ordered by (time_created, id): timestamps have 1s resolution, so the id
         breaks ties deterministically. Selects columns only -- never
         image_base64, which the auto-action drain has no use for.
-        ``location_context`` is here because the drain's identification step
-        builds its location term from it (backend.shot_identification).
+        The location fields are here because the drain's identification step
+        builds its location term from them (backend.shot_identification).
+        ``location_context`` is only ever the legacy JSON snapshot.
         """
         row = (
             self._session.query(
                 Shot.id,
                 Shot.user_id,
+                Shot.game_id,
                 Shot.ai_review_state,
                 Shot.ai_review,
-                Shot.location_context,
+                Shot.legacy_location_context,
+                Shot.location_time,
             )
             .filter_by(game_id=game_id, checked=False)
             .order_by(Shot.time_created, Shot.id)
@@ -131,6 +233,109 @@ class AdminInterface:
         )
         return QueueHead(*row) if row else None
 
+    @db_scoped
+    def get_shot_queue(
+        self, game_id: UUID = None, after: str = None, limit=20
+    ) -> Tuple[List[QueuedShotModel], Optional[str]]:
+        """
+        A page of unchecked shots, oldest first, as light rows without their
+        photos - in one game, or all of them.
+
+        Paged by (time_created, id) rather than by offset: ``after`` is the
+        cursor returned with the previous page, and the page starts just
+        after the last shot on it however the queue has changed since. Each
+        page is one seek in the queue's index. Returns the page and the
+        cursor for the next one, which is None once the queue is exhausted.
+
+        The AI's outcome and confidence are read out of each review here, for
+        just the page's shots, rather than by the database: JSON functions
+        differ between SQLite and Postgres.
+        """
+        limit = max(1, int(limit))
+
+        query = (
+            self._session.query(
+                Shot.id,
+                Shot.time_created,
+                Shot.game_id,
+                Shot.user_id,
+                User.name,
+                Team.name,
+                Shot.shot_damage,
+                Shot.ai_review_state,
+                Shot.ai_review,
+            )
+            .outerjoin(User, User.id == Shot.user_id)
+            .outerjoin(Team, Team.id == Shot.team_id)
+            .filter(Shot.checked == False)
+        )
+
+        if game_id is not None:
+            query = query.filter(Shot.game_id == game_id)
+
+        if after is not None:
+            after_time, after_id = _parse_queue_cursor(after)
+            query = query.filter(
+                sa.tuple_(Shot.time_created, Shot.id)
+                > sa.tuple_(
+                    sa.literal(after_time, _QueueTime),
+                    sa.literal(after_id, Shot.id.type),
+                )
+            )
+
+        rows = query.order_by(Shot.time_created, Shot.id).limit(limit + 1).all()
+
+        shots = []
+        for (
+            shot_id,
+            created,
+            shot_game_id,
+            user_id,
+            user_name,
+            team_name,
+            shot_damage,
+            ai_review_state,
+            ai_review,
+        ) in rows[:limit]:
+            outcome, is_hit, confidence = _ai_verdict(ai_review)
+            if ai_review_state == "done" and outcome is None and is_hit is not None:
+                # Reviews stored before outcomes existed only have is_hit
+                outcome = HIT_PLAYER if is_hit else MISS
+
+            shots.append(
+                QueuedShotModel(
+                    id=shot_id,
+                    time_created=created,
+                    game_id=shot_game_id,
+                    user_id=user_id,
+                    user_name=user_name,
+                    team_name=team_name,
+                    shot_damage=shot_damage,
+                    ai_review_state=ai_review_state,
+                    ai_outcome=outcome,
+                    ai_confidence=confidence,
+                )
+            )
+
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = _queue_cursor(last[1], last[0])
+
+        return shots, next_cursor
+
+    @db_scoped
+    def get_shot_image(self, shot_id: UUID, rendition: str = CROSS) -> ShotImage:
+        """
+        A rendition of a shot's photo, to be served by
+        :func:`backend.shot_images.make_response`. Derived renditions are
+        rendered once and cached: see backend/image_cache.py
+
+        Raises:
+            HTTPException: 404 if the shot or the rendition is unknown
+        """
+        return shot_images.find(self._session, shot_id, rendition)
+
     @db_scoped
     def get_games(self) -> List[GameModel]:
         logger.info("AdminInterface - get_games")
@@ -194,6 +399,9 @@ class AdminInterface:
         self._session.add(g)
         self._session.commit()
 
+        # Let the admin stream know there's a new game to watch
+        trigger_update_event("games", None)
+
         return g.id
 
     @db_scoped
@@ -454,6 +662,10 @@ class AdminInterface:
         for shot in list(user.shots):
             self._session.delete(shot)
 
+        # Their stats go, and so do their shooters' hits on them
+        scoreboard.record_target_removed(self._session, user_id)
+        self._session.query(UserStats).filter_by(user_id=user_id).delete()
+
         self._session.query(Shot).filter_by(target_user_id=user_id).update(
             {"target_user_id": None}
         )
@@ -491,7 +703,7 @@ class AdminInterface:
 
         shots = query.all()
 
-        return [ShotModel.model_validate(s) for s in shots]
+        return self._add_location_contexts([ShotModel.model_validate(s) for s in shots])
 
     @db_scoped
     def get_all_shot_ids(self) -> List[UUID]:
@@ -512,13 +724,24 @@ class AdminInterface:
         num_shots = query.count()
         filtered_shots = query.limit(limit).all()
 
-        shot_models = [ShotModel.model_validate(s) for s in filtered_shots]
+        # Queue images come from the cache: only a shot that has never been
+        # rendered costs a read of the original and any PIL work
+        image_cache = get_image_cache()
+        shot_models = [
+            ShotModel.model_validate(
+                _ShotWithImage(
+                    shot,
+                    image_cache.get(
+                        shot.id, CROSS, lambda shot=shot: shot.image_base64
+                    ),
+                )
+            )
+            for shot in filtered_shots
+        ]
+        self._add_location_contexts(shot_models)
 
         self._session.close()
 
-        for shot in shot_models:
-            shot.image_base64 = draw_cross_on_image(shot.image_base64)
-
         return num_shots, shot_models
 
     @staticmethod
@@ -527,25 +750,23 @@ class AdminInterface:
     ):
         new_model = shot_model.model_copy()
         if add_targetting:
-            new_model.image_base64 = draw_cross_on_image(new_model.image_base64)
+            new_model.image_base64 = get_image_cache().get(
+                shot_model.id, CROSS, lambda: shot_model.image_base64
+            )
         if add_annotations:
-            if not shot_model.checked:
-                status = "Unchecked"
-            elif shot_model.target_user_id:
+            target_name = None
+            if shot_model.checked and shot_model.target_user_id:
                 target_name = (
                     UserInterface(shot_model.target_user_id).get_user_model().name
                 )
-                status = f"Hit {target_name}"
-            elif shot_model.result == "bystander":
-                status = "Hit a bystander"
-            else:
-                status = "Missed / refunded"
 
-            stats = {
-                "Shooter": shot_model.user.name,
-                "Damage": shot_model.shot_damage,
-                "Result": status,
-            }
+            stats = shot_images.annotation_stats(
+                shot_model.user.name,
+                shot_model.shot_damage,
+                shot_model.checked,
+                shot_model.result,
+                target_name,
+            )
             new_model.image_base64 = annotate_image_with_stats(
                 new_model.image_base64, stats
             )
@@ -592,9 +813,10 @@ class AdminInterface:
         u_from = shot.user
         ui_target = UserInterface(target_user_id, session=self._session)
 
-        ui_target.hit(shot.shot_damage)
-
         u_to = self._get_user_orm(target_user_id)
+        was_up = u_to.hit_points > 0
+
+        ui_target.hit(shot.shot_damage)
 
         if u_to.hit_points > 0:
             message_type_public = tk.TickerMessageType.HIT_AND_DAMAGE
@@ -626,10 +848,17 @@ class AdminInterface:
         except HTTPException:
             # Handle the edge case where a user shoots themselves: the knockout
             # above already marked their unchecked shots as refunded
+            if shot.result == "refunded":
+                scoreboard.record_shot(self._session, u_from.id)
             shot.result = "hit"
 
         # Record the target user in the db
         shot.target_user_id = target_user_id
+        shot.knocked_out = was_up and u_to.hit_points <= 0
+
+        scoreboard.record_hit(
+            self._session, u_from.id, shot.shot_damage, shot.knocked_out
+        )
 
         self._session.commit()
 
@@ -778,6 +1007,7 @@ class AdminInterface:
         user = shot.user
 
         user.num_bullets += 1
+        scoreboard.record_refund(self._session, user_id)
 
         tk.send_ticker_message(
             tk.TickerMessageType.REFUNDED_SHOT,
@@ -850,88 +1080,72 @@ class AdminInterface:
         if not game_id:
             game_id = self._session.query(Game.id).first()[0]
 
+        # Players' positions are written to the database behind, so the
+        # newest may only be in memory
+        location_store = get_location_store()
+
         teams = self._session.query(Team).filter_by(game_id=game_id).all()
         locations = []
         for team in teams:
             for user in team.users:
                 user: User
+                fix = location_store.newest(
+                    user.id, user.latitude, user.longitude, user.location_timestamp
+                )
                 locations.append(
                     {
                         "user_id": user.id,
                         "team_id": team.id,
                         "user": user.name,
                         "team": team.name,
-                        "latitude": user.latitude,
-                        "longitude": user.longitude,
+                        "latitude": fix.latitude,
+                        "longitude": fix.longitude,
                         "state": user.state,
-                        "timestamp": user.location_timestamp,
+                        "timestamp": fix.timestamp,
                     }
                 )
         return locations
 
     @db_scoped
-    def get_scoreboard(self, game_id: UUID):
-        teams_and_ids = (
-            self._session.query(Team.id, Team.name).filter_by(game_id=game_id).all()
-        )
-        teams_by_id = {id: name for id, name in teams_and_ids}
-
-        user_data = (
-            self._session.query(
-                User.id, User.name, User.team_id, User.hit_points, User.time_of_death
-            )
-            .filter(User.team_id.in_(teams_by_id.keys()))
-            .all()
-        )
-        users_by_id = {
-            id: (name, teams_by_id[team_id], hit_points, time_of_death)
-            for id, name, team_id, hit_points, time_of_death in user_data
+    def get_players_near(
+        self, game_id: UUID, latitude: float, longitude: float, radius_m: float
+    ) -> List[dict]:
+        """The players in a game within ``radius_m`` metres of a point, nearest
+        first, as in get_locations but each with its ``distance`` in metres"""
+        locations = {
+            location["user_id"]: location
+            for location in self.get_locations(game_id)
+            if location["latitude"] is not None and location["longitude"] is not None
         }
-
-        completed_shots_by_these_users = (
-            self._session.query(Shot.user_id, Shot.shot_damage)
-            .filter(
-                and_(
-                    Shot.user_id.in_(users_by_id.keys()),
-                    Shot.checked,
-                    Shot.target_user_id != None,
-                )
-            )
-            .all()
+        # A scan: building an index for one query would cost more than it saves
+        near = points_within(
+            (
+                (user_id, (location["latitude"], location["longitude"]))
+                for user_id, location in locations.items()
+            ),
+            latitude,
+            longitude,
+            radius_m,
         )
+        return [
+            {**locations[user_id], "distance": distance} for user_id, distance in near
+        ]
 
-        self._session.close()
-
-        table = []
-        for user_id, (
-            username,
-            teamname,
-            hitpoints,
-            time_of_death,
-        ) in users_by_id.items():
-            total_damage = sum(
-                map(
-                    lambda s: s[1],
-                    filter(lambda s: s[0] == user_id, completed_shots_by_these_users),
-                )
-            )
-            table.append(
-                {
-                    "name": username,
-                    "team": teamname,
-                    "hitpoints": hitpoints,
-                    "total_damage": total_damage,
-                    "state": User.calculate_state(teamname, hitpoints, time_of_death),
-                }
-            )
-
-        table = sorted(table, key=lambda t: t["total_damage"], reverse=True)
+    @db_scoped
+    def get_positions_at(self, game_id: UUID, at_time: float) -> Dict[UUID, Fix]:
+        """Where each player in a game was at a time, from the location
+        history"""
+        return positions_at(self._session, game_id, at_time)
 
-        return {"table": table}
+    @db_scoped
+    def get_scoreboard(self, game_id: UUID):
+        """The game's scoreboard, from the players' stats. Players see a cached
+        copy: see scoreboard.get_cached_scoreboard"""
+        return scoreboard.render(scoreboard.load_rows(self._session, game_id))
 
     @db_scoped
-    def _get_all_game_ids(self):
-        return self._session.query(Game.id).all()
+    def get_game_ids(self) -> List[UUID]:
+        return [game_id for (game_id,) in self._session.query(Game.id).all()]
 
     @db_scoped
     def reset_game(self, game_id: UUID, keep_weapons=True):
@@ -970,47 +1184,17 @@ class AdminInterface:
             for item in user.items:
                 self._session.delete(item)
 
+        # And their stats
+        self._session.query(UserStats).filter(
+            UserStats.user_id.in_([user.id for user in users])
+        ).delete()
+
         # Wipe the ticker
         for ticker_entry in (
             self._session.query(TickerEntry).filter_by(game_id=game_id).all()
         ):
             self._session.delete(ticker_entry)
 
-    async def generate_any_game_updates(self, timeout=None):
-        """
-        An async iterator that yields None every time any ticker, circle or shot
-        queue is updated in any game, or at most after timeout seconds
-        """
-        while True:
-            game_ids = self._get_all_game_ids()
-
-            # Lookup / make an event for each game's ticker, circle and shots
-            events = []
-            for game_id in game_ids:
-                logger.debug("(AdminInterface) Getting events for game %s", game_id[0])
-                events.append(get_trigger_event("ticker", game_id[0]))
-                events.append(get_trigger_event("circle", game_id[0]))
-                events.append(get_trigger_event("shots", game_id[0]))
-
-            # No games yet: there are no events to wait on, and
-            # asyncio.as_completed([]) would raise StopIteration and kill this
-            # generator. Poll until a game appears.
-            if not events:
-                await asyncio.sleep(1)
-                yield
-                continue
-
-            # make futures for waiting for all these events
-            futures = [
-                asyncio.wait_for(event.wait(), timeout=timeout) for event in events
-            ]
+        self._session.commit()
 
-            try:
-                logger.debug("(Admin Updater) Subscribing to events %s", events)
-                await next(asyncio.as_completed(futures))
-
-                logger.debug("(Admin Updater) Event received")
-                yield
-            except asyncio.TimeoutError:
-                logger.debug("(Admin Updater) Event timeout")
-                yield
+        trigger_update_event("scoreboard", game_id)
@@ -18,12 +18,13 @@ import os
 from typing import Optional
 from uuid import UUID
 
+from . import image_cache
 from . import shot_auto_actions
 from . import shot_vision
 from .asyncio_triggers import trigger_update_event
-from .image_processing import draw_aim_marker
-from .image_processing import prepare_for_vision
-from .image_processing import zoom_image
+from .image_cache import VISION
+from .image_cache import ZOOM
+from .image_cache import get_image_cache
 from .model import AI_REVIEW_STATE_DONE
 from .model import AI_REVIEW_STATE_ERROR
 from .model import AI_REVIEW_STATE_PENDING
@@ -125,15 +126,17 @@ async def review_shot(shot_id: UUID, client=None) -> None:
     try:
         async with _get_semaphore():
             # The aim marker tells the model where the shot landed; the resize
-            # keeps the image bill sane.
-            prepared = prepare_for_vision(draw_aim_marker(image_base64))
+            # keeps the image bill sane. Usually rendered on submission.
+            prepared = await image_cache.get_async(
+                shot_id, VISION, lambda: image_base64
+            )
 
             # Cut the zoom from the *original*, not from `prepared`. The resize
             # above has already discarded the camera resolution that makes a
             # distant target readable, which is the only reason to zoom at all.
-            # Only called if the model asks, so an unzoomed shot costs nothing.
+            # Only called if the model asks. Usually rendered on submission.
             def zoom_provider():
-                return zoom_image(image_base64, factor=shot_vision.ZOOM_FACTOR)
+                return get_image_cache().get(shot_id, ZOOM, lambda: image_base64)
 
             result = await shot_vision.review_image(
                 client, prepared, zoom_provider=zoom_provider
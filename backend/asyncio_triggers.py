@@ -1,20 +1,91 @@
 import asyncio
+import itertools
 import logging
+from collections import deque
+from contextvars import ContextVar
+from typing import Callable
+from typing import Deque
 from typing import Dict
 from typing import Hashable
+from typing import List
+from typing import Optional
+from uuid import uuid4
+
+from .event_bus import InProcessEventBus
+from .event_bus import make_event_bus_from_env
 
 logger = logging.getLogger(__name__)
 
+# How many recent triggers to remember for each (event_type, key). A client
+# that has missed more than this just gets told to refresh everything.
+JOURNAL_LENGTH = 64
 
 _update_events: Dict[str, Dict[Hashable, asyncio.Event]] = {}
 _scheduled_tasks = set()
 
+# Every trigger is numbered from one process-wide counter, so that a single
+# number tells us how far through all of its streams a client has got. The
+# epoch changes each time the process starts: sequence numbers handed out by a
+# previous run mean nothing to this one.
+_journal_epoch = uuid4().hex[:8]
+_sequence = itertools.count(1)
+_latest_sequence = 0
+_journals: Dict[str, Dict[Hashable, Deque[int]]] = {}
+
+# Called with (event_type, key) for every trigger, from this process or
+# another, before anyone waiting for it is woken. See add_listener
+_listeners: List[Callable[[str, Hashable], None]] = []
+
+# Carries triggers to the other backend processes, if there are any. See
+# backend/event_bus.py
+_event_bus = InProcessEventBus()
+
+
+# The event loop that owns the events above. Database work handed to a thread
+# (database_scope_provider.run_in_db_thread) carries its loop here, so that any
+# triggers it fires are passed back to that loop: asyncio events are not
+# thread-safe.
+home_loop: ContextVar[Optional[asyncio.AbstractEventLoop]] = ContextVar(
+    "home_loop", default=None
+)
+
+
+def _is_running_in(loop: asyncio.AbstractEventLoop) -> bool:
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
 
 def trigger_update_event(event_type: str, key: Hashable):
+    loop = home_loop.get()
+    if loop is not None and not _is_running_in(loop):
+        loop.call_soon_threadsafe(trigger_update_event, event_type, key)
+        return
+
     logger.info(
         "(asyncio_triggers) Triggering updates for type %s, key %s", event_type, key
     )
 
+    _deliver_update_event(event_type, key)
+    _event_bus.publish(event_type, key)
+
+
+def _deliver_update_event(event_type: str, key: Hashable):
+    """Record a trigger in this process and wake whoever is waiting for it"""
+    global _latest_sequence
+
+    _latest_sequence = next(_sequence)
+    _journals.setdefault(event_type, {}).setdefault(
+        key, deque(maxlen=JOURNAL_LENGTH)
+    ).append(_latest_sequence)
+
+    for listener in _listeners:
+        try:
+            listener(event_type, key)
+        except Exception:
+            logger.exception("Update event listener %r failed", listener)
+
     if event_type not in _update_events:
         _update_events[event_type] = dict()
 
@@ -28,6 +99,40 @@ def trigger_update_event(event_type: str, key: Hashable):
         logger.debug("No update event found - not triggering")
 
 
+def add_listener(listener: Callable[[str, Hashable], None]):
+    """
+    Call ``listener(event_type, key)`` for every trigger delivered to this
+    process, including those from other processes over the event bus.
+
+    Listeners are called wherever the trigger is delivered - normally on the
+    event loop - before the waiters for it are woken, so must be quick and
+    must not block. They are for keeping
+    in-memory state - caches, mostly - in step with the database.
+    """
+    _listeners.append(listener)
+
+
+def start_event_bus(bus=None):
+    """
+    Start sharing triggers with the other backend processes, using ``bus`` or
+    else the one configured in the environment. Triggers from elsewhere are
+    delivered on the running event loop.
+    """
+    global _event_bus
+
+    _event_bus = bus or make_event_bus_from_env()
+    _event_bus.start(deliver=_deliver_update_event, loop=asyncio.get_running_loop())
+
+    logger.info("(asyncio_triggers) Using event bus %s", _event_bus)
+
+
+def stop_event_bus():
+    global _event_bus
+
+    _event_bus.stop()
+    _event_bus = InProcessEventBus()
+
+
 def schedule_update_event(event_type: str, key: Hashable, timeout: float):
     """Schedule an update event to happen after a timeout
 
@@ -85,3 +190,72 @@ def get_trigger_event(event_type: str, key: Hashable) -> asyncio.Event:
         logger.info("Made new event for type %s, key %s", event_type, key)
 
     return these_events[key]
+
+
+def latest_sequence(event_type: str = None, key: Hashable = None) -> int:
+    """
+    The sequence number of the most recent trigger for this type/key, or of
+    the most recent trigger of any kind if called without arguments. Zero if
+    there hasn't been one.
+    """
+    if event_type is None:
+        return _latest_sequence
+
+    journal = _journals.get(event_type, {}).get(key)
+    return journal[-1] if journal else 0
+
+
+def events_since(event_type: str, key: Hashable, sequence: int) -> Optional[List[int]]:
+    """
+    The sequence numbers of the triggers for this type/key after ``sequence``
+
+    Returns None if the journal has already forgotten some of them, in which
+    case the caller cannot know what it missed.
+    """
+    journal = _journals.get(event_type, {}).get(key, ())
+
+    if len(journal) == JOURNAL_LENGTH and journal[0] > sequence:
+        return None
+
+    return [s for s in journal if s > sequence]
+
+
+async def wait_for_event(event_type: str, key: Hashable, after: int) -> int:
+    """
+    Wait for a trigger for this type/key numbered after ``after``, and return
+    the latest sequence number for it
+
+    Returns immediately if one has already happened. Passing back the number
+    this returned means that a trigger which fires while the caller is busy
+    between waits is still seen, rather than lost with the one-shot event.
+    """
+    latest = latest_sequence(event_type, key)
+
+    if latest <= after:
+        await get_trigger_event(event_type, key).wait()
+        latest = latest_sequence(event_type, key)
+
+    return latest
+
+
+def format_event_id(sequence: int) -> str:
+    """An SSE event id for this sequence number, tagged with this run's epoch"""
+    return f"{_journal_epoch}-{sequence}"
+
+
+def parse_event_id(event_id: Optional[str]) -> Optional[int]:
+    """
+    The sequence number in an id made by :func:`format_event_id`, or None if
+    it is missing, malformed or was issued by a previous run of the server
+    """
+    if not event_id:
+        return None
+
+    epoch, _, sequence = event_id.partition("-")
+    if epoch != _journal_epoch:
+        return None
+
+    try:
+        return int(sequence)
+    except ValueError:
+        return None
@@ -0,0 +1,174 @@
+"""
+Content-addressed storage for shot photos.
+
+Photos used to live inline in the shots table as multi-megabyte base64 data
+URLs, so every query that loaded a Shot dragged its image through SQLite and
+pydantic. Now the shots table only holds the SHA-256 of the photo's bytes
+(``Shot.image_hash``) and the raw bytes are kept here, one file per hash:
+
+    <root>/ab/abcdef0123...
+
+Files are immutable and written atomically, so a reader never sees half a
+photo and the same photo submitted twice is only stored once. A photo written
+by a request whose transaction then rolls back is simply never referenced.
+
+By default the store sits next to the SQLite database (``data.db`` ->
+``data.blobs/``) so that it lives on the same persistent volume. Set
+``BLOB_STORE_DIR`` to put it somewhere else.
+"""
+
+import base64
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import AsyncIterable
+from typing import Optional
+from typing import Tuple
+
+logger = logging.getLogger(__name__)
+
+_DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def split_data_url(data_url: str) -> Tuple[str, bytes]:
+    """The MIME type and the decoded bytes of a base64 data URL"""
+    header, _, encoded = data_url.partition(",")
+    mime_type = header.removeprefix("data:").split(";")[0] or "image/jpeg"
+
+    return mime_type, base64.b64decode(encoded)
+
+
+def make_data_url(mime_type: str, data: bytes) -> str:
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+class BlobTooLarge(ValueError):
+    pass
+
+
+class BlobStore:
+    """Immutable blobs on the filesystem, named by the SHA-256 of their contents"""
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root)
+
+    def path(self, digest: str) -> Path:
+        if not _DIGEST_PATTERN.match(digest):
+            raise ValueError(f"Not a blob digest: {digest!r}")
+
+        return self.root / digest[:2] / digest
+
+    def exists(self, digest: str) -> bool:
+        return self.path(digest).exists()
+
+    def put(self, data: bytes) -> str:
+        """Store some bytes, if they aren't stored already, and return their
+        digest"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+
+        if path.exists():
+            return digest
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write to a temporary file in the same directory and rename it into
+        # place, so the blob appears all at once or not at all
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=".incoming-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+        logger.debug("Stored blob %s (%d bytes)", digest, len(data))
+
+        return digest
+
+    async def put_stream(
+        self, chunks: AsyncIterable[bytes], max_bytes: Optional[int] = None
+    ) -> Tuple[str, int]:
+        """
+        Store bytes as they arrive, hashing them on the way, without ever
+        holding more than one chunk in memory. Returns the digest and the
+        number of bytes.
+
+        Raises BlobTooLarge, and stores nothing, if there are more than
+        ``max_bytes``.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        # The digest isn't known until the end, so arrive in the root and move
+        # into place afterwards: still one filesystem, so still atomic
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix=".incoming-")
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise BlobTooLarge(f"More than {max_bytes} bytes")
+                    hasher.update(chunk)
+                    f.write(chunk)
+
+            digest = hasher.hexdigest()
+            path = self.path(digest)
+
+            if path.exists():
+                os.unlink(temp_path)
+            else:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+        logger.debug("Stored streamed blob %s (%d bytes)", digest, size)
+
+        return digest, size
+
+    def get(self, digest: str) -> bytes:
+        """The bytes of a blob. Raises FileNotFoundError if there is none"""
+        return self.path(digest).read_bytes()
+
+    def put_data_url(self, data_url: str) -> Tuple[str, str]:
+        """Store the image in a data URL. Returns its (digest, MIME type)"""
+        mime_type, data = split_data_url(data_url)
+        return self.put(data), mime_type
+
+    def get_data_url(self, digest: str, mime_type: str) -> str:
+        return make_data_url(mime_type, self.get(digest))
+
+
+def default_blob_dir() -> Path:
+    """``BLOB_STORE_DIR``, or a directory beside the SQLite database file"""
+    if os.environ.get("BLOB_STORE_DIR"):
+        return Path(os.environ["BLOB_STORE_DIR"]).resolve()
+
+    db_url = os.environ.get("DATABASE_URL", "")
+    if db_url.startswith("sqlite:///") and db_url != "sqlite:///:memory:":
+        db_path = Path(db_url.removeprefix("sqlite:///"))
+        return db_path.with_suffix(".blobs").resolve()
+
+    return Path("./blobs").resolve()
+
+
+_blob_store: Optional[BlobStore] = None
+
+
+def get_blob_store() -> BlobStore:
+    """The blob store for the configured database"""
+    global _blob_store
+
+    root = default_blob_dir()
+    if _blob_store is None or _blob_store.root != root:
+        _blob_store = BlobStore(root)
+
+    return _blob_store
@@ -6,6 +6,26 @@ from .asyncio_triggers import trigger_update_event
 
 logger = logging.getLogger(__name__)
 
+# The Game / GameModel attributes that describe its circles
+CIRCLE_FIELDS = [
+    "exclusion_circle_lat",
+    "exclusion_circle_long",
+    "exclusion_circle_radius",
+    "next_circle_lat",
+    "next_circle_long",
+    "next_circle_radius",
+    "drop_circle_lat",
+    "drop_circle_long",
+    "drop_circle_radius",
+]
+
+
+def get_circle_positions(game) -> dict:
+    """
+    The circles of a Game or GameModel, as served by /api/get_circles
+    """
+    return {field: getattr(game, field) for field in CIRCLE_FIELDS}
+
 
 def trigger_circle_update(game_id):
     """
@@ -1,15 +1,18 @@
 import logging
 import os
-import time
 import weakref
 from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+from typing import Optional
 
-from sqlalchemy import create_engine
 from sqlalchemy import event
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
 
+from . import db_perf  # noqa: F401 (registers the query timing listeners)
 from .dotenv import load_env_vars
+from .engine_config import make_engine
 
 load_env_vars()
 
@@ -17,76 +20,96 @@ engine = None
 Session = None
 session_counter = 0
 
-
+# Its level is set by backend/db_perf.py from DEBUG_DATABASE
 logger = logging.getLogger("sqltimings")
-if os.environ.get("DEBUG_DATABASE"):
-    logger.setLevel(logging.DEBUG)
-else:
-    logger.setLevel(logging.WARNING)
 
 
-# if the sqltimings logger is enabled for debug, add hooks to the database engine
-@event.listens_for(Engine, "before_cursor_execute")
-def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
-    if logger.isEnabledFor(logging.DEBUG):
-        conn.info.setdefault("query_start_time", []).append(time.time())
-        logger.debug("Start query: %s", statement)
+class UnitOfWork:
+    """
+    One session, on one connection, shared by every @db_scoped call made
+    within a request or task - see :func:`unit_of_work`. Also counts the
+    sessions and queries opened while it is active.
+    """
 
+    def __init__(self) -> None:
+        self.sessions = 0
+        self.queries = 0
+        # How many @db_scoped calls on the shared session are under way, on
+        # any interface object. Only the outermost commits
+        self.depth = 0
+        self._connection = None
+        self._session = None
 
-@event.listens_for(Engine, "after_cursor_execute")
-def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
-    if logger.isEnabledFor(logging.DEBUG):
-        total = time.time() - conn.info["query_start_time"].pop(-1)
-        logger.debug("Query complete in %fs", total)
+    def shares(self, session) -> bool:
+        """Whether ``session`` is this unit of work's shared session"""
+        return session is not None and session is self._session
 
+    @property
+    def session(self):
+        """The shared session, opened on first use"""
+        if self._session is None:
+            self._connection = engine.connect()
+            self._session = Session(bind=self._connection)
+        return self._session
+
+    def close(self) -> None:
+        if self._session is None:
+            return
+
+        self._session.close()
+        self._connection.close()
+
+        # Interface objects made during the unit of work keep hold of its
+        # session. Should one be used again afterwards, let it carry on as an
+        # ordinary session rather than fail on the closed connection.
+        self._session.bind = engine
 
-def add_missing_columns(engine):
-    """
-    Poor man's migrations: add any columns that the ORM models define but the
-    database lacks.
-
-    There is no Alembic here - in dev the database is simply reset after a
-    model change. Production data survives deploys though, so a newly added
-    column would otherwise break every SELECT on its table (e.g.
-    games.ai_shot_review_enabled did exactly that to the whole admin panel).
-    New tables are handled by the create_all() call in load(); this handles
-    new columns on existing tables.
-    """
-    import sqlalchemy as sa
-    from sqlalchemy.schema import CreateColumn
 
-    from .model import Base
+_unit_of_work: ContextVar[Optional[UnitOfWork]] = ContextVar(
+    "unit_of_work", default=None
+)
 
-    inspector = sa.inspect(engine)
 
-    with engine.begin() as conn:
-        for table in Base.metadata.sorted_tables:
-            if not inspector.has_table(table.name):
-                continue
+def current_unit_of_work() -> Optional[UnitOfWork]:
+    return _unit_of_work.get()
 
-            existing = {col["name"] for col in inspector.get_columns(table.name)}
 
-            for column in table.columns:
-                if column.name in existing:
-                    continue
+@contextmanager
+def unit_of_work() -> Iterator[UnitOfWork]:
+    """
+    Share one session between all the @db_scoped calls made inside this block,
+    on any interface class, rather than opening one per call.
+
+    Each outermost @db_scoped call still commits its own transaction when it
+    returns, so update triggers fire exactly as before. Outermost means on any
+    interface object: a call made from inside another, on a different object,
+    leaves the commit to the call it is inside, and its triggers wait for that
+    commit. If a unit of work is already active, this joins it.
+    """
+    active = _unit_of_work.get()
+    if active is not None:
+        yield active
+        return
 
-                ddl = CreateColumn(column).compile(dialect=engine.dialect).string
+    uow = UnitOfWork()
+    token = _unit_of_work.set(uow)
+    try:
+        yield uow
+    finally:
+        _unit_of_work.reset(token)
+        uow.close()
+        logger.debug(
+            "Unit of work done: %d sessions, %d queries", uow.sessions, uow.queries
+        )
 
-                # NOT NULL columns can only be added to a non-empty table with
-                # a default, so render the model's Python-side default (if it
-                # is a plain scalar) as a server-side DEFAULT clause
-                default = getattr(column.default, "arg", None)
-                if default is not None and not callable(default):
-                    literal = sa.literal(default).compile(
-                        dialect=engine.dialect,
-                        compile_kwargs={"literal_binds": True},
-                    )
-                    ddl += f" DEFAULT {literal}"
 
-                logging.getLogger(__name__).warning(
-                    "Adding missing database column %s.%s", table.name, ddl
-                )
-                conn.execute(sa.text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+# Count queries for the active unit of work. Query timings are kept by
+# backend/db_perf.py
+@event.listens_for(Engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    uow = _unit_of_work.get()
+    if uow is not None:
+        uow.queries += 1
 
 
 def load():
@@ -95,7 +118,7 @@ def load():
     """
     from sqlalchemy_utils import database_exists
 
-    from .model import Base
+    from .migrations import migrate
     from .reset_db import reset_database
 
     db_url = os.environ.get("DATABASE_URL")
@@ -108,12 +131,16 @@ def load():
     global engine
     global Session
 
-    engine = create_engine(db_url)
+    engine = make_engine(db_url)
     RawSession = sessionmaker(bind=engine)
 
     def get_wrapped_session(*args, **kwargs):
         session = RawSession(*args, **kwargs)
 
+        uow = _unit_of_work.get()
+        if uow is not None:
+            uow.sessions += 1
+
         global session_counter
         session_counter += 1
 
@@ -144,10 +171,7 @@ def load():
     ):
         reset_database(engine=engine)
     else:
-        # Bring an existing database up to date with the models: create any
-        # new tables, then add any new columns to existing tables
-        Base.metadata.create_all(bind=engine)
-        add_missing_columns(engine)
+        migrate(engine)
 
 
 @contextmanager
@@ -1,13 +1,91 @@
 import asyncio
+import contextvars
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from functools import wraps
 from typing import Callable
 from typing import Dict
+from typing import Optional
 
 from sqlalchemy.orm import Session
 
+from . import asyncio_triggers
+
 logger = logging.getLogger(__name__)
 
+# Only a few: the ORM work itself holds the GIL, so more threads mostly just
+# compete with the event loop for it
+DEFAULT_DB_THREADS = 2
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+# Where a session keeps the callbacks waiting for its transaction to commit
+_AFTER_COMMIT = "after_commit"
+
+
+def _db_threads() -> int:
+    raw = os.getenv("DB_THREADS")
+    if not raw:
+        return DEFAULT_DB_THREADS
+    try:
+        return max(0, int(raw))
+    except ValueError:
+        logger.warning(
+            "Ignoring unparseable DB_THREADS=%r; using %s", raw, DEFAULT_DB_THREADS
+        )
+        return DEFAULT_DB_THREADS
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(_db_threads(), thread_name_prefix="db")
+    return _executor
+
+
+async def run_in_db_thread(func: Callable, *args, **kwargs):
+    """
+    Call ``func``, which does blocking database work, on one of a pool of
+    ``DB_THREADS`` worker threads (default 2) and wait for it without holding
+    up the event loop. With ``DB_THREADS=0`` it is simply called, blocking the
+    loop, as handlers used to.
+
+    ``func`` should do all its work start to finish inside the thread: it runs
+    in a ``database.unit_of_work()``, so every interface object it uses shares
+    one session, which belongs to that thread. Any update events fired once it
+    commits are passed back to this event loop to be delivered.
+    """
+    if not _db_threads():
+        return _in_unit_of_work(func, *args, **kwargs)
+
+    loop = asyncio.get_running_loop()
+
+    context = contextvars.copy_context()
+    context.run(asyncio_triggers.home_loop.set, loop)
+
+    return await loop.run_in_executor(
+        _get_executor(), partial(context.run, _in_unit_of_work, func, *args, **kwargs)
+    )
+
+
+def _in_unit_of_work(func: Callable, *args, **kwargs):
+    from . import database
+
+    with database.unit_of_work():
+        return func(*args, **kwargs)
+
+
+def call_after_commit(session: Session, func: Callable) -> None:
+    """
+    Call ``func()`` once the outermost @db_scoped call using ``session`` has
+    committed it: for side effects that must not happen for changes that are
+    then rolled back. If the transaction is rolled back instead, ``func`` is
+    dropped.
+    """
+    session.info.setdefault(_AFTER_COMMIT, []).append(func)
+
 
 class DatabaseScopeProvider:
     """
@@ -26,14 +104,21 @@ class DatabaseScopeProvider:
     it will still commit them).
 
     1. For the first db_scoped method, starts a session and stores it in
-       self._session
+       self._session - or, inside a ``database.unit_of_work()``, takes that
+       unit of work's shared session instead
 
-    2. When the last @db_scoped method returns, commit and close the session
+    2. When the last @db_scoped method returns, commit and close the session.
+       Inside a unit of work, that means the last on any object: one called
+       from within another object's call leaves the commit to that call, and
+       its `postcommit_method` waits for it
 
     3. If any of the decorated functions altered the database state,
         a. Call `precommit_method(self)` before the db commit
         b. Call `postcommit_method(self)` after the db close
 
+       Anything queued with :func:`call_after_commit` is called after the
+       commit too, or dropped if the session is rolled back
+
     4. Regardless of whether the database state was altered, call
        `exit_method(self)`
 
@@ -78,9 +163,18 @@ class DatabaseScopeProvider:
                 }
                 wrapper_data = self._database_scope_data[self_outer.name]
 
+            unit = database.current_unit_of_work()
+
             if not self._session:
-                self._session = database.Session()
-                self._session.__owner = hash(self)
+                if unit is not None:
+                    self._session = unit.session
+                else:
+                    self._session = database.Session()
+                    self._session.__owner = hash(self)
+
+            if unit is not None and not unit.shares(self._session):
+                # A session of its own, from outside the unit of work
+                unit = None
 
             # If we're the entrypoint to a db_scoped session, reset the
             # session_modified flag. Note that we can't rely on the
@@ -90,6 +184,8 @@ class DatabaseScopeProvider:
                 wrapper_data["session_modified"] = False
 
             wrapper_data["session_users"] += 1
+            if unit is not None:
+                unit.depth += 1
 
             try:
                 out = func(self, *args, **kwargs)
@@ -112,6 +208,7 @@ class DatabaseScopeProvider:
             except Exception as e:
                 logging.exception("Exception encountered! Rolling back DB")
                 self._session.rollback()
+                self._session.info.pop(_AFTER_COMMIT, None)
                 raise e
             finally:
                 if wrapper_data["session_users"] == 1:
@@ -125,10 +222,25 @@ class DatabaseScopeProvider:
                     self_outer.precommit_method(self)
 
                 wrapper_data["session_users"] -= 1
+                if unit is not None:
+                    unit.depth -= 1
 
-                if wrapper_data["session_users"] == 0:
+                if wrapper_data["session_users"] == 0 and unit and unit.depth:
+                    logger.debug(
+                        "(DSP %s) Leaving the commit to the unit of work",
+                        self_outer.name,
+                    )
+                    if wrapper_data["session_modified"]:
+                        call_after_commit(
+                            self._session, partial(self_outer.postcommit_method, self)
+                        )
+
+                    self_outer.exit_method(self)
+
+                elif wrapper_data["session_users"] == 0:
                     logger.debug("(DSP %s) Committing session", self_outer.name)
                     self._session.commit()
+                    after_commit = self._session.info.pop(_AFTER_COMMIT, [])
 
                     try:
                         if self._session.__owner == hash(self):
@@ -145,6 +257,9 @@ class DatabaseScopeProvider:
                             self_outer.name,
                         )
 
+                    for callback in after_commit:
+                        callback()
+
                     if wrapper_data["session_modified"]:
                         logger.debug(
                             "(DSP %s) Calling postcommit_method", self_outer.name
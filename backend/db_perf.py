@@ -0,0 +1,245 @@
+"""
+Where the database time goes, endpoint by endpoint.
+
+Every query run while handling a request is counted and timed against that
+request, including queries run on the database threads
+(database_scope_provider.run_in_db_thread): the request's
+:class:`RequestStats` travels with it in a contextvar. When the request
+finishes its totals are added to those of its endpoint, and:
+
+* if one statement shape - the SQL with its parameters left out - ran
+  ``N_PLUS_ONE_THRESHOLD`` times or more, the request is noted as a likely
+  N+1, i.e. a query being run once per row of an earlier one;
+* the ``SLOW_QUERIES`` slowest single queries seen are kept.
+
+All of this is served at ``/api/admin_perf``. Each response also gets a
+``Server-Timing`` header with its query count and database time, so it shows
+up in the browser's network panel. For an SSE stream that header only covers
+the work done before the stream started.
+
+With ``DEBUG_DATABASE`` set, every query and its duration is logged to the
+``sqltimings`` logger as well.
+"""
+
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from collections import deque
+from contextvars import ContextVar
+from typing import Deque
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .dotenv import load_env_vars
+
+load_env_vars()
+
+logger = logging.getLogger(__name__)
+
+sql_logger = logging.getLogger("sqltimings")
+if os.environ.get("DEBUG_DATABASE"):
+    sql_logger.setLevel(logging.DEBUG)
+else:
+    sql_logger.setLevel(logging.WARNING)
+
+N_PLUS_ONE_THRESHOLD = 10
+SLOW_QUERIES = 20
+
+# How many N+1 sightings to keep
+N_PLUS_ONE_HISTORY = 50
+
+
+def statement_shape(statement: str) -> str:
+    """The statement with whitespace and IN lists collapsed, so that the same
+    query run for different rows gives the same shape"""
+    shape = " ".join(statement.split())
+    return re.sub(
+        r"\(\s*(?:\?|%\(\w+\)s)(?:\s*,\s*(?:\?|%\(\w+\)s))*\s*\)", "(?)", shape
+    )
+
+
+class RequestStats:
+    def __init__(self, scope: Optional[dict] = None) -> None:
+        self.scope = scope or {}
+        self.queries = 0
+        self.db_time = 0.0
+        self.shapes: Counter = Counter()
+        self.streaming = False
+        self.finished = False
+
+    @property
+    def endpoint(self) -> str:
+        """The route's path template (e.g. ``/user_info``, without the router's
+        prefix), rather than a path that may contain IDs. Anything unrouted,
+        such as static files, is lumped together"""
+        route = self.scope.get("route")
+        return route.path if route is not None else "(other)"
+
+    def server_timing(self) -> str:
+        return f'db;dur={1e3 * self.db_time:.1f};desc="{self.queries} queries"'
+
+
+class EndpointStats:
+    def __init__(self) -> None:
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_time = 0.0
+        self.n_plus_one = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "queries": self.queries,
+            "queries_per_request": self.queries / self.requests,
+            "max_queries": self.max_queries,
+            "db_ms": 1e3 * self.db_time,
+            "db_ms_per_request": 1e3 * self.db_time / self.requests,
+            "n_plus_one_requests": self.n_plus_one,
+        }
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("db_perf", default=None)
+
+_lock = threading.Lock()
+_endpoints: Dict[str, EndpointStats] = {}
+_n_plus_one: Deque[dict] = deque(maxlen=N_PLUS_ONE_HISTORY)
+# A min-heap of (duration, sequence, endpoint, statement)
+_slow_queries: List[Tuple[float, int, str, str]] = []
+_sequence = 0
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["query_start_time"].pop(-1)
+
+    sql_logger.debug("Query took %.2f ms: %s", 1e3 * duration, statement)
+
+    stats = _current.get()
+    if stats is None or stats.finished:
+        return
+
+    stats.queries += 1
+    stats.db_time += duration
+    stats.shapes[statement_shape(statement)] += 1
+
+    _record_if_slow(duration, stats.endpoint, statement)
+
+
+def _record_if_slow(duration: float, endpoint: str, statement: str) -> None:
+    global _sequence
+
+    if len(_slow_queries) == SLOW_QUERIES and duration <= _slow_queries[0][0]:
+        return
+
+    with _lock:
+        _sequence += 1
+        entry = (duration, _sequence, endpoint, " ".join(statement.split()))
+        if len(_slow_queries) < SLOW_QUERIES:
+            heapq.heappush(_slow_queries, entry)
+        else:
+            heapq.heappushpop(_slow_queries, entry)
+
+
+def _finish(stats: RequestStats) -> None:
+    stats.finished = True
+
+    with _lock:
+        endpoint = _endpoints.setdefault(stats.endpoint, EndpointStats())
+        endpoint.requests += 1
+        endpoint.queries += stats.queries
+        endpoint.max_queries = max(endpoint.max_queries, stats.queries)
+        endpoint.db_time += stats.db_time
+
+        # A stream runs the same queries once per update: that's expected
+        if stats.streaming or not stats.shapes:
+            return
+
+        shape, count = stats.shapes.most_common(1)[0]
+        if count >= N_PLUS_ONE_THRESHOLD:
+            endpoint.n_plus_one += 1
+            _n_plus_one.append(
+                {"endpoint": stats.endpoint, "statement": shape, "count": count}
+            )
+
+    if count >= N_PLUS_ONE_THRESHOLD:
+        logger.warning(
+            "Likely N+1 in %s: %d queries shaped like %s",
+            stats.endpoint,
+            count,
+            shape,
+        )
+
+
+def get_stats() -> dict:
+    with _lock:
+        return {
+            "endpoints": {
+                name: endpoint.as_dict()
+                for name, endpoint in sorted(
+                    _endpoints.items(), key=lambda item: -item[1].db_time
+                )
+            },
+            "n_plus_one": list(_n_plus_one),
+            "slow_queries": [
+                {"ms": 1e3 * duration, "endpoint": endpoint, "statement": statement}
+                for duration, _, endpoint, statement in sorted(
+                    _slow_queries, reverse=True
+                )
+            ],
+        }
+
+
+def reset() -> None:
+    with _lock:
+        _endpoints.clear()
+        _n_plus_one.clear()
+        _slow_queries.clear()
+
+
+class DbPerfMiddleware:
+    """Measure the database work of each HTTP request, and add it to the
+    response as a Server-Timing header"""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats(scope)
+        token = _current.set(stats)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                stats.streaming = any(
+                    name.lower() == b"content-type"
+                    and value.startswith(b"text/event-stream")
+                    for name, value in headers
+                )
+                headers.append((b"server-timing", stats.server_timing().encode()))
+                message = {**message, "headers": headers}
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            _finish(stats)
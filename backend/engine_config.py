@@ -0,0 +1,132 @@
+"""
+How the SQLAlchemy engine is built, configured from the environment.
+
+SQLite (the default, and what production runs) gets connection pragmas on
+every new connection:
+
+* ``SQLITE_JOURNAL_MODE`` (default ``WAL``) - readers no longer block the
+  writer or each other, so set_location, submit_shot and the AI review worker
+  stop queueing behind one another's reads.
+* ``SQLITE_SYNCHRONOUS`` (default ``NORMAL``) - with WAL, a power cut can lose
+  the last few commits but never corrupts the database.
+* ``SQLITE_BUSY_TIMEOUT_MS`` (default 5000) - how long a writer waits for the
+  lock before giving up with "database is locked".
+* ``SQLITE_CACHE_SIZE_KIB`` (default 65536) and ``SQLITE_MMAP_SIZE_MIB``
+  (default 256) - page cache and memory-mapped I/O per connection.
+
+Any other database (i.e. Postgres) gets a sized connection pool instead:
+``DB_POOL_SIZE`` (default 10), ``DB_MAX_OVERFLOW`` (20), ``DB_POOL_TIMEOUT``
+seconds (30) and ``DB_POOL_RECYCLE`` seconds (1800), with connections checked
+before use.
+"""
+
+import logging
+import os
+
+from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
+SQLITE_DEFAULTS = {
+    "SQLITE_JOURNAL_MODE": "WAL",
+    "SQLITE_SYNCHRONOUS": "NORMAL",
+    "SQLITE_BUSY_TIMEOUT_MS": 5000,
+    "SQLITE_CACHE_SIZE_KIB": 64 * 1024,
+    "SQLITE_MMAP_SIZE_MIB": 256,
+}
+
+POOL_DEFAULTS = {
+    "DB_POOL_SIZE": 10,
+    "DB_MAX_OVERFLOW": 20,
+    "DB_POOL_TIMEOUT": 30,
+    "DB_POOL_RECYCLE": 1800,
+}
+
+_JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+_SYNCHRONOUS_MODES = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+
+def _env_int(name: str, defaults: dict) -> int:
+    default = defaults[name]
+    raw = os.getenv(name)
+    if not raw:
+        return default
+    try:
+        return max(0, int(raw))
+    except ValueError:
+        logger.warning("Ignoring unparseable %s=%r; using %s", name, raw, default)
+        return default
+
+
+def _env_choice(name: str, choices: set, defaults: dict) -> str:
+    default = defaults[name]
+    raw = os.getenv(name)
+    if not raw:
+        return default
+    if raw.upper() not in choices:
+        logger.warning("Ignoring unknown %s=%r; using %s", name, raw, default)
+        return default
+    return raw.upper()
+
+
+def sqlite_pragmas(in_memory: bool = False) -> dict:
+    """The pragmas to run on each new SQLite connection, in order"""
+    pragmas = {}
+
+    # An in-memory database has no journal file to put in WAL mode
+    if not in_memory:
+        pragmas["journal_mode"] = _env_choice(
+            "SQLITE_JOURNAL_MODE", _JOURNAL_MODES, SQLITE_DEFAULTS
+        )
+
+    pragmas["synchronous"] = _env_choice(
+        "SQLITE_SYNCHRONOUS", _SYNCHRONOUS_MODES, SQLITE_DEFAULTS
+    )
+    pragmas["busy_timeout"] = _env_int("SQLITE_BUSY_TIMEOUT_MS", SQLITE_DEFAULTS)
+    # Negative cache sizes are in KiB rather than pages
+    pragmas["cache_size"] = -_env_int("SQLITE_CACHE_SIZE_KIB", SQLITE_DEFAULTS)
+    pragmas["mmap_size"] = _env_int("SQLITE_MMAP_SIZE_MIB", SQLITE_DEFAULTS) * 2**20
+
+    return pragmas
+
+
+def engine_options(db_url: str) -> dict:
+    """Keyword arguments for create_engine for this database"""
+    url = make_url(db_url)
+
+    if url.get_backend_name() == "sqlite":
+        # The busy timeout is also set by pragma, but pysqlite's own default
+        # of 5s would otherwise cap it
+        timeout_s = _env_int("SQLITE_BUSY_TIMEOUT_MS", SQLITE_DEFAULTS) / 1000
+        return {"connect_args": {"timeout": timeout_s}}
+
+    return {
+        "pool_size": _env_int("DB_POOL_SIZE", POOL_DEFAULTS),
+        "max_overflow": _env_int("DB_MAX_OVERFLOW", POOL_DEFAULTS),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", POOL_DEFAULTS),
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", POOL_DEFAULTS),
+        "pool_pre_ping": True,
+    }
+
+
+def make_engine(db_url: str) -> Engine:
+    """An engine for ``db_url``, tuned as the environment says"""
+    engine = create_engine(db_url, **engine_options(db_url))
+
+    if engine.dialect.name == "sqlite":
+        in_memory = engine.url.database in (None, "", ":memory:")
+        pragmas = sqlite_pragmas(in_memory)
+
+        @event.listens_for(engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+        logger.info("SQLite pragmas: %s", pragmas)
+
+    return engine
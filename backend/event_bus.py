@@ -0,0 +1,271 @@
+"""
+Carrying asyncio_triggers events between backend processes.
+
+Update signalling lives in asyncio_triggers, inside one process: a shot
+submitted to one uvicorn worker would never wake the SSE clients connected to
+another. An event bus closes that gap. Every trigger is delivered locally
+straight away, as it always was, and then published on the bus so that every
+other process delivers it too.
+
+Two implementations:
+
+* :class:`InProcessEventBus` - publishing goes nowhere. The default, and all a
+  single worker needs.
+* :class:`UnixSocketEventBus` - the workers on one machine meet at a Unix
+  domain socket (set ``EVENT_BUS_SOCKET`` to its path). Whichever worker gets
+  there first becomes the broker and relays every message to all the others.
+  If it dies, another takes over. Messages published while a worker is between
+  brokers are dropped, which costs its clients one missed update prompt.
+
+The bus listens on its own threads and publishing is a plain blocking write
+to a local socket, so it works whether or not there is a running event loop.
+Messages from other processes are handed back to the event loop the bus was
+started on.
+"""
+
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+from typing import Callable
+from typing import Hashable
+from typing import Optional
+from typing import Tuple
+from uuid import UUID
+
+logger = logging.getLogger(__name__)
+
+# How long to wait before trying to reach a broker again
+RECONNECT_INTERVAL = 0.5
+
+Deliver = Callable[[str, Hashable], None]
+
+
+def encode_message(event_type: str, key: Hashable) -> bytes:
+    """One newline-terminated JSON line per event. UUIDs, the usual keys, are
+    tagged so they come out the other side as UUIDs again"""
+    if isinstance(key, UUID):
+        key = {"uuid": str(key)}
+
+    return (json.dumps({"type": event_type, "key": key}) + "\n").encode("utf-8")
+
+
+def decode_message(line: bytes) -> Tuple[str, Hashable]:
+    message = json.loads(line)
+
+    key = message["key"]
+    if isinstance(key, dict):
+        key = UUID(key["uuid"])
+
+    return message["type"], key
+
+
+class InProcessEventBus:
+    """Nothing to carry events to: every subscriber is in this process"""
+
+    def start(self, deliver: Deliver, loop: asyncio.AbstractEventLoop) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+    def publish(self, event_type: str, key: Hashable) -> None:
+        pass
+
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server: "_Broker" = self.server
+        server.add_client(self.wfile)
+
+        try:
+            for line in self.rfile:
+                server.relay(line, sender=self.wfile)
+        finally:
+            server.remove_client(self.wfile)
+
+
+class _Broker(socketserver.ThreadingUnixStreamServer):
+    """Relays every line it receives to every other connected worker"""
+
+    daemon_threads = True
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path, _BrokerHandler)
+        self._clients = set()
+        self._lock = threading.Lock()
+
+    def add_client(self, wfile) -> None:
+        with self._lock:
+            self._clients.add(wfile)
+
+    def remove_client(self, wfile) -> None:
+        with self._lock:
+            self._clients.discard(wfile)
+
+    def relay(self, line: bytes, sender) -> None:
+        with self._lock:
+            for wfile in list(self._clients):
+                if wfile is sender:
+                    continue
+                try:
+                    wfile.write(line)
+                    wfile.flush()
+                except OSError:
+                    self._clients.discard(wfile)
+
+
+class UnixSocketEventBus:
+    """
+    Shares events between the processes on this machine through a broker on a
+    Unix domain socket. See the module docstring.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = str(path)
+
+        self._deliver: Optional[Deliver] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self._socket: Optional[socket.socket] = None
+        self._send_lock = threading.Lock()
+        self._connected = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._broker: Optional[_Broker] = None
+        self._broker_lock_file = None
+
+    def start(self, deliver: Deliver, loop: asyncio.AbstractEventLoop) -> None:
+        self._deliver = deliver
+        self._loop = loop
+
+        self._thread = threading.Thread(target=self._run, name="event-bus", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+        with self._send_lock:
+            if self._socket is not None:
+                try:
+                    self._socket.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+        if self._broker is not None:
+            self._broker.shutdown()
+            self._broker.server_close()
+            os.unlink(self.path)
+            self._broker_lock_file.close()
+
+    def wait_until_connected(self, timeout: float = None) -> bool:
+        return self._connected.wait(timeout)
+
+    @property
+    def is_broker(self) -> bool:
+        return self._broker is not None
+
+    def publish(self, event_type: str, key: Hashable) -> None:
+        message = encode_message(event_type, key)
+
+        with self._send_lock:
+            if self._socket is None:
+                logger.debug(
+                    "(Event bus) Not connected - dropping %s/%s", event_type, key
+                )
+                return
+
+            try:
+                self._socket.sendall(message)
+            except OSError as e:
+                logger.warning(
+                    "(Event bus) Could not publish %s/%s: %s", event_type, key, e
+                )
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                if not self._try_to_become_broker():
+                    self._stopping.wait(RECONNECT_INTERVAL)
+                continue
+
+            logger.info("(Event bus) Connected to broker at %s", self.path)
+
+            with self._send_lock:
+                self._socket = sock
+            self._connected.set()
+
+            try:
+                with sock.makefile("rb") as lines:
+                    for line in lines:
+                        self._hand_to_loop(*decode_message(line))
+            except OSError:
+                pass
+            finally:
+                self._connected.clear()
+                with self._send_lock:
+                    self._socket = None
+                sock.close()
+
+            if not self._stopping.is_set():
+                logger.warning("(Event bus) Lost the broker - reconnecting")
+
+    def _try_to_become_broker(self) -> bool:
+        """
+        Start a broker if nobody else is running one. The lock file decides
+        who: the operating system releases it when its holder dies, so a stale
+        socket file left behind by a crash can safely be removed.
+        """
+        if self._broker is not None:
+            return False
+
+        lock_file = open(self.path + ".lock", "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        self._broker = _Broker(self.path)
+        self._broker_lock_file = lock_file
+
+        threading.Thread(
+            target=self._broker.serve_forever, name="event-bus-broker", daemon=True
+        ).start()
+
+        logger.info("(Event bus) Acting as broker at %s", self.path)
+
+        return True
+
+    def _hand_to_loop(self, event_type: str, key: Hashable) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._deliver, event_type, key)
+        except RuntimeError:
+            # The loop has closed: we are shutting down
+            pass
+
+
+def make_event_bus_from_env():
+    """The bus configured by ``EVENT_BUS_SOCKET``: a Unix socket bus if it is
+    set, otherwise an in-process one"""
+    path = os.environ.get("EVENT_BUS_SOCKET")
+
+    if path:
+        return UnixSocketEventBus(path)
+
+    return InProcessEventBus()
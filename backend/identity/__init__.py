@@ -27,8 +27,10 @@ from backend.identity.code import parity_code
 from backend.identity.code import reed_solomon_code
 from backend.identity.config import DEFAULT_PALETTE
 from backend.identity.config import default_scheme
+from backend.identity.decoder import CompiledCandidates
 from backend.identity.decoder import DecodeResult
 from backend.identity.decoder import decode
+from backend.identity.decoder import decode_many
 from backend.identity.observations import ChannelObservation
 from backend.identity.observations import Prior
 from backend.identity.observations import Reading
@@ -43,8 +45,10 @@ __all__ = [
     "reed_solomon_code",
     "DEFAULT_PALETTE",
     "default_scheme",
+    "CompiledCandidates",
     "DecodeResult",
     "decode",
+    "decode_many",
     "ChannelObservation",
     "Prior",
     "Reading",
@@ -43,6 +43,7 @@ from typing import Mapping
 from typing import Optional
 from typing import Sequence
 from typing import Tuple
+from typing import Union
 
 from backend.identity.channels import ChannelSet
 from backend.identity.observations import Prior
@@ -124,9 +125,148 @@ def _hamming_distance(
     return dist
 
 
+def _result(
+    scores: Dict[object, float],
+    prior: Prior,
+    uniform: float,
+    min_dist: Optional[int],
+    num_erasures: int,
+    thresholds: DecoderThresholds,
+    code_min_distance: Optional[int],
+) -> DecodeResult:
+    """Normalise the scores into a ranking and raise the flags: the part of
+    decoding shared by :func:`decode` and :func:`decode_scalar`."""
+    total = sum(scores.values())
+    if total > 0:
+        ranked = [(pid, s / total) for pid, s in scores.items()]
+    else:
+        # Degenerate (all-zero): fall back to the prior alone, else uniform.
+        ranked = [(pid, prior.weight_for(pid, uniform)) for pid in scores]
+        norm = sum(s for _, s in ranked) or 1.0
+        ranked = [(pid, s / norm) for pid, s in ranked]
+    ranked.sort(key=lambda item: item[1], reverse=True)
+
+    # -- hard-decision analysis for the inconsistent flag -----------------
+    inconsistent = False
+    if min_dist is not None:
+        if code_min_distance is not None:
+            # Misreads correctable alongside e erasures: 2t + e + 1 <= d.
+            t = max((code_min_distance - 1 - num_erasures) // 2, 0)
+            inconsistent = min_dist > t
+        else:
+            inconsistent = min_dist > 0
+
+    # -- ambiguity / confidence ------------------------------------------
+    confident = bool(ranked) and ranked[0][1] >= thresholds.confident_threshold
+    ambiguous = (
+        len(ranked) >= 2 and (ranked[0][1] - ranked[1][1]) < thresholds.ambiguous_margin
+    )
+
+    return DecodeResult(
+        ranked=ranked,
+        inconsistent=inconsistent,
+        ambiguous=ambiguous,
+        confident=confident,
+        min_distance_to_codeword=min_dist,
+    )
+
+
+class CompiledCandidates:
+    """Candidate words prepared once, to decode any number of readings against.
+
+    The scalar decoder asks every candidate's observation for the weight of the
+    candidate's symbol, which re-resolves the observation's labels each time.
+    But a channel only has ``q`` or so symbols, so a reading can be weighed
+    once per (channel, symbol actually worn) into a table, after which each
+    candidate is a lookup per channel. :attr:`symbols` lists which symbols each
+    channel needs weighing for.
+    """
+
+    def __init__(
+        self,
+        candidates: Mapping[object, Sequence[Optional[int]]],
+        channels: ChannelSet,
+    ):
+        self.channels = channels
+        self.ids: List[object] = list(candidates)
+        self.words: List[Tuple[Optional[int], ...]] = []
+        for player_id, codeword in candidates.items():
+            if len(codeword) != channels.n:
+                raise ValueError(
+                    f"candidate {player_id!r} codeword length {len(codeword)} != n {channels.n}"
+                )
+            self.words.append(tuple(codeword))
+
+        self.symbols: List[List[int]] = [
+            sorted({word[i] for word in self.words if word[i] is not None})
+            for i in range(channels.n)
+        ]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def _decode_compiled(
+    reading: Reading,
+    compiled: CompiledCandidates,
+    prior: Prior,
+    thresholds: DecoderThresholds,
+    code_min_distance: Optional[int],
+) -> DecodeResult:
+    channels = compiled.channels
+    if len(reading) != channels.n:
+        raise ValueError(
+            f"reading has {len(reading)} channels but ChannelSet has {channels.n}"
+        )
+    q = channels.q
+    floor = thresholds.epsilon
+
+    # Per channel: {symbol: weight} and the hard-decision symbol, or None for
+    # an erasure, which contributes nothing to either
+    tables: List[Optional[Dict[int, float]]] = []
+    best_symbols: List[Optional[int]] = []
+    for obs, channel, symbols in zip(reading, channels, compiled.symbols):
+        if obs.is_erasure:
+            tables.append(None)
+            best_symbols.append(None)
+            continue
+        tables.append({s: obs.symbol_weight(s, channel, q, floor) for s in symbols})
+        best_symbols.append(obs.best_symbol(channel))
+
+    num_candidates = len(compiled)
+    uniform = 1.0 / num_candidates if num_candidates else 0.0
+
+    # Soft likelihood and hard distance together, in one pass. Multiplying
+    # in channel order, as decode_scalar does, gives identical posteriors
+    scores: Dict[object, float] = {}
+    min_dist: Optional[int] = None
+    for player_id, codeword in zip(compiled.ids, compiled.words):
+        likelihood = 1.0
+        dist = 0
+        for table, best, symbol in zip(tables, best_symbols, codeword):
+            if symbol is None or table is None:
+                continue
+            likelihood *= table[symbol]
+            if best != symbol:
+                dist += 1
+        scores[player_id] = prior.weight_for(player_id, uniform) * likelihood
+        if min_dist is None or dist < min_dist:
+            min_dist = dist
+
+    return _result(
+        scores,
+        prior,
+        uniform,
+        min_dist,
+        reading.num_erasures,
+        thresholds,
+        code_min_distance,
+    )
+
+
 def decode(
     reading: Reading,
-    candidates: Mapping[object, Sequence[Optional[int]]],
+    candidates: Union[Mapping[object, Sequence[Optional[int]]], CompiledCandidates],
     channels: ChannelSet,
     prior: Optional[Prior] = None,
     thresholds: Optional[DecoderThresholds] = None,
@@ -144,7 +284,9 @@ def decode(
         genuine ``Codeword``, but may instead be an overridden player's
         *effective word* (:data:`backend.identity.overrides.Word`), whose
         entries can be ``None`` at positions nobody can vouch for -- see the
-        module docstring for how those positions are scored.
+        module docstring for how those positions are scored. May also be
+        :class:`CompiledCandidates`, to save compiling the same candidates
+        for every reading.
     channels:
         The :class:`ChannelSet` (used to resolve symbol labels and ``q``).
     prior:
@@ -158,6 +300,56 @@ def decode(
         positions (see above), pass the candidate set's own effective minimum
         distance instead, since the nominal ``d`` no longer bounds it. If
         omitted, the flag falls back to a plain "no exact match" check.
+
+    Gives exactly the result of :func:`decode_scalar`, faster.
+    """
+    if len(reading) != channels.n:
+        raise ValueError(
+            f"reading has {len(reading)} channels but ChannelSet has {channels.n}"
+        )
+    (result,) = decode_many(
+        [reading], candidates, channels, [prior], thresholds, code_min_distance
+    )
+    return result
+
+
+def decode_many(
+    readings: Sequence[Reading],
+    candidates: Union[Mapping[object, Sequence[Optional[int]]], CompiledCandidates],
+    channels: ChannelSet,
+    priors: Optional[Sequence[Optional[Prior]]] = None,
+    thresholds: Optional[DecoderThresholds] = None,
+    code_min_distance: Optional[int] = None,
+) -> List[DecodeResult]:
+    """:func:`decode` each of ``readings`` against the same candidates,
+    compiling them only once. ``priors``, if given, has one entry per reading.
+    """
+    if priors is not None and len(priors) != len(readings):
+        raise ValueError(f"{len(priors)} priors for {len(readings)} readings")
+    if not isinstance(candidates, CompiledCandidates):
+        candidates = CompiledCandidates(candidates, channels)
+    thresholds = thresholds or DecoderThresholds()
+    priors = priors or [None] * len(readings)
+
+    return [
+        _decode_compiled(
+            reading, candidates, prior or Prior(), thresholds, code_min_distance
+        )
+        for reading, prior in zip(readings, priors)
+    ]
+
+
+def decode_scalar(
+    reading: Reading,
+    candidates: Mapping[object, Sequence[Optional[int]]],
+    channels: ChannelSet,
+    prior: Optional[Prior] = None,
+    thresholds: Optional[DecoderThresholds] = None,
+    code_min_distance: Optional[int] = None,
+) -> DecodeResult:
+    """:func:`decode`, one candidate and channel at a time, exactly as the
+    probability model is written down. Kept as the reference that the faster
+    :func:`decode` is tested against.
     """
     if len(reading) != channels.n:
         raise ValueError(
@@ -185,16 +377,6 @@ def decode(
             likelihood *= obs.symbol_weight(symbol, channel, q, floor)
         scores[player_id] = prior.weight_for(player_id, uniform) * likelihood
 
-    total = sum(scores.values())
-    if total > 0:
-        ranked = [(pid, s / total) for pid, s in scores.items()]
-    else:
-        # Degenerate (all-zero): fall back to the prior alone, else uniform.
-        ranked = [(pid, prior.weight_for(pid, uniform)) for pid in candidates]
-        norm = sum(s for _, s in ranked) or 1.0
-        ranked = [(pid, s / norm) for pid, s in ranked]
-    ranked.sort(key=lambda item: item[1], reverse=True)
-
     # -- hard-decision analysis for the inconsistent flag -----------------
     min_dist: Optional[int] = None
     if candidates:
@@ -202,26 +384,12 @@ def decode(
             _hamming_distance(reading, cw, channels) for cw in candidates.values()
         )
 
-    num_erasures = reading.num_erasures
-    inconsistent = False
-    if min_dist is not None:
-        if code_min_distance is not None:
-            # Misreads correctable alongside e erasures: 2t + e + 1 <= d.
-            t = max((code_min_distance - 1 - num_erasures) // 2, 0)
-            inconsistent = min_dist > t
-        else:
-            inconsistent = min_dist > 0
-
-    # -- ambiguity / confidence ------------------------------------------
-    confident = bool(ranked) and ranked[0][1] >= thresholds.confident_threshold
-    ambiguous = (
-        len(ranked) >= 2 and (ranked[0][1] - ranked[1][1]) < thresholds.ambiguous_margin
-    )
-
-    return DecodeResult(
-        ranked=ranked,
-        inconsistent=inconsistent,
-        ambiguous=ambiguous,
-        confident=confident,
-        min_distance_to_codeword=min_dist,
+    return _result(
+        scores,
+        prior,
+        uniform,
+        min_dist,
+        reading.num_erasures,
+        thresholds,
+        code_min_distance,
     )
@@ -0,0 +1,139 @@
+"""
+Copies of every submitted shot photo in ``logs/images``, for looking through
+after a game.
+
+The copy used to be written by submit_shot itself, re-encoded as PNG, inside
+the request's database transaction: the player waited for a slow encode and a
+large write, and the session stayed open for both. The photo is already safe
+in the blob store by then, so the copy can wait. submit_shot now just queues
+it, and a background worker copies the original bytes across unchanged.
+
+The queue is bounded (``IMAGE_ARCHIVE_QUEUE_SIZE``, default 100). If the disk
+falls that far behind, further copies are dropped with a warning rather than
+holding up play: the blob store still has every photo. :func:`get_stats`
+reports the queue depth and how many copies were written, failed or dropped.
+"""
+
+import logging
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from .blob_store import get_blob_store
+from .image_processing import IMAGE_OUTPUT_DIR
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 100
+
+_EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp"}
+
+
+def _queue_size() -> int:
+    raw = os.getenv("IMAGE_ARCHIVE_QUEUE_SIZE")
+    if not raw:
+        return DEFAULT_QUEUE_SIZE
+    try:
+        return max(1, int(raw))
+    except ValueError:
+        logger.warning(
+            "Ignoring unparseable IMAGE_ARCHIVE_QUEUE_SIZE=%r; using %s",
+            raw,
+            DEFAULT_QUEUE_SIZE,
+        )
+        return DEFAULT_QUEUE_SIZE
+
+
+def archive_filename(name: str, image_type: str, timestamp: float) -> str:
+    """``<player name>_<time>.<ext>``, with anything that could leave the
+    directory taken out of the name"""
+    safe_name = re.sub(r"[^\w\-]", "_", name or "unnamed")
+    extension = _EXTENSIONS.get(image_type, "bin")
+
+    return f"{safe_name}_{timestamp}.{extension}"
+
+
+class ImageArchiver:
+    """Copies blobs into an archive directory on a background thread"""
+
+    def __init__(self, output_dir: Path, max_queued: int = DEFAULT_QUEUE_SIZE):
+        self.output_dir = Path(output_dir)
+
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+        self.stats = {"archived": 0, "failed": 0, "dropped": 0}
+
+    def submit(self, image_hash: str, image_type: str, name: str) -> bool:
+        """Queue a copy of a stored photo. Never blocks. Returns False if the
+        queue is full and the copy was dropped"""
+        self._ensure_started()
+
+        filename = archive_filename(name, image_type, time.time())
+
+        try:
+            self._queue.put_nowait((image_hash, filename))
+        except queue.Full:
+            self.stats["dropped"] += 1
+            logger.warning(
+                "Image archive queue is full (%d waiting) - not archiving %s",
+                self._queue.qsize(),
+                filename,
+            )
+            return False
+
+        return True
+
+    def join(self) -> None:
+        """Wait until everything queued so far has been dealt with"""
+        self._queue.join()
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "queued": self._queue.qsize()}
+
+    def _ensure_started(self) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="image-archive", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            image_hash, filename = self._queue.get()
+            try:
+                self._archive(image_hash, filename)
+                self.stats["archived"] += 1
+            except Exception:
+                self.stats["failed"] += 1
+                logger.exception("Could not archive image %s", filename)
+            finally:
+                self._queue.task_done()
+
+    def _archive(self, image_hash: str, filename: str) -> None:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(get_blob_store().path(image_hash), self.output_dir / filename)
+
+
+_archiver: Optional[ImageArchiver] = None
+
+
+def get_image_archiver() -> ImageArchiver:
+    global _archiver
+
+    output_dir = Path(os.environ.get("IMAGE_ARCHIVE_DIR", IMAGE_OUTPUT_DIR)).resolve()
+    if _archiver is None or _archiver.output_dir != output_dir:
+        _archiver = ImageArchiver(output_dir, _queue_size())
+
+    return _archiver
+
+
+def get_stats() -> dict:
+    return get_image_archiver().get_stats()
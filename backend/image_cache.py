@@ -0,0 +1,341 @@
+"""
+Cache of shot photos with the admin markup already drawn on.
+
+A shot's photo never changes, so neither does any picture derived from it.
+The admin queue used to decode, draw on and re-encode every queued photo on
+every fetch, and it is fetched on every poll and every SSE prompt. Now each
+derived picture is rendered once and kept, keyed by (shot id, transform):
+
+* in memory, as the data URL the API returns, least recently used first out
+  once ``IMAGE_CACHE_MB`` (default 64) is exceeded;
+* on disk, as JPEG bytes, so a restart doesn't have to render the queue
+  again. They live under ``derived/`` in the blob store's directory, or in
+  ``IMAGE_CACHE_DIR`` if that is set.
+
+Besides the queue's crosshair there are the picture the vision model is sent,
+the magnified centre it can ask for and a thumbnail; backend/shot_images.py
+serves them all by URL. Transforms are named with a version: change what one
+draws and bump it, and the old renders are simply never read again.
+
+Submitting a shot schedules all of its renders straight away
+(:func:`enqueue_prefill`) on a pool of ``IMAGE_WORKERS`` threads (default 2),
+the vision model's first, so neither the review nor the admin usually waits
+for one at all. Pillow lets go of the GIL while it decodes, resizes and
+encodes, so the threads really do render side by side. A picture is only ever
+rendered once at a time: anyone else who wants it waits for that render.
+"""
+
+import asyncio
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Optional
+from typing import Tuple
+from uuid import UUID
+
+from .blob_store import default_blob_dir
+from .blob_store import make_data_url
+from .blob_store import split_data_url
+from .image_processing import draw_cross_on_image
+from .image_processing import make_thumbnail
+from .image_processing import prepare_for_vision
+from .image_processing import zoom_image
+from .shot_vision import ZOOM_FACTOR
+
+logger = logging.getLogger(__name__)
+
+# The crosshair and magnified centre shown in the admin shot queue
+CROSS = "cross-v1"
+# The aim marker and downsize the vision model is sent
+VISION = "vision-v2"
+# The magnified centre the vision model may ask for, cut from the original
+ZOOM = "zoom-v1"
+# A small copy for lists of shots
+THUMBNAIL = "thumb-v1"
+
+
+def _prepare_for_review(base64_image: str) -> str:
+    return prepare_for_vision(base64_image, aim_marker=True)
+
+
+def _zoom_for_review(base64_image: str) -> str:
+    return zoom_image(base64_image, factor=ZOOM_FACTOR)
+
+
+# In the order they are rendered on submission: the review is waiting first
+TRANSFORMS: Dict[str, Callable[[str], str]] = {
+    VISION: _prepare_for_review,
+    CROSS: draw_cross_on_image,
+    THUMBNAIL: make_thumbnail,
+    ZOOM: _zoom_for_review,
+}
+
+DEFAULT_MEMORY_MB = 64
+DEFAULT_WORKERS = 2
+
+# asyncio only holds a weak reference to a running task, so keep our own
+_tasks = set()
+
+
+def _memory_limit_bytes() -> int:
+    raw = os.getenv("IMAGE_CACHE_MB")
+    if not raw:
+        return DEFAULT_MEMORY_MB * 2**20
+    try:
+        return max(0, int(raw)) * 2**20
+    except ValueError:
+        logger.warning(
+            "Ignoring unparseable IMAGE_CACHE_MB=%r; using %s",
+            raw,
+            DEFAULT_MEMORY_MB,
+        )
+        return DEFAULT_MEMORY_MB * 2**20
+
+
+def _num_workers() -> int:
+    raw = os.getenv("IMAGE_WORKERS")
+    if not raw:
+        return DEFAULT_WORKERS
+    try:
+        return max(1, int(raw))
+    except ValueError:
+        logger.warning(
+            "Ignoring unparseable IMAGE_WORKERS=%r; using %s", raw, DEFAULT_WORKERS
+        )
+        return DEFAULT_WORKERS
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """The pool that renders pictures, off the event loop"""
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=_num_workers(), thread_name_prefix="image-render"
+            )
+
+    return _executor
+
+
+def default_cache_dir() -> Path:
+    if os.environ.get("IMAGE_CACHE_DIR"):
+        return Path(os.environ["IMAGE_CACHE_DIR"]).resolve()
+
+    return default_blob_dir() / "derived"
+
+
+class DerivedImageCache:
+    """Rendered pictures by (shot id, transform), in memory and on disk"""
+
+    def __init__(self, directory: Optional[Path], max_bytes: int) -> None:
+        self.directory = Path(directory) if directory else None
+        self.max_bytes = max_bytes
+
+        self._memory: "OrderedDict[Tuple[UUID, str], str]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = Lock()
+        self._rendering: Dict[Tuple[UUID, str], Lock] = {}
+
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "renders": 0}
+
+    def path(self, shot_id: UUID, transform: str) -> Path:
+        return self.directory / transform / f"{UUID(str(shot_id))}.jpg"
+
+    def get(self, shot_id: UUID, transform: str, source: Callable[[], str]) -> str:
+        """
+        The ``transform`` of a shot's photo, as a data URL. ``source`` is only
+        called, for the original photo, if there is no render to reuse.
+        """
+        key = (shot_id, transform)
+
+        image = self._from_memory(key)
+        if image is not None:
+            return image
+
+        with self._lock:
+            render_lock = self._rendering.setdefault(key, Lock())
+
+        with render_lock:
+            try:
+                # Rendered while we waited?
+                image = self._from_memory(key)
+                if image is None:
+                    image = self._render(shot_id, transform, source)
+                    self._remember(key, image)
+            finally:
+                with self._lock:
+                    if self._rendering.get(key) is render_lock:
+                        del self._rendering[key]
+
+        return image
+
+    def _from_memory(self, key: Tuple[UUID, str]) -> Optional[str]:
+        with self._lock:
+            image = self._memory.get(key)
+            if image is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+            return image
+
+    def _render(self, shot_id: UUID, transform: str, source: Callable[[], str]) -> str:
+        image = self._read_disk(shot_id, transform)
+        if image is not None:
+            self.stats["disk_hits"] += 1
+            return image
+
+        image = TRANSFORMS[transform](source())
+        self.stats["renders"] += 1
+        self._write_disk(shot_id, transform, image)
+
+        return image
+
+    def _remember(self, key: Tuple[UUID, str], image: str) -> None:
+        with self._lock:
+            if key in self._memory:
+                return
+
+            self._memory[key] = image
+            self._memory_bytes += len(image)
+
+            while self._memory_bytes > self.max_bytes and self._memory:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def _read_disk(self, shot_id: UUID, transform: str) -> Optional[str]:
+        if self.directory is None:
+            return None
+
+        try:
+            data = self.path(shot_id, transform).read_bytes()
+        except FileNotFoundError:
+            return None
+
+        return make_data_url("image/jpeg", data)
+
+    def _write_disk(self, shot_id: UUID, transform: str, image: str) -> None:
+        if self.directory is None:
+            return
+
+        mime_type, data = split_data_url(image)
+        if mime_type != "image/jpeg":
+            return
+
+        path = self.path(shot_id, transform)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=".incoming-")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            # The memory tier still works: don't fail the request over it
+            logger.exception("Could not write %s to the image cache", path)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+            }
+
+
+_image_cache: Optional[DerivedImageCache] = None
+
+
+def get_image_cache() -> DerivedImageCache:
+    global _image_cache
+
+    directory = default_cache_dir()
+    if _image_cache is None or _image_cache.directory != directory:
+        _image_cache = DerivedImageCache(directory, _memory_limit_bytes())
+
+    return _image_cache
+
+
+def _original_loader(shot_id: UUID) -> Callable[[], str]:
+    """Loads a shot's photo as a data URL the first time it is called, for
+    the renders of one shot to share"""
+    from .admin_interface import AdminInterface
+    from .shot_images import ORIGINAL
+
+    lock = Lock()
+    loaded = []
+
+    def load_original() -> str:
+        with lock:
+            if not loaded:
+                image = AdminInterface().get_shot_image(shot_id, ORIGINAL)
+                loaded.append(make_data_url(*image.load()))
+            return loaded[0]
+
+    return load_original
+
+
+def prefill(
+    shot_id: UUID,
+    transforms: Optional[Iterable[str]] = None,
+    source: Optional[Callable[[], str]] = None,
+) -> None:
+    """Render a shot's derived pictures now, so nobody waits for them later.
+    All of them, unless ``transforms`` says which"""
+    source = source or _original_loader(shot_id)
+
+    for transform in TRANSFORMS if transforms is None else transforms:
+        get_image_cache().get(shot_id, transform, source)
+
+
+async def get_async(shot_id: UUID, transform: str, source: Callable[[], str]) -> str:
+    """:meth:`DerivedImageCache.get` on the render pool, so a render doesn't
+    hold up the event loop"""
+    return await asyncio.get_running_loop().run_in_executor(
+        get_executor(), get_image_cache().get, shot_id, transform, source
+    )
+
+
+def enqueue_prefill(shot_id: UUID) -> Optional[asyncio.Task]:
+    """
+    Schedule :func:`prefill` on the render pool, each picture a job of its
+    own. Returns as soon as they are scheduled, so the player who fired is
+    not kept waiting. Returns None if there is no running event loop.
+    """
+    source = _original_loader(shot_id)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        jobs = [
+            loop.run_in_executor(get_executor(), prefill, shot_id, (transform,), source)
+            for transform in TRANSFORMS
+        ]
+        for transform, result in zip(
+            TRANSFORMS, await asyncio.gather(*jobs, return_exceptions=True)
+        ):
+            if isinstance(result, Exception):
+                logger.error(
+                    "Could not prefill %s for %s",
+                    transform,
+                    shot_id,
+                    exc_info=result,
+                )
+
+    try:
+        task = asyncio.create_task(run())
+    except RuntimeError:
+        logger.warning("Not prefilling images for %s: no running event loop", shot_id)
+        return None
+
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
@@ -0,0 +1,284 @@
+"""
+Every player's track through a game, and where everyone was at a given time.
+
+Each flush of :mod:`backend.location_store` appends the fixes it writes to the
+narrow, append-only ``location_history`` table (:class:`~backend.model.LocationFix`)
+as well as updating the players' latest positions. Shots no longer copy every
+player's position into a JSON snapshot: they record the time they were taken
+(``Shot.location_time``) and look the positions up here, with
+:func:`positions_at` - or, for a page of shots, :func:`positions_at_times` -
+when they are needed.
+
+"Where was everyone at time T" is one query: for each player in the game, one
+seek in the (game_id, user_id, timestamp) index for their last fix at or
+before T. Fixes still waiting in memory to be flushed are overlaid on the
+result.
+
+So that the table doesn't grow without bound, :func:`prune` - run every few
+minutes by the location store's flush task - thins out fixes older than
+``LOCATION_HISTORY_DOWNSAMPLE_AFTER`` seconds (default an hour) to one per
+player every ``LOCATION_HISTORY_RESOLUTION`` seconds (default 30), and deletes
+them altogether after ``LOCATION_HISTORY_RETENTION`` seconds (default a week).
+"""
+
+import logging
+import os
+import time
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from uuid import UUID
+
+import sqlalchemy as sa
+
+from .location_store import Fix
+from .location_store import get_location_store
+from .model import LocationFix
+from .model import Team
+from .model import User
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETENTION = 7 * 24 * 3600.0
+DEFAULT_DOWNSAMPLE_AFTER = 3600.0
+DEFAULT_RESOLUTION = 30.0
+
+# How often prune() is run by the location store's flush task, in seconds
+PRUNE_INTERVAL = 600.0
+
+# Thin out at most this much of the history per transaction, in seconds
+_THINNING_SLICE = 3600.0
+
+_DELETE_BATCH_SIZE = 500
+
+
+def _seconds(name: str, default: float) -> float:
+    raw = os.getenv(name)
+    if not raw:
+        return default
+    try:
+        return max(1.0, float(raw))
+    except ValueError:
+        logger.warning("Ignoring unparseable %s=%r; using %s", name, raw, default)
+        return default
+
+
+history = LocationFix.__table__
+
+# Appends one fix for a player, in the game they are playing in. Executed with
+# a list of fixes, as a batch
+record_statement = sa.insert(history).from_select(
+    ["game_id", "user_id", "timestamp", "latitude", "longitude"],
+    sa.select(
+        Team.game_id,
+        User.id,
+        sa.bindparam("timestamp", type_=sa.Float),
+        sa.bindparam("latitude", type_=sa.Float),
+        sa.bindparam("longitude", type_=sa.Float),
+    )
+    .join(Team, User.team_id == Team.id)
+    .where(User.id == sa.bindparam("user_id")),
+)
+
+
+def positions_at(connection, game_id: UUID, at_time: float) -> Dict[UUID, Fix]:
+    """
+    ``{user_id: fix}``: the last position each player in a game had reported at
+    ``at_time``. Players with no position by then are left out.
+
+    ``connection`` is anything with an ``execute()``: a Connection or Session.
+    """
+    return positions_at_times(connection, game_id, [at_time])[at_time]
+
+
+def positions_at_times(
+    connection, game_id: UUID, times: Iterable[float]
+) -> Dict[float, Dict[UUID, Fix]]:
+    """
+    :func:`positions_at` for several times in the same game, in one query:
+    ``{at_time: {user_id: fix}}``
+    """
+    times = sorted(set(times))
+    if not times:
+        return {}
+
+    at_times = sa.union_all(
+        *(
+            sa.select(sa.literal(at_time, sa.Float).label("at_time"))
+            for at_time in times
+        )
+    ).subquery("at_times")
+
+    # The id of each player's last fix at or before each time: one index seek
+    last_fix_id = (
+        sa.select(history.c.id)
+        .where(history.c.game_id == game_id)
+        .where(history.c.user_id == User.id)
+        .where(history.c.timestamp <= at_times.c.at_time)
+        .order_by(history.c.timestamp.desc())
+        .limit(1)
+        .correlate(User, at_times)
+        .scalar_subquery()
+    )
+
+    rows = connection.execute(
+        sa.select(
+            at_times.c.at_time,
+            User.id,
+            history.c.latitude,
+            history.c.longitude,
+            history.c.timestamp,
+        )
+        .join(Team, User.team_id == Team.id)
+        .join(at_times, sa.true())
+        .outerjoin(history, history.c.id == last_fix_id)
+        .where(Team.game_id == game_id)
+    ).all()
+
+    # Fixes not yet flushed are only in memory
+    location_store = get_location_store()
+
+    positions: Dict[float, Dict[UUID, Fix]] = {at_time: {} for at_time in times}
+    for at_time, user_id, latitude, longitude, timestamp in rows:
+        fix = location_store.get(user_id)
+        if fix is not None and fix.timestamp <= at_time:
+            if timestamp is None or fix.timestamp > timestamp:
+                positions[at_time][user_id] = fix
+                continue
+
+        if timestamp is not None:
+            positions[at_time][user_id] = Fix(latitude, longitude, timestamp)
+
+    return positions
+
+
+def snapshots(
+    session, game_id: UUID, times: Iterable[float]
+) -> Dict[float, List[dict]]:
+    """
+    ``{at_time: locations}``: every player in a game and their position at each
+    of ``times``, in the format of AdminInterface.get_locations - which is what
+    shots used to store. Names, teams and states are as they are now. Two
+    queries, however many times.
+    """
+    positions = positions_at_times(session, game_id, times)
+
+    rows = session.execute(
+        sa.select(
+            User.id,
+            User.name,
+            User.hit_points,
+            User.time_of_death,
+            Team.id,
+            Team.name,
+        )
+        .join(Team, User.team_id == Team.id)
+        .where(Team.game_id == game_id)
+    ).all()
+
+    return {
+        at_time: [
+            _location(fixes.get(user_id), user_id, *details)
+            for user_id, *details in rows
+        ]
+        for at_time, fixes in positions.items()
+    }
+
+
+def _location(
+    fix: Optional[Fix],
+    user_id: UUID,
+    user_name: str,
+    hit_points: int,
+    time_of_death: Optional[float],
+    team_id: UUID,
+    team_name: str,
+) -> dict:
+    return {
+        "user_id": user_id,
+        "team_id": team_id,
+        "user": user_name,
+        "team": team_name,
+        "latitude": fix.latitude if fix else None,
+        "longitude": fix.longitude if fix else None,
+        "state": User.calculate_state(team_id, hit_points, time_of_death),
+        "timestamp": fix.timestamp if fix else None,
+    }
+
+
+# Fixes before this time have already been thinned out by this process
+_thinned_until: Optional[float] = None
+
+
+def _thin_out(conn, start: float, end: float, resolution: float) -> int:
+    """Delete all but the first of each player's fixes in every
+    ``resolution`` seconds between ``start`` and ``end``. Returns how many
+    were deleted"""
+    rows = conn.execute(
+        sa.select(
+            history.c.id, history.c.game_id, history.c.user_id, history.c.timestamp
+        )
+        .where(history.c.timestamp >= start)
+        .where(history.c.timestamp < end)
+        .order_by(history.c.timestamp, history.c.id)
+    ).all()
+
+    kept = set()
+    redundant = []
+    for fix_id, game_id, user_id, timestamp in rows:
+        bucket = (game_id, user_id, int(timestamp // resolution))
+        if bucket in kept:
+            redundant.append(fix_id)
+        else:
+            kept.add(bucket)
+
+    for i in range(0, len(redundant), _DELETE_BATCH_SIZE):
+        batch = redundant[i : i + _DELETE_BATCH_SIZE]
+        conn.execute(sa.delete(history).where(history.c.id.in_(batch)))
+
+    return len(redundant)
+
+
+def prune(now: Optional[float] = None) -> int:
+    """
+    Delete expired fixes, and thin out old ones. Returns how many fixes were
+    deleted.
+    """
+    global _thinned_until
+
+    from . import database
+
+    now = time.time() if now is None else now
+    retention = _seconds("LOCATION_HISTORY_RETENTION", DEFAULT_RETENTION)
+    downsample_after = _seconds(
+        "LOCATION_HISTORY_DOWNSAMPLE_AFTER", DEFAULT_DOWNSAMPLE_AFTER
+    )
+    resolution = _seconds("LOCATION_HISTORY_RESOLUTION", DEFAULT_RESOLUTION)
+
+    expiry = now - retention
+
+    with database.engine.begin() as conn:
+        num_deleted = conn.execute(
+            sa.delete(history).where(history.c.timestamp < expiry)
+        ).rowcount
+
+    # Thin out whole buckets only, a slice at a time. After a restart this
+    # goes back over everything: thinning again is harmless, just slower
+    def align(t):
+        return t - t % resolution
+
+    start = align(max(expiry, _thinned_until or expiry))
+    end = align(now - downsample_after)
+    step = max(resolution, align(_THINNING_SLICE))
+
+    while start < end:
+        stop = min(start + step, end)
+        with database.engine.begin() as conn:
+            num_deleted += _thin_out(conn, start, stop, resolution)
+        start = _thinned_until = stop
+
+    if num_deleted:
+        logger.info("Pruned %d fixes from the location history", num_deleted)
+
+    return num_deleted
@@ -0,0 +1,225 @@
+"""
+Players' latest positions, kept in memory and written to the database behind.
+
+Every phone posts its position to ``/api/set_location`` every few seconds.
+That used to be a database transaction per fix, loading the whole user row to
+set three columns: with a hundred players, tens of write transactions a
+second, all queueing for SQLite's single writer. Now a fix just replaces the
+player's entry in :class:`LocationStore`, and the fixes received since the last
+flush are written to the ``users`` table together, in one batched UPDATE,
+every ``LOCATION_FLUSH_INTERVAL`` seconds (default 2), and appended to the
+location history (backend/location_history.py). The flush runs from the app's
+lifespan, and once more at shutdown.
+
+Readers (AdminInterface.get_locations, and through it the location snapshot
+taken with every shot) use whichever is newer of the database's position and
+this process's own. With several worker processes each only sees the fixes
+it received itself, but the others reach it through the database within a
+flush interval.
+
+A fix is only kept in memory until it is in the database, and for
+``FLUSHED_FIX_TTL`` seconds after that. Fixes for ids with no user - a cookie
+that never became a player, or a player since deleted - are dropped by the
+flush that finds no row for them.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Dict
+from typing import NamedTuple
+from typing import Optional
+from uuid import UUID
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 2.0
+
+# How long a fix is kept in memory after it has been written, in seconds: long
+# enough for any reader whose transaction began before the flush to finish
+FLUSHED_FIX_TTL = 60.0
+
+
+def _flush_interval() -> float:
+    raw = os.getenv("LOCATION_FLUSH_INTERVAL")
+    if not raw:
+        return DEFAULT_FLUSH_INTERVAL
+    try:
+        return max(0.1, float(raw))
+    except ValueError:
+        logger.warning(
+            "Ignoring unparseable LOCATION_FLUSH_INTERVAL=%r; using %s",
+            raw,
+            DEFAULT_FLUSH_INTERVAL,
+        )
+        return DEFAULT_FLUSH_INTERVAL
+
+
+class Fix(NamedTuple):
+    latitude: float
+    longitude: float
+    timestamp: float
+
+
+class LocationStore:
+    """The latest fix for each player, and which of them are yet to be written
+    to the database"""
+
+    def __init__(self) -> None:
+        self._latest: Dict[UUID, Fix] = {}
+        self._unflushed: Dict[UUID, Fix] = {}
+        self._lock = threading.Lock()
+
+    def set(self, user_id: UUID, latitude: float, longitude: float) -> Fix:
+        fix = Fix(latitude, longitude, time.time())
+        with self._lock:
+            self._latest[user_id] = fix
+            self._unflushed[user_id] = fix
+        return fix
+
+    def get(self, user_id: UUID) -> Optional[Fix]:
+        return self._latest.get(user_id)
+
+    def newest(
+        self,
+        user_id: UUID,
+        latitude: Optional[float],
+        longitude: Optional[float],
+        timestamp: Optional[float],
+    ) -> Fix:
+        """Whichever is newer of the given position, read from the database,
+        and the one held here"""
+        fix = self._latest.get(user_id)
+        if fix is not None and (timestamp is None or fix.timestamp >= timestamp):
+            return fix
+        return Fix(latitude, longitude, timestamp)
+
+    def flush(self) -> int:
+        """Write the fixes received since the last flush to the database, in
+        one transaction, and forget those written long enough ago. Returns how
+        many were written"""
+        import sqlalchemy as sa
+
+        from . import database
+        from .location_history import record_statement
+        from .model import User
+
+        with self._lock:
+            unflushed, self._unflushed = self._unflushed, {}
+
+        if not unflushed:
+            self._forget(unflushed, time.time() - FLUSHED_FIX_TTL)
+            return 0
+
+        users = User.__table__
+        # Never overwrite a newer fix, written by another worker process
+        statement = (
+            sa.update(users)
+            .where(users.c.id == sa.bindparam("user_id"))
+            .where(
+                sa.or_(
+                    users.c.location_timestamp.is_(None),
+                    users.c.location_timestamp <= sa.bindparam("timestamp"),
+                )
+            )
+            .values(
+                latitude=sa.bindparam("latitude"),
+                longitude=sa.bindparam("longitude"),
+                location_timestamp=sa.bindparam("timestamp"),
+            )
+        )
+
+        try:
+            with database.engine.begin() as conn:
+                known = set(
+                    conn.execute(
+                        sa.select(users.c.id).where(users.c.id.in_(list(unflushed)))
+                    ).scalars()
+                )
+                fixes = [
+                    {"user_id": user_id, **fix._asdict()}
+                    for user_id, fix in unflushed.items()
+                    if user_id in known
+                ]
+                if fixes:
+                    conn.execute(statement, fixes)
+                    conn.execute(record_statement, fixes)
+        except Exception:
+            # Put them back for next time, unless newer fixes have arrived
+            with self._lock:
+                self._unflushed = {**unflushed, **self._unflushed}
+            raise
+
+        unknown = {
+            user_id: fix for user_id, fix in unflushed.items() if user_id not in known
+        }
+        if unknown:
+            logger.debug("Dropping locations of %d unknown users", len(unknown))
+
+        self._forget(unknown, time.time() - FLUSHED_FIX_TTL)
+
+        return len(fixes)
+
+    def _forget(self, unknown: Dict[UUID, Fix], written_before: float) -> None:
+        """Drop the fixes of ``unknown`` users, and those already written that
+        are older than ``written_before``. Fixes received since are kept"""
+        with self._lock:
+            for user_id, fix in list(self._latest.items()):
+                if user_id in self._unflushed:
+                    continue
+                if unknown.get(user_id) is fix or fix.timestamp < written_before:
+                    del self._latest[user_id]
+
+
+_store = LocationStore()
+_task: Optional[asyncio.Task] = None
+
+
+def get_location_store() -> LocationStore:
+    return _store
+
+
+async def _flush_forever(interval: float) -> None:
+    from . import location_history
+    from .database_scope_provider import run_in_db_thread
+
+    last_pruned = time.monotonic()
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_db_thread(_store.flush)
+        except Exception:
+            logger.exception("Could not write player locations to the database")
+
+        if time.monotonic() - last_pruned < location_history.PRUNE_INTERVAL:
+            continue
+
+        last_pruned = time.monotonic()
+        try:
+            await run_in_db_thread(location_history.prune)
+        except Exception:
+            logger.exception("Could not prune the location history")
+
+
+def start() -> None:
+    """Start flushing on the running event loop"""
+    global _task
+
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_flush_forever(_flush_interval()))
+
+
+async def stop() -> None:
+    """Stop flushing, after one last flush"""
+    global _task
+
+    if _task is not None:
+        _task.cancel()
+        _task = None
+
+    from .database_scope_provider import run_in_db_thread
+
+    await run_in_db_thread(_store.flush)
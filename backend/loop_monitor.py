@@ -0,0 +1,75 @@
+"""
+How late the event loop is running.
+
+Every handler shares one event loop with every SSE stream, so anything that
+blocks it - a slow query run straight from a handler, say - delays everyone.
+This measures that directly: a task asks to wake every ``INTERVAL`` seconds
+and records how much later than that it actually woke. A healthy loop is a
+millisecond or so late; a blocked one is late by however long it was blocked.
+
+The last ``WINDOW`` samples are summarised by :func:`get_stats`, served at
+``/api/admin_event_loop_lag``.
+"""
+
+import asyncio
+import logging
+import statistics
+import time
+from collections import deque
+from typing import Deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+INTERVAL = 0.1
+
+# A minute's worth of samples
+WINDOW = 600
+
+_samples: Deque[float] = deque(maxlen=WINDOW)
+_task: Optional[asyncio.Task] = None
+
+
+def record_lag(lag: float) -> None:
+    _samples.append(lag)
+
+
+async def _measure_forever(interval: float) -> None:
+    while True:
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        record_lag(max(0.0, time.perf_counter() - expected))
+
+
+def start(interval: float = INTERVAL) -> None:
+    """Start measuring on the running event loop"""
+    global _task
+
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_measure_forever(interval))
+
+
+def stop() -> None:
+    global _task
+
+    if _task is not None:
+        _task.cancel()
+        _task = None
+
+
+def reset() -> None:
+    _samples.clear()
+
+
+def get_stats() -> dict:
+    """The lag over the last ``WINDOW`` samples, in milliseconds"""
+    samples = sorted(_samples)
+    if not samples:
+        return {"samples": 0, "p50_ms": None, "p99_ms": None, "max_ms": None}
+
+    return {
+        "samples": len(samples),
+        "p50_ms": 1e3 * statistics.median(samples),
+        "p99_ms": 1e3 * samples[min(len(samples) - 1, int(0.99 * len(samples)))],
+        "max_ms": 1e3 * samples[-1],
+    }
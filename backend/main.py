@@ -1,19 +1,23 @@
 import logging
 import os
+from contextlib import asynccontextmanager
 from contextlib import contextmanager
 from enum import Enum
 from functools import wraps
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
+from typing import Callable
 from typing import Dict
 from typing import List
 from typing import Optional
+from typing import Tuple
 from uuid import UUID
 
 import pydantic
 from fastapi import APIRouter
 from fastapi import Depends
 from fastapi import FastAPI
+from fastapi import Header
 from fastapi import HTTPException
 from fastapi import Request
 from pydantic import BaseModel
@@ -24,6 +28,10 @@ from starlette.responses import StreamingResponse
 from . import identity_admin
 from . import identity_demo
 from .admin_interface import CircleTypes
+from .blob_store import BlobTooLarge
+from .blob_store import get_blob_store
+from .database_scope_provider import run_in_db_thread
+from .db_perf import DbPerfMiddleware
 from .dotenv import load_env_vars
 from .item_actions import WEAPON_NAME_LOOKUP
 from .join_codes import JoinCodeModel
@@ -87,8 +95,16 @@ load_env_vars()
 setup_logging()
 
 from . import ai_shot_review
+from . import asyncio_triggers
+from . import db_perf
+from . import image_archive
+from . import image_cache
+from . import location_store
+from . import loop_monitor
 from . import shot_auto_actions
+from . import shot_images
 from . import sse_event_streams
+from . import sse_hub
 from .admin_auth import is_admin_authed
 from .admin_auth import mark_admin_authed
 from .admin_auth import require_admin_auth
@@ -96,13 +112,31 @@ from .admin_auth import require_admin_auth
 # Import these after logging is setup since they might have side effects (e.g. database setup)
 from .admin_interface import AdminInterface
 from .asyncio_triggers import trigger_update_event
+from .image_cache import CROSS
+from .image_cache import THUMBNAIL
 from .model import GameModel
 from .model import ShotModel
+from .scoreboard import get_cached_scoreboard
 from .ticker import Ticker
 from .user_id import get_user_id
 from .user_interface import UserInterface
+from .utils import add_params_to_url
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # With more than one worker process, triggers have to reach the SSE
+    # clients of every worker: see backend/event_bus.py
+    asyncio_triggers.start_event_bus()
+    loop_monitor.start()
+    location_store.start()
+    yield
+    await location_store.stop()
+    loop_monitor.stop()
+    asyncio_triggers.stop_event_bus()
+
+
+app = FastAPI(lifespan=lifespan)
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
@@ -110,6 +144,7 @@ if "SECRET_KEY" not in os.environ:
     logger.warning("No SECRET_KEY found in environment, using default value")
     os.environ["SECRET_KEY"] = "none"
 
+app.add_middleware(DbPerfMiddleware)
 app.add_middleware(
     SessionMiddleware,
     secret_key=os.environ["SECRET_KEY"],
@@ -133,8 +168,7 @@ async def get_my_id(
 async def get_user_info(
     user_id=Depends(get_user_id),
 ):
-    with UserInterface(user_id) as ui:
-        return ui.get_user_model()
+    return await run_in_db_thread(UserInterface(user_id).get_user_model)
 
 
 @router.get("/get_venue")
@@ -156,34 +190,104 @@ class _Shot(BaseModel):
     photo: str
 
 
-@router.post("/submit_shot")
-async def submit_shot(
-    shot: _Shot,
-    user_id=Depends(get_user_id),
-):
-    logger.info("Received shot from user %s", user_id)
+# The largest photo /submit_shot_photo will take. Phone cameras produce a few MB
+MAX_SHOT_PHOTO_BYTES = 20 * 2**20
+SHOT_PHOTO_TYPES = {"image/jpeg", "image/png", "image/webp"}
+
 
+def _submit_shot(user_id: UUID, submit: Callable) -> Tuple[UUID, UUID]:
+    """Call ``submit`` with the player's UserInterface; return the new shot's
+    id and its game"""
     with UserInterface(user_id) as ui:
-        shot_id = ui.submit_shot(shot.photo)
+        shot_id = submit(ui)
         game_id = ui.get_user().team.game_id
 
+    return shot_id, game_id
+
+
+async def _after_shot_submitted(shot_id: UUID, game_id: UUID) -> UUID:
     # Outside the session: queueing the review must not slow down the player
     # who fired, and the review itself must not hold a database session while
     # it waits on the network.
     trigger_update_event("shots", game_id)
-    if AdminInterface().is_ai_shot_review_enabled(game_id):
+    image_cache.enqueue_prefill(shot_id)
+    if await run_in_db_thread(AdminInterface().is_ai_shot_review_enabled, game_id):
         ai_shot_review.enqueue_review(shot_id)
 
     return shot_id
 
 
+@router.post("/submit_shot")
+async def submit_shot(
+    shot: _Shot,
+    user_id=Depends(get_user_id),
+):
+    """Submit a shot with its photo as a base64 data URL in JSON. Kept for
+    clients from before /submit_shot_photo"""
+    logger.info("Received shot from user %s", user_id)
+
+    shot_id, game_id = await run_in_db_thread(
+        _submit_shot, user_id, lambda ui: ui.submit_shot(shot.photo)
+    )
+
+    return await _after_shot_submitted(shot_id, game_id)
+
+
+@router.post("/submit_shot_photo")
+async def submit_shot_photo(
+    request: Request,
+    user_id=Depends(get_user_id),
+):
+    """
+    Submit a shot with its photo as the raw request body, e.g. a JPEG with
+    ``Content-Type: image/jpeg``. The body is streamed straight into the blob
+    store: no base64, no JSON, and never the whole photo in memory at once.
+    """
+    logger.info("Received shot photo from user %s", user_id)
+
+    image_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if image_type not in SHOT_PHOTO_TYPES:
+        raise HTTPException(415, f"Photo must be one of {sorted(SHOT_PHOTO_TYPES)}")
+
+    try:
+        image_hash, size = await get_blob_store().put_stream(
+            request.stream(), max_bytes=MAX_SHOT_PHOTO_BYTES
+        )
+    except BlobTooLarge:
+        raise HTTPException(413, "Photo too large")
+
+    if not size:
+        raise HTTPException(400, "No photo sent")
+
+    shot_id, game_id = await run_in_db_thread(
+        _submit_shot,
+        user_id,
+        lambda ui: ui.submit_stored_shot(image_hash, image_type),
+    )
+
+    return await _after_shot_submitted(shot_id, game_id)
+
+
 @router.get("/user_shots")
 async def get_user_shots(
     user_id=Depends(get_user_id),
 ):
-    """This user's own shots, newest first, without the images"""
+    """This user's own shots, newest first, without the images: each has
+    URLs for its photo and for a thumbnail, rendered when it was fired"""
     with UserInterface(user_id) as ui:
-        return ui.get_own_shots()
+        shots = ui.get_own_shots()
+
+    for shot in shots:
+        for key, rendition in [
+            ("image_url", shot_images.ORIGINAL),
+            ("thumbnail_url", THUMBNAIL),
+        ]:
+            shot[key] = add_params_to_url(
+                app.url_path_for("get_shot_image"),
+                {"shot_id": shot["id"], "rendition": rendition},
+            )
+
+    return shots
 
 
 @router.get("/user_shot_image")
@@ -197,6 +301,31 @@ async def get_user_shot_image(
         return {"image_base64": ui.get_own_shot_image(shot_id)}
 
 
+@router.get("/shot_image")
+async def get_shot_image(
+    request: Request,
+    shot_id: UUID,
+    rendition: str = shot_images.ORIGINAL,
+    user_id=Depends(get_user_id),
+    is_admin_authed=Depends(is_admin_authed),
+):
+    """
+    A shot's photo, or a rendition of it, as an image rather than base64 in
+    JSON, with an ETag and an immutable Cache-Control, and answering 304s
+    and byte ranges. The admin can have any shot in any rendition, players
+    the original and thumbnail of their own. See backend/shot_images.py
+    """
+
+    def respond():
+        if is_admin_authed:
+            image = AdminInterface().get_shot_image(shot_id, rendition)
+        else:
+            image = UserInterface(user_id).get_shot_image(shot_id, rendition)
+        return shot_images.make_response(image, request.headers)
+
+    return await run_in_db_thread(respond)
+
+
 @router.post("/set_name")
 async def set_name(
     name: str,
@@ -257,10 +386,23 @@ async def collect_item(
 
 @router.get("/ticker_messages")
 async def get_ticker_messages(
-    num_messages=3,
+    num_messages: int = 3,
+    since_id: Optional[int] = None,
     user_id=Depends(get_user_id),
 ):
-    return UserInterface(user_id).get_messages(num_messages, private=True)
+    """
+    The newest ``num_messages`` ticker messages, newest first, as (class,
+    message) pairs. With ``since_id`` - the id of the newest entry the client
+    already has - only the entries after it, oldest first, with their ids
+    """
+    if since_id is not None:
+        return await run_in_db_thread(
+            UserInterface(user_id).get_messages_since, since_id, num_messages
+        )
+
+    return await run_in_db_thread(
+        UserInterface(user_id).get_messages, num_messages, private=True
+    )
 
 
 @router.get("/get_users")
@@ -281,13 +423,15 @@ async def get_users(game_id: str = None, team_id: str = None):
 
 @router.get("/get_scoreboard")
 async def get_scoreboard(user_id=Depends(get_user_id)):
-    with UserInterface(user_id) as ui:
-        game_id = ui.get_user_model().game_id
+    def load_scoreboard():
+        game_id = UserInterface(user_id).get_user_model().game_id
+
+        if game_id is None:
+            raise HTTPException(404, "User is not in a game")
 
-    if game_id is None:
-        raise HTTPException(404, "User is not in a game")
+        return get_cached_scoreboard(game_id)
 
-    return AdminInterface().get_scoreboard(game_id)
+    return await run_in_db_thread(load_scoreboard)
 
 
 @router.post("/set_location")
@@ -296,9 +440,8 @@ async def set_location(
     longitude: float,
     user_id=Depends(get_user_id),
 ):
-    logger.info("Setting location for user %s to %f, %f", user_id, latitude, longitude)
-    with UserInterface(user_id) as ui:
-        ui.set_location(latitude, longitude)
+    logger.debug("Setting location for user %s to %f, %f", user_id, latitude, longitude)
+    UserInterface(user_id).set_location(latitude, longitude)
 
 
 ######## ADMIN ###########
@@ -380,6 +523,51 @@ async def admin_get_shots(limit=5):
     return {"numInQueue": num_in_queue, "shots": filtered_shots}
 
 
+# Most shots one page of the queue will list
+MAX_QUEUE_PAGE = 100
+
+
+@admin_method("/admin_get_shot_queue", method="GET")
+async def admin_get_shot_queue(
+    game_id: Optional[UUID] = None, after: Optional[str] = None, limit: int = 20
+):
+    """
+    The unchecked shots, oldest first, a page at a time: light rows with the
+    shooter and the AI's verdict, and a URL for each photo rather than the
+    photo itself.
+
+    Pass the ``next`` cursor from one page as ``after`` to get the one after
+    it; ``next`` is null on the last page. Restrict to one game with
+    ``game_id``.
+    """
+
+    def load_page():
+        return AdminInterface().get_shot_queue(
+            game_id=game_id, after=after, limit=min(limit, MAX_QUEUE_PAGE)
+        )
+
+    shots, next_cursor = await run_in_db_thread(load_page)
+
+    for shot in shots:
+        shot.image_url = add_params_to_url(
+            app.url_path_for("admin_shot_image"),
+            {"shot_id": shot.id, "transform": CROSS},
+        )
+
+    return {"shots": shots, "next": next_cursor}
+
+
+@admin_method("/admin_shot_image", method="GET")
+async def admin_shot_image(request: Request, shot_id: UUID, transform: str = CROSS):
+    """A shot's photo as marked up for the queue, as an image. Rendered once
+    and cached, here and by the browser: see backend/shot_images.py"""
+    return await run_in_db_thread(
+        lambda: shot_images.make_response(
+            AdminInterface().get_shot_image(shot_id, transform), request.headers
+        )
+    )
+
+
 @admin_method("/admin_get_shots_info", method="GET")
 async def admin_get_shots_info() -> list[UUID]:
     return AdminInterface().get_unchecked_shots_ids()
@@ -505,6 +693,18 @@ async def admin_get_locations(game_id=None):
     return AdminInterface().get_locations(game_id=game_id)
 
 
+@admin_method("/admin_get_players_near", method="GET")
+async def admin_get_players_near(
+    game_id: UUID, latitude: float, longitude: float, radius_m: float = 50
+):
+    """
+    Get the players in a game within radius_m metres of a point, nearest first
+    """
+    return await run_in_db_thread(
+        AdminInterface().get_players_near, game_id, latitude, longitude, radius_m
+    )
+
+
 @admin_method(path="/admin_make_new_item", method="POST")
 async def admin_make_new_item(
     item_type: str,
@@ -731,9 +931,27 @@ def _identity_admin_errors():
 @router.get("/sse_updates")
 async def sse_updates(
     user_id=Depends(get_user_id),
+    last_event_id: Optional[str] = None,
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+    coalesce_ms: Optional[int] = None,
+    payloads: bool = False,
+    ticker_since: Optional[int] = None,
 ):
+    """Update prompts for this user. Browsers send the Last-Event-ID header when
+    they reconnect by themselves; the frontend passes last_event_id when it
+    opens a fresh stream to resume an old one. coalesce_ms overrides the window
+    over which prompts are merged into one update mask (0 to turn it off).
+    With payloads, the stream sends the changed data rather than prompts to
+    fetch it; ticker_since is the newest ticker entry the client already has.
+    See backend/sse_payloads.py."""
     return StreamingResponse(
-        sse_event_streams.updates_generator(user_id),
+        sse_event_streams.updates_generator(
+            user_id,
+            last_event_id=last_event_id or last_event_id_header,
+            coalesce_ms=coalesce_ms,
+            payloads=payloads,
+            ticker_since=ticker_since,
+        ),
         headers={
             "Content-type": "text/event-stream",
             "Cache-Control": "no-cache",
@@ -742,6 +960,34 @@ async def sse_updates(
     )
 
 
+@admin_method("/admin_sse_stats", method="GET")
+async def admin_sse_stats() -> Dict:
+    """Open player streams, and how many update prompts were suppressed by
+    coalescing rather than each costing a client a refetch"""
+    return sse_hub.get_stats()
+
+
+@admin_method("/admin_image_archive_stats", method="GET")
+async def admin_image_archive_stats() -> Dict:
+    """Shot photos waiting to be copied into logs/images, and how many copies
+    were written, failed or dropped because the queue was full"""
+    return image_archive.get_stats()
+
+
+@admin_method("/admin_event_loop_lag", method="GET")
+async def admin_event_loop_lag() -> Dict:
+    """How late the event loop has been waking over the last minute. Anything
+    blocking it shows up here"""
+    return loop_monitor.get_stats()
+
+
+@admin_method("/admin_perf", method="GET")
+async def admin_perf() -> Dict:
+    """Query counts and database time for each endpoint, requests that look
+    like N+1s, and the slowest queries seen"""
+    return db_perf.get_stats()
+
+
 @admin_method("/sse_admin_updates", method="GET")
 async def sse_admin_updates():
     return StreamingResponse(
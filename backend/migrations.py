@@ -0,0 +1,601 @@
+"""
+Versioned schema migrations.
+
+The database records the migrations it has had in a ``schema_version`` table.
+At startup :func:`migrate` reads the highest version from it - a single query,
+with no reflection - and, if that is behind :data:`MIGRATIONS`, applies the
+missing ones in order, recording each as it completes. A new database is built
+straight from the models by create_all() and stamped with the latest version
+(:func:`stamp`), so it never runs any.
+
+To change the schema, change the models and append a migration here that
+takes an existing database to match:
+
+    @migration(3)
+    def add_shot_locations(engine):
+        \"\"\"Split shot locations out into their own table\"\"\"
+        ...
+
+A migration spells out the tables, columns and indexes it adds - its own
+``sa.Table`` definitions, or DDL - exactly as they were when it was written.
+It must never build them from the models: those will have moved on by the
+time an old database is migrated, and it would end up with a different schema
+from everyone else's.
+
+A migration gets the engine rather than a connection so that it can work in
+several transactions: a backfill over a large table should go a batch of rows
+at a time (:func:`backfill`) rather than hold one transaction for all of it.
+That means a migration can be interrupted part way, or run by two backend
+processes starting at once, so every migration must be safe to run again:
+tables and indexes are created only if they don't exist (:func:`create`), and
+a version already recorded by another process is left as it is.
+
+See what would be applied to the database in DATABASE_URL, without applying
+it:
+
+    python -m backend.migrations --dry-run
+"""
+
+import argparse
+import datetime
+import logging
+import os
+from dataclasses import dataclass
+from typing import Callable
+from typing import List
+
+import sqlalchemy as sa
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.schema import CreateTable
+from sqlalchemy_utils import UUIDType
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+schema_version_table = sa.Table(
+    "schema_version",
+    sa.MetaData(),
+    sa.Column("version", sa.Integer, primary_key=True),
+    sa.Column("name", sa.String, nullable=False),
+    sa.Column("applied_at", sa.DateTime, nullable=False),
+)
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    apply: Callable
+
+    @property
+    def description(self) -> str:
+        """The first line of the migration's docstring"""
+        return (self.apply.__doc__ or "").strip().split("\n")[0]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int):
+    """Register a migration. Versions go up by one, in the order written"""
+
+    def register(func):
+        expected = len(MIGRATIONS) + 1
+        if version != expected:
+            raise ValueError(
+                f"Migration {func.__name__} has version {version}, expected {expected}"
+            )
+        MIGRATIONS.append(Migration(version, func.__name__, func))
+        return func
+
+    return register
+
+
+def latest_version() -> int:
+    return len(MIGRATIONS)
+
+
+def current_version(engine) -> int:
+    """The version the database is at: 0 for a database from before versioning"""
+    try:
+        with engine.connect() as conn:
+            version = conn.execute(
+                sa.select(sa.func.max(schema_version_table.c.version))
+            ).scalar()
+    except sa.exc.DBAPIError:
+        # No schema_version table
+        return 0
+
+    return version or 0
+
+
+def pending(engine) -> List[Migration]:
+    return MIGRATIONS[current_version(engine) :]
+
+
+def _record(engine, migrations: List[Migration]) -> None:
+    create(engine, schema_version_table)
+
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    for m in migrations:
+        # Another process starting at the same time may have recorded it first
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    schema_version_table.insert(),
+                    {"version": m.version, "name": m.name, "applied_at": now},
+                )
+        except sa.exc.IntegrityError:
+            pass
+
+
+def stamp(engine) -> None:
+    """Mark a database just built from the models as fully migrated"""
+    _record(engine, MIGRATIONS)
+
+
+def migrate(engine, dry_run=False) -> List[Migration]:
+    """
+    Apply the migrations the database is missing, in order, and return them.
+    With ``dry_run``, only log and return what would be applied.
+    """
+    to_apply = pending(engine)
+
+    for m in to_apply:
+        if dry_run:
+            logger.warning(
+                "Would apply migration %d (%s): %s", m.version, m.name, m.description
+            )
+            continue
+
+        logger.warning("Applying migration %d (%s)", m.version, m.name)
+        m.apply(engine)
+        _record(engine, [m])
+
+    return to_apply
+
+
+def backfill(engine, select: str, update: Callable, batch_size=BATCH_SIZE) -> int:
+    """
+    Update rows a batch at a time, one transaction per batch.
+
+    ``select`` is SQL returning up to ``:batch_size`` rows that still need
+    work. It must leave out rows already done, or this never finishes.
+    ``update(conn, rows)`` does the work for one batch. Stops once a batch
+    comes back short, and returns the number of rows processed.
+    """
+    num_rows = 0
+
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(sa.text(select), {"batch_size": batch_size}).all()
+            if rows:
+                update(conn, rows)
+
+        num_rows += len(rows)
+
+        if len(rows) < batch_size:
+            return num_rows
+
+
+def create(engine, *tables: sa.Table) -> None:
+    """Create ``tables`` and their indexes, skipping any that already exist"""
+    with engine.begin() as conn:
+        for table in tables:
+            conn.execute(CreateTable(table, if_not_exists=True))
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+def add_missing_columns(engine, metadata=None):
+    """
+    Add any columns that the tables in ``metadata`` - by default, the ORM
+    models' - define but the database lacks. Tables the database doesn't have
+    are left alone.
+
+    The database was kept in step with the models this way, at every startup,
+    before there were migrations.
+    """
+    if metadata is None:
+        from .model import Base
+
+        metadata = Base.metadata
+
+    inspector = sa.inspect(engine)
+
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+
+                ddl = CreateColumn(column).compile(dialect=engine.dialect).string
+
+                # NOT NULL columns can only be added to a non-empty table with
+                # a default, so render the model's Python-side default (if it
+                # is a plain scalar) as a server-side DEFAULT clause, unless
+                # the model has one of its own
+                default = getattr(column.default, "arg", None)
+                if (
+                    column.server_default is None
+                    and default is not None
+                    and not callable(default)
+                ):
+                    literal = sa.literal(default).compile(
+                        dialect=engine.dialect,
+                        compile_kwargs={"literal_binds": True},
+                    )
+                    ddl += f" DEFAULT {literal}"
+
+                logger.warning("Adding missing database column %s.%s", table.name, ddl)
+                conn.execute(sa.text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+
+
+def add_missing_indexes(engine, metadata=None):
+    """
+    Create any indexes that the tables in ``metadata`` - by default, the ORM
+    models' - define but the database lacks, matched by name. The companion of
+    :func:`add_missing_columns`.
+    """
+    if metadata is None:
+        from .model import Base
+
+        metadata = Base.metadata
+
+    inspector = sa.inspect(engine)
+
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                if index.name in existing:
+                    continue
+
+                logger.warning(
+                    "Adding missing database index %s on %s", index.name, table.name
+                )
+                index.create(bind=conn)
+
+
+def move_images_to_blob_store(engine, batch_size=50) -> int:
+    """
+    Move shot photos still stored inline in shots.image_base64 into the blob
+    store, a batch of shots per transaction, and empty the old column.
+
+    If it is interrupted, the shots already moved stay moved and the rest are
+    picked up next time. Returns the number of shots moved.
+    """
+    from .blob_store import get_blob_store
+
+    blob_store = get_blob_store()
+
+    def move(conn, rows):
+        for shot_id, image_base64 in rows:
+            image_hash, image_type = blob_store.put_data_url(image_base64)
+            conn.execute(
+                sa.text(
+                    "UPDATE shots SET image_hash = :image_hash, "
+                    "image_type = :image_type, image_base64 = '' "
+                    "WHERE id = :id"
+                ),
+                {"image_hash": image_hash, "image_type": image_type, "id": shot_id},
+            )
+
+    num_moved = backfill(
+        engine,
+        "SELECT id, image_base64 FROM shots "
+        "WHERE image_hash IS NULL AND image_base64 != '' "
+        "LIMIT :batch_size",
+        move,
+        batch_size=batch_size,
+    )
+
+    if num_moved:
+        logger.warning(
+            "Moved %d shot images into the blob store at %s",
+            num_moved,
+            blob_store.root,
+        )
+
+        # SQLite doesn't give the space back to the filesystem by itself
+        if engine.dialect.name == "sqlite":
+            with engine.connect().execution_options(
+                isolation_level="AUTOCOMMIT"
+            ) as conn:
+                conn.execute(sa.text("VACUUM"))
+
+    return num_moved
+
+
+# The schema as it was when versioning began, which migration 1 brings
+# databases from before then up to. Frozen: what the models have gained since
+# belongs to later migrations. Only the defaults that DDL renders are kept.
+_schema_v1 = sa.MetaData()
+
+sa.Table(
+    "games",
+    _schema_v1,
+    sa.Column("id", UUIDType, primary_key=True),
+    sa.Column("time_created", sa.DateTime, server_default=sa.func.now()),
+    sa.Column("active", sa.Boolean, nullable=False, default=False),
+    sa.Column("ai_shot_review_enabled", sa.Boolean, nullable=False, default=False),
+    sa.Column("ai_auto_actions_enabled", sa.Boolean, nullable=False, default=False),
+    sa.Column("exclusion_circle_lat", sa.Float, nullable=True),
+    sa.Column("exclusion_circle_long", sa.Float, nullable=True),
+    sa.Column("exclusion_circle_radius", sa.Float, nullable=True),
+    sa.Column("next_circle_lat", sa.Float, nullable=True),
+    sa.Column("next_circle_long", sa.Float, nullable=True),
+    sa.Column("next_circle_radius", sa.Float, nullable=True),
+    sa.Column("drop_circle_lat", sa.Float, nullable=True),
+    sa.Column("drop_circle_long", sa.Float, nullable=True),
+    sa.Column("drop_circle_radius", sa.Float, nullable=True),
+    sa.Column("ticker_update_tag", sa.Integer),
+)
+
+sa.Table(
+    "teams",
+    _schema_v1,
+    sa.Column("id", UUIDType, primary_key=True),
+    sa.Column("time_created", sa.DateTime, server_default=sa.func.now()),
+    sa.Column("name", sa.String),
+    sa.Column(
+        "game_id", UUIDType, sa.ForeignKey("games.id"), index=True, nullable=False
+    ),
+)
+
+sa.Table(
+    "users",
+    _schema_v1,
+    sa.Column("id", UUIDType, primary_key=True),
+    sa.Column("time_created", sa.DateTime, server_default=sa.func.now()),
+    sa.Column("last_seen", sa.DateTime),
+    sa.Column("name", sa.String),
+    sa.Column("team_id", UUIDType, sa.ForeignKey("teams.id"), index=True),
+    sa.Column("num_bullets", sa.Integer, nullable=False, default=0),
+    sa.Column("hit_points", sa.Integer, nullable=False, default=1),
+    sa.Column("shot_timeout", sa.Float, nullable=False, default=6),
+    sa.Column("shot_damage", sa.Integer, nullable=False, default=1),
+    sa.Column("latitude", sa.Float, nullable=True),
+    sa.Column("longitude", sa.Float, nullable=True),
+    sa.Column("location_timestamp", sa.Float, nullable=True),
+    sa.Column("time_of_death", sa.Float, nullable=True),
+    sa.Column("identity_slot", sa.Integer, nullable=True),
+    sa.Column("identity_overrides", sa.String, nullable=True),
+    sa.Column("update_tag", sa.Integer),
+)
+
+sa.Table(
+    "shots",
+    _schema_v1,
+    sa.Column("id", UUIDType, primary_key=True, nullable=False),
+    sa.Column("time_created", sa.DateTime, server_default=sa.func.now()),
+    sa.Column("game_id", UUIDType, sa.ForeignKey("games.id"), nullable=False),
+    sa.Column("user_id", UUIDType, sa.ForeignKey("users.id"), nullable=False),
+    sa.Column("target_user_id", UUIDType, sa.ForeignKey("users.id"), nullable=True),
+    sa.Column("team_id", UUIDType, sa.ForeignKey("teams.id"), nullable=False),
+    sa.Column("shot_damage", sa.Integer),
+    sa.Column("image_hash", sa.String, nullable=True),
+    sa.Column("image_type", sa.String, nullable=True),
+    sa.Column("image_base64", sa.String, nullable=False, default=""),
+    sa.Column("checked", sa.Boolean, nullable=False, default=False),
+    sa.Column("result", sa.String, nullable=True),
+    sa.Column("location_context", sa.String, nullable=True),
+    sa.Column("ai_review_state", sa.String, nullable=True),
+    sa.Column("ai_review", sa.String, nullable=True),
+    sa.Index("ix_shots_game_checked_time", "game_id", "checked", "time_created", "id"),
+    sa.Index("ix_shots_checked_time", "checked", "time_created"),
+    sa.Index("ix_shots_user_checked_target", "user_id", "checked", "target_user_id"),
+)
+
+sa.Table(
+    "items",
+    _schema_v1,
+    sa.Column("id", UUIDType, primary_key=True, nullable=False),
+    sa.Column("time_created", sa.DateTime, server_default=sa.func.now()),
+    sa.Column("item_type", sa.Enum("AMMO", "MEDPACK", "ARMOUR", "WEAPON")),
+    sa.Column("data", sa.String),
+    sa.Column("collected_only_once", sa.Boolean, default=True, nullable=False),
+    sa.Column("collected_as_team", sa.Boolean, default=False, nullable=False),
+    sa.Column("game_id", UUIDType, sa.ForeignKey("games.id")),
+)
+
+sa.Table(
+    "association_table",
+    _schema_v1,
+    sa.Column("user_id", UUIDType, sa.ForeignKey("users.id"), primary_key=True),
+    sa.Column("item_id", UUIDType, sa.ForeignKey("items.id"), primary_key=True),
+)
+
+sa.Table(
+    "ticker_entries",
+    _schema_v1,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("time_created", sa.DateTime, server_default=sa.func.now()),
+    sa.Column(
+        "game_id", UUIDType, sa.ForeignKey("games.id"), index=True, nullable=False
+    ),
+    sa.Column(
+        "private_user_id",
+        UUIDType,
+        sa.ForeignKey("users.id"),
+        index=True,
+        nullable=True,
+    ),
+    sa.Column(
+        "highlight_user_id",
+        UUIDType,
+        sa.ForeignKey("users.id"),
+        index=True,
+        nullable=True,
+    ),
+    sa.Column("message", sa.String, nullable=False),
+)
+
+
+@migration(1)
+def sync_with_models(engine):
+    """Bring a database from before versioning up to date with the models"""
+    create(engine, *_schema_v1.sorted_tables)
+    add_missing_columns(engine, _schema_v1)
+    add_missing_indexes(engine, _schema_v1)
+
+
+@migration(2)
+def move_shot_images(engine):
+    """Move shot photos stored inline in shots.image_base64 to the blob store"""
+    move_images_to_blob_store(engine)
+
+
+_schema_v3 = sa.MetaData()
+
+_location_history_v3 = sa.Table(
+    "location_history",
+    _schema_v3,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("game_id", UUIDType, nullable=False),
+    sa.Column("user_id", UUIDType, nullable=False),
+    sa.Column("timestamp", sa.Float, nullable=False),
+    sa.Column("latitude", sa.Float, nullable=False),
+    sa.Column("longitude", sa.Float, nullable=False),
+    sa.Index("ix_location_history_game_user_time", "game_id", "user_id", "timestamp"),
+    sa.Index("ix_location_history_timestamp", "timestamp"),
+)
+
+# Only the columns added to it
+sa.Table("shots", _schema_v3, sa.Column("location_time", sa.Float, nullable=True))
+
+
+@migration(3)
+def add_location_history(engine):
+    """Add the location history, starting it from players' latest positions"""
+    create(engine, _location_history_v3)
+    add_missing_columns(engine, _schema_v3)
+
+    with engine.begin() as conn:
+        conn.execute(
+            sa.text(
+                "INSERT INTO location_history "
+                "(game_id, user_id, timestamp, latitude, longitude) "
+                "SELECT teams.game_id, users.id, users.location_timestamp, "
+                "users.latitude, users.longitude "
+                "FROM users JOIN teams ON users.team_id = teams.id "
+                "WHERE users.location_timestamp IS NOT NULL "
+                "AND users.latitude IS NOT NULL AND users.longitude IS NOT NULL "
+                "AND NOT EXISTS (SELECT 1 FROM location_history "
+                "WHERE location_history.user_id = users.id)"
+            )
+        )
+
+
+_schema_v4 = sa.MetaData()
+
+# Referred to by user_stats' foreign key
+sa.Table("users", _schema_v4, sa.Column("id", UUIDType, primary_key=True))
+
+_user_stats_v4 = sa.Table(
+    "user_stats",
+    _schema_v4,
+    sa.Column("user_id", UUIDType, sa.ForeignKey("users.id"), primary_key=True),
+    sa.Column("shots_fired", sa.Integer, nullable=False, default=0),
+    sa.Column("hits", sa.Integer, nullable=False, default=0),
+    sa.Column("kills", sa.Integer, nullable=False, default=0),
+    sa.Column("damage_dealt", sa.Integer, nullable=False, default=0),
+)
+
+# Only the columns added to it
+sa.Table(
+    "shots",
+    _schema_v4,
+    sa.Column("knocked_out", sa.Boolean, nullable=False, server_default=sa.false()),
+)
+
+
+@migration(4)
+def add_user_stats(engine):
+    """Keep running totals of each player's shooting, for the scoreboard"""
+    create(engine, _user_stats_v4)
+    add_missing_columns(engine, _schema_v4)
+
+    # Add the totals up as backend.scoreboard.rebuild() did then. Which earlier
+    # hits were knockouts wasn't recorded, so they count no kills
+    hit = "shots.checked AND shots.target_user_id IS NOT NULL"
+    with engine.begin() as conn:
+        conn.execute(sa.text("DELETE FROM user_stats"))
+        conn.execute(
+            sa.text(
+                "INSERT INTO user_stats "
+                "(user_id, shots_fired, hits, kills, damage_dealt) "
+                "SELECT shots.user_id, "
+                "SUM(CASE WHEN COALESCE(shots.result, '') != 'refunded' "
+                "THEN 1 ELSE 0 END), "
+                f"SUM(CASE WHEN {hit} THEN 1 ELSE 0 END), "
+                "0, "
+                f"COALESCE(SUM(CASE WHEN {hit} THEN shots.shot_damage "
+                "ELSE 0 END), 0) "
+                # Shots can outlive their shooter in an old database
+                "FROM shots JOIN users ON users.id = shots.user_id "
+                "GROUP BY shots.user_id"
+            )
+        )
+
+
+@migration(5)
+def page_the_shot_queue(engine):
+    """Extend the all-games shot queue index with the shot id, for paging"""
+    with engine.begin() as conn:
+        conn.execute(sa.text("DROP INDEX IF EXISTS ix_shots_checked_time"))
+        conn.execute(
+            sa.text(
+                "CREATE INDEX IF NOT EXISTS ix_shots_checked_time_id "
+                "ON shots (checked, time_created, id)"
+            )
+        )
+
+
+@migration(6)
+def index_ticker_feeds(engine):
+    """Index each game's ticker by feed, newest first, for loading its tail"""
+    with engine.begin() as conn:
+        conn.execute(
+            sa.text(
+                "CREATE INDEX IF NOT EXISTS ix_ticker_entries_game_private_id "
+                "ON ticker_entries (game_id, private_user_id, id DESC)"
+            )
+        )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Migrate the database")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="only list what would be applied"
+    )
+    args = parser.parse_args(argv)
+
+    # Not through backend.database: importing that migrates the database
+    from .dotenv import load_env_vars
+    from .engine_config import make_engine
+
+    load_env_vars()
+    engine = make_engine(os.environ["DATABASE_URL"])
+
+    print(f"Database is at version {current_version(engine)} of {latest_version()}")
+    for m in migrate(engine, dry_run=args.dry_run):
+        verb = "Would apply" if args.dry_run else "Applied"
+        print(f"{verb} {m.version} ({m.name}): {m.description}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
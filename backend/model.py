@@ -16,13 +16,19 @@ from sqlalchemy import DateTime
 from sqlalchemy import Enum
 from sqlalchemy import Float
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
 from sqlalchemy import Integer
 from sqlalchemy import String
 from sqlalchemy import Table
+from sqlalchemy import desc
+from sqlalchemy import false
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.orm import deferred
 from sqlalchemy.orm import relationship
 from sqlalchemy_utils import UUIDType
 
+from .blob_store import get_blob_store
+
 DEFAULT_SHOT_TIMEOUT = 6
 
 # The values Shot.ai_review_state can take. They live here, next to the column,
@@ -98,6 +104,15 @@ class Shot(Base):
     """
 
     __tablename__ = "shots"
+    __table_args__ = (
+        # The shot queue, oldest first: per game (AdminInterface.get_queue_head)
+        # and across all games (get_unchecked_shots). The id breaks ties, for
+        # paging through the queue (get_shot_queue)
+        Index("ix_shots_game_checked_time", "game_id", "checked", "time_created", "id"),
+        Index("ix_shots_checked_time_id", "checked", "time_created", "id"),
+        # Each player's hits, for rebuilding the scoreboard (backend/scoreboard.py)
+        Index("ix_shots_user_checked_target", "user_id", "checked", "target_user_id"),
+    )
 
     id = Column(UUIDType, primary_key=True, nullable=False, default=get_uuid)
     time_created = Column(DateTime, server_default=func.now())
@@ -123,9 +138,24 @@ class Shot(Base):
     # Required since users could pick up upgrades after taking this shot
     shot_damage = Column(Integer, default=1)
 
-    image_base64 = Column(String, nullable=False)
+    # The photo lives in the blob store (backend/blob_store.py), named by the
+    # SHA-256 of its bytes. Shots from before the blob store kept the photo
+    # inline as a data URL in the old image_base64 column: that is deferred so
+    # that ordinary queries never load it, and emptied once the photo has been
+    # moved (migrations.move_images_to_blob_store).
+    image_hash = Column(String, nullable=True)
+    image_type = Column(String, nullable=True)
+    legacy_image_base64 = deferred(
+        Column("image_base64", String, nullable=False, default="")
+    )
+
     checked = Column(Boolean, nullable=False, default=False)
 
+    # Whether this shot's hit knocked its target out. Recorded so that the
+    # scoreboard's kill counts can be rebuilt from the shots. Defaulted in the
+    # database too, for shots written by code from before it existed
+    knocked_out = Column(Boolean, nullable=False, default=False, server_default=false())
+
     # How the shot was adjudicated: "hit" / "miss" / "bystander" / "refunded",
     # or null while it is still in the queue. Recorded so the shooter's shot
     # history can report what happened - target_user_id alone can't tell a miss
@@ -133,7 +163,12 @@ class Shot(Base):
     # caught somebody who isn't playing.
     result = Column(String, nullable=True)
 
-    location_context = Column(String, nullable=True)
+    # Where everyone was when the shot was taken is looked up in the location
+    # history (backend/location_history.py) at this time. Shots from before the
+    # history kept a JSON snapshot of every player's position in the old
+    # location_context column instead.
+    location_time = Column(Float, nullable=True)
+    legacy_location_context = Column("location_context", String, nullable=True)
 
     # AI review of the photo. Shown as tags under the image in the queue, and
     # -- when the game's toggle is on -- acted on automatically for the queue
@@ -145,6 +180,21 @@ class Shot(Base):
     # "error". Text JSON matches how location_context is already stored.
     ai_review = Column(String, nullable=True)
 
+    @property
+    def image_base64(self) -> str:
+        """The photo as a data URL, read from wherever it is stored"""
+        if self.image_hash:
+            return get_blob_store().get_data_url(self.image_hash, self.image_type)
+
+        return self.legacy_image_base64 or ""
+
+    @property
+    def location_context(self) -> Optional[str]:
+        """The JSON snapshot of every player's position kept by shots from
+        before the location history. Later shots have a location_time instead,
+        and are given their positions by AdminInterface"""
+        return self.legacy_location_context
+
 
 class Team(Base):
     """
@@ -159,7 +209,7 @@ class Team(Base):
     time_created = Column(DateTime, server_default=func.now())
     name = Column(String)
 
-    game_id = Column(UUIDType, ForeignKey("games.id"), nullable=False)
+    game_id = Column(UUIDType, ForeignKey("games.id"), index=True, nullable=False)
     game = relationship("Game", lazy=True, foreign_keys=game_id, back_populates="teams")
 
     users = relationship("User", lazy=True, back_populates="team")
@@ -195,7 +245,7 @@ class User(Base):
     last_seen = Column(DateTime, default=func.now())
     name = Column(String)
 
-    team_id = Column(UUIDType, ForeignKey("teams.id"))
+    team_id = Column(UUIDType, ForeignKey("teams.id"), index=True)
     team = relationship(
         "Team", lazy="joined", foreign_keys=team_id, back_populates="users"
     )
@@ -284,12 +334,66 @@ class ItemType(str, enum.Enum):
     WEAPON = "weapon"
 
 
+class UserStats(Base):
+    """
+    Running totals of each player's shooting, for the scoreboard. Updated in
+    the same transaction as the shots they count (backend/scoreboard.py), and
+    can be rebuilt from - and checked against - the shots table
+    """
+
+    __tablename__ = "user_stats"
+
+    user_id = Column(UUIDType, ForeignKey("users.id"), primary_key=True)
+
+    # Shots that cost ammo: all of them but the refunded
+    shots_fired = Column(Integer, nullable=False, default=0)
+    hits = Column(Integer, nullable=False, default=0)
+    kills = Column(Integer, nullable=False, default=0)
+    damage_dealt = Column(Integer, nullable=False, default=0)
+
+
+class LocationFix(Base):
+    """
+    One of a player's positions, in the order received: their track through a
+    game. Written behind by backend/location_store.py, and thinned out and
+    expired by backend/location_history.py
+    """
+
+    __tablename__ = "location_history"
+    __table_args__ = (
+        # A player's latest position at a given time, within a game
+        Index("ix_location_history_game_user_time", "game_id", "user_id", "timestamp"),
+        # Expiring and thinning out old fixes
+        Index("ix_location_history_timestamp", "timestamp"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    game_id = Column(UUIDType, nullable=False)
+    user_id = Column(UUIDType, nullable=False)
+    timestamp = Column(Float, nullable=False)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+
+
 class TickerEntry(Base):
     __tablename__ = "ticker_entries"
+    __table_args__ = (
+        # The newest entries of each player's private feed, and of the public
+        # one, all read in one pass when backend/ticker.py loads a game's tail
+        Index(
+            "ix_ticker_entries_game_private_id",
+            "game_id",
+            "private_user_id",
+            desc("id"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
     time_created = Column(DateTime, server_default=func.now())
 
+    # Indexed for finding a game's entries. Players' feeds are read through
+    # ix_ticker_entries_game_private_id instead, which doesn't have to skip
+    # over other players' private entries
     game_id = Column(UUIDType, ForeignKey("games.id"), index=True, nullable=False)
     game = relationship("Game", lazy=True, foreign_keys=game_id)
 
@@ -420,6 +524,7 @@ class ShotModel(pydantic.BaseModel):
 
     shot_damage: int
 
+    location_time: Optional[float] = None
     location_context: Optional[str] = None
 
     ai_review_state: Optional[str] = None
@@ -428,6 +533,28 @@ class ShotModel(pydantic.BaseModel):
     model_config = pydantic.ConfigDict(from_attributes=True, extra="forbid")
 
 
+class QueuedShotModel(pydantic.BaseModel):
+    """A shot waiting in the admin's queue, as listed: no photo, which is
+    fetched separately from ``image_url``, and none of the nested models"""
+
+    id: UUID
+    time_created: datetime.datetime
+    game_id: UUID
+    user_id: UUID
+    user_name: Optional[str] = None
+    team_name: Optional[str] = None
+    shot_damage: int
+
+    ai_review_state: Optional[str] = None
+    # The bottom line of a finished AI review: see shot_vision.ShotVisionResult
+    ai_outcome: Optional[str] = None
+    ai_confidence: Optional[float] = None
+
+    image_url: Optional[str] = None
+
+    model_config = pydantic.ConfigDict(extra="forbid")
+
+
 class TickerEntryModel(pydantic.BaseModel):
     id: int
     time_created: datetime.datetime
@@ -6,6 +6,7 @@ from uuid import uuid4
 
 from .database import engine as db_engine
 from .dotenv import load_env_vars
+from .migrations import stamp
 from .model import Base
 from .model import Game
 from .model import Team
@@ -39,6 +40,9 @@ def reset_database(engine):
     target_metadata.drop_all(bind=engine)
     target_metadata.create_all(bind=engine)
 
+    # Built from the models, so already up to date
+    stamp(engine)
+
     logger.warning("Resetting database")
 
     if "MAKE_DEBUG_ENTRIES" in os.environ:
@@ -0,0 +1,374 @@
+"""
+The scoreboard: each player's shots fired, hits, kills and damage dealt.
+
+Rather than add every player's hits up from the shots table each time someone
+opens the scoreboard, running totals are kept per player in ``user_stats``
+(:class:`~backend.model.UserStats`). The interfaces update them in the same
+transaction as the shot they count:
+
+* submitting a shot fires it (:func:`record_shot`);
+* refunding it - by hand, or because the shooter was knocked out before it was
+  checked - takes it back (:func:`record_refund`);
+* marking it as a hit adds the hit, its damage and, if it knocked the target
+  out, a kill (:func:`record_hit`).
+
+Misses and bystanders change nothing: the shot was already fired. Deleting a
+player or resetting a game adjusts the totals to match the shots that remain.
+
+The totals are always what :func:`rebuild` would make from the shots, and
+:func:`check` says where they aren't:
+
+    python -m backend.scoreboard --check
+    python -m backend.scoreboard --rebuild
+
+On top of that, the scoreboard as shown to players is cached per game
+(:func:`get_cached_scoreboard`). The cache listens to the update events
+(:func:`backend.asyncio_triggers.add_listener`) and drops a game's scoreboard
+whenever something in it changes, so between changes the scoreboard costs no
+queries at all. Players' states are worked out each time it is shown, since
+knocked-out players die with the passing of time rather than a database write.
+"""
+
+import argparse
+import logging
+import os
+import threading
+from typing import Dict
+from typing import Hashable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+from uuid import UUID
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import ClauseElement
+
+from .asyncio_triggers import add_listener
+from .model import Shot
+from .model import Team
+from .model import User
+from .model import UserStats
+
+logger = logging.getLogger(__name__)
+
+STAT_NAMES = ("shots_fired", "hits", "kills", "damage_dealt")
+
+# Update events whose key is the id of the game they concern
+_GAME_EVENT_TYPES = {"shots", "ticker", "scoreboard"}
+
+
+class Row(NamedTuple):
+    user_id: UUID
+    name: str
+    team: str
+    hit_points: int
+    time_of_death: Optional[float]
+    shots_fired: int
+    hits: int
+    kills: int
+    damage_dealt: int
+
+
+def _bump(session: Session, user_id: UUID, **deltas: int) -> None:
+    """
+    Add ``deltas`` to a player's totals, as part of the session's transaction
+
+    The additions are made in SQL (``SET hits = hits + 1``) so that two
+    transactions counting shots by the same player at once can't lose one. The
+    session isn't flushed: the interfaces' @db_scoped wrappers tell whether a
+    call changed anything by what is still waiting to be flushed.
+    """
+    with session.no_autoflush:
+        stats = session.get(UserStats, user_id)
+
+        if stats is None:
+            stats = UserStats(user_id=user_id, **{name: 0 for name in STAT_NAMES})
+            session.add(stats)
+
+        for name, delta in deltas.items():
+            current = getattr(stats, name)
+            if stats in session.new or isinstance(current, ClauseElement):
+                setattr(stats, name, current + delta)
+            else:
+                setattr(stats, name, getattr(UserStats, name) + delta)
+
+
+def record_shot(session: Session, user_id: UUID) -> None:
+    _bump(session, user_id, shots_fired=1)
+
+
+def record_refund(session: Session, user_id: UUID, num_shots=1) -> None:
+    _bump(session, user_id, shots_fired=-num_shots)
+
+
+def record_hit(session: Session, user_id: UUID, damage: int, knocked_out: bool) -> None:
+    _bump(session, user_id, hits=1, damage_dealt=damage, kills=int(knocked_out))
+
+
+def record_target_removed(session: Session, user_id: UUID) -> None:
+    """Take back the hits on a player who is about to be deleted, whose shots
+    will no longer have a target"""
+    hits = (
+        session.query(
+            Shot.user_id,
+            sa.func.count(),
+            sa.func.sum(Shot.shot_damage),
+            sa.func.sum(sa.cast(Shot.knocked_out, sa.Integer)),
+        )
+        .filter(
+            Shot.target_user_id == user_id,
+            Shot.checked,
+            Shot.user_id != user_id,
+        )
+        .group_by(Shot.user_id)
+        .all()
+    )
+
+    for shooter_id, num_hits, damage, kills in hits:
+        _bump(
+            session,
+            shooter_id,
+            hits=-num_hits,
+            damage_dealt=-(damage or 0),
+            kills=-(kills or 0),
+        )
+
+
+def _computed_stats(session: Session) -> Dict[UUID, Tuple[int, int, int, int]]:
+    """Every player's totals, added up from the shots, as tuples in the order
+    of STAT_NAMES"""
+    is_hit = sa.and_(Shot.checked, Shot.target_user_id.is_not(None))
+
+    rows = (
+        session.query(
+            Shot.user_id,
+            sa.func.sum(
+                sa.case((sa.func.coalesce(Shot.result, "") != "refunded", 1), else_=0)
+            ),
+            sa.func.sum(sa.case((is_hit, 1), else_=0)),
+            sa.func.sum(sa.case((sa.and_(is_hit, Shot.knocked_out), 1), else_=0)),
+            sa.func.sum(sa.case((is_hit, Shot.shot_damage), else_=0)),
+        )
+        .group_by(Shot.user_id)
+        .all()
+    )
+
+    return {user_id: tuple(int(n or 0) for n in stats) for user_id, *stats in rows}
+
+
+def _stored_stats(session: Session) -> Dict[UUID, Tuple[int, int, int, int]]:
+    columns = [getattr(UserStats, name) for name in STAT_NAMES]
+    return {
+        user_id: tuple(stats)
+        for user_id, *stats in session.query(UserStats.user_id, *columns)
+    }
+
+
+def check(session: Session) -> List[str]:
+    """
+    How the stored totals differ from the shots, one line per player who is
+    wrong. Players with no shots needn't have a row.
+    """
+    computed = _computed_stats(session)
+    stored = _stored_stats(session)
+    zeros = (0,) * len(STAT_NAMES)
+
+    problems = []
+    for user_id in sorted(computed.keys() | stored.keys(), key=str):
+        expected = computed.get(user_id, zeros)
+        actual = stored.get(user_id, zeros)
+        if expected != actual:
+            problems.append(
+                f"{user_id}: "
+                + ", ".join(
+                    f"{name} is {a}, should be {e}"
+                    for name, a, e in zip(STAT_NAMES, actual, expected)
+                    if a != e
+                )
+            )
+
+    return problems
+
+
+def rebuild(session: Session) -> int:
+    """Replace every player's totals with ones added up from the shots, and
+    return how many players have them. Doesn't commit"""
+    computed = _computed_stats(session)
+
+    # Shots can outlive their shooter in an old database
+    existing_users = {user_id for (user_id,) in session.query(User.id)}
+
+    session.query(UserStats).delete()
+    session.add_all(
+        UserStats(user_id=user_id, **dict(zip(STAT_NAMES, stats)))
+        for user_id, stats in computed.items()
+        if user_id in existing_users
+    )
+    session.flush()
+
+    return len(computed.keys() & existing_users)
+
+
+def load_rows(session: Session, game_id: UUID) -> List[Row]:
+    """Everyone in the game and their totals, in one query"""
+    totals = [sa.func.coalesce(getattr(UserStats, name), 0) for name in STAT_NAMES]
+
+    rows = (
+        session.query(
+            User.id,
+            User.name,
+            Team.name,
+            User.hit_points,
+            User.time_of_death,
+            *totals,
+        )
+        .select_from(Team)
+        .join(User, User.team_id == Team.id)
+        .outerjoin(UserStats, UserStats.user_id == User.id)
+        .filter(Team.game_id == game_id)
+        .all()
+    )
+
+    return [Row(*row) for row in rows]
+
+
+def render(rows: List[Row]) -> dict:
+    table = [
+        {
+            "name": row.name,
+            "team": row.team,
+            "hitpoints": row.hit_points,
+            "total_damage": row.damage_dealt,
+            "hits": row.hits,
+            "kills": row.kills,
+            "shots_fired": row.shots_fired,
+            "state": User.calculate_state(row.team, row.hit_points, row.time_of_death),
+        }
+        for row in rows
+    ]
+
+    table = sorted(table, key=lambda t: t["total_damage"], reverse=True)
+
+    return {"table": table}
+
+
+class ScoreboardCache:
+    """
+    Each game's scoreboard rows, kept until something in the game changes
+
+    Each game has a generation, moved on by every change. A load notes the
+    generation before it starts and its rows are only kept if nothing changed
+    while it ran, so a load racing a change can't keep what the change made
+    out of date.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._generations: Dict[UUID, int] = {}
+        self._rows: Dict[UUID, Tuple[int, List[Row]]] = {}
+        self._games_by_user: Dict[UUID, UUID] = {}
+
+    def generation(self, game_id: UUID) -> int:
+        with self._lock:
+            return self._generations.setdefault(game_id, 0)
+
+    def get(self, game_id: UUID) -> Optional[List[Row]]:
+        with self._lock:
+            generation, rows = self._rows.get(game_id, (None, None))
+            if generation is None or generation != self._generations.get(game_id):
+                return None
+            return rows
+
+    def put(self, game_id: UUID, generation: int, rows: List[Row]) -> None:
+        with self._lock:
+            if generation != self._generations.get(game_id):
+                return
+            self._rows[game_id] = (generation, rows)
+            for row in rows:
+                self._games_by_user[row.user_id] = game_id
+
+    def invalidate(self, game_id: UUID) -> None:
+        with self._lock:
+            self._invalidate(game_id)
+
+    def invalidate_all(self) -> None:
+        with self._lock:
+            for game_id in list(self._generations):
+                self._invalidate(game_id)
+            self._games_by_user.clear()
+
+    def _invalidate(self, game_id: UUID) -> None:
+        self._generations[game_id] = self._generations.get(game_id, 0) + 1
+        self._rows.pop(game_id, None)
+
+    def on_update_event(self, event_type: str, key: Hashable) -> None:
+        if event_type in _GAME_EVENT_TYPES:
+            self.invalidate(key)
+        elif event_type == "user":
+            # A player we haven't seen may have just joined a game
+            game_id = self._games_by_user.get(key)
+            if game_id is None:
+                self.invalidate_all()
+            else:
+                self.invalidate(game_id)
+        elif event_type == "games":
+            self.invalidate_all()
+
+
+_cache = ScoreboardCache()
+add_listener(_cache.on_update_event)
+
+
+def get_cached_scoreboard(game_id: UUID) -> dict:
+    """The scoreboard for a game, from the cache if nothing has changed"""
+    from .database import session_scope
+
+    rows = _cache.get(game_id)
+
+    if rows is None:
+        generation = _cache.generation(game_id)
+        with session_scope() as session:
+            rows = load_rows(session, game_id)
+        _cache.put(game_id, generation, rows)
+
+    return render(rows)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check or rebuild player stats")
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument(
+        "--check", action="store_true", help="list stats that don't match the shots"
+    )
+    action.add_argument(
+        "--rebuild", action="store_true", help="recalculate every player's stats"
+    )
+    args = parser.parse_args(argv)
+
+    # Not through backend.database: importing that migrates the database
+    from .dotenv import load_env_vars
+    from .engine_config import make_engine
+
+    load_env_vars()
+    engine = make_engine(os.environ["DATABASE_URL"])
+
+    with Session(bind=engine) as session:
+        if args.rebuild:
+            num_users = rebuild(session)
+            session.commit()
+            print(f"Rebuilt the stats of {num_users} players")
+            return 0
+
+        problems = check(session)
+
+    for problem in problems:
+        print(problem)
+    print(f"{len(problems)} players' stats don't match their shots")
+
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
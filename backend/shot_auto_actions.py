@@ -53,6 +53,14 @@ def process_queue_head(game_id: UUID) -> None:
     in. Races with an admin resolving the same shot are expected: the
     resolvers 400 on an already-checked shot, and the re-read sees the truth.
     """
+    from .database import unit_of_work
+
+    # Every AdminInterface below shares one session
+    with unit_of_work():
+        _drain_queue(game_id)
+
+
+def _drain_queue(game_id: UUID) -> None:
     from .admin_interface import AdminInterface
 
     if not AdminInterface().is_ai_auto_actions_enabled(game_id):
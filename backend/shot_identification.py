@@ -62,6 +62,7 @@ from .identity.scheme import IdentityScheme
 from .model import ShotModel
 from .model import UserModel
 from .shot_vision import reading_from_review
+from .spatial import LocalProjection
 
 logger = logging.getLogger(__name__)
 
@@ -99,6 +100,10 @@ PRIOR_FLOOR = 0.02
 
 _EARTH_RADIUS_M = 6_371_000.0
 
+# Beyond this distance from the shooter Λ_x is 1 whatever the fix's age: it
+# peaks, over sigma_eff, at d = sqrt(A / (π e)) -- about 340 m for A = 1 km^2
+_MAX_EVIDENCE_DISTANCE_M = math.sqrt(GAME_AREA_M2 / (math.pi * math.e))
+
 
 def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """Great-circle distance in metres."""
@@ -142,6 +147,22 @@ def parse_location_context(raw: Optional[str]) -> Dict[UUID, dict]:
     return fixes
 
 
+def location_fixes(shot) -> Dict[UUID, dict]:
+    """``{user_id: fix}`` for everyone's position when the shot was taken.
+
+    Looked up in the location history at the shot's ``location_time``; shots
+    from before the history carry their own JSON snapshot instead.
+    """
+    location_time = getattr(shot, "location_time", None)
+    if location_time is None:
+        return parse_location_context(shot.location_context)
+
+    from .admin_interface import AdminInterface
+
+    positions = AdminInterface().get_positions_at(shot.game_id, location_time)
+    return {user_id: fix._asdict() for user_id, fix in positions.items()}
+
+
 def _effective_sigma_m(fix: dict, at_time: float) -> float:
     """How uncertain this player's *current* position is, given the fix's age.
 
@@ -190,21 +211,32 @@ def location_likelihood_ratios(
     if shooter_fix is None:
         return {pid: 1.0 for pid in candidate_ids}
 
-    ratios: Dict[UUID, float] = {}
-    for pid in candidate_ids:
-        fix = fixes.get(pid)
-        if fix is None:
-            ratios[pid] = 1.0
+    # Distances on a flat grid centred on the shooter: over the distances that
+    # can make a difference here that is as good as a haversine, and cheaper
+    shooter_lat = float(shooter_fix["latitude"])
+    shooter_lon = float(shooter_fix["longitude"])
+    projection = LocalProjection(shooter_lat, shooter_lon)
+
+    located = [pid for pid in candidate_ids if pid in fixes]
+    squared_distances = projection.squared_distances_m2(
+        shooter_lat,
+        shooter_lon,
+        (
+            (float(fixes[pid]["latitude"]), float(fixes[pid]["longitude"]))
+            for pid in located
+        ),
+    )
+
+    ratios: Dict[UUID, float] = {pid: 1.0 for pid in candidate_ids}
+    for pid, squared_distance in zip(located, squared_distances):
+        if squared_distance > _MAX_EVIDENCE_DISTANCE_M**2:
+            # Too far away to be evidence of anything, however fresh the fix
             continue
-        sigma = _effective_sigma_m(fix, at_time)
+        sigma = _effective_sigma_m(fixes[pid], at_time)
         spread_area = 2 * math.pi * sigma**2
-        distance = haversine_m(
-            float(shooter_fix["latitude"]),
-            float(shooter_fix["longitude"]),
-            float(fix["latitude"]),
-            float(fix["longitude"]),
+        ratio = (GAME_AREA_M2 / spread_area) * math.exp(
+            -squared_distance / (2 * sigma**2)
         )
-        ratio = (GAME_AREA_M2 / spread_area) * math.exp(-(distance**2) / (2 * sigma**2))
         ratios[pid] = max(1.0, ratio)
     return ratios
 
@@ -292,12 +324,16 @@ def rank_candidates(
     review: dict,
     scheme: Optional[IdentityScheme] = None,
     at_time: Optional[float] = None,
+    fixes: Optional[Dict[UUID, dict]] = None,
 ) -> Optional[DecodeResult]:
     """Rank the living players by how well they explain this shot's photograph.
 
     Returns ``None`` when there is nobody to rank. Every candidate keeps a
     non-zero posterior, so the caller decides what is good enough to act on --
     this function never refuses on its own account.
+
+    ``fixes`` is ``{user_id: fix}`` for everyone's position when the shot was
+    taken, looked up with :func:`location_fixes` if not given.
     """
     scheme = scheme or default_scheme()
     candidates = eligible_candidates(users, shot.user_id)
@@ -310,7 +346,8 @@ def rank_candidates(
     candidates = [user for user in candidates if user.id in words]
 
     at_time = at_time if at_time is not None else time.time()
-    fixes = parse_location_context(shot.location_context)
+    if fixes is None:
+        fixes = location_fixes(shot)
     shooter = next((u for u in users if u.id == shot.user_id), None)
 
     # The candidates' own separation, not the code's nominal d: an overridden
@@ -0,0 +1,263 @@
+"""
+Shot photos served as images, for browsers and proxies to cache.
+
+``/api/shot_image?shot_id=...&rendition=...`` answers with the image's bytes
+rather than a base64 data URL inside JSON. A shot's photo never changes, so
+neither does anything drawn from it, and each response says so:
+
+* a strong ``ETag`` made from the photo's SHA-256 (``Shot.image_hash``) and
+  the rendition, which is named with its version;
+* ``Cache-Control: private, max-age=31536000, immutable``. Private, since only
+  the admin and the shooter may see a photo;
+* ``304 Not Modified`` for an ``If-None-Match`` that matches, without reading
+  or rendering the image at all;
+* a single byte range (``Range: bytes=...``), answered with ``206``, so a
+  dropped download on a phone can carry on where it stopped.
+
+The renditions are the original photo, each of the image cache's transforms
+(:data:`backend.image_cache.TRANSFORMS`: the queue's crosshair, what the
+vision model is sent, a thumbnail) and the crosshair annotated with who fired
+and what they hit. The annotation changes as the shot is checked, so that one
+is revalidated each time (``no-cache``) with an ETag that covers the text.
+
+Players may only fetch the original and the thumbnail of their own shots.
+Anyone else's shot is a 404, as in ``/api/user_shot_image``.
+"""
+
+import hashlib
+import json
+import re
+from typing import Callable
+from typing import Mapping
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+from uuid import UUID
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from sqlalchemy.orm import aliased
+from starlette.responses import Response
+
+from .blob_store import get_blob_store
+from .blob_store import make_data_url
+from .blob_store import split_data_url
+from .image_cache import CROSS
+from .image_cache import THUMBNAIL
+from .image_cache import TRANSFORMS
+from .image_cache import get_image_cache
+from .image_processing import annotate_image_with_stats
+from .model import Shot
+from .model import User
+
+ORIGINAL = "original"
+# The crosshair with the shooter, damage and result written on
+ANNOTATED = "annotated-v1"
+
+RENDITIONS = {ORIGINAL, ANNOTATED, *TRANSFORMS}
+PLAYER_RENDITIONS = {ORIGINAL, THUMBNAIL}
+
+IMMUTABLE = "private, max-age=31536000, immutable"
+REVALIDATE = "private, no-cache"
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class ShotImage(NamedTuple):
+    """How to answer for one rendition of a shot's photo. ``load`` returns
+    (MIME type, bytes) and doesn't need the database session"""
+
+    etag: str
+    cache_control: str
+    load: Callable[[], Tuple[str, bytes]]
+
+
+def annotation_stats(
+    shooter_name: str,
+    shot_damage: int,
+    checked: bool,
+    result: Optional[str],
+    target_name: Optional[str],
+) -> dict:
+    """The text written on an annotated shot. ``target_name`` is set for a hit"""
+    if not checked:
+        status = "Unchecked"
+    elif target_name:
+        status = f"Hit {target_name}"
+    elif result == "bystander":
+        status = "Hit a bystander"
+    else:
+        status = "Missed / refunded"
+
+    return {
+        "Shooter": shooter_name,
+        "Damage": shot_damage,
+        "Result": status,
+    }
+
+
+def find(
+    session: Session,
+    shot_id: UUID,
+    rendition: str,
+    shooter_id: Optional[UUID] = None,
+) -> ShotImage:
+    """
+    Look up a rendition of a shot's photo without loading it. With
+    ``shooter_id``, only a player's own shots, in the renditions players get.
+
+    Raises:
+        HTTPException: 404 if the rendition or the shot is unknown, or not
+        the player's to see
+    """
+    if rendition not in RENDITIONS or (
+        shooter_id is not None and rendition not in PLAYER_RENDITIONS
+    ):
+        raise HTTPException(404, f"No image rendition {rendition!r}")
+
+    shooter = aliased(User)
+    target = aliased(User)
+    row = (
+        session.query(
+            Shot.user_id,
+            Shot.image_hash,
+            Shot.image_type,
+            Shot.checked,
+            Shot.result,
+            Shot.shot_damage,
+            shooter.name,
+            target.name,
+        )
+        .outerjoin(shooter, shooter.id == Shot.user_id)
+        .outerjoin(target, target.id == Shot.target_user_id)
+        .filter(Shot.id == shot_id)
+        .first()
+    )
+
+    if row is None or (shooter_id is not None and row.user_id != shooter_id):
+        raise HTTPException(404, f"Shot {shot_id} not found")
+
+    _, image_hash, image_type, checked, result, damage, name, target_name = row
+
+    if image_hash:
+        base_tag = image_hash
+
+        def load_original() -> Tuple[str, bytes]:
+            return image_type, get_blob_store().get(image_hash)
+
+    else:
+        # From before the blob store: the photo is still in the shots table
+        base_tag = f"shot-{UUID(str(shot_id)).hex}"
+        legacy = (
+            session.query(Shot.legacy_image_base64).filter(Shot.id == shot_id).scalar()
+        )
+
+        def load_original() -> Tuple[str, bytes]:
+            return split_data_url(legacy)
+
+    def source() -> str:
+        return make_data_url(*load_original())
+
+    if rendition == ORIGINAL:
+        return ShotImage(f'"{base_tag}"', IMMUTABLE, load_original)
+
+    if rendition in TRANSFORMS:
+        return ShotImage(
+            f'"{base_tag}.{rendition}"',
+            IMMUTABLE,
+            lambda: split_data_url(get_image_cache().get(shot_id, rendition, source)),
+        )
+
+    stats = annotation_stats(name, damage, checked, result, target_name)
+    text_tag = hashlib.sha256(json.dumps(stats).encode()).hexdigest()[:16]
+
+    def load_annotated() -> Tuple[str, bytes]:
+        crossed = get_image_cache().get(shot_id, CROSS, source)
+        return split_data_url(annotate_image_with_stats(crossed, stats))
+
+    return ShotImage(f'"{base_tag}.{rendition}.{text_tag}"', REVALIDATE, load_annotated)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """Whether an If-None-Match lists ``etag``. Weak comparison, as RFC 9110
+    asks for this header"""
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    The first and last byte asked for by a Range header, or None for the whole
+    image: no header, one we don't understand, or several ranges. The RFC
+    lets a server ignore a Range, and nobody asks for several of an image.
+
+    Raises:
+        RangeNotSatisfiable: if the range starts past the end of the image
+    """
+    if not header:
+        return None
+
+    match = _RANGE_PATTERN.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+
+    first, last = match.groups()
+
+    if not first:
+        # The last n bytes
+        if int(last) == 0:
+            raise RangeNotSatisfiable(header)
+        return max(0, size - int(last)), size - 1
+
+    first = int(first)
+    if last and int(last) < first:
+        return None
+    if first >= size:
+        raise RangeNotSatisfiable(header)
+
+    return first, size - 1 if not last else min(int(last), size - 1)
+
+
+def make_response(image: ShotImage, headers: Mapping[str, str]) -> Response:
+    """
+    Answer a request for ``image``, whose headers are ``headers``: 304 if the
+    browser has it already, else the image or the part of it asked for. Only
+    loads the image if it has to
+    """
+    validators = {"ETag": image.etag, "Cache-Control": image.cache_control}
+
+    if_none_match = headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, image.etag):
+        return Response(status_code=304, headers=validators)
+
+    mime_type, data = image.load()
+    validators["Accept-Ranges"] = "bytes"
+
+    # A range of a different version of the image would be garbage: If-Range
+    # says which version the client has the rest of
+    if_range = headers.get("if-range")
+    if if_range and if_range.strip() != image.etag:
+        return Response(data, media_type=mime_type, headers=validators)
+
+    try:
+        byte_range = parse_range(headers.get("range"), len(data))
+    except RangeNotSatisfiable:
+        return Response(
+            status_code=416,
+            headers={**validators, "Content-Range": f"bytes */{len(data)}"},
+        )
+
+    if byte_range is None:
+        return Response(data, media_type=mime_type, headers=validators)
+
+    first, last = byte_range
+    return Response(
+        data[first : last + 1],
+        status_code=206,
+        media_type=mime_type,
+        headers={**validators, "Content-Range": f"bytes {first}-{last}/{len(data)}"},
+    )
@@ -0,0 +1,192 @@
+"""
+Distances between players, and which players are near a point.
+
+A game is played over a couple of km, and over that distance the Earth is flat
+to well within a GPS fix's accuracy. So rather than a haversine per pair of
+points - four trig functions, a square root and an arcsine - positions are
+projected onto a flat local grid in metres around an origin
+(:class:`LocalProjection`, an equirectangular projection), after which a
+distance is a subtraction, two multiplications and a square root. Comparing
+against a radius doesn't even need the square root.
+
+"Who is within r metres of here" is a scan of everybody's projected
+positions (:func:`points_within`). For many queries against the same
+positions, :class:`GridIndex` buckets them into cells, so that each query only
+looks at the players in the cells that the circle touches. The cells are a fixed size in
+degrees, chosen to be about ``cell_size_m`` across at the venue, so the index
+still works - just less efficiently - for positions far from it.
+"""
+
+import math
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict
+from typing import Generic
+from typing import Hashable
+from typing import Iterable
+from typing import List
+from typing import Tuple
+from typing import TypeVar
+
+# Mean radius, as used by shot_identification.haversine_m
+EARTH_RADIUS_M = 6_371_000.0
+
+METRES_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+DEFAULT_CELL_SIZE_M = 50.0
+
+# A query touching more cells than this scans every point instead
+_MAX_CELLS_PER_QUERY = 400
+
+Key = TypeVar("Key", bound=Hashable)
+
+
+class LocalProjection:
+    """Positions as (x, y) in metres east and north of an origin.
+
+    Accurate to a fraction of a percent for points within a few km of the
+    origin, and for distances between points near each other anywhere around
+    it. Distances between points far from the origin are stretched or squashed
+    east-west, so centre the projection on whatever is being measured from.
+    """
+
+    def __init__(self, origin_lat: float, origin_lon: float) -> None:
+        self.origin_lat = origin_lat
+        self.origin_lon = origin_lon
+        self.m_per_deg_lat = METRES_PER_DEGREE
+        self.m_per_deg_lon = METRES_PER_DEGREE * math.cos(math.radians(origin_lat))
+
+    def to_xy(self, lat: float, lon: float) -> Tuple[float, float]:
+        return (
+            (lon - self.origin_lon) * self.m_per_deg_lon,
+            (lat - self.origin_lat) * self.m_per_deg_lat,
+        )
+
+    def distance_m(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+        dx = (lon2 - lon1) * self.m_per_deg_lon
+        dy = (lat2 - lat1) * self.m_per_deg_lat
+        return math.sqrt(dx * dx + dy * dy)
+
+    def squared_distances_m2(
+        self, lat: float, lon: float, points: Iterable[Tuple[float, float]]
+    ) -> List[float]:
+        """Squared distances in m^2 from (lat, lon) to each (lat, lon) in
+        ``points``, in order"""
+        kx, ky = self.m_per_deg_lon, self.m_per_deg_lat
+        return [
+            ((p_lon - lon) * kx) ** 2 + ((p_lat - lat) * ky) ** 2
+            for p_lat, p_lon in points
+        ]
+
+    def distances_m(
+        self, lat: float, lon: float, points: Iterable[Tuple[float, float]]
+    ) -> List[float]:
+        """Distances in metres from (lat, lon) to each (lat, lon) in
+        ``points``, in order"""
+        return [math.sqrt(d2) for d2 in self.squared_distances_m2(lat, lon, points)]
+
+
+@lru_cache(maxsize=None)
+def venue_projection() -> LocalProjection:
+    """A projection centred on the middle of the active venue's map"""
+    from .venues import ACTIVE_VENUE
+
+    bounds = ACTIVE_VENUE.map.bounds
+    return LocalProjection(
+        (bounds.north + bounds.south) / 2, (bounds.east + bounds.west) / 2
+    )
+
+
+class GridIndex(Generic[Key]):
+    """Points, by key, bucketed into cells for "what's near here" queries"""
+
+    def __init__(
+        self, projection: LocalProjection = None, cell_size_m=DEFAULT_CELL_SIZE_M
+    ) -> None:
+        projection = projection or venue_projection()
+        self._cell_lat = cell_size_m / projection.m_per_deg_lat
+        self._cell_lon = cell_size_m / projection.m_per_deg_lon
+
+        self._points: Dict[Key, Tuple[float, float]] = {}
+        self._cells: Dict[Tuple[int, int], Dict[Key, Tuple[float, float]]] = (
+            defaultdict(dict)
+        )
+
+    @classmethod
+    def from_points(
+        cls, points: Dict[Key, Tuple[float, float]], **kwargs
+    ) -> "GridIndex[Key]":
+        index = cls(**kwargs)
+        for key, (lat, lon) in points.items():
+            index.set(key, lat, lon)
+        return index
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (math.floor(lat / self._cell_lat), math.floor(lon / self._cell_lon))
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def set(self, key: Key, lat: float, lon: float) -> None:
+        """Add a point, or move it"""
+        self.remove(key)
+        self._points[key] = (lat, lon)
+        self._cells[self._cell(lat, lon)][key] = (lat, lon)
+
+    def remove(self, key: Key) -> None:
+        point = self._points.pop(key, None)
+        if point is None:
+            return
+
+        cell = self._cell(*point)
+        del self._cells[cell][key]
+        if not self._cells[cell]:
+            del self._cells[cell]
+
+    def within(
+        self, lat: float, lon: float, radius_m: float
+    ) -> List[Tuple[Key, float]]:
+        """``(key, distance in metres)`` for every point within ``radius_m``
+        of (lat, lon), nearest first"""
+        # Measure from the query point, wherever it is
+        projection = LocalProjection(lat, lon)
+
+        d_lat = radius_m / projection.m_per_deg_lat
+        d_lon = radius_m / max(projection.m_per_deg_lon, 1e-9)
+        south, west = self._cell(lat - d_lat, lon - d_lon)
+        north, east = self._cell(lat + d_lat, lon + d_lon)
+
+        if (north - south + 1) * (east - west + 1) > _MAX_CELLS_PER_QUERY:
+            candidates = self._points.items()
+        else:
+            candidates = [
+                item
+                for i in range(south, north + 1)
+                for j in range(west, east + 1)
+                for item in self._cells.get((i, j), {}).items()
+            ]
+
+        return points_within(candidates, lat, lon, radius_m)
+
+
+def points_within(
+    points: Iterable[Tuple[Key, Tuple[float, float]]],
+    lat: float,
+    lon: float,
+    radius_m: float,
+) -> List[Tuple[Key, float]]:
+    """``(key, distance in metres)`` for every ``(key, (lat, lon))`` in
+    ``points`` within ``radius_m`` of (lat, lon), nearest first. A scan of them
+    all: cheaper than building a :class:`GridIndex` for a single query"""
+    points = list(points)
+
+    # Measure from the query point, wherever it is
+    projection = LocalProjection(lat, lon)
+    squared = projection.squared_distances_m2(lat, lon, (point for _, point in points))
+
+    radius2 = radius_m * radius_m
+    found = [
+        (key, math.sqrt(d2)) for (key, _), d2 in zip(points, squared) if d2 <= radius2
+    ]
+    found.sort(key=lambda item: item[1])
+    return found
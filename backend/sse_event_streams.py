@@ -5,200 +5,77 @@ This module provides functionality for generating Server-Sent Events (SSE) updat
 It includes functions to create SSE update messages, generate updates for users, and generate updates for administrators.
 """
 
-import asyncio
-import json
 import logging
-from typing import AsyncGenerator
+from typing import Optional
 
-from .admin_interface import AdminInterface
-from .circles import generate_circle_updates
+from . import sse_hub
 from .user_interface import UserInterface
 
-# How often to send keepalive messages
-SSE_KEEPALIVE_TIMEOUT = 15
-
 logger = logging.getLogger(__name__)
 
 
-def make_sse_update_message(m):
-    out = f"data: {m}\n\n"
-    logger.debug('make_sse_update_message - "%s"', out)
-    return out
-
-
-async def updates_generator(user_id):
+async def updates_generator(
+    user_id,
+    last_event_id: Optional[str] = None,
+    coalesce_ms: Optional[int] = None,
+    payloads: bool = False,
+    ticker_since: Optional[int] = None,
+):
     """
     Yields SSE update prompts that should be received by a given user
 
     This generator just sends out bumps to prompt clients to refresh themselves.
 
-    This is an async generator - it will collect messages from all relevant
-    source for this user (including global announcements) and include keepalive
-    events.
-    """
+    The prompts come from this user's game's :class:`~.sse_hub.GameHub`, which
+    watches the user's own events, their game's ticker and circles, and adds
+    keepalive events. If the user changes team, the hub closes the stream to
+    prompt a reload.
 
-    team_id = UserInterface(user_id).get_team_id()
-    game_id = UserInterface(user_id).get_game_id()
+    A client resuming a stream from ``last_event_id`` is only prompted to
+    refresh the things that changed while it was away.
 
-    update_user = make_sse_update_message(
-        json.dumps({"handler": "update_prompt", "data": "user"})
-    )
-    update_ticker = make_sse_update_message(
-        json.dumps({"handler": "update_prompt", "data": "ticker"})
-    )
-    update_circles = make_sse_update_message(
-        json.dumps({"handler": "update_prompt", "data": "circle"})
-    )
+    Prompts arriving within ``coalesce_ms`` of each other are sent together as
+    one update mask. Defaults to ``SSE_COALESCE_MS``: see :mod:`.sse_hub`.
 
-    yield update_user
-    yield update_ticker
-    yield update_circles
-
-    # An asyncio queue to pass to the generators
-    queue = asyncio.Queue()
-
-    # A function that logs a message every time an async generator yields
-    async def feed_generator_to_queue(generator: AsyncGenerator, message: str) -> None:
-        async for data in generator:
-            logger.debug(
-                'feed_generator_to_queue (UID %s) - Received message "%s" from %s',
-                user_id,
-                data,
-                message,
-            )
-            await queue.put((message, data))
-
-    # A function that yields from the queue as soon as items arrive
-    async def yield_from_queue() -> AsyncGenerator:
-        while True:
-            msg = await asyncio.wait_for(queue.get(), timeout=None)
-            logger.debug(
-                "yield_from_queue (UID %s) - Yielding message %s", user_id, msg
-            )
-            yield msg
-
-    # Keep track of the asyncio tasks we start for producers
-    producers = []
+    With ``payloads``, the stream carries the changed data itself rather than
+    prompts to refetch it, starting from the ticker entries after
+    ``ticker_since``: see :mod:`.sse_payloads`. Data frames are never
+    coalesced.
+    """
 
-    logger.debug("updates_generator - User updates for user %s starting", user_id)
+    if payloads:
+        coalesce_window = 0
+    elif coalesce_ms is None:
+        coalesce_window = sse_hub.default_coalesce_window()
+    else:
+        coalesce_window = max(0, coalesce_ms) / 1000
 
-    # Start a producer for user events:
     with UserInterface(user_id) as ui:
-        user_event_generator = ui.generate_user_updates()
-
-    producers.append(
-        asyncio.create_task(feed_generator_to_queue(user_event_generator, "user")),
-    )
-
-    # Start a producer which will watch for the user changing team / game. If
-    # this happens, it'll close this connection, prompting a reload
-    async def changed_team_generator():
-        logger.debug(
-            "change_team_generator - Watching for change of team for user %s", user_id
-        )
-
-        ui = UserInterface(user_id)
+        team_id = ui.get_team_id()
+        game_id = ui.get_game_id()
 
-        initial_team_id = ui.get_team_id()  # Might be "none"
-
-        logger.debug(
-            "User %s is in team %s. Waiting for update", user_id, initial_team_id
-        )
-
-        # Check if the user is in a team
-        while ui.get_team_id() == initial_team_id:
-            # generate_updates does not interact with the database session, so
-            # will not block other database requests
-            await anext(ui.generate_user_updates())
-
-        logger.debug("User %s has changed team. Closing connection", user_id)
-
-        yield None
-        await asyncio.sleep(1e10)
-
-    # Queue the changed_team_generator
-    producers.append(
-        asyncio.create_task(
-            feed_generator_to_queue(changed_team_generator(), "changed_team")
-        )
-    )
+    logger.debug("updates_generator - User updates for user %s starting", user_id)
 
-    # Watch the user ticker if they're in a team
-    if team_id is not None:
-
-        async def ticker_generator():
-            logger.debug(
-                "updates_generator - User is in game, mounting to game ticker for user %s",
-                user_id,
-            )
-            # Yield one update immediately to refresh the ticker
-            yield None
-
-            # Then yield from the ticker
-            async for x in UserInterface(user_id).generate_ticker_updates():
-                logger.debug(
-                    "updates_generator - Forwarding ticker event for user %s", user_id
-                )
-                yield x
-
-        # Queue the ticker generator
-        producers.append(
-            asyncio.create_task(feed_generator_to_queue(ticker_generator(), "ticker"))
-        )
-
-    # Add a keepalive producer
-    async def keepalive_timer(timeout=SSE_KEEPALIVE_TIMEOUT):
-        logger.debug("Starting keepalive timer")
-
-        i = 0
-
-        while True:
-            await asyncio.sleep(timeout)
-            logger.debug("Sending keepalive message %s", i)
-            yield i
-            i += 1
-
-    producers.append(
-        asyncio.create_task(feed_generator_to_queue(keepalive_timer(), "keepalive"))
+    # Subscribe before sending the initial prompts, so that nothing which
+    # happens in between is missed
+    connection = sse_hub.connect(
+        user_id,
+        game_id=game_id,
+        team_id=team_id,
+        coalesce_window=coalesce_window,
+        payloads=payloads,
     )
 
-    # Watch for circle updates if the user is in a game
-    if game_id:
-        producers.append(
-            asyncio.create_task(
-                feed_generator_to_queue(
-                    generate_circle_updates(game_id=game_id), "circle"
-                )
-            )
-        )
-
-    # Iterate through the consumer:
     try:
-        async for target, data in yield_from_queue():
-            logger.debug(
-                'updates_generator (UID%s) - Received message from queue: target "%s", data "%s"',
-                user_id,
-                target,
-                data,
-            )
-            if target == "user":
-                yield update_user
-            elif target == "ticker":
-                yield update_ticker
-            elif target == "circle":
-                yield update_circles
-            elif target == "changed_team":
-                # Close the connection to force a reload
-                return
-            elif target == "keepalive":
-                yield make_sse_update_message(
-                    json.dumps({"handler": "keepalive", "data": data})
-                )
-            else:
-                logger.error('Unknown update target "%s"', target)
+        for frame in await sse_hub.catch_up_frames(
+            connection, last_event_id, ticker_since
+        ):
+            yield frame
+
+        async for frame in connection.frames():
+            yield frame
     finally:
-        for task in producers:
-            task.cancel()
+        sse_hub.disconnect(connection)
 
 
 async def admin_updates_generator():
@@ -206,27 +83,19 @@ async def admin_updates_generator():
     Asynchronous generator that yields Server-Sent Events (SSE) updates for the
     admin interface.
 
-    This just prompts an update any time anything happens in any game. Very
-    inefficient, but who cares, there's only one admin and it's me.
+    Every prompt names the panel to refresh ("admin", "circle" or "shots") and
+    the game it concerns. The prompts come from the
+    :class:`~.sse_hub.AdminHub`, which subscribes to every game once and hears
+    about new games through the "games" event.
     """
 
-    update_admin = make_sse_update_message(
-        json.dumps({"handler": "update_prompt", "data": "admin"})
-    )
-    update_circle = make_sse_update_message(
-        json.dumps({"handler": "update_prompt", "data": "circle"})
-    )
-    update_shots = make_sse_update_message(
-        json.dumps({"handler": "update_prompt", "data": "shots"})
-    )
+    connection = await sse_hub.connect_admin()
 
-    yield update_admin
-    yield update_circle
-    yield update_shots
+    try:
+        for frame in sse_hub.admin_catch_up_frames():
+            yield frame
 
-    async for _ in AdminInterface().generate_any_game_updates():
-        logger.debug("(admin_updates_generator) Update received - sending")
-        # Lazily update the circle, the admin stats and the shot queue each time
-        yield update_admin
-        yield update_circle
-        yield update_shots
+        async for frame in connection.frames():
+            yield frame
+    finally:
+        sse_hub.disconnect(connection)
@@ -0,0 +1,785 @@
+"""
+sse_hub.py
+
+A shared fan-out point for the player SSE streams.
+
+Each /api/sse_updates connection used to start its own queue plus a producer
+task per update source (user, changed team, ticker, circle, keepalive), so 150
+players meant ~750 tasks, all waiting on the same handful of asyncio_triggers
+events. Instead, every game gets one :class:`GameHub`. The hub runs exactly one
+watcher task per (event_type, key) that somebody is subscribed to, renders each
+frame once, and pushes it into the small buffer of every connection that wants
+it. A single keepalive ticker serves every connection in every game.
+
+Players who are not in a game yet share the hub for ``game_id=None``, where
+the only subscriptions are their own user events. Admin streams have a hub of
+their own, :class:`AdminHub`, which watches every game.
+
+Prompts carry an asyncio_triggers sequence number as their SSE id. A client
+that reconnects with that id (the browser's ``Last-Event-ID`` header, or the
+``last_event_id`` query parameter) is only re-prompted for what it missed:
+see :func:`catch_up_frames`. Sequence numbers are shared by every key but
+frames are not always sent in their order, so the id a connection sends is
+never past a prompt still waiting in its buffer: see :class:`SSEConnection`.
+
+A burst of triggers (a hit fires user, ticker and shot events back to back)
+would otherwise send one prompt, and so one client refetch, per trigger. Each
+connection can instead coalesce its prompts: after the first one arrives it
+waits a short window, then sends everything that piled up as a single
+``update_mask`` frame whose data is a bitmask of :data:`PROMPT_BITS`. Set the
+window with ``SSE_COALESCE_MS`` or per stream with the ``coalesce_ms`` query
+parameter; 0 sends every prompt as its own ``update_prompt`` frame. The hub
+counts how many prompts never needed a frame of their own: see
+:func:`get_stats`.
+
+Connections opened in payload mode are sent the changed data itself rather
+than prompts, loaded and rendered once per game: see :mod:`.sse_payloads`.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from functools import reduce
+from typing import Deque
+from typing import Dict
+from typing import Hashable
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+from uuid import UUID
+
+from .asyncio_triggers import events_since
+from .asyncio_triggers import format_event_id
+from .asyncio_triggers import latest_sequence
+from .asyncio_triggers import parse_event_id
+from .asyncio_triggers import wait_for_event
+from .database_scope_provider import run_in_db_thread
+
+# How often to send keepalive messages
+SSE_KEEPALIVE_TIMEOUT = 15
+
+# How long a connection waits for more prompts before sending what it has
+DEFAULT_COALESCE_MS = 100
+
+# The bits of an update_mask frame. Must match UPDATE_MASK_BITS in
+# react-ui/src/UpdateListener.js
+PROMPT_BITS = {"user": 1, "ticker": 2, "circle": 4}
+
+logger = logging.getLogger(__name__)
+
+
+def make_sse_update_message(m, event_id: Optional[str] = None):
+    out = f"data: {m}\n\n"
+    if event_id is not None:
+        out = f"id: {event_id}\n" + out
+    logger.debug('make_sse_update_message - "%s"', out)
+    return out
+
+
+def make_prompt_frame(target: str, event_id: Optional[str] = None) -> str:
+    """
+    An update prompt for ``target``. An empty ``event_id`` clears the client's
+    last event id
+    """
+    return make_sse_update_message(
+        json.dumps({"handler": "update_prompt", "data": target}), event_id=event_id
+    )
+
+
+def make_admin_prompt_frame(panel: str, game_id: Optional[UUID] = None) -> str:
+    """
+    An update prompt for the admin page's ``panel``, about ``game_id``, or about
+    every game if that is None
+    """
+    message = {"handler": "update_prompt", "data": panel}
+    if game_id is not None:
+        message["game_id"] = str(game_id)
+    return make_sse_update_message(json.dumps(message))
+
+
+def make_mask_frame(mask: int, event_id: Optional[str] = None) -> str:
+    """One frame prompting every target whose bit is set in ``mask``"""
+    return make_sse_update_message(
+        json.dumps({"handler": "update_mask", "data": mask}), event_id=event_id
+    )
+
+
+def default_coalesce_window() -> float:
+    """The coalescing window in seconds, from ``SSE_COALESCE_MS``"""
+    raw = os.getenv("SSE_COALESCE_MS")
+    if not raw:
+        return DEFAULT_COALESCE_MS / 1000
+    try:
+        return max(0, int(raw)) / 1000
+    except ValueError:
+        logger.warning(
+            "Ignoring unparseable SSE_COALESCE_MS=%r; using %s",
+            raw,
+            DEFAULT_COALESCE_MS,
+        )
+        return DEFAULT_COALESCE_MS / 1000
+
+
+class SSEConnection:
+    """
+    One client's end of the hub: a buffer of rendered frames waiting to be
+    written to its response, and an event to wake the writer.
+
+    Update prompts are idempotent, so a newer prompt of a kind replaces one
+    of the same kind that is still waiting in the buffer. That keeps the
+    buffer tiny even if the client stops reading for a while.
+
+    With a ``coalesce_window`` (in seconds), the writer holds off for that long
+    after a prompt arrives and then sends all the waiting prompts as one
+    ``update_mask`` frame.
+
+    With ``payloads``, the connection is sent data frames instead of prompts.
+    Its ``ticker_cursor`` is the id of the newest ticker entry it has been sent.
+
+    Frames are buffered without an SSE id, and given one as they are sent: the
+    sequence number the client can resume from. That is the newest sent so
+    far, unless an older one is still in the buffer, in which case it is the
+    one before that. A client that reconnects after getting a ticker prompt
+    is then still prompted for a user event that was waiting behind it. An
+    event whose data is still being loaded is :meth:`held <hold>` back the
+    same way.
+    """
+
+    def __init__(
+        self,
+        user_id: UUID,
+        game_id: Optional[UUID],
+        team_id: Optional[UUID],
+        coalesce_window: float = 0,
+        payloads: bool = False,
+    ) -> None:
+        self.user_id = user_id
+        self.game_id = game_id
+        self.team_id = team_id
+        self.coalesce_window = coalesce_window
+        self.payloads = payloads
+        self.ticker_cursor = 0
+        # Which hub this connection belongs to
+        self.hub_key: Hashable = game_id
+        self.closed = False
+        self.subscriptions: List[Tuple[str, Hashable]] = []
+
+        # Prompts received, and how many of those were folded into another
+        self.num_prompts = 0
+        self.num_suppressed = 0
+
+        # (kind, rendered frame, sequence number)
+        self._frames: Deque[Tuple[Optional[str], str, Optional[int]]] = deque()
+        self._wakeup = asyncio.Event()
+        # The newest sequence number sent, and those on their way
+        self._newest_sent = 0
+        self._held: List[int] = []
+
+    def push(
+        self, frame: str, kind: Optional[str] = None, sequence: Optional[int] = None
+    ) -> None:
+        """
+        Buffer a frame. A frame with a ``kind`` is an update prompt: one of the
+        same kind still waiting is dropped. A frame with a ``sequence`` is sent
+        with an SSE id worked out from it, so must not have an id of its own
+        """
+        if self.closed:
+            return
+
+        if kind is not None:
+            self._count_prompts(1)
+            for waiting in [f for f in self._frames if f[0] == kind]:
+                self._frames.remove(waiting)
+                self._count_suppressed(1)
+
+        self._frames.append((kind, frame, sequence))
+        self._wakeup.set()
+
+    def hold(self, sequence: int) -> None:
+        """Don't send an id past ``sequence`` until it is released: a frame
+        for it is on its way"""
+        self._held.append(sequence)
+
+    def release(self, sequence: int) -> None:
+        self._held.remove(sequence)
+
+    def close(self) -> None:
+        """Stop the stream once the frames already buffered have been sent"""
+        self.closed = True
+        self._wakeup.set()
+
+    async def frames(self):
+        """Yield frames as they arrive until the connection is closed"""
+        while True:
+            if self.coalesce_window > 0 and self._has_prompts() and not self.closed:
+                # Give the rest of a burst time to arrive
+                await asyncio.sleep(self.coalesce_window)
+
+            for frame in self._drain():
+                yield frame
+
+            if self.closed and not self._frames:
+                return
+
+            if not self._frames:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+    def _has_prompts(self) -> bool:
+        return any(kind is not None for kind, _, _ in self._frames)
+
+    def _drain(self) -> List[str]:
+        """Empty the buffer into the frames to send, merging the prompts into a
+        single update mask if this connection coalesces them"""
+        waiting = list(self._frames)
+        self._frames.clear()
+
+        if self.coalesce_window <= 0:
+            # (frame, oldest sequence in it, newest sequence in it)
+            batch = [(frame, sequence, sequence) for _, frame, sequence in waiting]
+        else:
+            batch = [(frame, seq, seq) for kind, frame, seq in waiting if not kind]
+            prompts = [(kind, seq) for kind, _, seq in waiting if kind and seq]
+            # Such as the last prompt of a closing stream, which clears the
+            # client's id: sent after the mask, so that the mask's doesn't undo it
+            unnumbered = [
+                (frame, None, None) for kind, frame, seq in waiting if kind and not seq
+            ]
+
+            if prompts:
+                mask = reduce(lambda m, p: m | PROMPT_BITS[p[0]], prompts, 0)
+                sequences = [seq for _, seq in prompts]
+                batch.append((make_mask_frame(mask), min(sequences), max(sequences)))
+                self._count_suppressed(len(prompts) - 1)
+
+            batch += unnumbered
+
+        return self._number(batch)
+
+    def _number(self, batch) -> List[str]:
+        """Give each frame in ``batch`` the id a client can resume from once it
+        has had that frame, but none of those after it"""
+        frames = []
+        for i, (frame, _, newest) in enumerate(batch):
+            if newest is None:
+                frames.append(frame)
+                continue
+
+            self._newest_sent = max(self._newest_sent, newest)
+            resume_from = self._newest_sent
+
+            still_to_send = [oldest for _, oldest, _ in batch[i + 1 :] if oldest]
+            still_to_send += self._held
+            if still_to_send:
+                resume_from = min(resume_from, min(still_to_send) - 1)
+
+            frames.append(f"id: {format_event_id(resume_from)}\n" + frame)
+
+        return frames
+
+    def _count_prompts(self, num: int) -> None:
+        self.num_prompts += num
+        _stats["prompts"] += num
+
+    def _count_suppressed(self, num: int) -> None:
+        self.num_suppressed += num
+        _stats["suppressed"] += num
+
+
+class GameHub:
+    """
+    Fans update events for one game out to every connection in it.
+
+    Subscriptions are reference counted by connection: the first connection
+    interested in an (event_type, key) starts its watcher, the last one to
+    leave cancels it.
+    """
+
+    def __init__(self, game_id: Optional[UUID]) -> None:
+        self.game_id = game_id
+        self.connections: Set[SSEConnection] = set()
+
+        self._subscribers: Dict[Tuple[str, Hashable], Set[SSEConnection]] = {}
+        self._watchers: Dict[Tuple[str, Hashable], asyncio.Task] = {}
+
+    def add(self, connection: SSEConnection) -> None:
+        self.connections.add(connection)
+
+        self._subscribe(connection, "user", connection.user_id)
+
+        if self.game_id is not None:
+            self._subscribe(connection, "ticker", self.game_id)
+            self._subscribe(connection, "circle", self.game_id)
+
+    def remove(self, connection: SSEConnection) -> None:
+        self.connections.discard(connection)
+
+        for subscription in list(self._subscribers):
+            subscribers = self._subscribers[subscription]
+            subscribers.discard(connection)
+
+            if not subscribers:
+                logger.debug("(GameHub %s) Dropping watcher %s", self.key, subscription)
+                del self._subscribers[subscription]
+                self._watchers.pop(subscription).cancel()
+
+    def push_to_all(self, frame: str) -> None:
+        for connection in self.connections:
+            connection.push(frame)
+
+    def close(self) -> None:
+        for connection in list(self.connections):
+            connection.close()
+            self.remove(connection)
+
+    @property
+    def key(self) -> Hashable:
+        """This hub's key in the hub registry"""
+        return self.game_id
+
+    @property
+    def num_watchers(self) -> int:
+        return len(self._watchers)
+
+    def _subscribe(
+        self, connection: SSEConnection, event_type: str, key: Hashable
+    ) -> None:
+        subscription = (event_type, key)
+
+        if subscription not in self._subscribers:
+            logger.debug("(GameHub %s) Starting watcher %s", self.key, subscription)
+            self._subscribers[subscription] = set()
+            # Note the current sequence number now rather than when the task
+            # first runs, so that nothing triggered in between is missed
+            self._watchers[subscription] = asyncio.create_task(
+                self._watch(event_type, key, latest_sequence(event_type, key))
+            )
+
+        self._subscribers[subscription].add(connection)
+        connection.subscriptions.append(subscription)
+
+    async def _watch(self, event_type: str, key: Hashable, sequence: int) -> None:
+        while True:
+            sequence = await wait_for_event(event_type, key, after=sequence)
+
+            subscribers = list(self._subscribers.get((event_type, key), ()))
+            logger.debug(
+                "(GameHub %s) %s event for %s - pushing to %d connections",
+                self.key,
+                event_type,
+                key,
+                len(subscribers),
+            )
+
+            # One failed delivery mustn't stop every later one
+            try:
+                await self._deliver(event_type, key, sequence, subscribers)
+            except Exception:
+                logger.exception(
+                    "(GameHub %s) Could not deliver %s event for %s",
+                    self.key,
+                    event_type,
+                    key,
+                )
+
+    async def _deliver(
+        self, event_type: str, key: Hashable, sequence: int, subscribers
+    ) -> None:
+        if event_type == "user":
+            moved = await self._team_changed(key, sequence, subscribers)
+            self._close_for_new_team(moved)
+            subscribers = [c for c in subscribers if c not in moved]
+
+        prompted = [c for c in subscribers if not c.payloads]
+        if prompted:
+            frame = make_prompt_frame(event_type)
+            for connection in prompted:
+                connection.push(frame, kind=event_type, sequence=sequence)
+
+        with_payloads = [c for c in subscribers if c.payloads]
+        if with_payloads:
+            await self._push_payloads(event_type, key, sequence, with_payloads)
+
+    @staticmethod
+    async def _push_payloads(
+        event_type: str, key: Hashable, sequence: int, connections
+    ) -> None:
+        """Load what changed once, off the event loop, and send it to every
+        connection that wants the data rather than a prompt"""
+        from . import sse_payloads
+
+        for connection in connections:
+            connection.hold(sequence)
+
+        try:
+            if event_type == "ticker":
+                # Ticker updates are deltas, so unlike the others they must not
+                # replace one another in a connection's buffer
+                audiences = [(c.user_id, c.ticker_cursor) for c in connections]
+                entries = await run_in_db_thread(
+                    sse_payloads.load_ticker_entries_for, key, audiences
+                )
+                frames = sse_payloads.make_ticker_frames(entries, connections)
+                for connection, frame in frames.items():
+                    connection.push(frame, sequence=sequence)
+                return
+
+            if event_type == "user":
+                frame = await run_in_db_thread(sse_payloads.load_user_frame, key)
+            elif event_type == "circle":
+                frame = await run_in_db_thread(sse_payloads.load_circle_frame, key)
+            else:
+                raise ValueError(f"No payload for {event_type} events")
+
+            for connection in connections:
+                connection.push(frame, kind=event_type, sequence=sequence)
+        finally:
+            for connection in connections:
+                connection.release(sequence)
+
+    @staticmethod
+    async def _team_changed(user_id, sequence: int, connections) -> List[SSEConnection]:
+        """The connections whose user has changed team or game since they
+        connected. The team is looked up off the event loop"""
+        from .user_interface import UserInterface
+
+        for connection in connections:
+            connection.hold(sequence)
+
+        try:
+            team_id = await run_in_db_thread(UserInterface(user_id).get_team_id)
+        finally:
+            for connection in connections:
+                connection.release(sequence)
+
+        return [c for c in connections if c.team_id != team_id]
+
+    @staticmethod
+    def _close_for_new_team(connections) -> None:
+        """
+        A user who changes team or game needs a fresh stream with fresh
+        subscriptions, so close theirs: the client reconnects and reloads
+        """
+        for connection in connections:
+            logger.debug(
+                "User %s has changed team. Closing connection", connection.user_id
+            )
+            # Clear the client's last event id on the way out: its next
+            # stream is for a different game, so it can't resume this one.
+            # This is a plain prompt even in payload mode: the new stream
+            # will send everything afresh
+            connection.push(make_prompt_frame("user", ""), kind="user")
+            connection.close()
+
+
+class AdminHub(GameHub):
+    """
+    The hub for admin streams. Watches the ticker, circles and shot queue of
+    every game, and the "games" event that announces a new one, so it
+    subscribes to each game once rather than polling for the list.
+
+    Each prompt names the admin panel to refresh and the game it is about, so
+    that a ticker change doesn't make the shot queue refetch.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(game_id=None)
+        self._game_ids: Set[UUID] = set()
+        # Whether every game in the database has been found yet
+        self._listed = False
+
+    @property
+    def key(self) -> Hashable:
+        return ADMIN_HUB_KEY
+
+    def add(self, connection: SSEConnection) -> None:
+        self.connections.add(connection)
+
+        # Subscribe to "games" before listing them, so no new game is missed
+        self._subscribe(connection, "games", None)
+
+        for game_id in self._game_ids:
+            self._subscribe_to_game(connection, game_id)
+
+    async def list_games(self) -> None:
+        """Watch every game. Only the first admin to connect has to wait for
+        the list"""
+        if not self._listed:
+            await self._watch_new_games()
+            self._listed = True
+
+    async def _watch_new_games(self) -> Set[UUID]:
+        """Subscribe every connection to the games not watched yet, listed off
+        the event loop, and return them"""
+        from .admin_interface import AdminInterface
+
+        game_ids = await run_in_db_thread(AdminInterface().get_game_ids)
+
+        # Connections may have come and gone while we waited
+        new_game_ids = set(game_ids) - self._game_ids
+        self._game_ids |= new_game_ids
+
+        for game_id in new_game_ids:
+            for connection in self.connections:
+                self._subscribe_to_game(connection, game_id)
+
+        return new_game_ids
+
+    def _subscribe_to_game(self, connection: SSEConnection, game_id: UUID) -> None:
+        for event_type in ADMIN_GAME_EVENTS:
+            self._subscribe(connection, event_type, game_id)
+
+    async def _deliver(
+        self, event_type: str, key: Hashable, sequence: int, subscribers
+    ) -> None:
+        if event_type == "games":
+            await self._add_new_games()
+            return
+
+        for panel in ADMIN_PANELS[event_type]:
+            frame = make_admin_prompt_frame(panel, key)
+            for connection in subscribers:
+                connection.push(frame, kind=f"{panel}:{key}")
+
+    async def _add_new_games(self) -> None:
+        for game_id in await self._watch_new_games():
+            logger.debug("(AdminHub) Watching new game %s", game_id)
+            frame = make_admin_prompt_frame("admin", game_id)
+            for connection in self.connections:
+                connection.push(frame, kind=f"admin:{game_id}")
+
+
+_hubs: Dict[Hashable, GameHub] = {}
+_keepalive_task: Optional[asyncio.Task] = None
+
+# Where the admin hub lives among the game hubs
+ADMIN_HUB_KEY = "admin"
+
+# The events the admin hub watches in each game
+ADMIN_GAME_EVENTS = ["ticker", "circle", "shots"]
+
+# The admin panels each event should refresh. A shot being submitted or
+# resolved changes players' ammo and hit points, which the "admin" page shows
+ADMIN_PANELS = {
+    "ticker": ["admin"],
+    "circle": ["circle"],
+    "shots": ["shots", "admin"],
+}
+
+# Totals across every connection since startup. See get_stats
+_stats = {"prompts": 0, "suppressed": 0}
+
+
+def get_hub(game_id: Optional[UUID]) -> GameHub:
+    """The hub for a game's player streams"""
+    if game_id not in _hubs:
+        _hubs[game_id] = GameHub(game_id)
+
+    return _hubs[game_id]
+
+
+def connect(
+    user_id: UUID,
+    game_id: Optional[UUID],
+    team_id: Optional[UUID],
+    coalesce_window: float = 0,
+    payloads: bool = False,
+) -> SSEConnection:
+    """Register a new SSE client with its game's hub"""
+    connection = SSEConnection(
+        user_id=user_id,
+        game_id=game_id,
+        team_id=team_id,
+        coalesce_window=coalesce_window,
+        payloads=payloads,
+    )
+    _register(get_hub(game_id), connection)
+
+    return connection
+
+
+async def connect_admin() -> SSEConnection:
+    """Register a new admin SSE client with the admin hub"""
+    if ADMIN_HUB_KEY not in _hubs:
+        _hubs[ADMIN_HUB_KEY] = AdminHub()
+
+    hub = _hubs[ADMIN_HUB_KEY]
+
+    connection = SSEConnection(user_id=None, game_id=None, team_id=None)
+    connection.hub_key = ADMIN_HUB_KEY
+    _register(hub, connection)
+
+    try:
+        await hub.list_games()
+    except BaseException:
+        disconnect(connection)
+        raise
+
+    return connection
+
+
+def _register(hub: GameHub, connection: SSEConnection) -> None:
+    global _keepalive_task
+
+    hub.add(connection)
+
+    if _keepalive_task is None or _keepalive_task.done():
+        _keepalive_task = asyncio.create_task(_keepalive_timer())
+
+
+def admin_catch_up_frames() -> List[str]:
+    """A new admin client refreshes every panel, for every game"""
+    return [make_admin_prompt_frame(panel) for panel in ["admin", "circle", "shots"]]
+
+
+async def catch_up_frames(
+    connection: SSEConnection,
+    last_event_id: Optional[str] = None,
+    ticker_since: Optional[int] = None,
+) -> List[str]:
+    """
+    The prompts to send a newly connected client before any live updates
+
+    A fresh client, or one whose last event id can't be resumed from, is
+    prompted to refresh everything it subscribes to. A client resuming a
+    stream is only prompted for the things that changed since its last event.
+    A connection that coalesces its prompts gets them all in one update mask.
+
+    A connection in payload mode gets the data instead of the prompts, loaded
+    off the event loop: for the ticker, the entries newer than
+    ``ticker_since``. Live ticker updates arriving meanwhile start from there
+    too, and no entry is sent twice.
+    """
+    since = parse_event_id(last_event_id)
+    event_id = format_event_id(latest_sequence())
+
+    # Before anything is awaited, so that no live update misses it
+    connection.ticker_cursor = ticker_since or 0
+
+    targets = [
+        event_type
+        for event_type, key in connection.subscriptions
+        if since is None or events_since(event_type, key, since) != []
+    ]
+
+    if connection.payloads:
+        payloads = await run_in_db_thread(
+            _load_catch_up_payloads, connection, targets, ticker_since
+        )
+        frames = [
+            _catch_up_payload(connection, target, payload, event_id)
+            for target, payload in zip(targets, payloads)
+        ]
+    elif connection.coalesce_window > 0 and targets:
+        mask = reduce(lambda m, target: m | PROMPT_BITS[target], targets, 0)
+        frames = [make_mask_frame(mask, event_id)]
+    else:
+        frames = [make_prompt_frame(target, event_id) for target in targets]
+
+    logger.debug(
+        "catch_up_frames - user %s resuming from %s: %d prompts",
+        connection.user_id,
+        since,
+        len(targets),
+    )
+
+    return frames
+
+
+def _load_catch_up_payloads(
+    connection: SSEConnection, targets: List[str], ticker_since: Optional[int]
+) -> list:
+    """The data for each of ``targets``: a rendered frame's data for the user
+    and the circles, and the new entries for the ticker"""
+    from . import sse_payloads
+
+    payloads = []
+    for target in targets:
+        if target == "user":
+            payloads.append(sse_payloads.load_user_data(connection.user_id))
+        elif target == "circle":
+            payloads.append(sse_payloads.load_circle_data(connection.game_id))
+        else:
+            payloads.append(
+                sse_payloads.load_ticker_entries(
+                    connection.game_id, ticker_since, user_id=connection.user_id
+                )
+            )
+
+    return payloads
+
+
+def _catch_up_payload(
+    connection: SSEConnection, target: str, payload, event_id: str
+) -> str:
+    from . import sse_payloads
+
+    if target == "user":
+        return sse_payloads.make_data_frame("user_data", payload, event_id)
+
+    if target == "circle":
+        return sse_payloads.make_data_frame("circle_data", payload, event_id)
+
+    # Leaving out what a live update has sent since
+    entries = [entry for entry in payload if entry.id > connection.ticker_cursor]
+    connection.ticker_cursor = max(
+        [connection.ticker_cursor] + [entry.id for entry in entries]
+    )
+
+    return sse_payloads.make_ticker_frame(entries, connection.user_id, event_id)
+
+
+def disconnect(connection: SSEConnection) -> None:
+    connection.close()
+
+    hub = _hubs.get(connection.hub_key)
+    if hub is None:
+        return
+
+    hub.remove(connection)
+
+    if not hub.connections:
+        del _hubs[connection.hub_key]
+
+
+def num_connections() -> int:
+    return sum(len(hub.connections) for hub in _hubs.values())
+
+
+def get_stats() -> dict:
+    """
+    How many update prompts the hub has handled, and how many of them were
+    suppressed: replaced by a newer prompt of the same kind, or folded into an
+    update mask. Each suppressed prompt is a refetch a client didn't make.
+    """
+    return {
+        "connections": num_connections(),
+        "prompts": _stats["prompts"],
+        "suppressed": _stats["suppressed"],
+    }
+
+
+async def _keepalive_timer(timeout=SSE_KEEPALIVE_TIMEOUT):
+    """
+    One ticker for every connection. Clients check that the counts they see are
+    consecutive, which still holds: every open connection gets every tick.
+    Stops itself once nobody is connected.
+    """
+    logger.debug("Starting keepalive timer")
+
+    i = 0
+
+    while _hubs:
+        await asyncio.sleep(timeout)
+
+        logger.debug("Sending keepalive message %s", i)
+        frame = make_sse_update_message(json.dumps({"handler": "keepalive", "data": i}))
+        for hub in list(_hubs.values()):
+            hub.push_to_all(frame)
+
+        i += 1
+
+    logger.debug("No connections left - stopping keepalive timer")
@@ -0,0 +1,150 @@
+"""
+sse_payloads.py
+
+Data frames for player SSE streams opened in payload mode.
+
+A normal stream only prompts its client to refetch /user_info,
+/ticker_messages or /get_circles, and every client in a game then makes that
+round trip, each with its own database session. A stream opened with
+``payloads=true`` is sent the data itself instead:
+
+* ``{"handler": "user_data", "data": <UserModel>}``
+* ``{"handler": "ticker_data", "data": [{"id", "class", "message"}, ...]}`` -
+  only the ticker entries newer than the last one the client was sent, oldest
+  first. Clients pass the id of the newest entry they already have as
+  ``ticker_since`` when they reconnect.
+* ``{"handler": "circle_data", "data": <as /get_circles>}``
+
+The hub loads each change once and renders each frame once per game. The only
+per-player work is a ticker update that is private to, or highlights, a
+particular player.
+"""
+
+import json
+from typing import Dict
+from typing import Hashable
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+from uuid import UUID
+
+from .circles import get_circle_positions
+from .database import session_scope
+from .model import Game
+from .sse_hub import make_sse_update_message
+from .ticker import Entry
+from .ticker import Ticker
+from .ticker import render_entries
+
+# The most ticker entries to send at once. The client only shows a few
+TICKER_PAYLOAD_LIMIT = 20
+
+
+def make_data_frame(handler: str, data, event_id: Optional[str] = None) -> str:
+    return make_sse_update_message(
+        json.dumps({"handler": handler, "data": data}), event_id=event_id
+    )
+
+
+def load_user_data(user_id: UUID) -> Optional[dict]:
+    from .user_interface import UserInterface
+
+    user_model = UserInterface(user_id).get_user_model()
+    return user_model.model_dump(mode="json") if user_model else None
+
+
+def load_user_frame(user_id: UUID, event_id: Optional[str] = None) -> str:
+    return make_data_frame("user_data", load_user_data(user_id), event_id)
+
+
+def load_circle_data(game_id: UUID):
+    with session_scope() as session:
+        game = session.get(Game, game_id)
+        return get_circle_positions(game) if game else None
+
+
+def load_circle_frame(game_id: UUID, event_id: Optional[str] = None) -> str:
+    return make_data_frame("circle_data", load_circle_data(game_id), event_id)
+
+
+def load_ticker_entries(
+    game_id: UUID, after_id: Optional[int], user_id: Optional[UUID] = None
+) -> List[Entry]:
+    """
+    The newest ticker entries after ``after_id`` that ``user_id`` can see, or
+    that anybody can see if no user is given
+    """
+    return Ticker(game_id=game_id, user_id=user_id).get_entries_since(
+        after_id, TICKER_PAYLOAD_LIMIT, everyone=user_id is None
+    )
+
+
+def load_ticker_entries_for(
+    game_id: UUID, audiences: Iterable[Tuple[UUID, int]]
+) -> List[Entry]:
+    """
+    Everything a ticker update has to send, oldest first: for each audience -
+    a player and the id of the newest entry they have - the newest entries
+    after that which the player can see. Loaded for each audience, so that
+    other players' private entries can't crowd out a player's own
+    """
+    entries = {}
+    for user_id, after_id in set(audiences):
+        for entry in load_ticker_entries(game_id, after_id, user_id=user_id):
+            entries[entry.id] = entry
+
+    return sorted(entries.values())
+
+
+def make_ticker_frame(
+    entries: Iterable[Entry], user_id: UUID, event_id: Optional[str] = None
+) -> str:
+    return make_data_frame("ticker_data", render_entries(entries, user_id), event_id)
+
+
+def make_ticker_frames(
+    entries: List[Entry], connections: Iterable
+) -> Dict[Hashable, str]:
+    """
+    The ticker frame for each connection: the newest entries it can see that
+    are newer than its ``ticker_cursor``, at most ``TICKER_PAYLOAD_LIMIT``.
+    Connections that are sent the same entries, none of them about their own
+    player, share one rendered frame.
+
+    Connections with nothing new to see are left out. Returns a dict of
+    connection to frame, and moves each connection's cursor on.
+    """
+    frames = {}
+    rendered = {}
+
+    for connection in connections:
+        user_id = connection.user_id
+        visible = [
+            entry
+            for entry in entries
+            if entry.id > connection.ticker_cursor
+            and entry.private_user_id in (None, user_id)
+        ][-TICKER_PAYLOAD_LIMIT:]
+
+        if entries:
+            connection.ticker_cursor = max(connection.ticker_cursor, entries[-1].id)
+
+        if not visible:
+            continue
+
+        about_this_user = any(
+            user_id in (entry.private_user_id, entry.highlight_user_id)
+            for entry in visible
+        )
+        cache_key = (
+            tuple(entry.id for entry in visible),
+            user_id if about_this_user else None,
+        )
+
+        if cache_key not in rendered:
+            rendered[cache_key] = make_ticker_frame(visible, user_id)
+
+        frames[connection] = rendered[cache_key]
+
+    return frames
@@ -1,12 +1,34 @@
+"""
+The ticker: messages for everyone in a game, or private to one player
+
+Every ticker trigger has every player in the game asking for the ticker at
+once, so reads are served from memory (:class:`TickerTail`): per game, the
+newest ``TAIL_LENGTH`` public entries and each player's newest private ones.
+The database is read once per game when the tail is first wanted, and after
+that, once per change - ``id > newest`` - however many players then ask.
+"""
+
 import asyncio
+import heapq
 import logging
+import threading
+from collections import deque
+from itertools import islice
+from typing import Deque
+from typing import Dict
+from typing import Hashable
+from typing import Iterable
 from typing import List
+from typing import NamedTuple
+from typing import Optional
 from typing import Tuple
 from uuid import UUID
 
+import sqlalchemy as sa
 from sqlalchemy import or_
 from sqlalchemy.orm import Session
 
+from .asyncio_triggers import add_listener
 from .asyncio_triggers import get_trigger_event
 from .asyncio_triggers import trigger_update_event
 from .database_scope_provider import DatabaseScopeProvider
@@ -15,6 +37,239 @@ from .model import TickerEntry
 
 logger = logging.getLogger(__name__)
 
+# Most entries, public and per player, kept in memory for each game. Reads for
+# more than this go to the database
+TAIL_LENGTH = 100
+
+
+def message_class(private_user_id, highlight_user_id, user_id) -> str:
+    """
+    How a ticker entry is shown to ``user_id``: "highlight" if it is about
+    them, "user" if it is private to them, otherwise "public"
+    """
+    if highlight_user_id is not None and highlight_user_id == user_id:
+        return "highlight"
+
+    if private_user_id:
+        return "user"
+
+    return "public"
+
+
+class Entry(NamedTuple):
+    id: int
+    private_user_id: Optional[UUID]
+    highlight_user_id: Optional[UUID]
+    message: str
+
+
+def render_entries(entries: Iterable[Entry], user_id: Optional[UUID]) -> List[dict]:
+    """Entries as they are sent to ``user_id``, in the order given"""
+    return [
+        {
+            "id": entry.id,
+            "class": message_class(
+                entry.private_user_id, entry.highlight_user_id, user_id
+            ),
+            "message": entry.message,
+        }
+        for entry in entries
+    ]
+
+
+class _GameTail:
+    def __init__(self, length: int) -> None:
+        self.length = length
+        self.public: Deque[Entry] = deque(maxlen=length)
+        self.private: Dict[UUID, Deque[Entry]] = {}
+        # The newest entry read from the database: the next read starts after it
+        self.newest_id = 0
+        # The generation the tail is up to date with
+        self.generation = -1
+
+    def add(self, entries: Iterable[Entry]) -> None:
+        """Add entries, oldest first, skipping any we already have"""
+        for entry in entries:
+            if entry.id <= self.newest_id:
+                continue
+            if entry.private_user_id is None:
+                self.public.append(entry)
+            else:
+                self.private.setdefault(
+                    entry.private_user_id, deque(maxlen=self.length)
+                ).append(entry)
+            self.newest_id = entry.id
+
+    def newest(
+        self, user_id: Optional[UUID], after_id: Optional[int], num: int, everyone
+    ) -> List[Entry]:
+        """The newest ``num`` entries after ``after_id`` that ``user_id`` can
+        see, or anybody if ``everyone``, oldest first"""
+        if everyone:
+            tails = [self.public, *self.private.values()]
+        else:
+            tails = [self.public, self.private.get(user_id, ())]
+
+        candidates = []
+        for tail in tails:
+            for entry in islice(reversed(tail), num):
+                if after_id is not None and entry.id <= after_id:
+                    break
+                candidates.append(entry)
+
+        return sorted(heapq.nlargest(num, candidates))
+
+
+class TickerTail:
+    """
+    The newest ticker entries of each game, kept up to date by the ticker
+    update events
+
+    As in :class:`backend.scoreboard.ScoreboardCache`, each game has a
+    generation, moved on by every ticker event, and a tail is only up to date
+    if nothing happened since it was last read. Entries are never changed, so
+    bringing a tail up to date is a read of the entries newer than its newest.
+    Entries are only deleted by resetting a game or deleting a player, whose
+    private entries nobody else could see anyway. A reset throws the game's
+    tail away instead.
+    """
+
+    def __init__(self, length: int = TAIL_LENGTH) -> None:
+        self.length = length
+        self._lock = threading.Lock()
+        self._generations: Dict[UUID, int] = {}
+        # Moved on when a game's tail is thrown away
+        self._epochs: Dict[UUID, int] = {}
+        self._tails: Dict[UUID, _GameTail] = {}
+
+    def newest(
+        self,
+        game_id: UUID,
+        user_id: Optional[UUID],
+        after_id: Optional[int],
+        num: int,
+        everyone=False,
+    ) -> Optional[List[Entry]]:
+        """
+        The newest ``num`` entries after ``after_id`` that ``user_id`` can see,
+        or anybody if ``everyone``, oldest first. None if that is more than the
+        tail holds.
+        """
+        if num > self.length:
+            return None
+
+        tail = self._up_to_date(game_id)
+
+        with self._lock:
+            return tail.newest(user_id, after_id, num, everyone)
+
+    def _up_to_date(self, game_id: UUID) -> _GameTail:
+        from .database import session_scope
+
+        with self._lock:
+            generation = self._generations.setdefault(game_id, 0)
+            epoch = self._epochs.get(game_id, 0)
+            tail = self._tails.get(game_id)
+            if tail is not None and tail.generation == generation:
+                return tail
+            newest_id = tail.newest_id if tail is not None else None
+
+        # In a session of our own, so that the read sees everything committed
+        # before the event that put the tail out of date
+        with session_scope() as session:
+            if newest_id is None:
+                entries = _load_tail(session, game_id, self.length)
+            else:
+                entries = _load_since(session, game_id, newest_id)
+
+        with self._lock:
+            if tail is None:
+                tail = self._tails.get(game_id)
+                if tail is None:
+                    tail = _GameTail(self.length)
+                    # Not kept if the ticker was wiped while we read it
+                    if epoch == self._epochs.get(game_id, 0):
+                        self._tails[game_id] = tail
+
+            tail.add(entries)
+            tail.generation = max(tail.generation, generation)
+
+        return tail
+
+    def invalidate(self, game_id: UUID) -> None:
+        with self._lock:
+            self._generations[game_id] = self._generations.get(game_id, 0) + 1
+
+    def discard(self, game_id: UUID) -> None:
+        with self._lock:
+            self._discard(game_id)
+
+    def discard_all(self) -> None:
+        with self._lock:
+            for game_id in list(self._generations):
+                self._discard(game_id)
+
+    def _discard(self, game_id: UUID) -> None:
+        self._generations[game_id] = self._generations.get(game_id, 0) + 1
+        self._epochs[game_id] = self._epochs.get(game_id, 0) + 1
+        self._tails.pop(game_id, None)
+
+    def on_update_event(self, event_type: str, key: Hashable) -> None:
+        if event_type == "ticker":
+            self.invalidate(key)
+        elif event_type == "scoreboard":
+            # Sent by resetting a game, which wipes its ticker
+            self.discard(key)
+        elif event_type == "games":
+            self.discard_all()
+
+
+def _entry_columns():
+    return (
+        TickerEntry.id,
+        TickerEntry.private_user_id,
+        TickerEntry.highlight_user_id,
+        TickerEntry.message,
+    )
+
+
+def _load_tail(session: Session, game_id: UUID, length: int) -> List[Entry]:
+    """The newest ``length`` public entries of a game and the newest
+    ``length`` private to each player, oldest first"""
+    rank = (
+        sa.func.row_number()
+        .over(partition_by=TickerEntry.private_user_id, order_by=TickerEntry.id.desc())
+        .label("rank")
+    )
+    ranked = (
+        session.query(*_entry_columns(), rank).filter_by(game_id=game_id).subquery()
+    )
+
+    rows = session.query(
+        ranked.c.id,
+        ranked.c.private_user_id,
+        ranked.c.highlight_user_id,
+        ranked.c.message,
+    ).filter(ranked.c.rank <= length)
+
+    # Sorted here: ordering by id in SQL would re-sort the whole tail in a
+    # temporary b-tree, where the index hands each feed over already in order
+    return sorted(Entry(*row) for row in rows)
+
+
+def _load_since(session: Session, game_id: UUID, after_id: int) -> List[Entry]:
+    rows = (
+        session.query(*_entry_columns())
+        .filter(TickerEntry.game_id == game_id, TickerEntry.id > after_id)
+        .order_by(TickerEntry.id)
+    )
+
+    return [Entry(*row) for row in rows]
+
+
+_tail = TickerTail()
+add_listener(_tail.on_update_event)
+
 
 def trigger_ticker_update_event(ticker: "Ticker"):
     logger.debug("Triggering update for game ticker %s", ticker.game_id)
@@ -53,6 +308,22 @@ class Ticker:
         Returns:
             List[Tuple[str,str]]: A list of messages, each as a tuple of (type, message)
         """
+        # The tail has the newest entries; the oldest are in the database
+        entries = None
+        if newest_first:
+            entries = _tail.newest(self.game_id, self.user_id, None, num_messages)
+
+        if entries is not None:
+            return [
+                (
+                    message_class(
+                        entry.private_user_id, entry.highlight_user_id, self.user_id
+                    ),
+                    entry.message,
+                )
+                for entry in reversed(entries)
+            ]
+
         if newest_first:
             order = TickerEntry.id.desc()
         else:
@@ -82,19 +353,59 @@ class Ticker:
             len(ticker_entries),
         )
 
-        out = []
-        for private_user_id, highlight_user_id, message in ticker_entries:
-            message_class = "public"
+        return [
+            (message_class(private_user_id, highlight_user_id, self.user_id), message)
+            for private_user_id, highlight_user_id, message in ticker_entries
+        ]
 
-            if private_user_id:
-                message_class = "user"
+    @db_scoped
+    def get_entries_since(
+        self, after_id: Optional[int], num_entries: int, everyone=False
+    ) -> List[Entry]:
+        """
+        The newest ``num_entries`` ticker entries with ids above ``after_id``,
+        oldest first.
+        Args:
+            after_id (int, optional): Only get entries newer than this one. If None, get the newest.
+            num_entries (int): The most entries to retrieve.
+            everyone (bool): If True, include the entries private to any user, not just this ticker's. Defaults to False.
+        Returns:
+            List[Entry]: Entries with id, private_user_id, highlight_user_id and message
+        """
+        entries = _tail.newest(
+            self.game_id, self.user_id, after_id, num_entries, everyone
+        )
+        if entries is not None:
+            return entries
+
+        query = self._session.query(
+            TickerEntry.id,
+            TickerEntry.private_user_id,
+            TickerEntry.highlight_user_id,
+            TickerEntry.message,
+        ).filter_by(game_id=self.game_id)
+
+        if not everyone:
+            query = query.filter(
+                or_(
+                    TickerEntry.private_user_id == self.user_id,
+                    TickerEntry.private_user_id == None,
+                )
+            )
+
+        if after_id is not None:
+            query = query.filter(TickerEntry.id > after_id)
 
-            if highlight_user_id is not None and highlight_user_id == self.user_id:
-                message_class = "highlight"
+        ticker_entries = query.order_by(TickerEntry.id.desc()).limit(num_entries).all()
 
-            out.append((message_class, message))
+        logger.debug(
+            "(Game Ticker %s) Looked up %d ticker entries after %s",
+            self.game_id,
+            len(ticker_entries),
+            after_id,
+        )
 
-        return out
+        return [Entry(*row) for row in ticker_entries[::-1]]
 
     @db_scoped
     def _get_game(self) -> Game:
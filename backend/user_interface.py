@@ -2,6 +2,7 @@ import asyncio
 import json
 import logging
 import time
+from functools import partial
 from threading import RLock
 from typing import List
 from typing import Optional
@@ -14,12 +15,17 @@ from fastapi import HTTPException
 from sqlalchemy.orm import Session as SQLAlchemySession
 
 from . import asyncio_triggers
+from . import scoreboard
+from . import shot_images
 from .asyncio_triggers import get_trigger_event
-from .database import session_scope
+from .blob_store import get_blob_store
+from .circles import get_circle_positions
 from .database_scope_provider import DatabaseScopeProvider
-from .image_processing import save_image
+from .database_scope_provider import call_after_commit
+from .image_archive import get_image_archiver
 from .item_actions import do_item_actions
 from .items import ItemModel
+from .location_store import get_location_store
 from .model import Game
 from .model import GameModel
 from .model import Item
@@ -28,8 +34,11 @@ from .model import Team
 from .model import TeamModel
 from .model import User
 from .model import UserModel
+from .shot_images import ORIGINAL
+from .shot_images import ShotImage
 from .shot_vision import HIT_BYSTANDER
 from .ticker import Ticker
+from .ticker import render_entries
 
 logger = logging.getLogger(__name__)
 
@@ -172,7 +181,18 @@ class UserInterface:
     @db_scoped
     def get_user_model(self) -> UserModel:
         u = self.get_user()
-        return UserModel.model_validate(u) if u else None
+        if not u:
+            return None
+
+        model = UserModel.model_validate(u)
+        (
+            model.latitude,
+            model.longitude,
+            model.location_timestamp,
+        ) = get_location_store().newest(
+            u.id, u.latitude, u.longitude, u.location_timestamp
+        )
+        return model
 
     @db_scoped
     def get_team_id(self) -> UUID:
@@ -297,10 +317,17 @@ class UserInterface:
         user.identity_slot = slot
         user.identity_overrides = None
 
-    @db_scoped
     def submit_shot(self, image_base64: str):
-        from .admin_interface import AdminInterface
+        """Submit a shot whose photo is a base64 data URL"""
+        image_hash, image_type = get_blob_store().put_data_url(image_base64)
+        return self.submit_stored_shot(image_hash, image_type)
 
+    @db_scoped
+    def submit_stored_shot(self, image_hash: str, image_type: str):
+        """
+        Submit a shot whose photo is already in the blob store. If the shot is
+        refused the photo stays there, unreferenced
+        """
         user: User = self.get_user()
         team = user.team
 
@@ -317,10 +344,6 @@ class UserInterface:
 
         logger.info("User %s submitting shot to game %s", user.id, game.id)
 
-        all_user_locations = AdminInterface(session=self._session).get_locations(
-            game_id=game.id
-        )
-
         # Assign the id here rather than letting the column default do it at
         # flush time, so it can be returned without flushing. Flushing would
         # clear the session's dirty flag and rob @db_scoped of the signal it
@@ -332,16 +355,23 @@ class UserInterface:
             user=user,
             team=team,
             game=game,
-            image_base64=image_base64,
+            image_hash=image_hash,
+            image_type=image_type,
             shot_damage=user.shot_damage,
-            location_context=json.dumps(all_user_locations, default=str),
+            # Everyone's positions are looked up in the location history
+            location_time=time.time(),
         )
         self._session.add(shot_entry)
 
         user.num_bullets -= 1
+        scoreboard.record_shot(self._session, user.id)
 
-        # Save to folder
-        save_image(base64_image=image_base64, name=user.name)
+        # A copy for the logs, written in the background once the shot is in
+        # the database
+        call_after_commit(
+            self._session,
+            partial(get_image_archiver().submit, image_hash, image_type, user.name),
+        )
 
         return shot_id
 
@@ -413,6 +443,17 @@ class UserInterface:
 
         return shot.image_base64
 
+    @db_scoped
+    def get_shot_image(self, shot_id: UUID, rendition: str = ORIGINAL) -> ShotImage:
+        """
+        A rendition of one of this user's own shots, to be served by
+        :func:`backend.shot_images.make_response`. Players get the original
+        and the thumbnail. Responds 404 for anyone else's shot.
+        """
+        return shot_images.find(
+            self._session, shot_id, rendition, shooter_id=self.user_id
+        )
+
     @db_scoped
     def collect_item(self, encoded_item: str) -> None:
         """
@@ -482,17 +523,7 @@ class UserInterface:
         if game_model is None:
             return None
 
-        return {
-            "exclusion_circle_lat": game_model.exclusion_circle_lat,
-            "exclusion_circle_long": game_model.exclusion_circle_long,
-            "exclusion_circle_radius": game_model.exclusion_circle_radius,
-            "next_circle_lat": game_model.next_circle_lat,
-            "next_circle_long": game_model.next_circle_long,
-            "next_circle_radius": game_model.next_circle_radius,
-            "drop_circle_lat": game_model.drop_circle_lat,
-            "drop_circle_long": game_model.drop_circle_long,
-            "drop_circle_radius": game_model.drop_circle_radius,
-        }
+        return get_circle_positions(game_model)
 
     @db_scoped
     def get_messages(
@@ -520,6 +551,31 @@ class UserInterface:
             user_id=self.user_id if private else None,
         ).get_messages(num_messages=num, newest_first=newest_first)
 
+    def get_messages_since(self, after_id: Optional[int], num) -> List[dict]:
+        """
+        Get this user's ticker entries newer than ``after_id``, oldest first,
+        read from the game's tail in memory (see backend/ticker.py)
+
+        Args:
+            after_id (int, optional): The id of the newest entry the client already has. If None, get the newest.
+            num (int): The most entries to get
+
+        Returns:
+            List[dict]: Entries with id, class and message, as in SSE payloads
+        """
+        user = self.get_user()
+
+        if not user.team:
+            return []
+
+        entries = Ticker(
+            game_id=user.team.game.id,
+            session=self.get_session(),
+            user_id=self.user_id,
+        ).get_entries_since(after_id, num)
+
+        return render_entries(entries, self.user_id)
+
     def generate_user_updates(self, timeout=None):
         """
         An async generator that yields None every time an update is available
@@ -584,22 +640,20 @@ class UserInterface:
             shot.result = "refunded"
             bullet_refunds += 1
 
+        if bullet_refunds:
+            scoreboard.record_refund(self._session, self.user_id, bullet_refunds)
+
         self.award_ammo(bullet_refunds)
 
     def set_location(self, latitute: float, longitude: float):
         """
         Record the location of the user
 
-        This method should be quick and _does not_ prompt a user update event
+        This method should be quick and _does not_ prompt a user update event.
+        It doesn't touch the database: the location is held in memory and
+        written behind (backend/location_store.py)
         """
-        timestamp = time.time()
-
-        # Make our own session, detached from the usual machinery to ensure no update events
-        with session_scope() as session:
-            user = session.get(User, self.user_id)
-            user.latitude = latitute
-            user.longitude = longitude
-            user.location_timestamp = timestamp
+        get_location_store().set(self.user_id, latitute, longitude)
 
     async def generate_user_updates(self, timeout=None):
         """
@@ -26,10 +26,10 @@ export const MyWebcam = forwardRef(
 
     const mediaStream = useRef(null);
 
-    // Return the current frame as a base64-encoded image
-    const capture = useCallback(() => {
+    // Draw the current frame onto the canvas and return the canvas
+    const drawFrame = useCallback(() => {
       if (videoRef.current === null || canvasRef.current === null) {
-        return;
+        return null;
       }
       const video = videoRef.current;
       const canvas = canvasRef.current;
@@ -43,31 +43,45 @@ export const MyWebcam = forwardRef(
 
       ctx.drawImage(video, 0, 0, w, h);
 
+      return canvas;
+    }, [videoRef, canvasRef]);
+
+    // Return the current frame as a base64-encoded image
+    const capture = useCallback(() => {
+      const canvas = drawFrame();
+      if (canvas === null) {
+        return;
+      }
+
       const imageSrc = canvas.toDataURL("image/jpeg");
 
       return imageSrc;
-    }, [videoRef, canvasRef]);
+    }, [drawFrame]);
 
-    // Take a shot and upload it when trigger changes
+    // Take a shot and upload it when trigger changes. The JPEG is sent as the
+    // raw request body: a third smaller than base64 in JSON, and the backend
+    // streams it straight to storage
     const captureAndUpload = useCallback(() => {
-      const imageSrc = capture();
-      const query = JSON.stringify({
-        photo: imageSrc,
-      });
-
-      const requestOptions = {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: query,
-      };
-      fetch("/api/submit_shot", requestOptions)
-        .then((response) => response.json())
-        .then((data) => {
-          console.log(`Response: ${data}`);
-          // The new shot should appear in the shot history straight away
-          refreshShots();
-        });
-    }, [capture]);
+      const canvas = drawFrame();
+      if (canvas === null) {
+        return;
+      }
+
+      canvas.toBlob((photo) => {
+        const requestOptions = {
+          method: "POST",
+          headers: { "Content-Type": "image/jpeg" },
+          body: photo,
+        };
+        fetch("/api/submit_shot_photo", requestOptions)
+          .then((response) => response.json())
+          .then((data) => {
+            console.log(`Response: ${data}`);
+            // The new shot should appear in the shot history straight away
+            refreshShots();
+          });
+      }, "image/jpeg");
+    }, [drawFrame]);
 
     // Expose the capture function to the parent component
     useImperativeHandle(refFromParent, () => ({
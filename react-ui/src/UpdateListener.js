@@ -24,6 +24,16 @@ const TIMEOUT_CHECK_INTERVAL = 1000;
 // }
 var listeners = new Map();
 
+// The targets behind each bit of an "update_mask" message, which the server
+// sends in place of a burst of update prompts. Must match PROMPT_BITS in
+// backend/sse_hub.py
+const UPDATE_MASK_BITS = { user: 1, ticker: 2, circle: 4 };
+
+// The id of the last numbered event seen on each endpoint. Passed back when a
+// stream is reopened so the server only prompts for what was missed while it
+// was down, rather than for everything.
+var lastEventIds = new Map();
+
 function getTimestamp() {
   return new Date().getTime();
 }
@@ -47,14 +57,24 @@ export function deregisterListener(type, handle) {
   listeners.get(type).delete(handle);
 }
 
+// Admin prompts also say which game changed: it is passed to the callbacks,
+// which may ignore it
 function processUpdateMessage(message) {
-  const update_target = message.data;
+  notifyListeners(message.data, message.game_id);
+}
 
+function processMaskMessage(message) {
+  for (const [update_target, bit] of Object.entries(UPDATE_MASK_BITS)) {
+    if (message.data & bit) notifyListeners(update_target);
+  }
+}
+
+function notifyListeners(update_target, game_id) {
   if (listeners.has(update_target)) {
     const targetted_listeners = listeners.get(update_target);
 
     targetted_listeners.forEach((callback, handle) => {
-      callback();
+      callback(game_id);
     });
   }
 }
@@ -72,7 +92,10 @@ export function UpdateSSEConnection({ endpoint = "sse_updates" }) {
   const [bumpCounter, setBumpCounter] = useState(0);
 
   useEffect(() => {
-    const eventSource = new EventSource(makeAPIURL(endpoint));
+    const lastEventId = lastEventIds.get(endpoint);
+    const eventSource = new EventSource(
+      makeAPIURL(endpoint, lastEventId ? { last_event_id: lastEventId } : null),
+    );
     var retry_timeout_handle = 0;
     var keepalive_interval_handle = 0;
     var keepaliveCount = null;
@@ -96,6 +119,8 @@ export function UpdateSSEConnection({ endpoint = "sse_updates" }) {
     function processMessage(message) {
       if (message.handler === "update_prompt")
         return processUpdateMessage(message);
+      else if (message.handler === "update_mask")
+        return processMaskMessage(message);
       else if (message.handler === "keepalive")
         return processKeepaliveMessage(message);
     }
@@ -126,6 +151,9 @@ export function UpdateSSEConnection({ endpoint = "sse_updates" }) {
     // pass them for processing by the listeners
     eventSource.onmessage = (event) => {
       lastTimestamp = getTimestamp();
+      // An empty id is the server telling us not to resume this stream
+      if (event.lastEventId !== undefined)
+        lastEventIds.set(endpoint, event.lastEventId);
       const parsed_event = JSON.parse(event.data);
       processMessage(parsed_event);
     };
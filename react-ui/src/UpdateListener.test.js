@@ -7,6 +7,9 @@ import UpdateListener, {
 import {
   getEventSources,
   emitUpdate,
+  emitUpdateWithId,
+  emitUpdateMask,
+  emitAdminUpdate,
   emitKeepalive,
   emitError,
 } from "./testUtils";
@@ -38,6 +41,39 @@ describe("listener registry", () => {
     deregisterListener("ticker", tickerHandle);
   });
 
+  test("an update mask fires the callbacks for each target it names", () => {
+    render(<UpdateSSEConnection />);
+    const userCallback = jest.fn();
+    const tickerCallback = jest.fn();
+    const circleCallback = jest.fn();
+    const userHandle = registerListener("user", userCallback);
+    const tickerHandle = registerListener("ticker", tickerCallback);
+    const circleHandle = registerListener("circle", circleCallback);
+
+    // user | circle
+    act(() => emitUpdateMask(5));
+
+    expect(userCallback).toHaveBeenCalledTimes(1);
+    expect(tickerCallback).not.toHaveBeenCalled();
+    expect(circleCallback).toHaveBeenCalledTimes(1);
+
+    deregisterListener("user", userHandle);
+    deregisterListener("ticker", tickerHandle);
+    deregisterListener("circle", circleHandle);
+  });
+
+  test("an admin update passes the game it is about to the callbacks", () => {
+    render(<UpdateSSEConnection endpoint="sse_admin_updates" />);
+    const callback = jest.fn();
+    const handle = registerListener("shots", callback);
+
+    act(() => emitAdminUpdate("shots", "game-1"));
+
+    expect(callback).toHaveBeenCalledWith("game-1");
+
+    deregisterListener("shots", handle);
+  });
+
   test("multiple listeners registered on the same type all fire", () => {
     render(<UpdateSSEConnection />);
     const callback1 = jest.fn();
@@ -176,6 +212,32 @@ describe("UpdateSSEConnection", () => {
     expect(sources[1]).not.toBe(first);
   });
 
+  test("a reopened stream resumes from the last event id seen", () => {
+    render(<UpdateSSEConnection endpoint="resume_test" />);
+
+    act(() => emitUpdateWithId("user", "abc-7"));
+    act(() => emitKeepalive(1));
+    act(() => emitKeepalive(5)); // desync: forces a new stream
+
+    const sources = getEventSources();
+    expect(sources).toHaveLength(2);
+    expect(sources[0].url).not.toContain("last_event_id");
+    expect(sources[1].url).toContain("last_event_id=abc-7");
+  });
+
+  test("an empty event id stops the next stream from resuming", () => {
+    render(<UpdateSSEConnection endpoint="reset_test" />);
+
+    act(() => emitUpdateWithId("user", "abc-7"));
+    act(() => emitUpdateWithId("user", ""));
+    act(() => emitKeepalive(1));
+    act(() => emitKeepalive(5));
+
+    const sources = getEventSources();
+    expect(sources).toHaveLength(2);
+    expect(sources[1].url).not.toContain("last_event_id");
+  });
+
   describe("timer-driven reconnects", () => {
     beforeEach(() => {
       jest.useFakeTimers();
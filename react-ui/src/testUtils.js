@@ -14,6 +14,9 @@
 //   FakeEventSource            - fake EventSource class (installed as global.EventSource)
 //   getEventSources()          - every FakeEventSource instance created so far
 //   emitUpdate(type, [es])     - push an "update_prompt" message (e.g. "user", "ticker")
+//   emitUpdateWithId(type, id, [es]) - the same, numbered with an SSE event id
+//   emitUpdateMask(mask, [es]) - push an "update_mask" message (bits as in sse_hub.py)
+//   emitAdminUpdate(type, gameId, [es]) - push an admin "update_prompt" about one game
 //   emitKeepalive(count, [es]) - push a "keepalive" message
 //   emitError([es])            - fire the stream's onerror
 //   (es defaults to the most recently created FakeEventSource)
@@ -192,9 +195,9 @@ function latestEventSource() {
   return eventSourceInstances[eventSourceInstances.length - 1];
 }
 
-function deliverMessage(es, payload) {
+function deliverMessage(es, payload, lastEventId = undefined) {
   if (!es) throw new Error("No FakeEventSource instance available to emit on");
-  if (es.onmessage) es.onmessage({ data: JSON.stringify(payload) });
+  if (es.onmessage) es.onmessage({ data: JSON.stringify(payload), lastEventId });
 }
 
 // Push an "update_prompt" message for the given update type ("user",
@@ -204,6 +207,23 @@ export function emitUpdate(type, es = latestEventSource()) {
   deliverMessage(es, { handler: "update_prompt", data: type });
 }
 
+// Push an "update_prompt" message carrying an SSE event id, as the server's
+// numbered prompts do. An empty id clears the stream's last event id.
+export function emitUpdateWithId(type, id, es = latestEventSource()) {
+  deliverMessage(es, { handler: "update_prompt", data: type }, id);
+}
+
+// Push an admin "update_prompt" message, which also names the game it is about.
+export function emitAdminUpdate(type, gameId, es = latestEventSource()) {
+  deliverMessage(es, { handler: "update_prompt", data: type, game_id: gameId });
+}
+
+// Push an "update_mask" message: several update prompts coalesced into one,
+// with a bit set for each target (user = 1, ticker = 2, circle = 4).
+export function emitUpdateMask(mask, es = latestEventSource()) {
+  deliverMessage(es, { handler: "update_mask", data: mask });
+}
+
 // Push a "keepalive" message with the given incrementing count.
 export function emitKeepalive(count, es = latestEventSource()) {
   deliverMessage(es, { handler: "keepalive", data: count });
@@ -0,0 +1,302 @@
+"""Concurrency benchmark for the database under set_location and submit_shot.
+
+Starts several backend processes, as ``uvicorn --workers N`` would, against
+one throwaway SQLite database. Each runs many simulated players through the
+real ASGI app: every player sends location updates, and every tenth request
+submits a small shot photo instead. Requests within one process are handled
+one at a time by its event loop, so it is the processes that compete for the
+database, just as they do in production.
+
+It does this once per journal mode (``SQLITE_JOURNAL_MODE``, default: the old
+``DELETE`` and the new ``WAL``) and reports, for each endpoint, the p50 and
+p99 latency and how many requests failed with "database is locked":
+
+    python -m scripts.bench_db_concurrency --processes 4 --clients 25 \\
+        --requests 40 --journal-modes DELETE WAL
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+from base64 import b64encode
+from pathlib import Path
+from typing import Dict
+from typing import List
+from uuid import UUID
+from uuid import uuid4
+
+SHOT_EVERY = 10
+
+
+def configure_environment(scratch: Path, journal_mode: str) -> None:
+    """Point the backend at a scratch database and keep it quiet. Must run
+    before anything from ``backend`` is imported: the database is set up on
+    import. ``.env`` is still read, but never overrides what is set here."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{scratch / 'bench.db'}"
+    os.environ["BLOB_STORE_DIR"] = str(scratch / "blobs")
+    os.environ["IMAGE_ARCHIVE_DIR"] = str(scratch / "archive")
+    os.environ["IMAGE_CACHE_DIR"] = str(scratch / "derived")
+    os.environ["SQLITE_JOURNAL_MODE"] = journal_mode
+    os.environ["LOG_LEVEL"] = "WARNING"
+    os.environ["DEBUG_DATABASE"] = ""
+
+
+def make_photo() -> bytes:
+    from PIL import Image
+
+    image = Image.frombytes("RGB", (320, 240), os.urandom(320 * 240 * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def make_players(num: int, num_bullets: int) -> List[UUID]:
+    """One game, one team, ``num`` players with plenty of ammo"""
+    from backend.admin_interface import AdminInterface
+    from backend.database import session_scope
+    from backend.model import User
+
+    game_id = AdminInterface().create_game()
+    team_id = AdminInterface().create_team(game_id, "Benchmark")
+
+    user_ids = [uuid4() for _ in range(num)]
+    with session_scope() as session:
+        session.add_all(
+            [
+                User(id=user_id, team_id=team_id, num_bullets=num_bullets)
+                for user_id in user_ids
+            ]
+        )
+
+    return user_ids
+
+
+def session_cookie(user_id: UUID) -> str:
+    import itsdangerous
+
+    signer = itsdangerous.TimestampSigner(os.environ["SECRET_KEY"])
+    data = b64encode(json.dumps({"UUID": str(user_id)}).encode("utf-8"))
+    return signer.sign(data).decode("utf-8")
+
+
+async def post(app, path: str, query: str, body: bytes, headers: list) -> int:
+    """One request through the ASGI app. Returns the status code"""
+    sent = False
+    status = None
+
+    async def receive():
+        nonlocal sent
+        chunk, sent = (b"" if sent else body), True
+        return {"type": "http.request", "body": chunk, "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": [(b"host", b"testserver")] + headers,
+        "client": ("127.0.0.1", 10000),
+        "server": ("testserver", 80),
+    }
+    await app(scope, receive, send)
+
+    return status
+
+
+async def run_player(app, user_id: UUID, photo: bytes, num_requests: int, results):
+    cookie = (b"cookie", f"session={session_cookie(user_id)}".encode())
+
+    for n in range(num_requests):
+        if n % SHOT_EVERY == SHOT_EVERY - 1:
+            endpoint = "submit_shot"
+            args = (
+                "/api/submit_shot_photo",
+                "",
+                photo + os.urandom(8),
+                [cookie, (b"content-type", b"image/jpeg")],
+            )
+        else:
+            endpoint = "set_location"
+            args = (
+                "/api/set_location",
+                f"latitude={51.5 + n * 1e-5}&longitude=-0.1",
+                b"",
+                [cookie],
+            )
+
+        start = time.perf_counter()
+        try:
+            status = await post(app, *args)
+            outcome = "ok" if status == 200 else f"http_{status}"
+        except Exception as e:
+            outcome = "locked" if "database is locked" in str(e) else type(e).__name__
+        results[endpoint].append((time.perf_counter() - start, outcome))
+
+        # Let the other players in this process have a turn
+        await asyncio.sleep(0)
+
+
+# How long to wait for every process to be ready before giving up
+STARTUP_TIMEOUT = 120
+
+
+def worker(
+    scratch, journal_mode, user_ids, num_requests, import_lock, barrier, queue
+) -> None:
+    configure_environment(Path(scratch), journal_mode)
+
+    # One at a time: importing the app rolls the log file over, and two
+    # processes doing that at once trip over each other
+    with import_lock:
+        from backend.main import app
+
+    photo = make_photo()
+    results = {"set_location": [], "submit_shot": []}
+
+    async def run():
+        await asyncio.gather(
+            *(
+                run_player(app, user_id, photo, num_requests, results)
+                for user_id in user_ids
+            )
+        )
+
+    barrier.wait(STARTUP_TIMEOUT)
+    asyncio.run(run())
+    queue.put(results)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarise(results: Dict[str, list], elapsed: float) -> dict:
+    summary = {"requests_per_s": sum(map(len, results.values())) / elapsed}
+
+    for endpoint, samples in results.items():
+        if not samples:
+            continue
+
+        latencies = [latency for latency, _ in samples]
+        outcomes = [outcome for _, outcome in samples]
+        summary[f"{endpoint}_p50_ms"] = 1e3 * statistics.median(latencies)
+        summary[f"{endpoint}_p99_ms"] = 1e3 * percentile(latencies, 0.99)
+        summary[f"{endpoint}_locked"] = outcomes.count("locked")
+        summary[f"{endpoint}_other_errors"] = (
+            len(outcomes) - outcomes.count("ok") - outcomes.count("locked")
+        )
+
+    return summary
+
+
+def run_mode(journal_mode: str, processes: int, clients: int, num_requests: int):
+    context = multiprocessing.get_context("spawn")
+
+    with tempfile.TemporaryDirectory() as scratch:
+        # Set the database up in a process of its own, so that this one holds
+        # no connections while the workers run
+        setup_queue = context.Queue()
+        setup = context.Process(
+            target=setup_players,
+            args=(
+                scratch,
+                journal_mode,
+                processes * clients,
+                num_requests,
+                setup_queue,
+            ),
+        )
+        setup.start()
+        user_ids = setup_queue.get()
+        setup.join()
+
+        import_lock = context.Lock()
+        barrier = context.Barrier(processes + 1)
+        queue = context.Queue()
+        workers = [
+            context.Process(
+                target=worker,
+                args=(
+                    scratch,
+                    journal_mode,
+                    user_ids[i * clients : (i + 1) * clients],
+                    num_requests,
+                    import_lock,
+                    barrier,
+                    queue,
+                ),
+            )
+            for i in range(processes)
+        ]
+        for process in workers:
+            process.start()
+
+        barrier.wait(STARTUP_TIMEOUT)
+        start = time.perf_counter()
+        results = {"set_location": [], "submit_shot": []}
+        for _ in workers:
+            for endpoint, samples in queue.get().items():
+                results[endpoint].extend(samples)
+        elapsed = time.perf_counter() - start
+
+        for process in workers:
+            process.join()
+
+    return summarise(results, elapsed)
+
+
+def setup_players(scratch, journal_mode, num_players, num_requests, queue) -> None:
+    configure_environment(Path(scratch), journal_mode)
+    queue.put(make_players(num_players, num_bullets=num_requests))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--processes", type=int, default=4, help="backend worker processes"
+    )
+    parser.add_argument(
+        "--clients", type=int, default=25, help="simulated players per process"
+    )
+    parser.add_argument(
+        "--requests", type=int, default=40, help="requests each player makes"
+    )
+    parser.add_argument(
+        "--journal-modes",
+        nargs="+",
+        default=["DELETE", "WAL"],
+        help="SQLITE_JOURNAL_MODE values to compare",
+    )
+    args = parser.parse_args(argv)
+
+    for journal_mode in args.journal_modes:
+        results = run_mode(journal_mode, args.processes, args.clients, args.requests)
+
+        print(f"journal_mode={journal_mode}")
+        for name, value in results.items():
+            if isinstance(value, float):
+                value = f"{value:.1f}"
+            print(f"{name:>28}: {value}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,115 @@
+"""Benchmark for the identity decoder: the scalar reference against the
+compiled decoder.
+
+For each number of candidate players, decodes a batch of random readings
+against the default scheme's codewords (re-used across players, as overrides
+and a big enough game would) three ways:
+
+* ``decode_scalar``, one candidate and channel at a time;
+* ``decode``, compiling the candidates for each reading;
+* ``decode_many``, compiling them once for the whole batch.
+
+    python -m scripts.bench_decoder --players 50 500 5000 --readings 100
+"""
+
+import argparse
+import random
+import statistics
+import time
+from typing import Callable
+
+
+def time_call(func: Callable, repeat: int) -> float:
+    """Median wall time of ``func()`` over ``repeat`` runs, in ms"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return 1e3 * statistics.median(timings)
+
+
+def random_reading(scheme):
+    from backend.identity.observations import ChannelObservation
+    from backend.identity.observations import Reading
+
+    observations = []
+    for i, channel in enumerate(scheme.channels):
+        if random.random() < 0.2:
+            observations.append(ChannelObservation.erasure())
+            continue
+        index = random.randrange(scheme.channels.max_addressable_symbol(i))
+        observations.append(
+            ChannelObservation.best_guess(
+                channel.index_to_label(index), random.uniform(0.5, 1.0)
+            )
+        )
+    return Reading(observations)
+
+
+def bench(num_players: int, num_readings: int, repeat: int) -> dict:
+    from backend.identity.config import default_scheme
+    from backend.identity.decoder import decode
+    from backend.identity.decoder import decode_many
+    from backend.identity.decoder import decode_scalar
+
+    scheme = default_scheme()
+    slots = scheme.usable_slots()
+    candidates = {
+        f"player-{n}": scheme.codeword_of_slot(slots[n % len(slots)])
+        for n in range(num_players)
+    }
+    readings = [random_reading(scheme) for _ in range(num_readings)]
+    d = scheme.code.min_distance()
+    channels = scheme.channels
+
+    for reading in readings:
+        assert (
+            decode(reading, candidates, channels, code_min_distance=d).ranked
+            == decode_scalar(reading, candidates, channels, code_min_distance=d).ranked
+        )
+
+    def per_reading(func):
+        return time_call(func, repeat) / num_readings
+
+    return {
+        "scalar_ms": per_reading(
+            lambda: [
+                decode_scalar(r, candidates, channels, code_min_distance=d)
+                for r in readings
+            ]
+        ),
+        "decode_ms": per_reading(
+            lambda: [
+                decode(r, candidates, channels, code_min_distance=d) for r in readings
+            ]
+        ),
+        "decode_many_ms": per_reading(
+            lambda: decode_many(readings, candidates, channels, code_min_distance=d)
+        ),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--players", type=int, nargs="+", default=[50, 500, 5000], help="candidates"
+    )
+    parser.add_argument("--readings", type=int, default=100, help="readings per run")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs each")
+    args = parser.parse_args(argv)
+
+    random.seed(0)
+
+    results = {n: bench(n, args.readings, args.repeat) for n in args.players}
+
+    print("ms per reading")
+    print(f"{'players':>16}" + "".join(f"{n:>10}" for n in results))
+    for name in next(iter(results.values())):
+        print(f"{name:>16}" + "".join(f"{results[n][name]:10.3g}" for n in results))
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,158 @@
+"""Benchmark for the hot read queries, with and without their indexes.
+
+Fills a throwaway SQLite database with a season's worth of play: several
+games, each with its teams, players, shots (mostly checked, some still in the
+queue) and ticker entries. Then it times:
+
+* the head of one game's shot queue (``AdminInterface.get_queue_head``);
+* the IDs of every unchecked shot (``get_unchecked_shots_ids``);
+* one game's scoreboard (``get_scoreboard``);
+* a player's ticker (``Ticker.get_messages``).
+
+It does this once with the indexes the models define, then drops the indexes
+added for these queries and times them again:
+
+    python -m scripts.bench_hot_queries --games 10 --players 50 --shots 2000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+from uuid import uuid4
+
+# The indexes added for these queries, which the second run goes without
+INDEXES = [
+    "ix_shots_game_checked_time",
+    "ix_shots_checked_time",
+    "ix_shots_user_checked_target",
+    "ix_users_team_id",
+    "ix_teams_game_id",
+]
+
+
+def configure_environment(scratch: Path) -> None:
+    """Point the backend at a scratch database and keep it quiet. Must run
+    before anything from ``backend`` is imported: the database is set up on
+    import. ``.env`` is still read, but never overrides what is set here."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{scratch / 'bench.db'}"
+    os.environ["BLOB_STORE_DIR"] = str(scratch / "blobs")
+    os.environ["LOG_LEVEL"] = "WARNING"
+    os.environ["DEBUG_DATABASE"] = ""
+
+
+def make_games(num_games: int, num_players: int, num_shots: int):
+    """``num_games`` games of ``num_players`` players in four teams, each game
+    with ``num_shots`` shots of which the last 5% are unchecked. Returns a
+    (game_id, user_id) to query"""
+    from backend.database import session_scope
+    from backend.model import Game
+    from backend.model import Shot
+    from backend.model import Team
+    from backend.model import TickerEntry
+    from backend.model import User
+
+    random.seed(0)
+
+    with session_scope() as session:
+        for _ in range(num_games):
+            game = Game(id=uuid4())
+            teams = [Team(id=uuid4(), game_id=game.id, name=f"T{i}") for i in range(4)]
+            users = [
+                User(id=uuid4(), team_id=teams[i % 4].id, name=f"P{i}")
+                for i in range(num_players)
+            ]
+            session.add(game)
+            session.add_all(teams + users)
+
+            for n in range(num_shots):
+                shooter = random.choice(users)
+                checked = n < 0.95 * num_shots
+                session.add(
+                    Shot(
+                        game_id=game.id,
+                        team_id=shooter.team_id,
+                        user_id=shooter.id,
+                        target_user_id=random.choice(users).id if checked else None,
+                        checked=checked,
+                    )
+                )
+
+                private = random.choice(users).id if n % 2 else None
+                session.add(
+                    TickerEntry(
+                        game_id=game.id, private_user_id=private, message=f"M{n}"
+                    )
+                )
+
+        return game.id, users[0].id
+
+
+def time_call(func: Callable, repeat: int) -> float:
+    """Median wall time of ``func()`` over ``repeat`` runs, in ms"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return 1e3 * statistics.median(timings)
+
+
+def time_queries(game_id, user_id, repeat: int) -> dict:
+    from backend.admin_interface import AdminInterface
+    from backend.ticker import Ticker
+
+    return {
+        "queue_head_ms": time_call(
+            lambda: AdminInterface().get_queue_head(game_id), repeat
+        ),
+        "unchecked_ids_ms": time_call(
+            lambda: AdminInterface().get_unchecked_shots_ids(), repeat
+        ),
+        "scoreboard_ms": time_call(
+            lambda: AdminInterface().get_scoreboard(game_id), repeat
+        ),
+        "ticker_ms": time_call(
+            lambda: Ticker(game_id, user_id).get_messages(10), repeat
+        ),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--games", type=int, default=10, help="games to create")
+    parser.add_argument("--players", type=int, default=50, help="players per game")
+    parser.add_argument("--shots", type=int, default=2000, help="shots per game")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs each")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        configure_environment(Path(scratch))
+
+        import sqlalchemy as sa
+
+        from backend import database
+
+        game_id, user_id = make_games(args.games, args.players, args.shots)
+
+        with_indexes = time_queries(game_id, user_id, args.repeat)
+
+        with database.engine.begin() as conn:
+            for index in INDEXES:
+                conn.execute(sa.text(f"DROP INDEX {index}"))
+
+        without_indexes = time_queries(game_id, user_id, args.repeat)
+
+    print(f"{'':>18}  {'indexed':>8}  {'no index':>8}")
+    for name in with_indexes:
+        print(f"{name:>18}  {with_indexes[name]:8.2f}  {without_indexes[name]:8.2f}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,141 @@
+"""Benchmark for looking players' positions up in the location history.
+
+Fills a throwaway SQLite database with one game's players and their tracks -
+a fix every few seconds for each player, for a few hours - then times:
+
+* "where was everyone at time T", at random times (``positions_at``);
+* building and parsing the JSON snapshot that shots used to store, for
+  comparison, and how big it is;
+* pruning the history: thinning out the old fixes and expiring none.
+
+    python -m scripts.bench_location_history --players 100 --hours 3
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+from uuid import uuid4
+
+
+def configure_environment(scratch: Path) -> None:
+    """Point the backend at a scratch database and keep it quiet. Must run
+    before anything from ``backend`` is imported: the database is set up on
+    import. ``.env`` is still read, but never overrides what is set here."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{scratch / 'bench.db'}"
+    os.environ["BLOB_STORE_DIR"] = str(scratch / "blobs")
+    os.environ["LOG_LEVEL"] = "WARNING"
+    os.environ["DEBUG_DATABASE"] = ""
+
+
+def make_game(num_players: int, hours: float, every: float, start: float):
+    """A game of ``num_players`` in four teams, each with a fix every
+    ``every`` seconds for ``hours`` from ``start``. Returns (game_id, rows)"""
+    import sqlalchemy as sa
+
+    from backend import database
+    from backend.database import session_scope
+    from backend.model import Game
+    from backend.model import LocationFix
+    from backend.model import Team
+    from backend.model import User
+
+    random.seed(0)
+
+    game = Game(id=uuid4())
+    teams = [Team(id=uuid4(), game_id=game.id, name=f"T{i}") for i in range(4)]
+    users = [
+        User(id=uuid4(), team_id=teams[i % 4].id, name=f"P{i}")
+        for i in range(num_players)
+    ]
+    game_id, user_ids = game.id, [user.id for user in users]
+
+    with session_scope() as session:
+        session.add(game)
+        session.add_all(teams + users)
+
+    rows = []
+    t = start
+    while t < start + 3600 * hours:
+        for user_id in user_ids:
+            rows.append(
+                {
+                    "game_id": game_id,
+                    "user_id": user_id,
+                    "timestamp": t + random.random(),
+                    "latitude": 51.5 + random.random() / 100,
+                    "longitude": -0.1 + random.random() / 100,
+                }
+            )
+        t += every
+
+    with database.engine.begin() as conn:
+        conn.execute(sa.insert(LocationFix.__table__), rows)
+
+    return game_id, len(rows)
+
+
+def time_call(func: Callable, repeat: int) -> float:
+    """Median wall time of ``func()`` over ``repeat`` runs, in ms"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return 1e3 * statistics.median(timings)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, default=100, help="players")
+    parser.add_argument("--hours", type=float, default=3, help="length of play")
+    parser.add_argument("--every", type=float, default=5, help="seconds per fix")
+    parser.add_argument("--repeat", type=int, default=50, help="timed runs each")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        configure_environment(Path(scratch))
+
+        from backend.admin_interface import AdminInterface
+        from backend.database import session_scope
+        from backend.location_history import positions_at
+        from backend.location_history import prune
+        from backend.shot_identification import parse_location_context
+
+        start = time.time() - 3600 * args.hours
+        game_id, num_rows = make_game(args.players, args.hours, args.every, start)
+
+        def lookup():
+            at_time = start + random.random() * 3600 * args.hours
+            with session_scope() as session:
+                return positions_at(session, game_id, at_time)
+
+        def old_snapshot():
+            raw = json.dumps(AdminInterface().get_locations(game_id), default=str)
+            return parse_location_context(raw), raw
+
+        positions_ms = time_call(lookup, args.repeat)
+        snapshot_ms = time_call(old_snapshot, args.repeat)
+        snapshot_bytes = len(old_snapshot()[1])
+
+        t0 = time.perf_counter()
+        num_pruned = prune()
+        prune_ms = 1e3 * (time.perf_counter() - t0)
+
+        assert len(lookup()) == args.players
+
+    print(f"{num_rows} fixes for {args.players} players over {args.hours} h")
+    print(f"positions at T:            {positions_ms:8.2f} ms")
+    print(f"old snapshot (build+parse):{snapshot_ms:8.2f} ms, {snapshot_bytes} bytes")
+    print(f"prune:                     {prune_ms:8.2f} ms, {num_pruned} fixes thinned")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
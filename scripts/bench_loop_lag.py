@@ -0,0 +1,226 @@
+"""Event-loop lag under load on the hot player endpoints.
+
+Runs simulated players through the real ASGI app, each polling
+``/api/user_info``, ``/api/ticker_messages`` and ``/api/get_scoreboard`` and
+posting ``/api/set_location``, with a short pause between requests. Meanwhile
+``backend.loop_monitor`` measures how late the event loop wakes: that is the
+delay every SSE stream and upload in the process suffers.
+
+It runs twice, each in its own process: with ``DB_THREADS=0`` (database work
+on the event loop, as handlers used to do it) and with database work offloaded
+to the thread pool. Request latencies are not comparable between the two:
+with the loop blocked, a request's wait for it to come free shows up as lag
+rather than as latency of its own.
+
+
+    python -m scripts.bench_loop_lag --clients 50 --requests 40
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from base64 import b64encode
+from pathlib import Path
+from typing import List
+from uuid import UUID
+from uuid import uuid4
+
+REQUESTS = [
+    ("GET", "/api/user_info", ""),
+    ("GET", "/api/ticker_messages", ""),
+    ("POST", "/api/set_location", "latitude=51.5&longitude=-0.1"),
+    ("GET", "/api/get_scoreboard", ""),
+]
+
+# Between one player's requests
+THINK_TIME = 0.005
+
+
+def configure_environment(scratch: Path, db_threads: int) -> None:
+    """Point the backend at a scratch database and keep it quiet. Must run
+    before anything from ``backend`` is imported: the database is set up on
+    import. ``.env`` is still read, but never overrides what is set here."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{scratch / 'bench.db'}"
+    os.environ["DB_THREADS"] = str(db_threads)
+    os.environ["LOG_LEVEL"] = "WARNING"
+    os.environ["DEBUG_DATABASE"] = ""
+
+
+def make_players(num: int) -> List[UUID]:
+    """One game, two teams, ``num`` players between them, and a ticker with
+    something on it"""
+    from backend.admin_interface import AdminInterface
+    from backend.database import session_scope
+    from backend.model import User
+    from backend.ticker import Ticker
+
+    game_id = AdminInterface().create_game()
+    team_ids = [AdminInterface().create_team(game_id, name) for name in ("Red", "Blue")]
+
+    user_ids = [uuid4() for _ in range(num)]
+    with session_scope() as session:
+        session.add_all(
+            [
+                User(id=user_id, team_id=team_ids[i % 2], name=f"Player {i}")
+                for i, user_id in enumerate(user_ids)
+            ]
+        )
+
+    for i in range(10):
+        Ticker(game_id, user_id=None).post_message(f"Message {i}")
+
+    return user_ids
+
+
+def session_cookie(user_id: UUID) -> str:
+    import itsdangerous
+
+    signer = itsdangerous.TimestampSigner(os.environ["SECRET_KEY"])
+    data = b64encode(json.dumps({"UUID": str(user_id)}).encode("utf-8"))
+    return signer.sign(data).decode("utf-8")
+
+
+async def request(app, method: str, path: str, query: str, cookie: str) -> int:
+    """One request through the ASGI app. Returns the status code"""
+    status = None
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": [
+            (b"host", b"testserver"),
+            (b"cookie", f"session={cookie}".encode()),
+        ],
+        "client": ("127.0.0.1", 10000),
+        "server": ("testserver", 80),
+    }
+    await app(scope, receive, send)
+
+    return status
+
+
+async def run_player(app, user_id: UUID, num_requests: int, latencies: list):
+    cookie = session_cookie(user_id)
+
+    for n in range(num_requests):
+        method, path, query = REQUESTS[n % len(REQUESTS)]
+
+        start = time.perf_counter()
+        status = await request(app, method, path, query, cookie)
+        latencies.append(time.perf_counter() - start)
+
+        if status != 200:
+            raise RuntimeError(f"{path} failed with {status}")
+
+        await asyncio.sleep(THINK_TIME)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def measure(num_clients: int, num_requests: int) -> dict:
+    from backend import loop_monitor
+    from backend.main import app
+
+    user_ids = make_players(num_clients)
+    latencies = []
+
+    loop_monitor.start(interval=0.01)
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(run_player(app, user_id, num_requests, latencies) for user_id in user_ids)
+    )
+    elapsed = time.perf_counter() - start
+    loop_monitor.stop()
+
+    lag = loop_monitor.get_stats()
+
+    return {
+        "requests_per_s": len(latencies) / elapsed,
+        "request_p50_ms": 1e3 * statistics.median(latencies),
+        "request_p99_ms": 1e3 * percentile(latencies, 0.99),
+        "loop_lag_p50_ms": lag["p50_ms"],
+        "loop_lag_p99_ms": lag["p99_ms"],
+        "loop_lag_max_ms": lag["max_ms"],
+    }
+
+
+def run_worker(db_threads: int, num_clients: int, num_requests: int) -> None:
+    with tempfile.TemporaryDirectory() as scratch:
+        configure_environment(Path(scratch), db_threads)
+        results = asyncio.run(measure(num_clients, num_requests))
+
+    print(json.dumps(results))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=50, help="simulated players")
+    parser.add_argument(
+        "--requests", type=int, default=40, help="requests each player makes"
+    )
+    parser.add_argument(
+        "--db-threads",
+        type=int,
+        nargs="+",
+        default=[0, 2],
+        help="DB_THREADS values to compare (0: on the event loop)",
+    )
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker is not None:
+        run_worker(args.worker, args.clients, args.requests)
+        return 0
+
+    for db_threads in args.db_threads:
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "scripts.bench_loop_lag",
+                "--clients",
+                str(args.clients),
+                "--requests",
+                str(args.requests),
+                "--worker",
+                str(db_threads),
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        results = json.loads(output.strip().splitlines()[-1])
+
+        print(f"DB_THREADS={db_threads}")
+        for name, value in results.items():
+            print(f"{name:>18}: {value:.1f}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
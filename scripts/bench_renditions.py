@@ -0,0 +1,92 @@
+"""Benchmark for rendering a shot's pictures.
+
+Makes a phone-sized photo and times:
+
+* preparing it for the vision model as every review used to: the aim marker
+  drawn on the full-size photo, which is encoded, decoded again and resized;
+* preparing it as it is now, decoding the JPEG at a reduced scale and drawing
+  the marker on the downsized picture;
+* rendering every picture a shot gets on submission
+  (``image_cache.TRANSFORMS``), one after another and on the render pool;
+* what a review then pays for its picture: a read from the cache.
+
+    python -m scripts.bench_renditions --width 4032 --height 3024
+"""
+
+import argparse
+import io
+import os
+import statistics
+import time
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from uuid import uuid4
+
+
+def make_photo(width: int, height: int) -> str:
+    """A phone-sized JPEG as a data URL. Noise, so it compresses like a photo
+    rather than like a blank frame"""
+    from PIL import Image
+
+    image = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+
+    return "data:image/jpeg;base64," + b64encode(buffer.getvalue()).decode("ascii")
+
+
+def time_call(func: Callable, repeat: int) -> float:
+    """Median wall time of ``func()`` over ``repeat`` runs, in ms"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return 1e3 * statistics.median(timings)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--width", type=int, default=4032, help="photo width")
+    parser.add_argument("--height", type=int, default=3024, help="photo height")
+    parser.add_argument("--workers", type=int, default=2, help="render threads")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs each")
+    args = parser.parse_args(argv)
+
+    from backend import image_cache
+    from backend.image_cache import VISION
+    from backend.image_cache import DerivedImageCache
+    from backend.image_processing import draw_aim_marker
+    from backend.image_processing import prepare_for_vision
+
+    photo = make_photo(args.width, args.height)
+    transforms = list(image_cache.TRANSFORMS.values())
+    pool = ThreadPoolExecutor(max_workers=args.workers)
+
+    def all_in_pool():
+        list(pool.map(lambda transform: transform(photo), transforms))
+
+    cache = DerivedImageCache(directory=None, max_bytes=2**30)
+    shot_id = uuid4()
+    cache.get(shot_id, VISION, lambda: photo)
+
+    results = {
+        "vision, as it was": lambda: prepare_for_vision(draw_aim_marker(photo)),
+        "vision, now": lambda: image_cache.TRANSFORMS[VISION](photo),
+        "all, one by one": lambda: [transform(photo) for transform in transforms],
+        f"all, {args.workers} workers": all_in_pool,
+        "review, from cache": lambda: cache.get(shot_id, VISION, lambda: 1 / 0),
+    }
+
+    print(f"{args.width}x{args.height} photo, {len(transforms)} pictures per shot")
+    for name, func in results.items():
+        print(f"{name:<24}{time_call(func, args.repeat):10.2f} ms")
+
+    pool.shutdown()
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,197 @@
+"""Benchmark for loading the scoreboard.
+
+Fills a throwaway SQLite database with a game - players in four teams, and a
+number of checked shots each, a third of them hits - then times the
+scoreboard:
+
+* added up from every player's shots, as it used to be;
+* read from the players' running totals (``AdminInterface.get_scoreboard``);
+* from the cache, as players get it while nothing changes
+  (``scoreboard.get_cached_scoreboard``);
+
+and how long checking and rebuilding the totals take.
+
+    python -m scripts.bench_scoreboard --players 100 --shots 50
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+from uuid import uuid4
+
+
+def configure_environment(scratch: Path) -> None:
+    """Point the backend at a scratch database and keep it quiet. Must run
+    before anything from ``backend`` is imported: the database is set up on
+    import. ``.env`` is still read, but never overrides what is set here."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{scratch / 'bench.db'}"
+    os.environ["BLOB_STORE_DIR"] = str(scratch / "blobs")
+    os.environ["LOG_LEVEL"] = "WARNING"
+    os.environ["DEBUG_DATABASE"] = ""
+
+
+def make_game(num_players: int, shots_per_player: int):
+    """A game of ``num_players`` in four teams who have each fired
+    ``shots_per_player`` shots, with their totals built. Returns the game id"""
+    from backend import scoreboard
+    from backend.database import session_scope
+    from backend.model import Game
+    from backend.model import Shot
+    from backend.model import Team
+    from backend.model import User
+
+    random.seed(0)
+
+    game = Game(id=uuid4())
+    teams = [Team(id=uuid4(), game_id=game.id, name=f"T{i}") for i in range(4)]
+    users = [
+        User(id=uuid4(), team_id=teams[i % 4].id, name=f"P{i}")
+        for i in range(num_players)
+    ]
+    game_id = game.id
+
+    shots = []
+    for user in users:
+        for _ in range(shots_per_player):
+            hit = random.random() < 1 / 3
+            shots.append(
+                Shot(
+                    game_id=game_id,
+                    team_id=user.team_id,
+                    user_id=user.id,
+                    checked=True,
+                    result="hit" if hit else "miss",
+                    target_user_id=random.choice(users).id if hit else None,
+                    shot_damage=random.randint(1, 3),
+                )
+            )
+
+    with session_scope() as session:
+        session.add(game)
+        session.add_all(teams + users)
+        session.flush()
+        session.add_all(shots)
+
+    with session_scope() as session:
+        scoreboard.rebuild(session)
+
+    return game_id
+
+
+def old_scoreboard(game_id):
+    """AdminInterface.get_scoreboard as it was: every player's hits added up
+    from the shots table"""
+    from sqlalchemy import and_
+
+    from backend.database import session_scope
+    from backend.model import Shot
+    from backend.model import Team
+    from backend.model import User
+
+    with session_scope() as session:
+        teams_by_id = dict(session.query(Team.id, Team.name).filter_by(game_id=game_id))
+        user_data = (
+            session.query(
+                User.id, User.name, User.team_id, User.hit_points, User.time_of_death
+            )
+            .filter(User.team_id.in_(teams_by_id.keys()))
+            .all()
+        )
+        shots = (
+            session.query(Shot.user_id, Shot.shot_damage)
+            .filter(
+                and_(
+                    Shot.user_id.in_([row[0] for row in user_data]),
+                    Shot.checked,
+                    Shot.target_user_id != None,
+                )
+            )
+            .all()
+        )
+
+    table = []
+    for user_id, name, team_id, hit_points, time_of_death in user_data:
+        total_damage = sum(damage for shooter, damage in shots if shooter == user_id)
+        table.append(
+            {
+                "name": name,
+                "team": teams_by_id[team_id],
+                "hitpoints": hit_points,
+                "total_damage": total_damage,
+                "state": User.calculate_state(
+                    teams_by_id[team_id], hit_points, time_of_death
+                ),
+            }
+        )
+
+    return {"table": sorted(table, key=lambda t: t["total_damage"], reverse=True)}
+
+
+def time_call(func: Callable, repeat: int) -> float:
+    """Median wall time of ``func()`` over ``repeat`` runs, in ms"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return 1e3 * statistics.median(timings)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, default=100, help="players")
+    parser.add_argument("--shots", type=int, default=50, help="shots per player")
+    parser.add_argument("--repeat", type=int, default=50, help="timed runs each")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        configure_environment(Path(scratch))
+
+        from backend import scoreboard
+        from backend.admin_interface import AdminInterface
+        from backend.database import session_scope
+
+        game_id = make_game(args.players, args.shots)
+
+        def damages(board):
+            return sorted((row["name"], row["total_damage"]) for row in board["table"])
+
+        assert damages(old_scoreboard(game_id)) == damages(
+            AdminInterface().get_scoreboard(game_id)
+        )
+
+        def check():
+            with session_scope() as session:
+                assert scoreboard.check(session) == []
+
+        def rebuild():
+            with session_scope() as session:
+                scoreboard.rebuild(session)
+
+        old_ms = time_call(lambda: old_scoreboard(game_id), args.repeat)
+        stats_ms = time_call(
+            lambda: AdminInterface().get_scoreboard(game_id), args.repeat
+        )
+        cached_ms = time_call(
+            lambda: scoreboard.get_cached_scoreboard(game_id), args.repeat
+        )
+        check_ms = time_call(check, max(1, args.repeat // 10))
+        rebuild_ms = time_call(rebuild, max(1, args.repeat // 10))
+
+    print(f"{args.players} players, {args.players * args.shots} shots")
+    print(f"added up from the shots: {old_ms:8.2f} ms")
+    print(f"from the stats table:    {stats_ms:8.2f} ms")
+    print(f"from the cache:          {cached_ms:8.2f} ms")
+    print(f"check:                   {check_ms:8.2f} ms")
+    print(f"rebuild:                 {rebuild_ms:8.2f} ms")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,144 @@
+"""Benchmark for fetching shot photos.
+
+Fills a throwaway SQLite database and blob store with one player's shots,
+each a phone-sized photo, then times getting one photo back and measures what
+is sent:
+
+* ``/user_shot_image``: the photo as a base64 data URL inside JSON, every
+  time it is asked for;
+* ``/shot_image``: the photo's bytes, with an ETag and an immutable
+  Cache-Control. The browser keeps it, so asking again costs nothing; a
+  revalidation (``If-None-Match``) is answered 304 without reading it;
+* the same for the thumbnail, rendered once and then read from the image
+  cache.
+
+    python -m scripts.bench_shot_images --shots 20
+"""
+
+import argparse
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+from base64 import b64encode
+from pathlib import Path
+from typing import Callable
+from uuid import uuid4
+
+
+def configure_environment(scratch: Path) -> None:
+    """Point the backend at a scratch database and blob store and keep it
+    quiet. Must run before anything from ``backend`` is imported: the database
+    is set up on import. ``.env`` is still read, but never overrides what is
+    set here."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{scratch / 'bench.db'}"
+    os.environ["BLOB_STORE_DIR"] = str(scratch / "blobs")
+    os.environ["LOG_LEVEL"] = "WARNING"
+    os.environ["DEBUG_DATABASE"] = ""
+
+
+def make_photo(width: int, height: int) -> str:
+    """A phone-sized JPEG as a data URL. Noise, so it compresses like a photo
+    rather than like a blank frame"""
+    from PIL import Image
+
+    image = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+
+    return "data:image/jpeg;base64," + b64encode(buffer.getvalue()).decode("ascii")
+
+
+def make_shots(num_shots: int, photo: str):
+    """A player in a game who has fired ``num_shots``. Returns their id and the
+    shots' ids"""
+    from backend.admin_interface import AdminInterface
+    from backend.user_interface import UserInterface
+
+    admin = AdminInterface()
+    team_id = admin.create_team(admin.create_game(), "T")
+
+    user_id = UserInterface(uuid4()).get_user_model().id
+    admin.add_user_to_team(user_id, team_id)
+
+    shooter = UserInterface(user_id)
+    shooter.award_ammo(num_shots)
+    shot_ids = [shooter.submit_shot(photo) for _ in range(num_shots)]
+
+    return user_id, shot_ids
+
+
+def time_call(func: Callable, repeat: int) -> float:
+    """Median wall time of ``func()`` over ``repeat`` runs, in ms"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return 1e3 * statistics.median(timings)
+
+
+def bench(num_shots: int, photo: str, repeat: int) -> dict:
+    from backend import shot_images
+    from backend.image_cache import THUMBNAIL
+    from backend.user_interface import UserInterface
+
+    user_id, shot_ids = make_shots(num_shots, photo)
+    shot_id = shot_ids[-1]
+
+    def old_fetch():
+        return json.dumps(
+            {"image_base64": UserInterface(user_id).get_own_shot_image(shot_id)}
+        ).encode()
+
+    def fetch(rendition, headers=None):
+        image = UserInterface(user_id).get_shot_image(shot_id, rendition)
+        return shot_images.make_response(image, headers or {}).body
+
+    etag = UserInterface(user_id).get_shot_image(shot_id, "original").etag
+    thumb_etag = UserInterface(user_id).get_shot_image(shot_id, THUMBNAIL).etag
+    fetch(THUMBNAIL)
+
+    results = {}
+    for name, func in {
+        "json": old_fetch,
+        "bytes": lambda: fetch("original"),
+        "304": lambda: fetch("original", {"if-none-match": etag}),
+        "thumb": lambda: fetch(THUMBNAIL),
+        "thumb 304": lambda: fetch(THUMBNAIL, {"if-none-match": thumb_etag}),
+    }.items():
+        results[name] = (time_call(func, repeat), len(func()) / 1024)
+
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shots", type=int, default=20, help="shots fired")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs each")
+    parser.add_argument("--width", type=int, default=1600, help="photo width")
+    parser.add_argument("--height", type=int, default=1200, help="photo height")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        configure_environment(Path(scratch))
+
+        from backend import database
+
+        # The blob store and image cache follow the environment by themselves
+        database.load()
+
+        photo = make_photo(args.width, args.height)
+        results = bench(args.shots, photo, args.repeat)
+
+    print(f"{'':>10}{'ms':>10}{'KiB':>10}")
+    for name, (ms, kib) in results.items():
+        print(f"{name:>10}{ms:10.2f}{kib:10.1f}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,162 @@
+"""Benchmark for reading shots with their photos inline vs in the blob store.
+
+Fills a throwaway SQLite database with shots whose photos are stored the old
+way, inline in ``shots.image_base64``, and times:
+
+* loading every shot row, as the admin history and the per-player shot lists
+  do (the old column was loaded with every row, so it is undeferred here);
+* a page of the admin shot queue (``AdminInterface.get_unchecked_shots``);
+* the size of the database file.
+
+It then moves the photos into the blob store with the startup migration
+(``migrations.move_images_to_blob_store``), reports how long that took, and
+times the same reads again:
+
+    python -m scripts.bench_shot_queue --shots 500 --repeat 5
+"""
+
+import argparse
+import io
+import os
+import statistics
+import tempfile
+import time
+from base64 import b64encode
+from pathlib import Path
+from typing import Callable
+
+
+def configure_environment(scratch: Path) -> None:
+    """Point the backend at a scratch database and blob store and keep it
+    quiet. Must run before anything from ``backend`` is imported: the database
+    is set up on import. ``.env`` is still read, but never overrides what is
+    set here."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{scratch / 'bench.db'}"
+    os.environ["BLOB_STORE_DIR"] = str(scratch / "blobs")
+    os.environ["LOG_LEVEL"] = "WARNING"
+    os.environ["DEBUG_DATABASE"] = ""
+
+
+def make_photo(width: int, height: int) -> str:
+    """A phone-sized JPEG as a data URL. Noise, so it compresses like a photo
+    rather than like a blank frame"""
+    from PIL import Image
+
+    image = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+
+    return "data:image/jpeg;base64," + b64encode(buffer.getvalue()).decode("ascii")
+
+
+def make_inline_shots(num: int, photo: str) -> None:
+    """``num`` unchecked shots from one player, photos inline. Inserted in
+    bulk: submit_shot would put them straight into the blob store"""
+    from backend.admin_interface import AdminInterface
+    from backend.database import session_scope
+    from backend.model import Shot
+    from backend.model import User
+
+    game_id = AdminInterface().create_game()
+    team_id = AdminInterface().create_team(game_id, "Benchmark")
+
+    with session_scope() as session:
+        user = User(team_id=team_id)
+        session.add(user)
+        session.flush()
+
+        session.add_all(
+            [
+                Shot(
+                    game_id=game_id,
+                    team_id=team_id,
+                    user_id=user.id,
+                    legacy_image_base64=photo,
+                )
+                for _ in range(num)
+            ]
+        )
+
+
+def time_ms(function: Callable, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    return 1e3 * statistics.median(timings)
+
+
+def time_reads(repeat: int, undefer_images: bool) -> dict:
+    from sqlalchemy.orm import undefer
+
+    from backend import database
+    from backend.admin_interface import AdminInterface
+    from backend.database import session_scope
+    from backend.model import Shot
+
+    def load_all_shots():
+        with session_scope() as session:
+            query = session.query(Shot)
+            if undefer_images:
+                query = query.options(undefer(Shot.legacy_image_base64))
+            query.all()
+
+    db_path = Path(database.engine.url.database)
+
+    return {
+        "load_all_shots_ms": time_ms(load_all_shots, repeat),
+        "queue_page_ms": time_ms(
+            lambda: AdminInterface().get_unchecked_shots(), repeat
+        ),
+        "db_size_mib": db_path.stat().st_size / 2**20,
+    }
+
+
+def run_benchmark(num_shots: int, repeat: int, width: int, height: int) -> dict:
+    from backend import database
+    from backend import migrations
+
+    photo = make_photo(width, height)
+    make_inline_shots(num_shots, photo)
+
+    results = {"shots": num_shots, "photo_kib": len(photo) / 1024}
+
+    for name, value in time_reads(repeat, undefer_images=True).items():
+        results[f"inline_{name}"] = value
+
+    start = time.perf_counter()
+    migrations.move_images_to_blob_store(database.engine)
+    results["migration_s"] = time.perf_counter() - start
+
+    for name, value in time_reads(repeat, undefer_images=False).items():
+        results[f"blob_{name}"] = value
+
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shots", type=int, default=500, help="shots in the table")
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="timings to take the median of"
+    )
+    parser.add_argument("--width", type=int, default=1600, help="photo width")
+    parser.add_argument("--height", type=int, default=1200, help="photo height")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        configure_environment(Path(scratch))
+        results = run_benchmark(args.shots, args.repeat, args.width, args.height)
+
+    for name, value in results.items():
+        if isinstance(value, float):
+            value = f"{value:.3f}"
+        print(f"{name:>28}: {value}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
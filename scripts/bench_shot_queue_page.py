@@ -0,0 +1,153 @@
+"""Benchmark for refreshing the admin's shot queue.
+
+Fills a throwaway SQLite database and blob store with a game - players in four
+teams and a queue of unchecked shots with phone-sized photos - renders the
+queue's marked-up photos once, as they are on submission, then times a
+refresh of the queue and measures the JSON it sends:
+
+* ``/admin_get_shots``: full ``ShotModel``s, each with the shooter, the whole
+  game and every player in it, and the marked-up photo inline, plus a count
+  of the queue;
+* ``/admin_get_shot_queue``: a page of light rows with a URL for each photo.
+  The photos are fetched once each, and then come from the browser's cache.
+
+    python -m scripts.bench_shot_queue_page --players 20 100 --queue 20
+"""
+
+import argparse
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+from base64 import b64encode
+from pathlib import Path
+from typing import Callable
+from uuid import uuid4
+
+
+def configure_environment(scratch: Path) -> None:
+    """Point the backend at a scratch database and blob store and keep it
+    quiet. Must run before anything from ``backend`` is imported: the database
+    is set up on import. ``.env`` is still read, but never overrides what is
+    set here."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{scratch / 'bench.db'}"
+    os.environ["BLOB_STORE_DIR"] = str(scratch / "blobs")
+    os.environ["LOG_LEVEL"] = "WARNING"
+    os.environ["DEBUG_DATABASE"] = ""
+
+
+def make_photo(width: int, height: int) -> str:
+    """A phone-sized JPEG as a data URL. Noise, so it compresses like a photo
+    rather than like a blank frame"""
+    from PIL import Image
+
+    image = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+
+    return "data:image/jpeg;base64," + b64encode(buffer.getvalue()).decode("ascii")
+
+
+def make_game(num_players: int, queue_length: int, photo: str):
+    """A game of ``num_players`` in four teams, the first of whom has fired
+    ``queue_length`` shots that are waiting to be checked"""
+    from backend import image_cache
+    from backend.admin_interface import AdminInterface
+    from backend.user_interface import UserInterface
+
+    admin = AdminInterface()
+    game_id = admin.create_game()
+    team_ids = [admin.create_team(game_id, f"T{i}") for i in range(4)]
+
+    user_ids = []
+    for i in range(num_players):
+        user_id = UserInterface(uuid4()).get_user_model().id
+        admin.add_user_to_team(user_id, team_ids[i % 4])
+        user_ids.append(user_id)
+
+    shooter = UserInterface(user_ids[0])
+    shooter.award_ammo(queue_length)
+    for _ in range(queue_length):
+        image_cache.prefill(shooter.submit_shot(photo))
+
+    return game_id
+
+
+def time_call(func: Callable, repeat: int) -> float:
+    """Median wall time of ``func()`` over ``repeat`` runs, in ms"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return 1e3 * statistics.median(timings)
+
+
+def bench(num_players: int, queue_length: int, photo: str, repeat: int) -> dict:
+    from fastapi.encoders import jsonable_encoder
+
+    from backend.admin_interface import AdminInterface
+
+    make_game(num_players, queue_length, photo)
+
+    def old_refresh():
+        num_in_queue, shots = AdminInterface().get_unchecked_shots(limit=queue_length)
+        return json.dumps(
+            jsonable_encoder({"numInQueue": num_in_queue, "shots": shots})
+        )
+
+    def new_refresh():
+        shots, next_cursor = AdminInterface().get_shot_queue(limit=queue_length)
+        for shot in shots:
+            shot.image_url = f"/api/admin_shot_image?shot_id={shot.id}&transform=x"
+        return json.dumps(jsonable_encoder({"shots": shots, "next": next_cursor}))
+
+    shot_id = AdminInterface().get_unchecked_shots_ids()[0]
+
+    return {
+        "old_ms": time_call(old_refresh, repeat),
+        "old_kib": len(old_refresh()) / 1024,
+        "new_ms": time_call(new_refresh, repeat),
+        "new_kib": len(new_refresh()) / 1024,
+        "image_ms": time_call(
+            lambda: AdminInterface().get_shot_image(shot_id).load(), repeat
+        ),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--players", type=int, nargs="+", default=[20, 100], help="players"
+    )
+    parser.add_argument("--queue", type=int, default=20, help="shots in the queue")
+    parser.add_argument("--repeat", type=int, default=10, help="timed runs each")
+    parser.add_argument("--width", type=int, default=1600, help="photo width")
+    parser.add_argument("--height", type=int, default=1200, help="photo height")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for num_players in args.players:
+        with tempfile.TemporaryDirectory() as scratch:
+            configure_environment(Path(scratch))
+
+            from backend import database
+
+            # The blob store and image cache follow the environment by themselves
+            database.load()
+
+            photo = make_photo(args.width, args.height)
+            results[num_players] = bench(num_players, args.queue, photo, args.repeat)
+
+    names = list(next(iter(results.values())))
+    print(f"{'players':>10}" + "".join(f"{n:>10}" for n in results))
+    for name in names:
+        print(f"{name:>10}" + "".join(f"{results[n][name]:10.1f}" for n in results))
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
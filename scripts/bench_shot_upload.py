@@ -0,0 +1,265 @@
+"""Benchmark for submitting shots: base64 JSON vs the raw photo upload.
+
+Compares the two ways a player can submit a shot:
+
+* ``json`` - ``POST /api/submit_shot`` with ``{"photo": <data URL>}``, as
+  clients did before the binary endpoint;
+* ``raw`` - ``POST /api/submit_shot_photo`` with the JPEG as the body.
+
+For each photo size it reports the end-to-end latency through the real ASGI
+app (the median of ``--repeat`` submissions, each of a different photo so that
+the blob store has to write every one) and how far the backend's peak RSS rose
+above its resting RSS while handling one submission. Request bodies are sent
+in 64 KiB chunks, as a server would receive them.
+
+Each mode and size runs in its own process, so that one measurement's peak
+can't hide another's. Runs against a throwaway SQLite database:
+
+    python -m scripts.bench_shot_upload --sizes-mb 2 5 10 --repeat 5
+"""
+
+import argparse
+import asyncio
+import gc
+import io
+import json
+import math
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from base64 import b64encode
+from pathlib import Path
+from uuid import UUID
+from uuid import uuid4
+
+CHUNK_SIZE = 64 * 1024
+
+MODES = {
+    "json": ("/api/submit_shot", "application/json"),
+    "raw": ("/api/submit_shot_photo", "image/jpeg"),
+}
+
+
+def configure_environment(scratch: Path) -> None:
+    """Point the backend at a scratch database and blob store and keep it
+    quiet. Must run before anything from ``backend`` is imported: the database
+    is set up on import. ``.env`` is still read, but never overrides what is
+    set here."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{scratch / 'bench.db'}"
+    os.environ["BLOB_STORE_DIR"] = str(scratch / "blobs")
+    os.environ["IMAGE_ARCHIVE_DIR"] = str(scratch / "archive")
+    os.environ["IMAGE_CACHE_DIR"] = str(scratch / "derived")
+    os.environ["LOG_LEVEL"] = "WARNING"
+    os.environ["DEBUG_DATABASE"] = ""
+
+
+def make_photo(num_bytes: int) -> bytes:
+    """A JPEG of about ``num_bytes``. Noise, so it compresses like a photo:
+    roughly three quarters of a byte per pixel at this quality"""
+    from PIL import Image
+
+    width = int(math.sqrt(num_bytes / 0.75 * 4 / 3))
+    height = width * 3 // 4
+    image = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+
+    return buffer.getvalue()
+
+
+def make_body(mode: str, photo: bytes, n: int) -> bytes:
+    # Bytes after the end of a JPEG are ignored by decoders, but make each
+    # photo distinct to the blob store
+    photo = photo + n.to_bytes(8, "big")
+
+    if mode == "raw":
+        return photo
+
+    data_url = "data:image/jpeg;base64," + b64encode(photo).decode("ascii")
+    return json.dumps({"photo": data_url}).encode("utf-8")
+
+
+def session_cookie(user_id: UUID) -> str:
+    import itsdangerous
+
+    signer = itsdangerous.TimestampSigner(os.environ["SECRET_KEY"])
+    data = b64encode(json.dumps({"UUID": str(user_id)}).encode("utf-8"))
+    return signer.sign(data).decode("utf-8")
+
+
+async def post(app, path: str, content_type: str, body: bytes, cookie: str) -> int:
+    """One request through the ASGI app. Returns the status code"""
+    offset = 0
+    status = None
+
+    async def receive():
+        # Sliced as they are asked for, so the harness holds no second copy
+        nonlocal offset
+        chunk = body[offset : offset + CHUNK_SIZE]
+        offset += len(chunk)
+        return {"type": "http.request", "body": chunk, "more_body": offset < len(body)}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"host", b"testserver"),
+            (b"content-type", content_type.encode()),
+            (b"content-length", str(len(body)).encode()),
+            (b"cookie", f"session={cookie}".encode()),
+        ],
+        "client": ("127.0.0.1", 10000),
+        "server": ("testserver", 80),
+    }
+    await app(scope, receive, send)
+
+    return status
+
+
+def make_player(num_bullets: int) -> UUID:
+    """A player in a team, with the ammo for every submission"""
+    from backend.admin_interface import AdminInterface
+    from backend.database import session_scope
+    from backend.model import User
+
+    game_id = AdminInterface().create_game()
+    team_id = AdminInterface().create_team(game_id, "Benchmark")
+
+    user_id = uuid4()
+    with session_scope() as session:
+        session.add(User(id=user_id, team_id=team_id, num_bullets=num_bullets))
+
+    return user_id
+
+
+def read_status_kib(field: str) -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+
+    raise KeyError(field)
+
+
+async def measure(mode: str, photo: bytes, repeat: int) -> dict:
+    from backend.main import app
+
+    path, content_type = MODES[mode]
+    cookie = session_cookie(make_player(num_bullets=repeat + 2))
+
+    # Warm up: imports, the first session, the blob store directories
+    await post(app, path, content_type, make_body(mode, photo[:1000], 0), cookie)
+
+    timings = []
+    peak_rise_kib = None
+    for n in range(1, repeat + 1):
+        body = make_body(mode, photo, n)
+        gc.collect()
+
+        if peak_rise_kib is None:
+            # Reset the peak RSS to the current RSS (Linux only)
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+            resting_kib = read_status_kib("VmRSS")
+
+        start = time.perf_counter()
+        status = await post(app, path, content_type, body, cookie)
+        timings.append(time.perf_counter() - start)
+
+        if status != 200:
+            raise RuntimeError(f"{mode} submission failed with {status}")
+
+        if peak_rise_kib is None:
+            peak_rise_kib = read_status_kib("VmHWM") - resting_kib
+
+        del body
+
+    return {
+        "latency_ms": 1e3 * statistics.median(timings),
+        "peak_rss_rise_mib": peak_rise_kib / 1024,
+    }
+
+
+def run_worker(mode: str, photo_path: Path, repeat: int) -> None:
+    photo = photo_path.read_bytes()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        configure_environment(Path(scratch))
+        results = asyncio.run(measure(mode, photo, repeat))
+
+    print(json.dumps(results))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes-mb",
+        type=float,
+        nargs="+",
+        default=[2, 5, 10],
+        help="photo sizes to submit",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="submissions to take the median of"
+    )
+    parser.add_argument(
+        "--worker", nargs=2, metavar=("MODE", "PHOTO"), help=argparse.SUPPRESS
+    )
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        mode, photo_path = args.worker
+        run_worker(mode, Path(photo_path), args.repeat)
+        return 0
+
+    print(f"{'photo_mb':>9} {'mode':>5} {'latency_ms':>11} {'peak_rss_rise_mib':>18}")
+
+    with tempfile.TemporaryDirectory() as scratch:
+        for size_mb in args.sizes_mb:
+            photo_path = Path(scratch) / f"{size_mb}.jpg"
+            photo_path.write_bytes(make_photo(int(size_mb * 2**20)))
+            actual_mb = photo_path.stat().st_size / 2**20
+
+            for mode in MODES:
+                output = subprocess.run(
+                    [
+                        sys.executable,
+                        "-m",
+                        "scripts.bench_shot_upload",
+                        "--repeat",
+                        str(args.repeat),
+                        "--worker",
+                        mode,
+                        str(photo_path),
+                    ],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                ).stdout
+                results = json.loads(output.strip().splitlines()[-1])
+
+                print(
+                    f"{actual_mb:>9.2f} {mode:>5} {results['latency_ms']:>11.1f}"
+                    f" {results['peak_rss_rise_mib']:>18.1f}"
+                )
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
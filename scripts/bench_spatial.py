@@ -0,0 +1,149 @@
+"""Benchmark for the distance and proximity sums behind shot identification.
+
+Scatters simulated players over a couple of km of the active venue and times,
+for each number of players:
+
+* the location term of a shot's identification
+  (``shot_identification.location_likelihood_ratios``), against the same sum
+  done with a haversine per candidate as it used to be;
+* "who is within r metres of this point", from a ``GridIndex`` against a
+  haversine scan of every player and a projected one (``points_within``, as
+  the admin's proximity query does), plus the one-off cost of building the
+  index.
+
+    python -m scripts.bench_spatial --players 50 500 5000
+"""
+
+import argparse
+import math
+import random
+import statistics
+import time
+from typing import Callable
+from uuid import uuid4
+
+
+def time_call(func: Callable, repeat: int) -> float:
+    """Median wall time of ``func()`` over ``repeat`` runs, in ms"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return 1e3 * statistics.median(timings)
+
+
+def haversine_ratios(shooter_fix, fixes, candidate_ids, at_time):
+    """location_likelihood_ratios as it was, with a haversine per candidate"""
+    from backend import shot_identification as si
+
+    ratios = {}
+    for pid in candidate_ids:
+        fix = fixes.get(pid)
+        if fix is None:
+            ratios[pid] = 1.0
+            continue
+        sigma = si._effective_sigma_m(fix, at_time)
+        spread_area = 2 * math.pi * sigma**2
+        distance = si.haversine_m(
+            float(shooter_fix["latitude"]),
+            float(shooter_fix["longitude"]),
+            float(fix["latitude"]),
+            float(fix["longitude"]),
+        )
+        ratio = (si.GAME_AREA_M2 / spread_area) * math.exp(
+            -(distance**2) / (2 * sigma**2)
+        )
+        ratios[pid] = max(1.0, ratio)
+    return ratios
+
+
+def simulate(num_players: int, spread_deg: float, now: float):
+    """Fixes for ``num_players`` scattered around the venue, up to two minutes
+    old"""
+    from backend.spatial import venue_projection
+
+    projection = venue_projection()
+    return {
+        uuid4(): {
+            "latitude": projection.origin_lat + random.uniform(-1, 1) * spread_deg,
+            "longitude": projection.origin_lon + random.uniform(-1, 1) * spread_deg,
+            "timestamp": now - random.uniform(0, 120),
+        }
+        for _ in range(num_players)
+    }
+
+
+def bench(num_players: int, radius_m: float, spread_deg: float, repeat: int) -> dict:
+    from backend import shot_identification as si
+    from backend.spatial import GridIndex
+    from backend.spatial import points_within
+
+    now = time.time()
+    fixes = simulate(num_players, spread_deg, now)
+    candidate_ids = list(fixes)
+    shooter_fix = fixes[candidate_ids[0]]
+
+    old = haversine_ratios(shooter_fix, fixes, candidate_ids, now)
+    new = si.location_likelihood_ratios(shooter_fix, fixes, candidate_ids, now)
+    worst = max(abs(new[pid] - old[pid]) / old[pid] for pid in candidate_ids)
+
+    points = {pid: (fix["latitude"], fix["longitude"]) for pid, fix in fixes.items()}
+    index = GridIndex.from_points(points)
+    lat, lon = points[candidate_ids[0]]
+
+    def scan():
+        return [
+            pid
+            for pid, (p_lat, p_lon) in points.items()
+            if si.haversine_m(lat, lon, p_lat, p_lon) <= radius_m
+        ]
+
+    assert {pid for pid, _ in index.within(lat, lon, radius_m)} == set(scan())
+
+    return {
+        "haversine_ratios_ms": time_call(
+            lambda: haversine_ratios(shooter_fix, fixes, candidate_ids, now), repeat
+        ),
+        "ratios_ms": time_call(
+            lambda: si.location_likelihood_ratios(
+                shooter_fix, fixes, candidate_ids, now
+            ),
+            repeat,
+        ),
+        "worst_ratio_error": worst,
+        "scan_ms": time_call(scan, repeat),
+        "projected_scan_ms": time_call(
+            lambda: points_within(points.items(), lat, lon, radius_m), repeat
+        ),
+        "grid_within_ms": time_call(lambda: index.within(lat, lon, radius_m), repeat),
+        "grid_build_ms": time_call(lambda: GridIndex.from_points(points), repeat),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--players", type=int, nargs="+", default=[50, 500, 5000], help="players"
+    )
+    parser.add_argument("--radius", type=float, default=50, help="metres")
+    parser.add_argument(
+        "--spread", type=float, default=0.01, help="degrees either side of centre"
+    )
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs each")
+    args = parser.parse_args(argv)
+
+    random.seed(0)
+
+    results = {n: bench(n, args.radius, args.spread, args.repeat) for n in args.players}
+
+    names = list(next(iter(results.values())))
+    print(f"{'players':>20}" + "".join(f"{n:>10}" for n in results))
+    for name in names:
+        print(f"{name:>20}" + "".join(f"{results[n][name]:10.3g}" for n in results))
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
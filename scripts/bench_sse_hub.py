@@ -0,0 +1,229 @@
+"""Load benchmark for the player SSE stream (``/api/sse_updates``).
+
+Opens a few thousand simulated SSE clients against the real ASGI app -- no
+network, just the ASGI calls a server would make -- with every client signed
+in as its own player in one big team. It then reports:
+
+* how much Python heap each open connection costs, and how many asyncio tasks
+  exist in total (the shared hub in ``backend/sse_hub.py`` should keep the
+  task count at one per watched event, not several per client);
+* event-to-delivery latency: the time from ``trigger_update_event("ticker")``
+  until each client has the resulting ``update_prompt`` frame in hand (or
+  ``update_mask`` frame, with ``--coalesce-ms``, which adds the window);
+* how many prompts the hub suppressed rather than sending.
+
+Runs against a throwaway SQLite database, so it is safe to point at a dev tree:
+
+    python -m scripts.bench_sse_hub --clients 2000 --rounds 20 --coalesce-ms 0
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from base64 import b64encode
+from pathlib import Path
+from typing import List
+from uuid import UUID
+from uuid import uuid4
+
+
+def configure_environment(db_path: Path) -> None:
+    """Point the backend at a scratch database and keep it quiet. Must run
+    before anything from ``backend`` is imported: the database is set up on
+    import. ``.env`` is still read, but never overrides what is set here."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["LOG_LEVEL"] = "WARNING"
+    os.environ["DEBUG_DATABASE"] = ""
+
+
+class SimulatedClient:
+    """One EventSource, as far as the ASGI app can tell."""
+
+    def __init__(self, app, user_id: UUID, port: int, coalesce_ms: int) -> None:
+        self.app = app
+        self.user_id = user_id
+        self.port = port
+        self.coalesce_ms = coalesce_ms
+        self.frames: List[str] = []
+
+        self._disconnect = asyncio.Event()
+        self._expected = None
+        self._got_frames = asyncio.Event()
+
+    def _session_cookie(self) -> str:
+        import itsdangerous
+
+        signer = itsdangerous.TimestampSigner(os.environ["SECRET_KEY"])
+        data = b64encode(json.dumps({"UUID": str(self.user_id)}).encode("utf-8"))
+        return signer.sign(data).decode("utf-8")
+
+    async def run(self) -> None:
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": "/api/sse_updates",
+            "raw_path": b"/api/sse_updates",
+            "root_path": "",
+            "query_string": f"coalesce_ms={self.coalesce_ms}".encode(),
+            "headers": [
+                (b"host", b"testserver"),
+                (b"cookie", f"session={self._session_cookie()}".encode()),
+            ],
+            "client": ("127.0.0.1", self.port),
+            "server": ("testserver", 80),
+        }
+        await self.app(scope, self._receive, self._send)
+
+    def close(self) -> None:
+        self._disconnect.set()
+
+    def expect(self, text: str) -> asyncio.Future:
+        """A future resolved with the arrival time of the next frame
+        containing ``text``"""
+        self._expected = (text, asyncio.get_running_loop().create_future())
+        return self._expected[1]
+
+    async def wait_for_frames(self, num: int) -> None:
+        while len(self.frames) < num:
+            self._got_frames.clear()
+            await self._got_frames.wait()
+
+    async def _receive(self):
+        await self._disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def _send(self, message) -> None:
+        if message["type"] != "http.response.body" or not message.get("body"):
+            return
+
+        arrived = time.perf_counter()
+        frame = message["body"].decode("utf-8")
+        self.frames.append(frame)
+        self._got_frames.set()
+
+        if self._expected and self._expected[0] in frame:
+            text, future = self._expected
+            self._expected = None
+            future.set_result(arrived)
+
+
+def make_players(num: int):
+    """One game, one team, ``num`` players in it. Inserted in bulk: going
+    through UserInterface would fire an update event per player."""
+    from backend.admin_interface import AdminInterface
+    from backend.database import session_scope
+    from backend.model import User
+
+    game_id = AdminInterface().create_game()
+    team_id = AdminInterface().create_team(game_id, "Benchmark")
+
+    user_ids = [uuid4() for _ in range(num)]
+    with session_scope() as session:
+        session.add_all([User(id=user_id, team_id=team_id) for user_id in user_ids])
+
+    return game_id, user_ids
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run_benchmark(num_clients: int, rounds: int, coalesce_ms: int) -> dict:
+    from backend import sse_hub
+    from backend.asyncio_triggers import trigger_update_event
+    from backend.main import app
+
+    game_id, user_ids = make_players(num_clients)
+
+    tracemalloc.start()
+    heap_before, _ = tracemalloc.get_traced_memory()
+    tasks_before = len(asyncio.all_tasks())
+
+    clients = [
+        SimulatedClient(app, user_id, port=10000 + i, coalesce_ms=coalesce_ms)
+        for i, user_id in enumerate(user_ids)
+    ]
+    runners = [asyncio.create_task(client.run()) for client in clients]
+
+    # Every client has its initial prompts once it is fully subscribed: three
+    # of them, or one mask covering all three
+    initial_frames = 1 if coalesce_ms else 3
+    await asyncio.gather(
+        *(client.wait_for_frames(initial_frames) for client in clients)
+    )
+
+    heap_after, _ = tracemalloc.get_traced_memory()
+    tasks_after = len(asyncio.all_tasks())
+    tracemalloc.stop()
+
+    expected = '"update_mask"' if coalesce_ms else '"ticker"'
+    latencies = []
+    for _ in range(rounds):
+        arrivals = [client.expect(expected) for client in clients]
+        triggered = time.perf_counter()
+        trigger_update_event("ticker", game_id)
+        for arrived in await asyncio.gather(*arrivals):
+            latencies.append(arrived - triggered)
+
+    hub = sse_hub.get_hub(game_id)
+    results = {
+        "clients": num_clients,
+        "connections_in_hub": len(hub.connections),
+        "hub_watchers": hub.num_watchers,
+        # Less the one runner task per client that stands in for the server
+        "tasks_per_client": (tasks_after - tasks_before - num_clients) / num_clients,
+        "heap_per_client_kib": (heap_after - heap_before) / num_clients / 1024,
+        "latency_p50_ms": 1e3 * statistics.median(latencies),
+        "latency_p99_ms": 1e3 * percentile(latencies, 0.99),
+        "latency_max_ms": 1e3 * max(latencies),
+        "prompts_suppressed": sse_hub.get_stats()["suppressed"],
+    }
+
+    for client in clients:
+        client.close()
+    await asyncio.gather(*runners)
+
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--clients", type=int, default=2000, help="simulated SSE connections"
+    )
+    parser.add_argument(
+        "--rounds", type=int, default=20, help="ticker events to time delivery of"
+    )
+    parser.add_argument(
+        "--coalesce-ms",
+        type=int,
+        default=0,
+        help="per-client coalescing window (0: one frame per prompt)",
+    )
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        configure_environment(Path(scratch) / "bench.db")
+        results = asyncio.run(
+            run_benchmark(args.clients, args.rounds, args.coalesce_ms)
+        )
+
+    for name, value in results.items():
+        if isinstance(value, float):
+            value = f"{value:.3f}"
+        print(f"{name:>22}: {value}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,158 @@
+"""Benchmark for reading the ticker after a new message.
+
+Fills a throwaway SQLite database with a game whose ticker already has a
+history - public messages and some private to each player - then posts one
+more and times every player in the game reading their ticker, as they all do
+on the trigger that follows:
+
+* each player querying the database, as every read used to;
+* each player reading the game's tail in memory, which the first of them
+  brings up to date with one query for the new entry.
+
+    python -m scripts.bench_ticker --players 20 100 --history 2000
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+from uuid import uuid4
+
+
+def configure_environment(scratch: Path) -> None:
+    """Point the backend at a scratch database and keep it quiet. Must run
+    before anything from ``backend`` is imported: the database is set up on
+    import. ``.env`` is still read, but never overrides what is set here."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{scratch / 'bench.db'}"
+    os.environ["BLOB_STORE_DIR"] = str(scratch / "blobs")
+    os.environ["LOG_LEVEL"] = "WARNING"
+    os.environ["DEBUG_DATABASE"] = ""
+
+
+def make_game(num_players: int, history: int):
+    """A game of ``num_players`` and a ticker of ``history`` messages, every
+    fourth private to a player. Returns the game's id and the players'"""
+    from backend import database
+    from backend.admin_interface import AdminInterface
+    from backend.model import TickerEntry
+    from backend.user_interface import UserInterface
+
+    admin = AdminInterface()
+    game_id = admin.create_game()
+    team_id = admin.create_team(game_id, "T")
+
+    user_ids = []
+    for _ in range(num_players):
+        user_id = UserInterface(uuid4()).get_user_model().id
+        admin.add_user_to_team(user_id, team_id)
+        user_ids.append(user_id)
+
+    with database.session_scope() as session:
+        session.add_all(
+            TickerEntry(
+                game_id=game_id,
+                private_user_id=user_ids[i % num_players] if i % 4 == 0 else None,
+                message=f"Message {i}",
+            )
+            for i in range(history)
+        )
+
+    return game_id, user_ids
+
+
+def time_call(func: Callable, repeat: int) -> float:
+    """Median wall time of ``func()`` over ``repeat`` runs, in ms"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return 1e3 * statistics.median(timings)
+
+
+def bench(num_players: int, history: int, num_messages: int, repeat: int) -> dict:
+    from sqlalchemy import or_
+
+    from backend import database
+    from backend.model import TickerEntry
+    from backend.ticker import Ticker
+
+    game_id, user_ids = make_game(num_players, history)
+    poster = Ticker(game_id, None)
+
+    def old_read(user_id):
+        with database.session_scope() as session:
+            return (
+                session.query(
+                    TickerEntry.private_user_id,
+                    TickerEntry.highlight_user_id,
+                    TickerEntry.message,
+                )
+                .filter_by(game_id=game_id)
+                .filter(
+                    or_(
+                        TickerEntry.private_user_id == user_id,
+                        TickerEntry.private_user_id == None,
+                    )
+                )
+                .order_by(TickerEntry.id.desc())
+                .limit(num_messages)
+                .all()
+            )
+
+    def everyone_reads(read):
+        poster.post_message("Someone was hit")
+        for user_id in user_ids:
+            read(user_id)
+
+    def new_read(user_id):
+        return Ticker(game_id, user_id).get_messages(num_messages)
+
+    # The first read of a game loads its tail
+    start = time.perf_counter()
+    new_read(user_ids[0])
+    cold_ms = 1e3 * (time.perf_counter() - start)
+
+    return {
+        "database": time_call(lambda: everyone_reads(old_read), repeat),
+        "tail": time_call(lambda: everyone_reads(new_read), repeat),
+        "first load": cold_ms,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--players", type=int, nargs="+", default=[20, 100], help="players"
+    )
+    parser.add_argument("--history", type=int, default=2000, help="messages so far")
+    parser.add_argument("--messages", type=int, default=20, help="messages shown")
+    parser.add_argument("--repeat", type=int, default=10, help="timed runs each")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for num_players in args.players:
+        with tempfile.TemporaryDirectory() as scratch:
+            configure_environment(Path(scratch))
+
+            from backend import database
+
+            database.load()
+
+            results[num_players] = bench(
+                num_players, args.history, args.messages, args.repeat
+            )
+
+    names = list(next(iter(results.values())))
+    print(f"{'players':>12}" + "".join(f"{n:>10}" for n in results))
+    for name in names:
+        print(f"{name:>12}" + "".join(f"{results[n][name]:10.1f}" for n in results))
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
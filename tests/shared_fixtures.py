@@ -325,7 +325,7 @@ def api_user_id(api_client):
 
 @pytest.fixture
 def test_image_string():
-    return Path(__file__, "../sample_base64_image.txt").resolve().read_text()
+    return Path(__file__, "../sample_base64_image.txt").resolve().read_text().strip()
 
 
 @pytest.fixture
@@ -8,6 +8,7 @@ import json
 import pytest
 
 from backend import ai_shot_review
+from backend import image_cache
 from backend import shot_vision
 from backend.admin_interface import AdminInterface
 from backend.identity.config import default_scheme
@@ -80,16 +81,15 @@ async def test_the_zoom_is_cut_from_the_original_not_the_downsized_image(
     # The whole point of the zoom is to spend camera resolution that
     # prepare_for_vision has already thrown away, so it must start from the raw
     # photo. Zooming the prepared image would just magnify blur.
-    spy = mocker.patch(
-        "backend.ai_shot_review.zoom_image", return_value="data:image/jpeg;base64,Z"
-    )
+    spy = mocker.Mock(return_value="data:image/jpeg;base64,Wg==")
+    mocker.patch.dict(image_cache.TRANSFORMS, {image_cache.ZOOM: spy})
     client = FakeVisionClient(reply=[{"request_zoom": True}, hit_reply()])
 
     await ai_shot_review.review_shot(shot_from_user_in_team, client)
 
     original = AdminInterface().get_shot_model(shot_from_user_in_team).image_base64
     assert spy.call_args[0][0] == original
-    assert client.images_sent[-1] == "data:image/jpeg;base64,Z"
+    assert client.images_sent[-1] == "data:image/jpeg;base64,Wg=="
     assert (
         AdminInterface().get_shot_ai_review(shot_from_user_in_team)["state"]
         == ai_shot_review.STATE_DONE
@@ -100,7 +100,8 @@ async def test_the_zoom_is_cut_from_the_original_not_the_downsized_image(
 async def test_no_zoom_is_produced_when_the_model_does_not_ask(
     mocker, db_session, shot_from_user_in_team
 ):
-    spy = mocker.patch("backend.ai_shot_review.zoom_image")
+    spy = mocker.Mock()
+    mocker.patch.dict(image_cache.TRANSFORMS, {image_cache.ZOOM: spy})
 
     await ai_shot_review.review_shot(
         shot_from_user_in_team, FakeVisionClient(hit_reply())
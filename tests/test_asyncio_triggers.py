@@ -17,9 +17,11 @@ from backend import asyncio_triggers
 def clean_registry():
     asyncio_triggers._scheduled_tasks.clear()
     asyncio_triggers._update_events.clear()
+    asyncio_triggers._journals.clear()
     yield
     asyncio_triggers._scheduled_tasks.clear()
     asyncio_triggers._update_events.clear()
+    asyncio_triggers._journals.clear()
 
 
 @pytest.mark.asyncio
@@ -57,3 +59,53 @@ async def test_scheduled_task_is_released_once_it_has_fired():
     await asyncio.sleep(0)
 
     assert not asyncio_triggers._scheduled_tasks
+
+
+def test_triggers_are_numbered_in_order():
+    asyncio_triggers.trigger_update_event("test_type", "a")
+    first = asyncio_triggers.latest_sequence()
+    asyncio_triggers.trigger_update_event("test_type", "b")
+
+    assert asyncio_triggers.latest_sequence() == first + 1
+    assert asyncio_triggers.latest_sequence("test_type", "a") == first
+    assert asyncio_triggers.latest_sequence("test_type", "b") == first + 1
+    assert asyncio_triggers.latest_sequence("test_type", "c") == 0
+
+
+def test_events_since_lists_only_the_missed_triggers():
+    asyncio_triggers.trigger_update_event("test_type", "a")
+    cursor = asyncio_triggers.latest_sequence()
+    asyncio_triggers.trigger_update_event("test_type", "a")
+    asyncio_triggers.trigger_update_event("test_type", "b")
+
+    assert asyncio_triggers.events_since("test_type", "a", cursor) == [cursor + 1]
+    assert asyncio_triggers.events_since("test_type", "a", cursor + 2) == []
+
+
+def test_events_since_admits_when_the_journal_has_forgotten():
+    cursor = asyncio_triggers.latest_sequence()
+    for _ in range(asyncio_triggers.JOURNAL_LENGTH + 1):
+        asyncio_triggers.trigger_update_event("test_type", "a")
+
+    assert asyncio_triggers.events_since("test_type", "a", cursor) is None
+
+
+@pytest.mark.asyncio
+async def test_wait_for_event_returns_at_once_for_a_missed_trigger():
+    cursor = asyncio_triggers.latest_sequence("test_type", "a")
+    asyncio_triggers.trigger_update_event("test_type", "a")
+
+    # Nobody was waiting when it fired, but the journal remembers
+    latest = await asyncio.wait_for(
+        asyncio_triggers.wait_for_event("test_type", "a", after=cursor), timeout=1
+    )
+    assert latest == asyncio_triggers.latest_sequence("test_type", "a")
+
+
+def test_event_ids_round_trip_only_within_this_run():
+    event_id = asyncio_triggers.format_event_id(42)
+
+    assert asyncio_triggers.parse_event_id(event_id) == 42
+    assert asyncio_triggers.parse_event_id("someotherrun-42") is None
+    assert asyncio_triggers.parse_event_id(None) is None
+    assert asyncio_triggers.parse_event_id(event_id + "x") is None
@@ -0,0 +1,85 @@
+import pytest
+import sqlalchemy as sa
+
+from backend.blob_store import BlobStore
+from backend.blob_store import BlobTooLarge
+from backend.blob_store import default_blob_dir
+from backend.database import session_scope
+from backend.model import Shot
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(tmp_path / "blobs")
+
+
+def test_put_then_get(store):
+    digest = store.put(b"some photo")
+
+    assert len(digest) == 64
+    assert store.exists(digest)
+    assert store.get(digest) == b"some photo"
+
+
+def test_same_bytes_are_stored_once(store):
+    assert store.put(b"photo") == store.put(b"photo")
+
+    assert len(list(store.root.rglob("*"))) == 2  # One directory, one blob
+
+
+def test_digests_are_checked(store):
+    with pytest.raises(ValueError):
+        store.get("../../etc/passwd")
+
+
+def test_data_url_round_trip(store, test_image_string):
+    digest, mime_type = store.put_data_url(test_image_string)
+
+    assert mime_type == "image/png"
+    assert store.get_data_url(digest, mime_type) == test_image_string
+
+
+def test_default_dir_is_beside_the_database(monkeypatch, tmp_path):
+    monkeypatch.delenv("BLOB_STORE_DIR", raising=False)
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path}/data.db")
+    assert default_blob_dir() == tmp_path / "data.blobs"
+
+    monkeypatch.setenv("BLOB_STORE_DIR", str(tmp_path / "elsewhere"))
+    assert default_blob_dir() == tmp_path / "elsewhere"
+
+
+def test_submitted_shot_keeps_its_photo_out_of_the_table(
+    shot_from_user_in_team, test_image_string
+):
+    with session_scope() as session:
+        image_hash, inline = session.execute(
+            sa.text("SELECT image_hash, image_base64 FROM shots")
+        ).one()
+
+        assert image_hash and inline == ""
+        assert session.get(Shot, shot_from_user_in_team).image_base64 == (
+            test_image_string
+        )
+
+
+async def chunks_of(data, size=7):
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+
+@pytest.mark.asyncio
+async def test_streamed_put_matches_put(store):
+    data = bytes(range(256)) * 10
+
+    digest, size = await store.put_stream(chunks_of(data))
+
+    assert (digest, size) == (store.put(data), len(data))
+    assert store.get(digest) == data
+
+
+@pytest.mark.asyncio
+async def test_streamed_put_stops_at_the_limit(store):
+    with pytest.raises(BlobTooLarge):
+        await store.put_stream(chunks_of(b"x" * 100), max_bytes=99)
+
+    assert not list(store.root.rglob("*"))
@@ -0,0 +1,77 @@
+import pytest
+import sqlalchemy as sa
+
+from backend import db_perf
+from backend.database import session_scope
+
+
+@pytest.fixture(autouse=True)
+def clean_stats():
+    db_perf.reset()
+    yield
+    db_perf.reset()
+
+
+def test_statement_shape_ignores_parameters_and_layout():
+    assert (
+        db_perf.statement_shape("SELECT *\n  FROM users WHERE id IN (?, ?, ?)")
+        == db_perf.statement_shape("SELECT * FROM users WHERE id IN (?)")
+        == "SELECT * FROM users WHERE id IN (?)"
+    )
+
+
+def test_responses_carry_server_timing(api_client, api_user_id):
+    response = api_client.get("/api/user_info")
+
+    assert response.is_success
+    assert response.headers["server-timing"].startswith("db;dur=")
+    assert "queries" in response.headers["server-timing"]
+
+
+def test_queries_are_counted_per_endpoint(admin_api_client, api_user_id):
+    for _ in range(3):
+        admin_api_client.get("/api/user_info")
+
+    stats = admin_api_client.get("/api/admin_perf").json()
+
+    (user_info,) = [
+        endpoint
+        for name, endpoint in stats["endpoints"].items()
+        if name.endswith("/user_info")
+    ]
+    assert user_info["requests"] == 3
+    assert user_info["queries"] >= 3
+    assert user_info["db_ms"] > 0
+
+
+def test_admin_only(api_client):
+    assert not api_client.get("/api/admin_perf").is_success
+
+
+def test_repeated_statements_are_flagged():
+    stats = db_perf.RequestStats()
+    token = db_perf._current.set(stats)
+    try:
+        with session_scope() as session:
+            for i in range(db_perf.N_PLUS_ONE_THRESHOLD):
+                session.execute(sa.text("SELECT :i"), {"i": i})
+    finally:
+        db_perf._current.reset(token)
+    db_perf._finish(stats)
+
+    (sighting,) = db_perf.get_stats()["n_plus_one"]
+    assert sighting["statement"] == "SELECT ?"
+    assert sighting["count"] == db_perf.N_PLUS_ONE_THRESHOLD
+    assert db_perf.get_stats()["endpoints"]["(other)"]["n_plus_one_requests"] == 1
+
+
+def test_only_the_slowest_queries_are_kept(admin_api_client, api_user_id):
+    for _ in range(db_perf.SLOW_QUERIES):
+        admin_api_client.get("/api/user_info")
+
+    slow_queries = db_perf.get_stats()["slow_queries"]
+
+    assert len(slow_queries) == db_perf.SLOW_QUERIES
+    assert [q["ms"] for q in slow_queries] == sorted(
+        (q["ms"] for q in slow_queries), reverse=True
+    )
@@ -0,0 +1,76 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from backend import asyncio_triggers
+from backend import loop_monitor
+from backend.database_scope_provider import run_in_db_thread
+from backend.user_interface import UserInterface
+
+
+@pytest.mark.asyncio
+async def test_work_runs_off_the_event_loop():
+    loop_thread = threading.get_ident()
+
+    worker_thread = await run_in_db_thread(threading.get_ident)
+
+    assert worker_thread != loop_thread
+
+
+@pytest.mark.asyncio
+async def test_triggers_from_a_thread_are_delivered_on_the_loop(
+    user_in_team, monkeypatch
+):
+    delivered_on = []
+    deliver = asyncio_triggers._deliver_update_event
+
+    def record_thread(event_type, key):
+        delivered_on.append(threading.get_ident())
+        deliver(event_type, key)
+
+    monkeypatch.setattr(asyncio_triggers, "_deliver_update_event", record_thread)
+    event = asyncio_triggers.get_trigger_event("user", user_in_team)
+
+    await run_in_db_thread(UserInterface(user_in_team).set_name, "Threaded")
+
+    await asyncio.wait_for(event.wait(), timeout=1)
+    assert delivered_on == [threading.get_ident()]
+    assert UserInterface(user_in_team).get_user_model().name == "Threaded"
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_the_caller():
+    with pytest.raises(ZeroDivisionError):
+        await run_in_db_thread(lambda: 1 / 0)
+
+
+@pytest.mark.asyncio
+async def test_db_threads_zero_runs_inline(monkeypatch):
+    monkeypatch.setenv("DB_THREADS", "0")
+
+    assert await run_in_db_thread(threading.get_ident) == threading.get_ident()
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_shows_blocking_but_not_offloaded_work():
+    loop_monitor.reset()
+    loop_monitor.start(interval=0.01)
+    try:
+        await run_in_db_thread(time.sleep, 0.2)
+        assert loop_monitor.get_stats()["max_ms"] < 100
+
+        time.sleep(0.2)
+        await asyncio.sleep(0.02)
+        assert loop_monitor.get_stats()["max_ms"] >= 150
+    finally:
+        loop_monitor.stop()
+        loop_monitor.reset()
+
+
+def test_loop_lag_endpoint(admin_api_client):
+    response = admin_api_client.get("/api/admin_event_loop_lag")
+
+    assert response.is_success
+    assert set(response.json()) == {"samples", "p50_ms", "p99_ms", "max_ms"}
@@ -0,0 +1,54 @@
+import sqlalchemy as sa
+
+from backend import database
+from backend.engine_config import engine_options
+from backend.engine_config import make_engine
+from backend.engine_config import sqlite_pragmas
+
+
+def read_pragmas(engine, *names):
+    with engine.connect() as conn:
+        return [conn.execute(sa.text(f"PRAGMA {name}")).scalar() for name in names]
+
+
+def test_app_database_is_tuned():
+    assert read_pragmas(database.engine, "journal_mode", "synchronous") == ["wal", 1]
+
+
+def test_pragmas_come_from_the_environment(monkeypatch, tmp_path):
+    monkeypatch.setenv("SQLITE_JOURNAL_MODE", "delete")
+    monkeypatch.setenv("SQLITE_BUSY_TIMEOUT_MS", "1234")
+    monkeypatch.setenv("SQLITE_CACHE_SIZE_KIB", "2048")
+
+    engine = make_engine(f"sqlite:///{tmp_path}/tuned.db")
+
+    assert read_pragmas(
+        engine, "journal_mode", "busy_timeout", "cache_size", "mmap_size"
+    ) == ["delete", 1234, -2048, 256 * 2**20]
+
+
+def test_bad_settings_fall_back_to_the_defaults(monkeypatch, caplog):
+    monkeypatch.setenv("SQLITE_JOURNAL_MODE", "sideways")
+    monkeypatch.setenv("SQLITE_BUSY_TIMEOUT_MS", "soon")
+
+    pragmas = sqlite_pragmas()
+
+    assert pragmas["journal_mode"] == "WAL"
+    assert pragmas["busy_timeout"] == 5000
+    assert "SQLITE_JOURNAL_MODE" in caplog.text
+
+
+def test_in_memory_database_keeps_its_journal():
+    assert "journal_mode" not in sqlite_pragmas(in_memory=True)
+    assert read_pragmas(make_engine("sqlite://"), "journal_mode") == ["memory"]
+
+
+def test_postgres_gets_a_sized_pool(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "4")
+
+    options = engine_options("postgresql://user@localhost/streetfight")
+
+    assert options["pool_size"] == 4
+    assert options["max_overflow"] == 20
+    assert options["pool_pre_ping"] is True
+    assert "connect_args" not in options
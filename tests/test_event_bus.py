@@ -0,0 +1,112 @@
+"""Tests for carrying update triggers between backend processes.
+
+The one that matters is the two-worker test: each worker is a separate Python
+process with its own asyncio_triggers, exactly as under ``uvicorn --workers``.
+"""
+
+import asyncio
+import multiprocessing
+from uuid import uuid4
+
+import pytest
+
+from backend import asyncio_triggers
+from backend.event_bus import UnixSocketEventBus
+from backend.event_bus import decode_message
+from backend.event_bus import encode_message
+
+TIMEOUT = 10
+
+
+def _listening_worker(socket_path, key, ready, results):
+    """Wait for one trigger that somebody else fires"""
+
+    async def listen():
+        bus = UnixSocketEventBus(socket_path)
+        asyncio_triggers.start_event_bus(bus)
+        bus.wait_until_connected(TIMEOUT)
+
+        cursor = asyncio_triggers.latest_sequence("shots", key)
+        ready.set()
+
+        await asyncio.wait_for(
+            asyncio_triggers.wait_for_event("shots", key, after=cursor), TIMEOUT
+        )
+        results.put(("received", str(key)))
+
+        asyncio_triggers.stop_event_bus()
+
+    asyncio.run(listen())
+
+
+def _triggering_worker(socket_path, key, ready):
+    """Fire one trigger once the listener is ready"""
+
+    async def trigger():
+        bus = UnixSocketEventBus(socket_path)
+        asyncio_triggers.start_event_bus(bus)
+        bus.wait_until_connected(TIMEOUT)
+
+        ready.wait(TIMEOUT)
+        asyncio_triggers.trigger_update_event("shots", key)
+
+        # Give the broker, which may be us, time to relay it before we go
+        await asyncio.sleep(1)
+        asyncio_triggers.stop_event_bus()
+
+    asyncio.run(trigger())
+
+
+def test_trigger_crosses_between_worker_processes(tmp_path):
+    context = multiprocessing.get_context("spawn")
+    socket_path = str(tmp_path / "events.sock")
+    key = uuid4()
+
+    ready = context.Event()
+    results = context.Queue()
+
+    listener = context.Process(
+        target=_listening_worker, args=(socket_path, key, ready, results)
+    )
+    trigger = context.Process(target=_triggering_worker, args=(socket_path, key, ready))
+
+    listener.start()
+    trigger.start()
+
+    try:
+        assert results.get(timeout=3 * TIMEOUT) == ("received", str(key))
+    finally:
+        for process in (listener, trigger):
+            process.join(timeout=TIMEOUT)
+            if process.is_alive():
+                process.kill()
+
+
+@pytest.mark.parametrize("key", [uuid4(), "some key", 3, None])
+def test_messages_round_trip(key):
+    assert decode_message(encode_message("ticker", key)) == ("ticker", key)
+
+
+@pytest.mark.asyncio
+async def test_first_bus_becomes_the_broker_and_relays(tmp_path):
+    socket_path = str(tmp_path / "events.sock")
+    loop = asyncio.get_running_loop()
+
+    received = asyncio.Queue()
+    buses = [UnixSocketEventBus(socket_path) for _ in range(3)]
+
+    for i, bus in enumerate(buses):
+        bus.start(lambda t, k, i=i: received.put_nowait((i, t, k)), loop)
+        assert await asyncio.to_thread(bus.wait_until_connected, TIMEOUT)
+
+    try:
+        assert sum(bus.is_broker for bus in buses) == 1
+
+        buses[1].publish("circle", "game")
+
+        # Everyone but the publisher, which delivers its own triggers directly
+        got = {await asyncio.wait_for(received.get(), TIMEOUT) for _ in range(2)}
+        assert got == {(0, "circle", "game"), (2, "circle", "game")}
+    finally:
+        for bus in buses:
+            await asyncio.to_thread(bus.stop)
@@ -10,12 +10,17 @@ the decoder is config-agnostic:
 No DB, no network, no Pillow: readings, candidates and priors are fed directly.
 """
 
+import random
+
 import pytest
 
 from backend.identity.config import default_scheme
 from backend.identity.config import scheme_with_distance
+from backend.identity.decoder import CompiledCandidates
 from backend.identity.decoder import DecoderThresholds
 from backend.identity.decoder import decode
+from backend.identity.decoder import decode_many
+from backend.identity.decoder import decode_scalar
 from backend.identity.observations import ChannelObservation
 from backend.identity.observations import Prior
 from backend.identity.observations import Reading
@@ -295,3 +300,104 @@ def test_thresholds_are_configurable():
     # it -- proving the flag thresholds are configuration, not hard-coded.
     assert confident_under(0.6)
     assert not confident_under(1.0 + 1e-9)
+
+
+# -- the compiled decoder against the scalar reference ----------------------
+
+
+def random_observation(rng, channel, q):
+    kind = rng.choice(["erasure", "best_guess", "distribution"])
+    if kind == "erasure":
+        return ChannelObservation.erasure()
+
+    def symbol():
+        index = rng.randrange(min(channel.size, q))
+        return channel.index_to_label(index) if rng.random() < 0.5 else index
+
+    if kind == "best_guess":
+        return ChannelObservation.best_guess(
+            symbol(), rng.choice([0.0, 1.0, rng.random()])
+        )
+    return ChannelObservation.distribution(
+        {symbol(): rng.choice([0.0, rng.random()]) for _ in range(rng.randint(1, 4))}
+    )
+
+
+def random_case(rng, scheme):
+    channels = scheme.channels
+    slots = rng.sample(scheme.usable_slots(), rng.randint(0, 12))
+    candidates = {}
+    for slot in slots:
+        word = list(scheme.codeword_of_slot(slot))
+        for i in range(len(word)):
+            if rng.random() < 0.1:
+                word[i] = None
+        candidates[f"player-{slot}"] = tuple(word)
+
+    reading = Reading(
+        [random_observation(rng, channel, channels.q) for channel in channels]
+    )
+
+    prior = rng.choice(
+        [
+            None,
+            Prior({pid: rng.choice([0.0, rng.random()]) for pid in candidates}),
+            Prior({pid: 0.0 for pid in candidates}),
+        ]
+    )
+    return reading, candidates, prior
+
+
+@pytest.mark.parametrize("make_scheme", SCHEMES)
+@pytest.mark.parametrize("seed", range(20))
+def test_decode_matches_the_scalar_reference(make_scheme, seed):
+    rng = random.Random(seed)
+    scheme = make_scheme()
+
+    for _ in range(25):
+        reading, candidates, prior = random_case(rng, scheme)
+        kwargs = dict(
+            prior=prior,
+            thresholds=DecoderThresholds(epsilon=rng.choice([1e-6, 0.0, 0.1])),
+            code_min_distance=rng.choice([None, scheme.code.min_distance()]),
+        )
+
+        expected = decode_scalar(reading, candidates, scheme.channels, **kwargs)
+        result = decode(reading, candidates, scheme.channels, **kwargs)
+
+        # Exactly: not approximately
+        assert result.ranked == expected.ranked
+        assert result.min_distance_to_codeword == expected.min_distance_to_codeword
+        assert (result.inconsistent, result.ambiguous, result.confident) == (
+            expected.inconsistent,
+            expected.ambiguous,
+            expected.confident,
+        )
+
+
+def test_decode_many_compiles_the_candidates_once():
+    rng = random.Random(0)
+    scheme = default_scheme()
+    candidates = all_candidates(scheme)
+    cases = [random_case(rng, scheme) for _ in range(10)]
+    readings = [reading for reading, _, _ in cases]
+
+    compiled = CompiledCandidates(candidates, scheme.channels)
+    results = decode_many(readings, compiled, scheme.channels)
+
+    assert [r.ranked for r in results] == [
+        decode_scalar(reading, candidates, scheme.channels).ranked
+        for reading in readings
+    ]
+
+
+def test_decode_rejects_the_wrong_lengths():
+    scheme = default_scheme()
+    reading = reading_for(scheme, scheme.codeword_of_slot(nth_usable(scheme, 0)))
+
+    with pytest.raises(ValueError):
+        decode(Reading(list(reading)[:-1]), all_candidates(scheme), scheme.channels)
+    with pytest.raises(ValueError):
+        decode(reading, {"short": (0, 1)}, scheme.channels)
+    with pytest.raises(ValueError):
+        decode_many([reading], all_candidates(scheme), scheme.channels, priors=[])
@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pytest
+
+from backend import image_archive
+from backend.blob_store import get_blob_store
+from backend.image_archive import ImageArchiver
+from backend.image_archive import archive_filename
+from backend.user_interface import UserInterface
+from backend.user_interface import db_scoped
+
+
+@pytest.fixture
+def archive_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv("IMAGE_ARCHIVE_DIR", str(tmp_path / "images"))
+    return tmp_path / "images"
+
+
+def test_submitted_shot_is_archived_unchanged(
+    archive_dir, shot_from_user_in_team, test_image_string
+):
+    image_archive.get_image_archiver().join()
+
+    (archived,) = archive_dir.iterdir()
+    digest, _ = get_blob_store().put_data_url(test_image_string)
+    assert archived.suffix == ".png"
+    assert archived.read_bytes() == get_blob_store().get(digest)
+    assert image_archive.get_stats() == {
+        "archived": 1,
+        "failed": 0,
+        "dropped": 0,
+        "queued": 0,
+    }
+
+
+class ShootsThenFails(UserInterface):
+    @db_scoped
+    def shoot_then_fail(self, image_hash, image_type):
+        self.submit_stored_shot(image_hash, image_type)
+        raise RuntimeError("Something went wrong after the shot")
+
+
+def test_shot_that_is_rolled_back_is_not_archived(
+    archive_dir, user_in_team, test_image_string
+):
+    image_hash, image_type = get_blob_store().put_data_url(test_image_string)
+    ui = ShootsThenFails(user_in_team)
+    ui.award_ammo(1)
+
+    with pytest.raises(RuntimeError):
+        ui.shoot_then_fail(image_hash, image_type)
+    image_archive.get_image_archiver().join()
+
+    assert UserInterface(user_in_team).get_own_shots() == []
+    assert not archive_dir.exists() or not list(archive_dir.iterdir())
+
+
+def test_names_cannot_escape_the_archive():
+    filename = archive_filename("../../etc/x", "image/jpeg", 12.5)
+
+    assert "/" not in filename
+    assert filename.endswith("_12.5.jpg")
+
+
+def test_failures_are_counted(tmp_path):
+    archiver = ImageArchiver(tmp_path)
+
+    archiver.submit("0" * 64, "image/jpeg", "nobody")
+    archiver.join()
+
+    assert archiver.get_stats()["failed"] == 1
+    assert not list(tmp_path.iterdir())
+
+
+def test_full_queue_drops_rather_than_blocks(tmp_path, monkeypatch):
+    archiver = ImageArchiver(tmp_path, max_queued=1)
+    release = threading.Event()
+    monkeypatch.setattr(archiver, "_archive", lambda *_: release.wait(5))
+
+    assert archiver.submit("a" * 64, "image/jpeg", "first")
+
+    # Wait for the worker to take the first one off the queue
+    deadline = time.monotonic() + 5
+    while archiver.get_stats()["queued"] and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+    assert archiver.submit("b" * 64, "image/jpeg", "second")
+    assert not archiver.submit("c" * 64, "image/jpeg", "third")
+    assert archiver.get_stats()["queued"] == 1
+
+    release.set()
+    archiver.join()
+    assert archiver.get_stats() == {
+        "archived": 2,
+        "failed": 0,
+        "dropped": 1,
+        "queued": 0,
+    }
+
+
+def test_stats_endpoint(admin_api_client):
+    response = admin_api_client.get("/api/admin_image_archive_stats")
+
+    assert response.is_success
+    assert set(response.json()) == {"archived", "failed", "dropped", "queued"}
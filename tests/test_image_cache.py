@@ -0,0 +1,122 @@
+import threading
+import time
+from uuid import uuid4
+
+import pytest
+
+from backend import image_cache
+from backend.admin_interface import AdminInterface
+from backend.image_cache import CROSS
+from backend.image_cache import DerivedImageCache
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch, tmp_path):
+    monkeypatch.setenv("IMAGE_CACHE_DIR", str(tmp_path / "derived"))
+    return image_cache.get_image_cache()
+
+
+def test_second_fetch_comes_from_memory(fresh_cache, test_image_string):
+    shot_id = uuid4()
+
+    first = fresh_cache.get(shot_id, CROSS, lambda: test_image_string)
+    second = fresh_cache.get(shot_id, CROSS, lambda: 1 / 0)
+
+    assert first == second
+    assert first.startswith("data:image/jpeg;base64,")
+    assert fresh_cache.stats == {"memory_hits": 1, "disk_hits": 0, "renders": 1}
+
+
+def test_renders_survive_a_restart(fresh_cache, test_image_string, monkeypatch):
+    shot_id = uuid4()
+    rendered = fresh_cache.get(shot_id, CROSS, lambda: test_image_string)
+
+    restarted = DerivedImageCache(fresh_cache.directory, max_bytes=2**30)
+    monkeypatch.setitem(image_cache.TRANSFORMS, CROSS, None)
+
+    assert restarted.get(shot_id, CROSS, lambda: 1 / 0) == rendered
+    assert restarted.stats["disk_hits"] == 1
+
+
+def test_least_recently_used_is_evicted_first(monkeypatch):
+    monkeypatch.setitem(image_cache.TRANSFORMS, "upper", str.upper)
+    cache = DerivedImageCache(directory=None, max_bytes=10)
+    a, b, c = uuid4(), uuid4(), uuid4()
+
+    cache.get(a, "upper", lambda: "aaaa")
+    cache.get(b, "upper", lambda: "bbbb")
+    cache.get(a, "upper", lambda: "aaaa")
+    cache.get(c, "upper", lambda: "cccc")
+
+    assert cache.get_stats()["memory_entries"] == 2
+    assert cache.get(a, "upper", lambda: 1 / 0) == "AAAA"
+    assert cache.get(b, "upper", lambda: "bbbb") == "BBBB"
+    assert cache.stats["renders"] == 4
+
+
+def test_prefilled_queue_needs_no_rendering(
+    shot_from_user_in_team, fresh_cache, monkeypatch
+):
+    image_cache.prefill(shot_from_user_in_team)
+
+    monkeypatch.setitem(image_cache.TRANSFORMS, CROSS, None)
+    for _ in range(2):
+        num_shots, (shot,) = AdminInterface().get_unchecked_shots()
+        assert num_shots == 1
+        assert shot.id == shot_from_user_in_team
+
+    assert fresh_cache.stats["renders"] == len(image_cache.TRANSFORMS)
+    assert fresh_cache.stats["memory_hits"] == 2
+
+
+def test_queue_image_is_marked_up(shot_from_user_in_team, test_image_string):
+    _, (shot,) = AdminInterface().get_unchecked_shots()
+
+    assert shot.image_base64 != test_image_string
+    assert (
+        shot.image_base64
+        == AdminInterface.markup_shot_model(
+            AdminInterface().get_shot_model(shot_from_user_in_team)
+        ).image_base64
+    )
+
+
+def test_a_picture_is_rendered_once_at_a_time(fresh_cache, monkeypatch):
+    def slow_upper(image):
+        time.sleep(0.05)
+        return image.upper()
+
+    monkeypatch.setitem(image_cache.TRANSFORMS, "upper", slow_upper)
+    shot_id = uuid4()
+    results = []
+
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(
+                fresh_cache.get(shot_id, "upper", lambda: "aaaa")
+            )
+        )
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["AAAA"] * 4
+    assert fresh_cache.stats["renders"] == 1
+
+
+@pytest.mark.asyncio
+async def test_submission_renders_every_picture(shot_from_user_in_team, fresh_cache):
+    await image_cache.enqueue_prefill(shot_from_user_in_team)
+
+    assert fresh_cache.stats["renders"] == len(image_cache.TRANSFORMS)
+    for transform in image_cache.TRANSFORMS:
+        assert fresh_cache.path(shot_from_user_in_team, transform).exists()
+
+    image = await image_cache.get_async(
+        shot_from_user_in_team, image_cache.VISION, lambda: 1 / 0
+    )
+    assert image.startswith("data:image/jpeg;base64,")
+    assert fresh_cache.stats["renders"] == len(image_cache.TRANSFORMS)
@@ -142,6 +142,45 @@ def test_prepare_for_vision_shrinks_the_payload(test_image_string):
     assert len(prepared) < len(test_image_string)
 
 
+def test_prepare_for_vision_decodes_large_jpegs_at_a_reduced_scale(mocker):
+    import base64
+    from io import BytesIO
+
+    from PIL import Image
+    from PIL.JpegImagePlugin import JpegImageFile
+
+    photo = Image.new("RGB", (4000, 3000), (40, 90, 160))
+    buffer = BytesIO()
+    photo.save(buffer, format="JPEG")
+    data_url = "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+    draft = mocker.spy(JpegImageFile, "draft")
+    image, _ = load_image(prepare_for_vision(data_url))
+
+    assert image.size == (1024, 768)
+    assert draft.spy_return[1] == (0, 0, 2000, 1500)
+
+
+def test_prepare_for_vision_can_mark_the_aim_point():
+    import base64
+    from io import BytesIO
+
+    from PIL import Image
+
+    flat = Image.new("RGB", (800, 600), (128, 128, 128))
+    buffer = BytesIO()
+    flat.save(buffer, format="PNG")
+    data_url = "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+    plain, _ = load_image(prepare_for_vision(data_url, max_dimension=400))
+    marked, _ = load_image(
+        prepare_for_vision(data_url, max_dimension=400, aim_marker=True)
+    )
+
+    assert marked.size == plain.size == (400, 300)
+    assert marked.getpixel((200, 150 + 12)) != plain.getpixel((200, 150 + 12))
+
+
 def test_prepare_for_vision_handles_transparency(test_image_string):
     # JPEG has no alpha channel, so an RGBA source must be converted, not crash
     import base64
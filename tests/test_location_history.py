@@ -0,0 +1,224 @@
+import json
+import time
+
+import pytest
+
+from backend import location_history
+from backend import location_store
+from backend.admin_interface import AdminInterface
+from backend.database import session_scope
+from backend.location_history import positions_at
+from backend.location_history import positions_at_times
+from backend.location_history import prune
+from backend.location_store import LocationStore
+from backend.model import LocationFix
+from backend.shot_identification import location_fixes
+from backend.user_interface import UserInterface
+
+NOW = 1_800_000_000.0
+
+
+@pytest.fixture(autouse=True)
+def store(monkeypatch):
+    store = LocationStore()
+    monkeypatch.setattr(location_store, "_store", store)
+    monkeypatch.setattr(location_history, "_thinned_until", None)
+    return store
+
+
+def add_fixes(game_id, user_id, timestamps, latitude=51.5, longitude=-0.1):
+    with session_scope() as session:
+        session.add_all(
+            LocationFix(
+                game_id=game_id,
+                user_id=user_id,
+                timestamp=timestamp,
+                latitude=latitude,
+                longitude=longitude,
+            )
+            for timestamp in timestamps
+        )
+
+
+def history_timestamps(user_id):
+    with session_scope() as session:
+        return sorted(
+            fix.timestamp
+            for fix in session.query(LocationFix).filter_by(user_id=user_id)
+        )
+
+
+def test_flush_appends_to_the_history(store, user_in_team, one_game):
+    ui = UserInterface(user_in_team)
+    ui.set_location(1.0, 2.0)
+    store.flush()
+    ui.set_location(51.5, -0.1)
+    store.flush()
+
+    with session_scope() as session:
+        fixes = session.query(LocationFix).order_by(LocationFix.timestamp).all()
+        assert [(f.latitude, f.longitude) for f in fixes] == [(1.0, 2.0), (51.5, -0.1)]
+        assert {f.game_id for f in fixes} == {one_game}
+
+
+def test_players_without_a_team_have_no_history(store, user_factory):
+    user_id = user_factory()
+    UserInterface(user_id).set_location(51.5, -0.1)
+
+    assert store.flush() == 1
+    assert history_timestamps(user_id) == []
+
+
+def test_positions_at_a_time(user_in_team, one_game):
+    add_fixes(one_game, user_in_team, [NOW - 20], latitude=1.0)
+    add_fixes(one_game, user_in_team, [NOW - 10], latitude=2.0)
+    add_fixes(one_game, user_in_team, [NOW + 10], latitude=3.0)
+
+    with session_scope() as session:
+        assert positions_at(session, one_game, NOW)[user_in_team].latitude == 2.0
+        assert positions_at(session, one_game, NOW - 15)[user_in_team].latitude == 1.0
+        assert positions_at(session, one_game, NOW - 30) == {}
+
+
+def test_positions_only_come_from_the_game(user_in_team, one_game, game_factory):
+    add_fixes(game_factory(), user_in_team, [NOW - 10])
+
+    with session_scope() as session:
+        assert positions_at(session, one_game, NOW) == {}
+
+
+def test_unflushed_fixes_are_included(user_in_team, one_game):
+    add_fixes(one_game, user_in_team, [time.time() - 60], latitude=1.0)
+    UserInterface(user_in_team).set_location(51.5, -0.1)
+
+    with session_scope() as session:
+        (fix,) = positions_at(session, one_game, time.time()).values()
+
+    assert fix.latitude == 51.5
+
+
+def test_positions_take_one_query(user_factory, one_team, one_game, engine):
+    from sqlalchemy import event
+
+    for _ in range(5):
+        user_id = user_factory()
+        AdminInterface().add_user_to_team(user_id, one_team)
+        add_fixes(one_game, user_id, [NOW - 30, NOW - 20, NOW - 10])
+
+    queries = []
+
+    def count(*args):
+        queries.append(args[2])
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        with session_scope() as session:
+            positions = positions_at(session, one_game, NOW)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+    assert len(positions) == 5
+    assert {fix.timestamp for fix in positions.values()} == {NOW - 10}
+    assert len(queries) == 1
+
+
+def test_positions_at_several_times(user_in_team, one_game):
+    add_fixes(one_game, user_in_team, [NOW - 20], latitude=1.0)
+    add_fixes(one_game, user_in_team, [NOW - 10], latitude=2.0)
+
+    with session_scope() as session:
+        positions = positions_at_times(session, one_game, [NOW, NOW - 15, NOW - 30])
+
+    assert positions[NOW][user_in_team].latitude == 2.0
+    assert positions[NOW - 15][user_in_team].latitude == 1.0
+    assert positions[NOW - 30] == {}
+
+
+def test_shot_queue_looks_positions_up_once_per_game(user_in_team, test_image_string):
+    from sqlalchemy import event
+
+    from backend.database import engine
+
+    ui = UserInterface(user_in_team)
+    ui.award_ammo(3)
+
+    def count_queue_queries():
+        queries = []
+
+        def count(*args):
+            queries.append(args[2])
+
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            _, shots = AdminInterface().get_unchecked_shots(limit=10)
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+
+        assert all(shot.location_context for shot in shots)
+        return len(queries)
+
+    ui.set_location(51.5, -0.1)
+    ui.submit_shot(test_image_string)
+    one_shot = count_queue_queries()
+
+    for latitude in (51.6, 51.7):
+        ui.set_location(latitude, -0.1)
+        ui.submit_shot(test_image_string)
+
+    assert count_queue_queries() == one_shot
+
+
+def test_shots_store_a_time_not_a_snapshot(user_in_team, test_image_string):
+    ui = UserInterface(user_in_team)
+    ui.award_ammo(1)
+    ui.set_location(51.5, -0.1)
+    shot_id = ui.submit_shot(test_image_string)
+
+    with session_scope() as session:
+        from backend.model import Shot
+
+        shot = session.get(Shot, shot_id)
+        assert shot.legacy_location_context is None
+        assert shot.location_time is not None
+
+    (location,) = json.loads(AdminInterface().get_shot_model(shot_id).location_context)
+    assert (location["latitude"], location["longitude"]) == (51.5, -0.1)
+
+
+def test_identification_looks_positions_up(user_in_team, one_game, test_image_string):
+    ui = UserInterface(user_in_team)
+    ui.award_ammo(1)
+    ui.set_location(51.5, -0.1)
+    ui.submit_shot(test_image_string)
+
+    head = AdminInterface().get_queue_head(one_game)
+    fixes = location_fixes(head)
+
+    assert fixes[user_in_team]["latitude"] == 51.5
+
+
+def test_expired_fixes_are_deleted(user_in_team, one_game, monkeypatch):
+    monkeypatch.setenv("LOCATION_HISTORY_RETENTION", "1000")
+    add_fixes(one_game, user_in_team, [NOW - 2000, NOW - 500])
+
+    prune(now=NOW)
+
+    assert history_timestamps(user_in_team) == [NOW - 500]
+
+
+def test_old_fixes_are_thinned_out(user_in_team, one_game, monkeypatch):
+    monkeypatch.setenv("LOCATION_HISTORY_DOWNSAMPLE_AFTER", "3600")
+    monkeypatch.setenv("LOCATION_HISTORY_RESOLUTION", "30")
+
+    old = [NOW - 7200 + 2 * i for i in range(30)]  # 60 s, every 2 s
+    recent = [NOW - 60 + 2 * i for i in range(30)]
+    add_fixes(one_game, user_in_team, old + recent)
+
+    assert prune(now=NOW) == 28
+
+    remaining = history_timestamps(user_in_team)
+    assert len(remaining) == 32
+    assert remaining[2:] == recent
+
+    # Nothing more to do until time moves on
+    assert prune(now=NOW) == 0
@@ -0,0 +1,130 @@
+import json
+from uuid import uuid4
+
+import pytest
+
+from backend import location_store
+from backend.admin_interface import AdminInterface
+from backend.database import session_scope
+from backend.location_store import LocationStore
+from backend.model import User
+from backend.user_interface import UserInterface
+
+
+@pytest.fixture(autouse=True)
+def store(monkeypatch):
+    store = LocationStore()
+    monkeypatch.setattr(location_store, "_store", store)
+    return store
+
+
+def stored_location(user_id):
+    with session_scope() as session:
+        user = session.get(User, user_id)
+        return user.latitude, user.longitude, user.location_timestamp
+
+
+def test_set_location_does_not_write_to_the_database(api_client, api_user_id):
+    api_client.get("/api/user_info")
+
+    response = api_client.post("/api/set_location?latitude=51.5&longitude=-0.1")
+
+    assert response.is_success
+    assert stored_location(api_user_id) == (None, None, None)
+    assert api_client.get("/api/user_info").json()["latitude"] == 51.5
+
+
+def test_locations_are_read_from_memory(user_in_team, one_game):
+    UserInterface(user_in_team).set_location(51.5, -0.1)
+
+    (location,) = AdminInterface().get_locations(one_game)
+
+    assert (location["latitude"], location["longitude"]) == (51.5, -0.1)
+    assert location["timestamp"] is not None
+
+
+def test_flush_writes_the_latest_fixes(store, user_factory, one_team):
+    user_ids = [user_factory() for _ in range(3)]
+    for user_id in user_ids:
+        AdminInterface().add_user_to_team(user_id, one_team)
+        UserInterface(user_id).set_location(1.0, 2.0)
+        UserInterface(user_id).set_location(51.5, -0.1)
+
+    assert store.flush() == 3
+    assert store.flush() == 0
+
+    for user_id in user_ids:
+        latitude, longitude, timestamp = stored_location(user_id)
+        assert (latitude, longitude) == (51.5, -0.1)
+        assert timestamp == store.get(user_id).timestamp
+
+
+def test_flush_keeps_newer_fixes_from_elsewhere(store, user_in_team):
+    UserInterface(user_in_team).set_location(1.0, 2.0)
+
+    # Another worker process has since written a newer fix
+    with session_scope() as session:
+        user = session.get(User, user_in_team)
+        user.latitude, user.longitude = 51.5, -0.1
+        user.location_timestamp = store.get(user_in_team).timestamp + 10
+
+    store.flush()
+
+    assert stored_location(user_in_team)[:2] == (51.5, -0.1)
+    assert UserInterface(user_in_team).get_user_model().latitude == 51.5
+
+
+def test_failed_flush_is_retried(store, user_in_team, monkeypatch):
+    UserInterface(user_in_team).set_location(51.5, -0.1)
+
+    from backend import database
+
+    monkeypatch.setattr(database, "engine", None)
+    with pytest.raises(AttributeError):
+        store.flush()
+    monkeypatch.undo()
+    monkeypatch.setattr(location_store, "_store", store)
+
+    assert store.flush() == 1
+    assert stored_location(user_in_team)[:2] == (51.5, -0.1)
+
+
+def test_locations_of_unknown_users_are_dropped(store, user_in_team):
+    stranger = uuid4()
+    store.set(stranger, 51.5, -0.1)
+    UserInterface(user_in_team).set_location(51.5, -0.1)
+
+    assert store.flush() == 1
+
+    assert store.get(stranger) is None
+    assert store.get(user_in_team) is not None
+
+
+def test_written_locations_are_forgotten_once_old(store, user_in_team, monkeypatch):
+    UserInterface(user_in_team).set_location(51.5, -0.1)
+    store.flush()
+    assert store.get(user_in_team) is not None
+
+    monkeypatch.setattr(location_store, "FLUSHED_FIX_TTL", -1)
+    store.flush()
+
+    assert store.get(user_in_team) is None
+    (location,) = [
+        loc
+        for loc in AdminInterface().get_locations(
+            UserInterface(user_in_team).get_user_model().game_id
+        )
+        if loc["user_id"] == user_in_team
+    ]
+    assert (location["latitude"], location["longitude"]) == (51.5, -0.1)
+
+
+def test_shots_snapshot_the_latest_locations(user_in_team, test_image_string):
+    ui = UserInterface(user_in_team)
+    ui.award_ammo(1)
+    ui.set_location(51.5, -0.1)
+    shot_id = ui.submit_shot(test_image_string)
+
+    context = json.loads(AdminInterface().get_shot_model(shot_id).location_context)
+
+    assert (context[0]["latitude"], context[0]["longitude"]) == (51.5, -0.1)
@@ -0,0 +1,273 @@
+from uuid import uuid4
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from backend import migrations
+from backend.model import Base
+from backend.model import Game
+from backend.model import LocationFix
+from backend.model import Shot
+from backend.model import Team
+from backend.model import User
+from backend.model import UserStats
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return sa.create_engine(f"sqlite:///{tmp_path}/migrations.db")
+
+
+@pytest.fixture
+def pre_versioning_engine(engine):
+    """A database kept in step with the models the old way: no
+    schema_version table, and missing a table, columns and an index that the
+    models have since gained"""
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(sa.text("DROP INDEX ix_shots_checked_time_id"))
+        conn.execute(
+            sa.text(
+                "CREATE INDEX ix_shots_checked_time ON shots (checked, time_created)"
+            )
+        )
+        conn.execute(sa.text("ALTER TABLE shots DROP COLUMN ai_review"))
+        conn.execute(sa.text("ALTER TABLE shots DROP COLUMN location_time"))
+        conn.execute(sa.text("DROP TABLE location_history"))
+        conn.execute(sa.text("ALTER TABLE shots DROP COLUMN knocked_out"))
+        conn.execute(sa.text("DROP TABLE user_stats"))
+    return engine
+
+
+def count_queries(engine):
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *args: queries.append(args[2]))
+    return queries
+
+
+def test_app_database_is_up_to_date():
+    from backend import database
+
+    assert migrations.current_version(database.engine) == migrations.latest_version()
+
+
+def test_new_database_is_stamped_and_left_alone(engine):
+    Base.metadata.create_all(engine)
+    migrations.stamp(engine)
+
+    queries = count_queries(engine)
+    assert migrations.migrate(engine) == []
+
+    # One cheap version check: no reflection
+    assert len(queries) == 1
+
+
+def test_old_database_is_brought_up_to_date(pre_versioning_engine):
+    engine = pre_versioning_engine
+    assert migrations.current_version(engine) == 0
+
+    applied = migrations.migrate(engine)
+
+    assert [m.version for m in applied] == list(
+        range(1, migrations.latest_version() + 1)
+    )
+    assert migrations.current_version(engine) == migrations.latest_version()
+
+    inspector = sa.inspect(engine)
+    assert "ai_review" in {col["name"] for col in inspector.get_columns("shots")}
+    indexes = {index["name"] for index in inspector.get_indexes("shots")}
+    assert "ix_shots_checked_time_id" in indexes
+    assert "ix_shots_checked_time" not in indexes
+    assert "location_time" in {col["name"] for col in inspector.get_columns("shots")}
+    assert inspector.has_table("location_history")
+
+    assert migrations.migrate(engine) == []
+
+
+def describe_schema(engine):
+    """Every table's columns, with their types and whether they can be null,
+    and its indexes"""
+    inspector = sa.inspect(engine)
+    return {
+        table: (
+            {
+                (col["name"], str(col["type"]), col["nullable"])
+                for col in inspector.get_columns(table)
+            },
+            {
+                (index["name"], tuple(index["column_names"]))
+                for index in inspector.get_indexes(table)
+            },
+        )
+        for table in inspector.get_table_names()
+        if table != "schema_version"
+    }
+
+
+def test_empty_database_is_migrated_to_the_models_schema(engine, tmp_path):
+    # Migration 1 starts from nothing with the schema as it was then, and the
+    # rest take it from there without looking at the models
+    migrations.migrate(engine)
+
+    new_engine = sa.create_engine(f"sqlite:///{tmp_path}/new.db")
+    Base.metadata.create_all(new_engine)
+
+    assert describe_schema(engine) == describe_schema(new_engine)
+
+
+def test_dry_run_changes_nothing(pre_versioning_engine):
+    engine = pre_versioning_engine
+
+    would_apply = migrations.migrate(engine, dry_run=True)
+
+    assert len(would_apply) == migrations.latest_version()
+    assert migrations.current_version(engine) == 0
+    assert "ai_review" not in {
+        col["name"] for col in sa.inspect(engine).get_columns("shots")
+    }
+
+
+def test_location_history_starts_from_latest_positions(pre_versioning_engine):
+    engine = pre_versioning_engine
+
+    game_id, team_id, player_id = uuid4(), uuid4(), uuid4()
+    located = dict(latitude=51.5, longitude=-0.1, location_timestamp=1000.0)
+    with Session(engine) as session, session.begin():
+        session.add_all(
+            [
+                Game(id=game_id),
+                Team(id=team_id, game_id=game_id),
+                User(id=player_id, team_id=team_id, **located),
+                # Not in a team, so not in any game's history
+                User(id=uuid4(), **located),
+            ]
+        )
+
+    migrations.migrate(engine)
+    migrations.MIGRATIONS[2].apply(engine)  # and again, harmlessly
+
+    with Session(engine) as session:
+        fixes = session.query(LocationFix).all()
+        assert [(f.game_id, f.user_id, f.timestamp) for f in fixes] == [
+            (game_id, player_id, 1000.0)
+        ]
+
+
+def test_user_stats_are_added_up_from_the_shots(engine):
+    Base.metadata.create_all(engine)
+
+    game_id, team_id, shooter_id, target_id = uuid4(), uuid4(), uuid4(), uuid4()
+    shot = dict(game_id=game_id, team_id=team_id, user_id=shooter_id)
+    with Session(engine) as session, session.begin():
+        session.add_all(
+            [
+                Game(id=game_id),
+                Team(id=team_id, game_id=game_id),
+                User(id=shooter_id, team_id=team_id),
+                User(id=target_id, team_id=team_id),
+            ]
+        )
+        session.flush()
+        session.add_all(
+            [
+                Shot(
+                    checked=True,
+                    result="hit",
+                    target_user_id=target_id,
+                    shot_damage=2,
+                    **shot,
+                ),
+                Shot(checked=True, result="refunded", **shot),
+                Shot(**shot),
+            ]
+        )
+
+    with engine.begin() as conn:
+        conn.execute(sa.text("ALTER TABLE shots DROP COLUMN knocked_out"))
+        conn.execute(sa.text("DROP TABLE user_stats"))
+
+    migrations.MIGRATIONS[3].apply(engine)
+    migrations.MIGRATIONS[3].apply(engine)  # and again, harmlessly
+
+    with Session(engine) as session:
+        (stats,) = session.query(UserStats).all()
+        assert (stats.user_id, stats.shots_fired, stats.hits, stats.damage_dealt) == (
+            shooter_id,
+            2,
+            1,
+            2,
+        )
+
+
+def test_failed_migration_is_not_recorded(pre_versioning_engine, monkeypatch):
+    def fail(engine):
+        raise RuntimeError("Out of disk")
+
+    monkeypatch.setattr(migrations.MIGRATIONS[-1], "apply", fail)
+
+    with pytest.raises(RuntimeError):
+        migrations.migrate(pre_versioning_engine)
+
+    # Everything before it stuck, and it is tried again next time
+    assert (
+        migrations.current_version(pre_versioning_engine)
+        == migrations.latest_version() - 1
+    )
+
+
+def test_version_recorded_by_another_process_is_left_alone(engine, tmp_path):
+    Base.metadata.create_all(engine)
+    other_process = sa.create_engine(f"sqlite:///{tmp_path}/migrations.db")
+
+    raced = []
+
+    def record_first(conn, cursor, statement, *args):
+        if statement.startswith("INSERT INTO schema_version") and not raced:
+            raced.append(statement)
+            migrations.stamp(other_process)
+
+    event.listen(engine, "before_cursor_execute", record_first)
+
+    migrations.stamp(engine)
+
+    assert migrations.current_version(engine) == migrations.latest_version()
+
+
+def test_backfill_works_in_batches(engine):
+    with engine.begin() as conn:
+        conn.execute(sa.text("CREATE TABLE numbers (n INTEGER, doubled INTEGER)"))
+        conn.execute(
+            sa.text("INSERT INTO numbers (n) VALUES (:n)"),
+            [{"n": n} for n in range(25)],
+        )
+
+    batches = []
+
+    def double(conn, rows):
+        batches.append(len(rows))
+        for (n,) in rows:
+            conn.execute(
+                sa.text("UPDATE numbers SET doubled = :d WHERE n = :n"),
+                {"d": 2 * n, "n": n},
+            )
+
+    num_rows = migrations.backfill(
+        engine,
+        "SELECT n FROM numbers WHERE doubled IS NULL LIMIT :batch_size",
+        double,
+        batch_size=10,
+    )
+
+    assert num_rows == 25
+    assert batches == [10, 10, 5]
+    with engine.connect() as conn:
+        assert conn.execute(sa.text("SELECT SUM(doubled) FROM numbers")).scalar() == (
+            2 * sum(range(25))
+        )
+
+
+def test_versions_must_follow_on():
+    with pytest.raises(ValueError):
+        migrations.migration(migrations.latest_version() + 2)(lambda engine: None)
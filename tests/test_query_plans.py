@@ -0,0 +1,129 @@
+"""
+The hot queries should be served by the indexes made for them (see the
+__table_args__ in backend.model), not by scanning a table that grows all game.
+
+Each test captures the SQL that an interface method actually runs and asks
+SQLite how it would execute it.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import event
+
+from backend import database
+from backend.admin_interface import AdminInterface
+from backend.admin_interface import _queue_cursor
+from backend.ticker import Ticker
+
+
+@contextmanager
+def captured_statements():
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(database.engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        event.remove(database.engine, "before_cursor_execute", capture)
+
+
+def query_plan(statement, parameters) -> str:
+    with database.engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return "\n".join(row[-1] for row in rows)
+
+
+def plans_for(table: str, func, *args):
+    """The query plans of every statement ``func`` runs against ``table``"""
+    with captured_statements() as statements:
+        func(*args)
+
+    plans = [
+        query_plan(statement, parameters)
+        for statement, parameters in statements
+        if statement.lstrip().startswith("SELECT") and f"FROM {table}" in statement
+    ]
+    assert plans, f"No query on {table} was run"
+    return plans
+
+
+@pytest.mark.parametrize(
+    "method,args,index",
+    [
+        ("get_queue_head", (True,), "ix_shots_game_checked_time"),
+        ("get_unchecked_shots", (), "ix_shots_checked_time_id"),
+        ("get_unchecked_shots_ids", (), "ix_shots_checked_time_id"),
+        ("get_shot_queue", (True,), "ix_shots_game_checked_time"),
+        ("get_shot_queue", (), "ix_shots_checked_time_id"),
+    ],
+)
+def test_shot_queue_uses_its_index(
+    shot_from_user_in_team, one_game, method, args, index
+):
+    args = (one_game,) if args else ()
+
+    for plan in plans_for("shots", getattr(AdminInterface(), method), *args):
+        assert index in plan, plan
+        assert "TEMP B-TREE" not in plan, plan
+
+
+@pytest.mark.parametrize("by_game", [True, False])
+def test_later_queue_pages_seek_in_the_index(shot_from_user_in_team, one_game, by_game):
+    game_id = one_game if by_game else None
+    cursor = _queue_cursor(datetime(2000, 1, 1), uuid4())
+
+    for plan in plans_for(
+        "shots", AdminInterface().get_shot_queue, game_id, cursor, 10
+    ):
+        assert "(checked=? AND (time_created,id)>(?,?))" in plan or (
+            "(game_id=? AND checked=? AND (time_created,id)>(?,?))" in plan
+        ), plan
+        assert "TEMP B-TREE" not in plan, plan
+
+
+def test_scoreboard_uses_indexes(shot_from_user_in_team, one_game):
+    (plan,) = plans_for("teams", AdminInterface().get_scoreboard, one_game)
+
+    assert "ix_teams_game_id" in plan, plan
+    assert "ix_users_team_id" in plan, plan
+    assert "sqlite_autoindex_user_stats_1" in plan, plan
+
+
+def test_scoreboard_does_not_read_the_shots(shot_from_user_in_team, one_game):
+    with captured_statements() as statements:
+        AdminInterface().get_scoreboard(one_game)
+
+    assert not any("FROM shots" in statement for statement, _ in statements)
+
+
+def test_ticker_uses_its_index(user_in_team, one_game):
+    ticker = Ticker(one_game, user_in_team)
+    ticker.post_message("Hello")
+
+    # The first read loads the game's tail: every feed's newest, in one pass
+    for plan in plans_for("ticker_entries", ticker.get_messages, 10):
+        assert "ix_ticker_entries_game_private_id" in plan, plan
+        assert "TEMP B-TREE" not in plan, plan
+
+    # Later ones only catch up on what was posted since
+    ticker.post_message("Hello again")
+    for plan in plans_for("ticker_entries", ticker.get_messages, 10):
+        assert "ix_ticker_entries_game_id" in plan, plan
+        assert "TEMP B-TREE" not in plan, plan
+
+
+def test_oldest_first_ticker_uses_its_index(user_in_team, one_game):
+    ticker = Ticker(one_game, user_in_team)
+    ticker.post_message("Hello")
+
+    for plan in plans_for(
+        "ticker_entries", lambda: ticker.get_messages(10, newest_first=False)
+    ):
+        assert "ix_ticker_entries_game_id" in plan, plan
+        assert "TEMP B-TREE" not in plan, plan
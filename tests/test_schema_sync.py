@@ -1,16 +1,21 @@
 """
-The startup schema sync (backend.database.add_missing_columns) exists because
-production keeps its data across deploys and there are no migrations: a column
-added to the models (like games.ai_shot_review_enabled) would otherwise break
-every SELECT on its table until someone wiped the database.
+The schema sync (backend.migrations.add_missing_columns) predates versioned
+migrations and is now their first step: it catches up databases from before
+then, whose columns were added at startup as the models gained them. A column
+missing from the database (like games.ai_shot_review_enabled) breaks every
+SELECT on its table.
 """
 
 import sqlalchemy as sa
 from sqlalchemy.orm import sessionmaker
 
-from backend.database import add_missing_columns
+from backend.blob_store import get_blob_store
+from backend.migrations import add_missing_columns
+from backend.migrations import add_missing_indexes
+from backend.migrations import move_images_to_blob_store
 from backend.model import Base
 from backend.model import Game
+from backend.model import Shot
 
 
 def make_old_schema_engine(tmp_path):
@@ -71,3 +76,65 @@ def test_sync_is_idempotent(tmp_path):
 
     with sessionmaker(bind=engine)() as session:
         assert len(session.query(Game).all()) == 1
+
+
+def test_missing_indexes_are_added(tmp_path):
+    engine = make_old_schema_engine(tmp_path)
+    with engine.begin() as conn:
+        conn.execute(sa.text("DROP INDEX ix_shots_game_checked_time"))
+        conn.execute(sa.text("DROP INDEX ix_users_team_id"))
+
+    add_missing_indexes(engine)
+    add_missing_indexes(engine)
+
+    inspector = sa.inspect(engine)
+    assert "ix_shots_game_checked_time" in {
+        index["name"] for index in inspector.get_indexes("shots")
+    }
+    assert "ix_users_team_id" in {
+        index["name"] for index in inspector.get_indexes("users")
+    }
+
+
+def test_inline_shot_images_are_moved_to_the_blob_store(
+    tmp_path, monkeypatch, test_image_string
+):
+    monkeypatch.setenv("BLOB_STORE_DIR", str(tmp_path / "blobs"))
+    engine = make_old_schema_engine(tmp_path)
+
+    # Shots from before the blob store, with their photos inline
+    with engine.begin() as conn:
+        conn.execute(sa.text("ALTER TABLE shots DROP COLUMN image_hash"))
+        conn.execute(sa.text("ALTER TABLE shots DROP COLUMN image_type"))
+        for n in range(3):
+            conn.execute(
+                sa.text(
+                    "INSERT INTO shots (id, game_id, user_id, team_id, image_base64,"
+                    " checked) VALUES (:id, :game_id, :id, :id, :image, 0)"
+                ),
+                {
+                    "id": bytes([n]) * 16,
+                    "game_id": b"0" * 16,
+                    "image": test_image_string,
+                },
+            )
+
+    add_missing_columns(engine)
+    assert move_images_to_blob_store(engine, batch_size=2) == 3
+    assert move_images_to_blob_store(engine) == 0
+
+    with engine.connect() as conn:
+        assert (
+            conn.execute(
+                sa.text("SELECT COUNT(*) FROM shots WHERE image_base64 != ''")
+            ).scalar()
+            == 0
+        )
+
+    with sessionmaker(bind=engine)() as session:
+        shots = session.query(Shot).all()
+        assert len(shots) == 3
+        assert len({shot.image_hash for shot in shots}) == 1
+        assert all(shot.image_base64 == test_image_string for shot in shots)
+
+    assert get_blob_store().root == tmp_path / "blobs"
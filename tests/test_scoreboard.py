@@ -0,0 +1,230 @@
+import pytest
+from sqlalchemy import event
+
+from backend import scoreboard
+from backend.admin_interface import AdminInterface
+from backend.asyncio_triggers import trigger_update_event
+from backend.database import session_scope
+from backend.model import UserStats
+from backend.scoreboard import ScoreboardCache
+from backend.scoreboard import get_cached_scoreboard
+from backend.user_interface import UserInterface
+
+
+def stats(user_id):
+    with session_scope() as session:
+        row = session.get(UserStats, user_id)
+        if row is None:
+            return None
+        return {name: getattr(row, name) for name in scoreboard.STAT_NAMES}
+
+
+def consistent():
+    with session_scope() as session:
+        return scoreboard.check(session) == []
+
+
+def fire(user_id, test_image_string, num=1):
+    ui = UserInterface(user_id)
+    ui.award_ammo(num)
+    return [ui.submit_shot(test_image_string) for _ in range(num)]
+
+
+@pytest.fixture
+def shooter_and_target(two_users_in_different_teams):
+    shooter, target = two_users_in_different_teams
+    UserInterface(shooter).set_weapon_data(1, 6)
+    AdminInterface().set_user_HP(target, 5)
+    return shooter, target
+
+
+def test_shots_are_counted_as_they_are_adjudicated(
+    shooter_and_target, test_image_string
+):
+    shooter, target = shooter_and_target
+    hit, miss, refund, unchecked = fire(shooter, test_image_string, 4)
+
+    AdminInterface().hit_user(hit, target)
+    AdminInterface().mark_shot_missed(miss)
+    AdminInterface().refund_shot(refund)
+
+    assert stats(shooter) == {
+        "shots_fired": 3,
+        "hits": 1,
+        "kills": 0,
+        "damage_dealt": 1,
+    }
+    assert stats(target) is None
+    assert consistent()
+
+
+def test_knockouts_count_as_kills(shooter_and_target, test_image_string):
+    shooter, target = shooter_and_target
+    UserInterface(shooter).set_weapon_data(3, 6)
+    first, second, third = fire(shooter, test_image_string, 3)
+
+    AdminInterface().hit_user(first, target)
+    AdminInterface().hit_user(second, target)
+    # They're already down
+    AdminInterface().hit_user(third, target)
+
+    assert stats(shooter) == {
+        "shots_fired": 3,
+        "hits": 3,
+        "kills": 1,
+        "damage_dealt": 9,
+    }
+    assert consistent()
+
+
+def test_a_knockout_refunds_the_targets_shots(shooter_and_target, test_image_string):
+    shooter, target = shooter_and_target
+    UserInterface(shooter).set_weapon_data(5, 6)
+    fire(target, test_image_string, 2)
+    (shot,) = fire(shooter, test_image_string)
+
+    AdminInterface().hit_user(shot, target)
+
+    assert stats(target)["shots_fired"] == 0
+    assert consistent()
+
+
+def test_shooting_yourself(user_in_team, test_image_string):
+    UserInterface(user_in_team).set_weapon_data(1, 6)
+    shot, _ = fire(user_in_team, test_image_string, 2)
+
+    AdminInterface().hit_user(shot, user_in_team)
+
+    assert stats(user_in_team) == {
+        "shots_fired": 1,
+        "hits": 1,
+        "kills": 1,
+        "damage_dealt": 1,
+    }
+    assert consistent()
+
+
+def test_deleting_a_player(shooter_and_target, test_image_string):
+    shooter, target = shooter_and_target
+    (shot,) = fire(shooter, test_image_string)
+    AdminInterface().hit_user(shot, target)
+    fire(target, test_image_string)
+
+    AdminInterface().delete_user(target)
+
+    assert stats(shooter)["hits"] == 0
+    assert stats(target) is None
+    assert consistent()
+
+
+def test_resetting_the_game(shooter_and_target, one_game, test_image_string):
+    shooter, target = shooter_and_target
+    (shot,) = fire(shooter, test_image_string)
+    AdminInterface().hit_user(shot, target)
+
+    AdminInterface().reset_game(one_game)
+
+    assert stats(shooter) is None
+    assert consistent()
+
+
+def test_rebuild_repairs_the_stats(shooter_and_target, test_image_string):
+    shooter, target = shooter_and_target
+    hit, _ = fire(shooter, test_image_string, 2)
+    AdminInterface().hit_user(hit, target)
+
+    with session_scope() as session:
+        session.get(UserStats, shooter).hits = 7
+        session.add(UserStats(user_id=target, shots_fired=1, hits=0, kills=0))
+
+    with session_scope() as session:
+        assert len(scoreboard.check(session)) == 2
+
+        assert scoreboard.rebuild(session) == 1
+
+    assert stats(shooter)["hits"] == 1
+    assert stats(target) is None
+    assert consistent()
+
+
+def test_scoreboard_comes_from_the_stats(
+    shooter_and_target, one_game, test_image_string
+):
+    shooter, target = shooter_and_target
+    (shot,) = fire(shooter, test_image_string)
+    AdminInterface().hit_user(shot, target)
+
+    table = AdminInterface().get_scoreboard(one_game)["table"]
+
+    assert [(row["total_damage"], row["hits"]) for row in table] == [(1, 1), (0, 0)]
+    assert table[0]["state"] == "alive"
+
+
+def count_queries(engine, func):
+    queries = []
+
+    def count(*args):
+        queries.append(args[2])
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        func()
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+    return len(queries)
+
+
+def test_cached_scoreboard(shooter_and_target, one_game, engine, test_image_string):
+    shooter, target = shooter_and_target
+    (shot,) = fire(shooter, test_image_string)
+
+    assert get_cached_scoreboard(one_game) == AdminInterface().get_scoreboard(one_game)
+    assert count_queries(engine, lambda: get_cached_scoreboard(one_game)) == 0
+
+    AdminInterface().hit_user(shot, target)
+
+    assert get_cached_scoreboard(one_game)["table"][0]["total_damage"] == 1
+
+
+@pytest.mark.parametrize(
+    "event_type,key",
+    [("shots", "game"), ("scoreboard", "game"), ("user", "user"), ("games", None)],
+)
+def test_cache_invalidation(event_type, key):
+    cache = ScoreboardCache()
+    row = scoreboard.Row("user", "name", "team", 1, None, 0, 0, 0, 0)
+
+    cache.put("game", cache.generation("game"), [row])
+    assert cache.get("game") == [row]
+
+    cache.on_update_event(event_type, key)
+    assert cache.get("game") is None
+
+
+def test_cache_ignores_other_games():
+    cache = ScoreboardCache()
+    cache.put("game", cache.generation("game"), [])
+
+    cache.on_update_event("shots", "other game")
+
+    assert cache.get("game") == []
+
+
+def test_a_load_racing_a_change_is_not_kept():
+    cache = ScoreboardCache()
+
+    generation = cache.generation("game")
+    cache.invalidate("game")
+    cache.put("game", generation, [])
+
+    assert cache.get("game") is None
+
+
+def test_triggers_reach_the_cache(shooter_and_target, one_game, test_image_string):
+    get_cached_scoreboard(one_game)
+    assert scoreboard._cache.get(one_game) is not None
+
+    trigger_update_event("ticker", one_game)
+
+    assert scoreboard._cache.get(one_game) is None
@@ -198,6 +198,29 @@ def test_proximity_breaks_a_tie_between_identical_outfits():
     assert ranked.best == near.id
 
 
+def test_fixes_can_be_handed_over_as_they_are():
+    shooter = player()
+    near = player(slot=7)
+    far = player(slot=7)
+
+    now = 1_000_000.0
+    fixes = {
+        shooter.id: fix(shooter, 51.5000, -0.1000, now),
+        near.id: fix(near, 51.5001, -0.1000, now),
+        far.id: fix(far, 51.5300, -0.1000, now),
+    }
+
+    ranked = si.rank_candidates(
+        shot_by(shooter),
+        [shooter, near, far],
+        review_of(SCHEME.appearance_of_slot(7)),
+        at_time=now,
+        fixes=fixes,
+    )
+
+    assert ranked.best == near.id
+
+
 def test_a_stale_fix_goes_quiet_rather_than_eliminating_the_candidate():
     """As a fix ages the location term must tend to 1, leaving the image
     evidence to decide - never to 0, which no photograph could climb back from."""
@@ -0,0 +1,177 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from backend import image_cache
+from backend.admin_interface import AdminInterface
+from backend.blob_store import split_data_url
+from backend.image_cache import CROSS
+from backend.image_cache import THUMBNAIL
+from backend.shot_images import ANNOTATED
+from backend.shot_images import RangeNotSatisfiable
+from backend.shot_images import parse_range
+from backend.user_interface import UserInterface
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch, tmp_path):
+    monkeypatch.setenv("IMAGE_CACHE_DIR", str(tmp_path / "derived"))
+    return image_cache.get_image_cache()
+
+
+@pytest.fixture
+def own_shot(api_client, api_user_id, one_team, test_image_string):
+    ui = UserInterface(api_user_id)
+    ui.join_team(one_team)
+    ui.award_ammo(1)
+    ui.set_weapon_data(1, 6)
+    return ui.submit_shot(test_image_string)
+
+
+def url(shot_id, rendition="original"):
+    return f"/api/shot_image?shot_id={shot_id}&rendition={rendition}"
+
+
+def test_original_is_served_as_bytes(api_client, own_shot, test_image_string):
+    response = api_client.get(url(own_shot))
+
+    assert response.status_code == 200
+    assert (response.headers["content-type"], response.content) == split_data_url(
+        test_image_string
+    )
+    assert response.headers["cache-control"] == "private, max-age=31536000, immutable"
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["etag"].startswith('"')
+
+
+def test_matching_etag_is_not_modified(admin_api_client, own_shot, fresh_cache):
+    etag = admin_api_client.get(url(own_shot, CROSS)).headers["etag"]
+    renders = fresh_cache.stats["renders"]
+
+    for if_none_match in [etag, f'"nonsense", W/{etag}', "*"]:
+        response = admin_api_client.get(
+            url(own_shot, CROSS), headers={"If-None-Match": if_none_match}
+        )
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+    response = admin_api_client.get(
+        url(own_shot, CROSS), headers={"If-None-Match": '"something else"'}
+    )
+    assert response.status_code == 200
+    assert fresh_cache.stats["renders"] == renders
+
+
+def test_renditions_have_their_own_etags(admin_api_client, own_shot):
+    etags = {
+        admin_api_client.get(url(own_shot, rendition)).headers["etag"]
+        for rendition in ["original", CROSS, THUMBNAIL, ANNOTATED]
+    }
+    assert len(etags) == 4
+
+
+def test_ranges(api_client, own_shot, test_image_string):
+    _, photo = split_data_url(test_image_string)
+
+    response = api_client.get(url(own_shot), headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == photo[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{len(photo)}"
+
+    response = api_client.get(url(own_shot), headers={"Range": "bytes=-5"})
+    assert response.content == photo[-5:]
+
+    response = api_client.get(url(own_shot), headers={"Range": f"bytes={len(photo)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(photo)}"
+
+
+def test_range_of_another_version_gets_the_whole_image(api_client, own_shot):
+    response = api_client.get(
+        url(own_shot), headers={"Range": "bytes=10-19", "If-Range": '"old"'}
+    )
+    assert response.status_code == 200
+
+    etag = response.headers["etag"]
+    response = api_client.get(
+        url(own_shot), headers={"Range": "bytes=10-19", "If-Range": etag}
+    )
+    assert response.status_code == 206
+
+
+@pytest.mark.parametrize(
+    "header,expected",
+    [
+        (None, None),
+        ("bytes=0-0", (0, 0)),
+        ("bytes=5-", (5, 99)),
+        ("bytes=90-200", (90, 99)),
+        ("bytes=-10", (90, 99)),
+        ("bytes=-500", (0, 99)),
+        ("bytes=9-5", None),
+        ("bytes=0-1,5-6", None),
+        ("bytes=-", None),
+        ("items=0-5", None),
+    ],
+)
+def test_parse_range(header, expected):
+    assert parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=150-200", "bytes=-0"])
+def test_unsatisfiable_ranges(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, 100)
+
+
+def test_thumbnail_is_small(api_client, own_shot):
+    response = api_client.get(url(own_shot, THUMBNAIL))
+
+    assert response.headers["content-type"] == "image/jpeg"
+    assert max(Image.open(BytesIO(response.content)).size) == 320
+
+
+def test_annotation_is_revalidated(admin_api_client, own_shot):
+    first = admin_api_client.get(url(own_shot, ANNOTATED))
+    assert first.headers["cache-control"] == "private, no-cache"
+
+    AdminInterface().mark_shot_missed(own_shot)
+
+    response = admin_api_client.get(
+        url(own_shot, ANNOTATED), headers={"If-None-Match": first.headers["etag"]}
+    )
+    assert response.status_code == 200
+    assert response.content != first.content
+
+
+def test_players_only_get_their_own_shots(
+    api_client, own_shot, user_in_team, test_image_string
+):
+    ui = UserInterface(user_in_team)
+    ui.award_ammo(1)
+    someone_elses = ui.submit_shot(test_image_string)
+
+    assert api_client.get(url(someone_elses)).status_code == 404
+    assert api_client.get(url(own_shot, CROSS)).status_code == 404
+    assert api_client.get(url(own_shot, "nonsense")).status_code == 404
+
+
+def test_admin_gets_any_shot(admin_api_client, shot_from_user_in_team):
+    response = admin_api_client.get(url(shot_from_user_in_team, CROSS))
+
+    assert response.status_code == 200
+    assert response.content.startswith(b"\xff\xd8")
+
+
+def test_queue_images_are_validated_too(admin_api_client, shot_from_user_in_team):
+    queue_url = f"/api/admin_shot_image?shot_id={shot_from_user_in_team}"
+    etag = admin_api_client.get(queue_url).headers["etag"]
+
+    response = admin_api_client.get(queue_url, headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert (
+        etag == admin_api_client.get(url(shot_from_user_in_team, CROSS)).headers["etag"]
+    )
@@ -0,0 +1,151 @@
+import pytest
+from fastapi.exceptions import HTTPException
+from sqlalchemy import event
+
+from backend import database
+
+from backend.admin_interface import AdminInterface
+from backend.user_interface import UserInterface
+
+
+@pytest.fixture
+def queued_shots(user_in_team, test_image_string):
+    """Five shots, most of them fired within the same second"""
+    ui = UserInterface(user_in_team)
+    ui.award_ammo(5)
+    for _ in range(5):
+        ui.submit_shot(test_image_string)
+
+    return AdminInterface().get_unchecked_shots_ids()
+
+
+def all_pages(game_id=None, limit=2):
+    ids, cursor = [], None
+    for _ in range(10):
+        shots, cursor = AdminInterface().get_shot_queue(game_id, cursor, limit)
+        ids += [shot.id for shot in shots]
+        if cursor is None:
+            return ids
+    raise AssertionError(f"Still paging after {ids}")
+
+
+def test_pages_cover_the_queue_in_order(queued_shots, one_game):
+    assert all_pages() == queued_shots
+    assert all_pages(one_game) == queued_shots
+    assert all_pages(limit=5) == queued_shots
+
+
+def test_pages_hold_their_place_as_the_queue_changes(queued_shots):
+    page, cursor = AdminInterface().get_shot_queue(limit=2)
+    assert [shot.id for shot in page] == queued_shots[:2]
+
+    AdminInterface().mark_shot_missed(queued_shots[0])
+    AdminInterface().mark_shot_missed(queued_shots[2])
+
+    page, _ = AdminInterface().get_shot_queue(after=cursor, limit=2)
+    assert [shot.id for shot in page] == queued_shots[3:5]
+
+
+def test_queue_can_be_restricted_to_a_game(queued_shots, game_factory):
+    shots, cursor = AdminInterface().get_shot_queue(game_factory())
+
+    assert shots == []
+    assert cursor is None
+
+
+def test_queue_rows_carry_the_ai_verdict(queued_shots, user_in_team):
+    done, legacy, error, _, _ = queued_shots
+    AdminInterface().store_shot_ai_review(
+        done,
+        "done",
+        {"outcome": "hit_bystander", "confidence": 0.75, "reasoning": "x" * 5000},
+    )
+    AdminInterface().store_shot_ai_review(legacy, "done", {"is_hit": True})
+    AdminInterface().store_shot_ai_review(error, "error", "The model timed out")
+
+    shots, _ = AdminInterface().get_shot_queue(limit=3)
+
+    assert [(s.ai_review_state, s.ai_outcome, s.ai_confidence) for s in shots] == [
+        ("done", "hit_bystander", 0.75),
+        ("done", "hit_player", None),
+        ("error", None, None),
+    ]
+    assert shots[0].user_name == UserInterface(user_in_team).get_user_model().name
+
+
+def test_queue_rows_tolerate_unreadable_reviews(queued_shots):
+    AdminInterface().store_shot_ai_review(queued_shots[0], "done", "not json")
+    AdminInterface().store_shot_ai_review(queued_shots[1], "done", "[1, 2]")
+
+    shots, _ = AdminInterface().get_shot_queue(limit=2)
+
+    assert [(s.ai_outcome, s.ai_confidence) for s in shots] == [(None, None)] * 2
+
+
+def test_queue_sql_is_portable(queued_shots):
+    """No SQLite-only JSON functions or text comparisons of timestamps: the
+    engine can be Postgres (see engine_config)"""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    _, cursor = AdminInterface().get_shot_queue(limit=2)
+    event.listen(database.engine, "before_cursor_execute", capture)
+    try:
+        AdminInterface().get_shot_queue(after=cursor, limit=2)
+    finally:
+        event.remove(database.engine, "before_cursor_execute", capture)
+
+    (query,) = [s for s in statements if "FROM shots" in s]
+    assert "json_" not in query.lower()
+    assert "CAST" not in query
+
+
+def test_bad_cursor():
+    with pytest.raises(HTTPException) as e:
+        AdminInterface().get_shot_queue(after="not a cursor")
+
+    assert e.value.status_code == 400
+
+
+def test_queue_endpoint_is_light(admin_api_client, queued_shots):
+    response = admin_api_client.get("/api/admin_get_shot_queue?limit=2")
+    assert response.status_code == 200
+
+    page = response.json()
+    assert [shot["id"] for shot in page["shots"]] == [str(s) for s in queued_shots[:2]]
+    assert "image_base64" not in page["shots"][0]
+    assert len(response.content) < 2000
+
+    response = admin_api_client.get(
+        "/api/admin_get_shot_queue", params={"limit": 10, "after": page["next"]}
+    )
+    assert len(response.json()["shots"]) == 3
+    assert response.json()["next"] is None
+
+
+def test_queue_image_urls(admin_api_client, queued_shots):
+    (shot,) = admin_api_client.get("/api/admin_get_shot_queue?limit=1").json()["shots"]
+
+    response = admin_api_client.get(shot["image_url"])
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert "immutable" in response.headers["cache-control"]
+    assert response.content.startswith(b"\xff\xd8")
+
+
+def test_queue_image_of_unknown_shot(admin_api_client, queued_shots):
+    response = admin_api_client.get(
+        f"/api/admin_shot_image?shot_id={queued_shots[0]}&transform=nonsense"
+    )
+    assert response.status_code == 404
+
+    AdminInterface().get_shot_image(queued_shots[0])
+    with pytest.raises(HTTPException):
+        AdminInterface().get_shot_image(AdminInterface().get_game_ids()[0])
+
+
+def test_queue_needs_admin(api_client):
+    assert api_client.get("/api/admin_get_shot_queue").status_code == 403
@@ -188,6 +188,10 @@ def test_user_shots_endpoint_excludes_images(
     assert shot["id"] == str(shot_id)
     assert "image_base64" not in shot
 
+    response = api_client.get(shot["thumbnail_url"])
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+
 
 def test_user_shot_image_endpoint(api_client, api_user_id, one_team, test_image_string):
     UserInterface(api_user_id).join_team(one_team)
@@ -202,3 +206,69 @@ def test_user_cannot_fetch_someone_elses_shot_image(api_client, shot_from_user_i
     # The api_client session is a different user from the one who fired
     response = api_client.get(f"/api/user_shot_image?shot_id={shot_from_user_in_team}")
     assert response.status_code == 404
+
+
+# -- the binary upload endpoint ----------------------------------------------
+
+
+@pytest.fixture
+def armed_api_user(api_user_id, one_team):
+    ui = UserInterface(api_user_id)
+    ui.join_team(one_team)
+    ui.award_ammo(1)
+    ui.set_weapon_data(1, 6)
+    return api_user_id
+
+
+def test_photo_upload_submits_a_shot(
+    api_client, armed_api_user, one_team, test_image_string
+):
+    from backend.blob_store import split_data_url
+
+    image_type, photo = split_data_url(test_image_string)
+
+    response = api_client.post(
+        "/api/submit_shot_photo", content=photo, headers={"Content-Type": image_type}
+    )
+    assert response.is_success
+
+    response = api_client.get(f"/api/user_shot_image?shot_id={response.json()}")
+    assert response.json()["image_base64"] == test_image_string
+
+    num_shots, _ = AdminInterface().get_unchecked_shots()
+    assert num_shots == 1
+    assert UserInterface(armed_api_user).get_user_model().num_bullets == 0
+
+
+def test_photo_upload_must_be_an_image(api_client, armed_api_user):
+    response = api_client.post(
+        "/api/submit_shot_photo",
+        content=b"{}",
+        headers={"Content-Type": "application/json"},
+    )
+    assert response.status_code == 415
+
+
+def test_photo_upload_size_is_limited(api_client, armed_api_user, monkeypatch):
+    from backend import main
+
+    monkeypatch.setattr(main, "MAX_SHOT_PHOTO_BYTES", 1000)
+
+    response = api_client.post(
+        "/api/submit_shot_photo",
+        content=b"x" * 1001,
+        headers={"Content-Type": "image/jpeg"},
+    )
+    assert response.status_code == 413
+    assert AdminInterface().get_unchecked_shots()[0] == 0
+
+
+def test_refused_photo_upload_uses_no_ammo(api_client, api_user_id, one_team):
+    UserInterface(api_user_id).join_team(one_team)
+
+    response = api_client.post(
+        "/api/submit_shot_photo",
+        content=b"\xff\xd8photo",
+        headers={"Content-Type": "image/jpeg"},
+    )
+    assert response.status_code == 403
@@ -0,0 +1,119 @@
+import random
+
+import pytest
+
+from backend.admin_interface import AdminInterface
+from backend.shot_identification import haversine_m
+from backend.spatial import GridIndex
+from backend.spatial import LocalProjection
+from backend.spatial import points_within
+from backend.spatial import venue_projection
+from backend.user_interface import UserInterface
+
+# Kingston, and somewhere else entirely
+ORIGINS = [(51.41, -0.305), (8.1166, 98.625)]
+
+
+def scatter(origin, num_points, spread_deg=0.01, seed=0):
+    rng = random.Random(seed)
+    lat, lon = origin
+    return {
+        n: (
+            lat + rng.uniform(-spread_deg, spread_deg),
+            lon + rng.uniform(-spread_deg, spread_deg),
+        )
+        for n in range(num_points)
+    }
+
+
+@pytest.mark.parametrize("origin", ORIGINS)
+def test_projected_distances_match_haversine(origin):
+    projection = LocalProjection(*origin)
+
+    for lat, lon in scatter(origin, 100).values():
+        expected = haversine_m(*origin, lat, lon)
+        assert projection.distance_m(*origin, lat, lon) == pytest.approx(
+            expected, rel=1e-3, abs=0.01
+        )
+
+
+def test_batch_distances_match_single_ones():
+    origin = ORIGINS[0]
+    projection = LocalProjection(*origin)
+    points = list(scatter(origin, 20).values())
+
+    assert projection.distances_m(*origin, points) == [
+        pytest.approx(projection.distance_m(*origin, *point)) for point in points
+    ]
+
+
+@pytest.mark.parametrize("origin", ORIGINS)
+@pytest.mark.parametrize("radius_m", [5, 60, 300, 5000])
+def test_within_finds_the_same_points_as_a_scan(origin, radius_m):
+    points = scatter(origin, 500)
+    index = GridIndex.from_points(points, projection=venue_projection())
+
+    query = points[0]
+    found = index.within(*query, radius_m)
+
+    expected = {
+        key for key, point in points.items() if haversine_m(*query, *point) <= radius_m
+    }
+    # Allow for the projection at the very edge of the circle
+    assert {key for key, _ in found} ^ expected <= {
+        key
+        for key, point in points.items()
+        if abs(haversine_m(*query, *point) - radius_m) < 1e-3 * radius_m
+    }
+
+    distances = [distance for _, distance in found]
+    assert distances == sorted(distances)
+    assert found[0] == (0, 0.0)
+
+
+@pytest.mark.parametrize("radius_m", [5, 60, 300, 5000])
+def test_a_scan_finds_what_the_index_does(radius_m):
+    points = scatter(ORIGINS[0], 500)
+    index = GridIndex.from_points(points, projection=venue_projection())
+
+    query = points[0]
+
+    assert points_within(points.items(), *query, radius_m) == index.within(
+        *query, radius_m
+    )
+
+
+def test_points_can_be_moved_and_removed():
+    index = GridIndex()
+    lat, lon = ORIGINS[0]
+
+    index.set("a", lat, lon)
+    index.set("a", lat + 0.01, lon)  # about 1.1 km north
+
+    assert index.within(lat, lon, 100) == []
+    assert [key for key, _ in index.within(lat + 0.01, lon, 100)] == ["a"]
+
+    index.remove("a")
+    index.remove("a")
+    assert len(index) == 0
+    assert index.within(lat + 0.01, lon, 100) == []
+
+
+def test_players_near_a_point(user_factory, one_team, one_game):
+    lat, lon = ORIGINS[0]
+    offsets = {"near": 0.0001, "nearer": 0.00001, "far": 0.01}
+
+    user_ids = {}
+    for name, offset in offsets.items():
+        user_id = user_factory()
+        AdminInterface().add_user_to_team(user_id, one_team)
+        UserInterface(user_id).set_location(lat + offset, lon)
+        user_ids[user_id] = name
+
+    # Never reported a position
+    AdminInterface().add_user_to_team(user_factory(), one_team)
+
+    near = AdminInterface().get_players_near(one_game, lat, lon, radius_m=50)
+
+    assert [user_ids[player["user_id"]] for player in near] == ["nearer", "near"]
+    assert near[1]["distance"] == pytest.approx(11.1, rel=0.01)
@@ -0,0 +1,473 @@
+"""Tests for the shared SSE fan-out hub.
+
+The point of the hub is that the number of watcher tasks depends on what is
+being watched, not on how many clients are watching it.
+"""
+
+import asyncio
+import json
+import threading
+
+import pytest
+
+from backend import asyncio_triggers
+from backend import sse_hub
+from backend.admin_interface import AdminInterface
+from backend.user_interface import UserInterface
+
+
+@pytest.fixture(autouse=True)
+def clean_hubs():
+    yield
+    for hub in list(sse_hub._hubs.values()):
+        hub.close()
+    sse_hub._hubs.clear()
+    asyncio_triggers._update_events.clear()
+
+
+def connect(user_id, coalesce_window=0):
+    ui = UserInterface(user_id)
+    return sse_hub.connect(
+        user_id,
+        game_id=ui.get_game_id(),
+        team_id=ui.get_team_id(),
+        coalesce_window=coalesce_window,
+    )
+
+
+async def next_frame(connection):
+    return await asyncio.wait_for(anext(connection.frames()), timeout=5)
+
+
+def prompt_target(frame):
+    """What an update prompt frame asks the client to refresh"""
+    data = frame.split("data: ", 1)[1]
+    return json.loads(data)["data"]
+
+
+def mask_targets(frame):
+    """What an update mask frame asks the client to refresh"""
+    message = json.loads(frame.split("data: ", 1)[1])
+    assert message["handler"] == "update_mask"
+    return sorted(t for t, bit in sse_hub.PROMPT_BITS.items() if message["data"] & bit)
+
+
+async def let_watchers_subscribe():
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_one_watcher_per_subscription(team_factory, user_factory):
+    team_id = team_factory()
+    user_ids = [user_factory() for _ in range(5)]
+    for user_id in user_ids:
+        UserInterface(user_id).join_team(team_id)
+
+    connections = [connect(user_id) for user_id in user_ids]
+    # A second tab for the first user shares their user watcher
+    connections.append(connect(user_ids[0]))
+
+    hub = sse_hub.get_hub(connections[0].game_id)
+    assert len(hub.connections) == 6
+    # One per user, plus the game's ticker and circle
+    assert hub.num_watchers == 5 + 2
+
+
+@pytest.mark.asyncio
+async def test_game_event_reaches_every_connection(team_factory, user_factory):
+    team_id = team_factory()
+    user_ids = [user_factory() for _ in range(3)]
+    for user_id in user_ids:
+        UserInterface(user_id).join_team(team_id)
+
+    connections = [connect(user_id) for user_id in user_ids]
+    await let_watchers_subscribe()
+
+    asyncio_triggers.trigger_update_event("ticker", connections[0].game_id)
+
+    for connection in connections:
+        assert prompt_target(await next_frame(connection)) == "ticker"
+
+
+@pytest.mark.asyncio
+async def test_user_event_only_reaches_that_user(team_factory, user_factory):
+    team_id = team_factory()
+    user_a, user_b = user_factory(), user_factory()
+    UserInterface(user_a).join_team(team_id)
+    UserInterface(user_b).join_team(team_id)
+
+    connection_a = connect(user_a)
+    connection_b = connect(user_b)
+    await let_watchers_subscribe()
+
+    asyncio_triggers.trigger_update_event("user", user_a)
+
+    assert prompt_target(await next_frame(connection_a)) == "user"
+    await asyncio.sleep(0.01)
+    assert not connection_b._frames
+
+
+@pytest.mark.asyncio
+async def test_newer_prompt_replaces_a_waiting_one(user_in_team):
+    connection = connect(user_in_team)
+
+    connection.push("first user prompt", kind="user")
+    connection.push("ticker prompt", kind="ticker")
+    connection.push("second user prompt", kind="user")
+
+    assert [frame for _, frame, _ in connection._frames] == [
+        "ticker prompt",
+        "second user prompt",
+    ]
+    assert connection.num_suppressed == 1
+
+
+@pytest.mark.asyncio
+async def test_changing_team_closes_the_stream(user_in_team, team_factory):
+    connection = connect(user_in_team)
+    await let_watchers_subscribe()
+
+    # join_team commits and fires a user event
+    UserInterface(user_in_team).join_team(team_factory())
+
+    frames = await asyncio.wait_for(_collect(connection), timeout=5)
+
+    assert [prompt_target(frame) for frame in frames] == ["user"]
+    # The old stream's id can't be resumed in the new game
+    assert frames[0].startswith("id: \n")
+    assert connection.closed
+
+
+@pytest.mark.asyncio
+async def test_team_is_looked_up_off_the_event_loop(
+    user_in_team, team_factory, monkeypatch
+):
+    get_team_id = UserInterface.get_team_id
+    looked_up_on = []
+
+    def record_thread(self):
+        looked_up_on.append(threading.get_ident())
+        return get_team_id(self)
+
+    connection = connect(user_in_team)
+    await let_watchers_subscribe()
+    monkeypatch.setattr(UserInterface, "get_team_id", record_thread)
+
+    UserInterface(user_in_team).join_team(team_factory())
+    await asyncio.wait_for(_collect(connection), timeout=5)
+
+    assert looked_up_on and threading.get_ident() not in looked_up_on
+
+
+async def _collect(connection):
+    return [frame async for frame in connection.frames()]
+
+
+@pytest.mark.asyncio
+async def test_last_disconnect_drops_the_watchers(user_in_team):
+    connection = connect(user_in_team)
+    hub = sse_hub.get_hub(connection.game_id)
+    watchers = list(hub._watchers.values())
+
+    sse_hub.disconnect(connection)
+    await let_watchers_subscribe()
+
+    assert all(watcher.cancelled() for watcher in watchers)
+    assert connection.game_id not in sse_hub._hubs
+
+
+@pytest.mark.asyncio
+async def test_keepalive_is_shared(user_factory):
+    connections = [connect(user_factory()) for _ in range(3)]
+
+    # Stop the real ticker and drive a fast one instead
+    sse_hub._keepalive_task.cancel()
+    ticker = asyncio.create_task(sse_hub._keepalive_timer(timeout=0.01))
+
+    try:
+        for connection in connections:
+            assert '"keepalive"' in await next_frame(connection)
+    finally:
+        ticker.cancel()
+
+
+def event_id(frame):
+    assert frame.startswith("id: ")
+    return frame.split("\n", 1)[0][len("id: ") :]
+
+
+@pytest.mark.asyncio
+async def test_live_prompts_carry_an_event_id(user_in_team):
+    connection = connect(user_in_team)
+    await let_watchers_subscribe()
+
+    asyncio_triggers.trigger_update_event("ticker", connection.game_id)
+
+    frame = await next_frame(connection)
+    assert asyncio_triggers.parse_event_id(event_id(frame)) == (
+        asyncio_triggers.latest_sequence()
+    )
+
+
+@pytest.mark.asyncio
+async def test_fresh_client_is_prompted_for_everything(user_in_team):
+    connection = connect(user_in_team)
+
+    frames = await sse_hub.catch_up_frames(connection, last_event_id=None)
+
+    assert sorted(prompt_target(f) for f in frames) == ["circle", "ticker", "user"]
+
+
+@pytest.mark.asyncio
+async def test_resuming_client_only_gets_what_it_missed(user_in_team):
+    connection = connect(user_in_team)
+    last_seen = asyncio_triggers.format_event_id(asyncio_triggers.latest_sequence())
+    sse_hub.disconnect(connection)
+
+    # While the client is away, only the ticker moves
+    asyncio_triggers.trigger_update_event("ticker", connection.game_id)
+
+    connection = connect(user_in_team)
+    frames = await sse_hub.catch_up_frames(connection, last_event_id=last_seen)
+
+    assert [prompt_target(f) for f in frames] == ["ticker"]
+
+    # And the client's new cursor covers it
+    connection = connect(user_in_team)
+    frames_again = await sse_hub.catch_up_frames(connection, event_id(frames[0]))
+    assert frames_again == []
+
+
+@pytest.mark.asyncio
+async def test_ids_from_another_run_get_a_full_refresh(user_in_team):
+    connection = connect(user_in_team)
+
+    frames = await sse_hub.catch_up_frames(connection, last_event_id="0ldep0ch-12")
+
+    assert len(frames) == 3
+
+
+@pytest.mark.asyncio
+async def test_trigger_while_the_watcher_is_busy_is_not_lost(user_in_team):
+    connection = connect(user_in_team)
+    await let_watchers_subscribe()
+
+    # Fire a second trigger while the watcher is still handling the first,
+    # before it has gone back to waiting on the one-shot event
+    push = connection.push
+    second_trigger = []
+
+    def push_then_trigger(frame, kind=None, sequence=None):
+        push(frame, kind, sequence)
+        if not second_trigger:
+            asyncio_triggers.trigger_update_event("ticker", connection.game_id)
+            second_trigger.append(asyncio_triggers.latest_sequence())
+
+    connection.push = push_then_trigger
+
+    asyncio_triggers.trigger_update_event("ticker", connection.game_id)
+    await asyncio.sleep(0.01)
+
+    # The second prompt replaced the first in the buffer
+    frame = await next_frame(connection)
+    assert asyncio_triggers.parse_event_id(event_id(frame)) == second_trigger[0]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("coalesce_window", [0, 0.01])
+async def test_resume_id_does_not_pass_a_waiting_prompt(user_in_team, coalesce_window):
+    connection = connect(user_in_team, coalesce_window=coalesce_window)
+
+    # Data for the newer event is ready before the prompt for the older one
+    connection.push("data: ticker\n\n", sequence=11)
+    connection.push("data: user\n\n", kind="user", sequence=10)
+
+    frames = connection._drain()
+
+    # Cut off after the first frame, the client must still hear about 10
+    ids = [asyncio_triggers.parse_event_id(event_id(frame)) for frame in frames]
+    assert ids == [9, 11]
+
+
+def test_sse_endpoint_resumes_from_query_parameter(api_client, monkeypatch):
+    from backend import sse_event_streams
+
+    seen = {}
+
+    async def fake_generator(user_id, last_event_id=None, coalesce_ms=None, **kwargs):
+        seen["last_event_id"] = last_event_id
+        seen["coalesce_ms"] = coalesce_ms
+        yield "data: {}\n\n"
+
+    monkeypatch.setattr(sse_event_streams, "updates_generator", fake_generator)
+
+    api_client.get("/api/sse_updates?last_event_id=abc-1")
+    assert seen["last_event_id"] == "abc-1"
+
+    api_client.get("/api/sse_updates", headers={"Last-Event-ID": "abc-2"})
+    assert seen["last_event_id"] == "abc-2"
+
+    api_client.get("/api/sse_updates?coalesce_ms=0")
+    assert seen["coalesce_ms"] == 0
+
+
+@pytest.mark.asyncio
+async def test_burst_of_prompts_is_sent_as_one_mask(user_in_team):
+    connection = connect(user_in_team, coalesce_window=0.05)
+    await let_watchers_subscribe()
+    suppressed_before = sse_hub.get_stats()["suppressed"]
+
+    # Each one reaches the connection before the next is fired
+    for event_type, key in [
+        ("user", user_in_team),
+        ("ticker", connection.game_id),
+        ("ticker", connection.game_id),
+    ]:
+        asyncio_triggers.trigger_update_event(event_type, key)
+        await asyncio.sleep(0.001)
+
+    frame = await next_frame(connection)
+
+    assert mask_targets(frame) == ["ticker", "user"]
+    # Numbered with the newest event, so a resume covers all of them
+    assert asyncio_triggers.parse_event_id(event_id(frame)) == (
+        asyncio_triggers.latest_sequence()
+    )
+    assert not connection._frames
+    # Two of the three prompts didn't need a frame of their own
+    assert connection.num_prompts == 3
+    assert connection.num_suppressed == 2
+    assert sse_hub.get_stats()["suppressed"] == suppressed_before + 2
+
+
+@pytest.mark.asyncio
+async def test_prompts_after_the_window_get_their_own_frame(user_in_team):
+    connection = connect(user_in_team, coalesce_window=0.01)
+    await let_watchers_subscribe()
+    frames = connection.frames()
+
+    asyncio_triggers.trigger_update_event("ticker", connection.game_id)
+    assert mask_targets(await asyncio.wait_for(anext(frames), 5)) == ["ticker"]
+
+    asyncio_triggers.trigger_update_event("circle", connection.game_id)
+    assert mask_targets(await asyncio.wait_for(anext(frames), 5)) == ["circle"]
+
+
+@pytest.mark.asyncio
+async def test_coalescing_client_catches_up_in_one_frame(user_in_team):
+    connection = connect(user_in_team, coalesce_window=0.05)
+
+    frames = await sse_hub.catch_up_frames(connection, last_event_id=None)
+
+    assert len(frames) == 1
+    assert mask_targets(frames[0]) == ["circle", "ticker", "user"]
+
+
+def test_coalescing_window_from_environment(monkeypatch):
+    monkeypatch.setenv("SSE_COALESCE_MS", "250")
+    assert sse_hub.default_coalesce_window() == 0.25
+
+    monkeypatch.setenv("SSE_COALESCE_MS", "0")
+    assert sse_hub.default_coalesce_window() == 0
+
+    monkeypatch.setenv("SSE_COALESCE_MS", "soon")
+    assert sse_hub.default_coalesce_window() == sse_hub.DEFAULT_COALESCE_MS / 1000
+
+
+def admin_prompt(frame):
+    """The (panel, game id) an admin prompt frame asks to refresh"""
+    message = json.loads(frame.split("data: ", 1)[1])
+    return message["data"], message.get("game_id")
+
+
+async def drain(frames, timeout=0.05):
+    """Every frame that arrives before things go quiet"""
+    out = []
+    try:
+        while True:
+            out.append(await asyncio.wait_for(anext(frames), timeout))
+    except asyncio.TimeoutError:
+        return out
+
+
+@pytest.mark.asyncio
+async def test_admin_hub_watches_every_game_once(game_factory):
+    game_factory(), game_factory()
+    num_games = len(AdminInterface().get_game_ids())
+
+    connections = [await sse_hub.connect_admin() for _ in range(2)]
+
+    hub = sse_hub._hubs[sse_hub.ADMIN_HUB_KEY]
+    assert len(hub.connections) == 2
+    # "games", plus ticker, circle and shots in each game
+    assert hub.num_watchers == 1 + 3 * num_games
+
+    for connection in connections:
+        sse_hub.disconnect(connection)
+    assert sse_hub.ADMIN_HUB_KEY not in sse_hub._hubs
+
+
+@pytest.mark.asyncio
+async def test_admin_is_told_which_game_and_panel_changed(one_game):
+    connection = await sse_hub.connect_admin()
+    await let_watchers_subscribe()
+
+    asyncio_triggers.trigger_update_event("ticker", one_game)
+    ticker_frames = await drain(connection.frames())
+
+    asyncio_triggers.trigger_update_event("shots", one_game)
+    shot_frames = await drain(connection.frames())
+
+    # A ticker change leaves the shot queue alone
+    assert [admin_prompt(f) for f in ticker_frames] == [("admin", str(one_game))]
+    assert sorted(admin_prompt(f) for f in shot_frames) == [
+        ("admin", str(one_game)),
+        ("shots", str(one_game)),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_admin_hub_picks_up_new_games(one_game):
+    connection = await sse_hub.connect_admin()
+    hub = sse_hub._hubs[sse_hub.ADMIN_HUB_KEY]
+    watchers_before = hub.num_watchers
+    await let_watchers_subscribe()
+
+    game_id = AdminInterface().create_game()
+
+    frames = await drain(connection.frames())
+    assert [admin_prompt(f) for f in frames] == [("admin", str(game_id))]
+    assert hub.num_watchers == watchers_before + 3
+
+    # And the new game's events now reach the admin
+    asyncio_triggers.trigger_update_event("circle", game_id)
+    frames = await drain(connection.frames())
+    assert [admin_prompt(f) for f in frames] == [("circle", str(game_id))]
+
+
+@pytest.mark.asyncio
+async def test_admin_hub_lists_games_off_the_event_loop(one_game, monkeypatch):
+    get_game_ids = AdminInterface.get_game_ids
+    listed_on = []
+
+    def record_thread(self):
+        listed_on.append(threading.get_ident())
+        return get_game_ids(self)
+
+    monkeypatch.setattr(AdminInterface, "get_game_ids", record_thread)
+
+    connection = await sse_hub.connect_admin()
+    await let_watchers_subscribe()
+    AdminInterface().create_game()
+    await drain(connection.frames())
+
+    assert len(listed_on) == 2
+    assert threading.get_ident() not in listed_on
+
+
+def test_admin_catch_up_refreshes_every_panel():
+    assert sorted(admin_prompt(f) for f in sse_hub.admin_catch_up_frames()) == [
+        ("admin", None),
+        ("circle", None),
+        ("shots", None),
+    ]
@@ -0,0 +1,286 @@
+"""Tests for SSE streams in payload mode, which carry the changed data itself"""
+
+import asyncio
+import json
+import threading
+
+import pytest
+
+from backend import asyncio_triggers
+from backend import sse_hub
+from backend import sse_payloads
+from backend.admin_interface import AdminInterface
+from backend.admin_interface import CircleTypes
+from backend.ticker import Ticker
+from backend.user_interface import UserInterface
+
+
+@pytest.fixture(autouse=True)
+def clean_hubs():
+    yield
+    for hub in list(sse_hub._hubs.values()):
+        hub.close()
+    sse_hub._hubs.clear()
+    asyncio_triggers._update_events.clear()
+
+
+def connect(user_id, payloads=True):
+    ui = UserInterface(user_id)
+    return sse_hub.connect(
+        user_id,
+        game_id=ui.get_game_id(),
+        team_id=ui.get_team_id(),
+        payloads=payloads,
+    )
+
+
+async def next_message(frames):
+    frame = await asyncio.wait_for(anext(frames), timeout=5)
+    return json.loads(frame.split("data: ", 1)[1])
+
+
+async def next_data(frames, handler):
+    """The data of the next message from ``handler``, skipping any others"""
+    while True:
+        message = await next_message(frames)
+        if message["handler"] == handler:
+            return message["data"]
+
+
+async def let_watchers_subscribe():
+    await asyncio.sleep(0)
+
+
+@pytest.fixture
+def two_players(team_factory, user_factory):
+    team_id = team_factory()
+    user_ids = [user_factory(), user_factory()]
+    for user_id in user_ids:
+        UserInterface(user_id).join_team(team_id)
+    return user_ids
+
+
+@pytest.mark.asyncio
+async def test_user_event_sends_the_user_model(user_in_team):
+    connection = connect(user_in_team)
+    await let_watchers_subscribe()
+
+    UserInterface(user_in_team).set_name("Payload")
+
+    message = await next_message(connection.frames())
+    assert message["handler"] == "user_data"
+    assert message["data"]["id"] == str(user_in_team)
+    assert message["data"]["name"] == "Payload"
+
+
+@pytest.mark.asyncio
+async def test_circle_event_sends_the_circles(user_in_team):
+    connection = connect(user_in_team)
+    await let_watchers_subscribe()
+
+    AdminInterface().set_circles(
+        connection.game_id, CircleTypes.NEXT, lat=51.5, long=-0.1, radius=100
+    )
+
+    circles = await next_data(connection.frames(), "circle_data")
+    assert circles["next_circle_lat"] == 51.5
+    assert circles["next_circle_radius"] == 100
+
+
+@pytest.mark.asyncio
+async def test_ticker_sends_only_what_each_player_can_see(two_players):
+    player_a, player_b = two_players
+    connection_a, connection_b = connect(player_a), connect(player_b)
+    game_id = connection_a.game_id
+    await let_watchers_subscribe()
+
+    Ticker(game_id, user_id=None).post_message("public")
+    Ticker(game_id, user_id=None).post_message("secret", private_for_user_id=player_a)
+
+    entries_b = await next_data(connection_b.frames(), "ticker_data")
+    assert [(e["class"], e["message"]) for e in entries_b] == [("public", "public")]
+
+    frames_a = connection_a.frames()
+    entries_a = await next_data(frames_a, "ticker_data")
+    while len(entries_a) < 2:
+        entries_a += await next_data(frames_a, "ticker_data")
+    assert [(e["class"], e["message"]) for e in entries_a] == [
+        ("public", "public"),
+        ("user", "secret"),
+    ]
+
+    # And player b's stream was never sent the private message
+    await asyncio.sleep(0.01)
+    assert not connection_b._frames
+
+
+def test_players_sent_the_same_entries_share_a_frame(two_players, one_game):
+    Ticker(one_game, user_id=None).post_message("one")
+    Ticker(one_game, user_id=None).post_message("two", highlight_user_id=None)
+    entries = sse_payloads.load_ticker_entries(one_game, after_id=None)
+    connections = [sse_hub.SSEConnection(u, one_game, None) for u in two_players]
+
+    frames = sse_payloads.make_ticker_frames(entries, connections)
+
+    assert frames[connections[0]] is frames[connections[1]]
+    assert all(c.ticker_cursor == entries[-1].id for c in connections)
+
+    # Nothing new, nothing sent
+    assert sse_payloads.make_ticker_frames(entries, connections) == {}
+
+
+def test_highlighted_player_gets_their_own_frame(two_players, one_game):
+    player_a, player_b = two_players
+    Ticker(one_game, user_id=None).post_message("a hit", highlight_user_id=player_a)
+    entries = sse_payloads.load_ticker_entries(one_game, after_id=None)
+    connections = [sse_hub.SSEConnection(u, one_game, None) for u in two_players]
+
+    frames = sse_payloads.make_ticker_frames(entries, connections)
+
+    data_a = json.loads(frames[connections[0]].split("data: ", 1)[1])["data"]
+    data_b = json.loads(frames[connections[1]].split("data: ", 1)[1])["data"]
+    assert data_a[0]["class"] == "highlight"
+    assert data_b[0]["class"] == "public"
+
+
+def test_others_private_entries_dont_crowd_out_a_players_own(two_players, one_game):
+    player_a, player_b = two_players
+    Ticker(one_game, user_id=None).post_message("public")
+    for i in range(sse_payloads.TICKER_PAYLOAD_LIMIT + 5):
+        Ticker(one_game, user_id=None).post_message(
+            f"secret {i}", private_for_user_id=player_a
+        )
+    connections = [sse_hub.SSEConnection(u, one_game, None) for u in two_players]
+
+    entries = sse_payloads.load_ticker_entries_for(
+        one_game, [(c.user_id, c.ticker_cursor) for c in connections]
+    )
+    frames = sse_payloads.make_ticker_frames(entries, connections)
+
+    data_a = json.loads(frames[connections[0]].split("data: ", 1)[1])["data"]
+    data_b = json.loads(frames[connections[1]].split("data: ", 1)[1])["data"]
+    assert len(data_a) == sse_payloads.TICKER_PAYLOAD_LIMIT
+    assert data_a[-1]["message"] == "secret 24"
+    assert [entry["message"] for entry in data_b] == ["public"]
+
+
+@pytest.mark.asyncio
+async def test_payloads_are_loaded_off_the_event_loop(user_in_team, monkeypatch):
+    load_user_frame = sse_payloads.load_user_frame
+    loaded_on = []
+
+    def record_thread(user_id):
+        loaded_on.append(threading.get_ident())
+        return load_user_frame(user_id)
+
+    monkeypatch.setattr(sse_payloads, "load_user_frame", record_thread)
+    connection = connect(user_in_team)
+    await let_watchers_subscribe()
+
+    asyncio_triggers.trigger_update_event("user", user_in_team)
+
+    assert (await next_message(connection.frames()))["handler"] == "user_data"
+    assert loaded_on and threading.get_ident() not in loaded_on
+
+
+@pytest.mark.asyncio
+async def test_catch_up_payloads_are_loaded_off_the_event_loop(
+    user_in_team, monkeypatch
+):
+    load_user_data = sse_payloads.load_user_data
+    loaded_on = []
+
+    def record_thread(user_id):
+        loaded_on.append(threading.get_ident())
+        return load_user_data(user_id)
+
+    monkeypatch.setattr(sse_payloads, "load_user_data", record_thread)
+    connection = connect(user_in_team)
+
+    await sse_hub.catch_up_frames(connection, last_event_id=None)
+
+    assert loaded_on and threading.get_ident() not in loaded_on
+
+
+@pytest.mark.asyncio
+async def test_a_failed_payload_doesnt_stop_later_ones(user_in_team, monkeypatch):
+    load_user_frame = sse_payloads.load_user_frame
+    calls = []
+
+    def fail_once(user_id):
+        calls.append(user_id)
+        if len(calls) == 1:
+            raise RuntimeError("Database is locked")
+        return load_user_frame(user_id)
+
+    monkeypatch.setattr(sse_payloads, "load_user_frame", fail_once)
+    connection = connect(user_in_team)
+    await let_watchers_subscribe()
+
+    asyncio_triggers.trigger_update_event("user", user_in_team)
+    while not calls:
+        await asyncio.sleep(0.01)
+    asyncio_triggers.trigger_update_event("user", user_in_team)
+
+    assert (await next_message(connection.frames()))["handler"] == "user_data"
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_no_id_is_sent_past_a_payload_being_loaded(user_in_team):
+    connection = connect(user_in_team)
+
+    connection.hold(10)
+    connection.push("data: ticker\n\n", sequence=11)
+    (frame,) = connection._drain()
+    assert frame.startswith(f"id: {asyncio_triggers.format_event_id(9)}\n")
+
+    connection.push("data: user\n\n", kind="user", sequence=10)
+    connection.release(10)
+    (frame,) = connection._drain()
+    assert frame.startswith(f"id: {asyncio_triggers.format_event_id(11)}\n")
+
+
+@pytest.mark.asyncio
+async def test_fresh_payload_client_is_sent_everything(user_in_team):
+    connection = connect(user_in_team)
+
+    frames = await sse_hub.catch_up_frames(connection, last_event_id=None)
+
+    handlers = sorted(
+        json.loads(frame.split("data: ", 1)[1])["handler"] for frame in frames
+    )
+    assert handlers == ["circle_data", "ticker_data", "user_data"]
+
+
+@pytest.mark.asyncio
+async def test_catch_up_only_sends_ticker_entries_after_ticker_since(user_in_team):
+    game_id = UserInterface(user_in_team).get_game_id()
+    Ticker(game_id, user_id=None).post_message("old news")
+    seen_id = sse_payloads.load_ticker_entries(game_id, after_id=None)[-1].id
+    Ticker(game_id, user_id=None).post_message("new news")
+
+    connection = connect(user_in_team)
+    frames = await sse_hub.catch_up_frames(connection, None, ticker_since=seen_id)
+
+    ticker = [
+        json.loads(frame.split("data: ", 1)[1])
+        for frame in frames
+        if '"ticker_data"' in frame
+    ][0]
+    assert [entry["message"] for entry in ticker["data"]] == ["new news"]
+    assert connection.ticker_cursor == ticker["data"][0]["id"]
+
+
+@pytest.mark.asyncio
+async def test_prompt_and_payload_clients_share_a_hub(two_players):
+    player_a, player_b = two_players
+    prompted = connect(player_a, payloads=False)
+    with_data = connect(player_b)
+    await let_watchers_subscribe()
+
+    asyncio_triggers.trigger_update_event("circle", prompted.game_id)
+
+    assert (await next_message(prompted.frames()))["handler"] == "update_prompt"
+    assert (await next_message(with_data.frames()))["handler"] == "circle_data"
+    assert sse_hub.get_hub(prompted.game_id).num_watchers == 2 + 2
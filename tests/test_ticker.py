@@ -1,10 +1,13 @@
 import time
 
 import pytest
+from sqlalchemy import event
 
+from backend import ticker as ticker_module
 from backend.admin_interface import AdminInterface
 from backend.model import Shot
 from backend.ticker import Ticker
+from backend.ticker import TickerTail
 from backend.user_interface import UserInterface
 
 
@@ -51,6 +54,28 @@ def test_ticker_filters_correctly_order(ticker):
     ]
 
 
+def test_ticker_entries_since(ticker):
+    for i in range(5):
+        ticker.post_message(str(i))
+
+    entries = ticker.get_entries_since(None, 3)
+    assert [entry.message for entry in entries] == ["2", "3", "4"]
+
+    newer = ticker.get_entries_since(entries[0].id, 10)
+    assert [entry.message for entry in newer] == ["3", "4"]
+
+
+def test_ticker_entries_since_for_everyone(ticker, user_factory):
+    ticker.post_message("mine", private_for_user_id=ticker.user_id)
+    ticker.post_message("theirs", private_for_user_id=user_factory())
+
+    assert [e.message for e in ticker.get_entries_since(None, 10)] == ["mine"]
+    assert [e.message for e in ticker.get_entries_since(None, 10, everyone=True)] == [
+        "mine",
+        "theirs",
+    ]
+
+
 def test_api_query_ticker_outside_team(api_client):
     response = api_client.get("/api/ticker_messages")
     assert response.is_success
@@ -107,6 +132,46 @@ def test_api_query_ticker_messages(api_client, ticker_for_user_in_game):
     assert len(messages) == 2
 
 
+def test_api_query_ticker_messages_since(
+    api_client, api_user_id, ticker_for_user_in_game, user_factory
+):
+    (joined,) = api_client.get("/api/ticker_messages?since_id=0").json()
+
+    ticker_for_user_in_game.post_message("hello")
+    ticker_for_user_in_game.post_message("not for you", user_factory())
+    ticker_for_user_in_game.post_message("for you", api_user_id, api_user_id)
+
+    response = api_client.get(f"/api/ticker_messages?since_id={joined['id']}")
+    assert response.is_success
+    messages = response.json()
+
+    assert [(m["class"], m["message"]) for m in messages] == [
+        ("public", "hello"),
+        ("highlight", "for you"),
+    ]
+    assert messages[0]["id"] > joined["id"]
+
+    latest = messages[-1]["id"]
+    assert api_client.get(f"/api/ticker_messages?since_id={latest}").json() == []
+
+
+def test_api_query_ticker_messages_by_number(api_client, ticker_for_user_in_game):
+    for i in range(4):
+        ticker_for_user_in_game.post_message(f"message {i}")
+
+    response = api_client.get("/api/ticker_messages?num_messages=3")
+    assert response.is_success
+    assert [m[1] for m in response.json()] == [
+        "message 3",
+        "message 2",
+        "message 1",
+    ]
+
+    response = api_client.get("/api/ticker_messages?num_messages=2&since_id=0")
+    assert response.is_success
+    assert [m["message"] for m in response.json()] == ["message 2", "message 3"]
+
+
 def test_ticker_announces_kill(
     db_session,
     api_client,
@@ -216,3 +281,96 @@ def test_get_messages_excludes_others_private_messages(ticker, user_factory):
     ticker.post_message("Public message")
     ticker.post_message("Private message", private_for_user_id=user_id)
     assert ticker.get_messages(2) == [("public", "Public message")]
+
+
+def count_queries(engine, func):
+    queries = []
+
+    def count(*args):
+        queries.append(args[2])
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        func()
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+    return len(queries)
+
+
+@pytest.fixture
+def short_tail(monkeypatch):
+    """Keep three entries per feed, for games from here on"""
+    monkeypatch.setattr(ticker_module._tail, "length", 3)
+
+
+def test_ticker_reads_are_served_from_memory(ticker, engine):
+    ticker.post_message("hello")
+    ticker.get_messages(3)
+
+    assert count_queries(engine, lambda: ticker.get_messages(3)) == 0
+    assert count_queries(engine, lambda: ticker.get_entries_since(None, 3)) == 0
+
+    ticker.post_message("world")
+
+    assert ticker.get_messages(3) == [("public", "world"), ("public", "hello")]
+
+
+def test_tail_keeps_each_feed(ticker, user_factory, short_tail):
+    someone = user_factory()
+    someone_else = user_factory()
+
+    for i in range(5):
+        ticker.post_message(f"public {i}")
+        ticker.post_message(f"mine {i}", private_for_user_id=someone)
+        ticker.post_message(f"theirs {i}", private_for_user_id=someone_else)
+
+    ticker.user_id = someone
+    assert ticker.get_messages(3) == [
+        ("user", "mine 4"),
+        ("public", "public 4"),
+        ("user", "mine 3"),
+    ]
+    assert [entry.message for entry in ticker.get_entries_since(None, 3, True)] == [
+        "public 4",
+        "mine 4",
+        "theirs 4",
+    ]
+
+
+def test_tail_matches_the_database(ticker, user_factory, short_tail):
+    someone = user_factory()
+    ticker.user_id = someone
+
+    ticker.post_message("old")
+    ticker.get_messages(3)
+    for i in range(4):
+        ticker.post_message(f"mine {i}", private_for_user_id=someone)
+    ticker.post_message("new")
+
+    # Longer than the tail, so read from the database
+    from_database = ticker.get_messages(4)
+
+    assert ticker.get_messages(3) == from_database[:3]
+
+
+def test_tail_follows_a_reset(ticker):
+    ticker.post_message("hello")
+    assert ticker.get_messages(3) == [("public", "hello")]
+
+    AdminInterface().reset_game(ticker.game_id)
+
+    assert ticker.get_messages(3) == []
+
+
+def test_tail_is_thrown_away_with_its_game():
+    tail = TickerTail()
+    tail._generations["game"] = 0
+    tail._tails["game"] = "a tail"
+
+    tail.on_update_event("ticker", "game")
+    assert tail._tails["game"] == "a tail"
+    assert tail._generations["game"] == 1
+
+    tail.on_update_event("games", None)
+    assert "game" not in tail._tails
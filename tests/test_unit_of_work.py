@@ -0,0 +1,111 @@
+import pytest
+
+from backend import asyncio_triggers
+from backend.admin_interface import AdminInterface
+from backend.admin_interface import db_scoped
+from backend.database import current_unit_of_work
+from backend.database import unit_of_work
+from backend.database_scope_provider import run_in_db_thread
+from backend.user_interface import UserInterface
+
+
+def test_calls_share_one_session(user_in_team, one_game):
+    with unit_of_work() as uow:
+        UserInterface(user_in_team).get_user_model()
+        AdminInterface().get_users_for_game(one_game)
+        AdminInterface().get_scoreboard(one_game)
+
+    assert uow.sessions == 1
+    assert uow.queries >= 3
+
+
+def test_nothing_is_counted_outside(user_in_team):
+    UserInterface(user_in_team).get_user_model()
+
+    assert current_unit_of_work() is None
+
+
+def test_nested_blocks_join(user_in_team):
+    with unit_of_work() as outer:
+        with unit_of_work() as inner:
+            UserInterface(user_in_team).get_user_model()
+
+    assert inner is outer
+    assert outer.sessions == 1
+
+
+def test_each_call_still_commits_and_triggers(user_in_team, one_game):
+    event = asyncio_triggers.get_trigger_event("user", user_in_team)
+
+    with unit_of_work():
+        UserInterface(user_in_team).set_name("Shared")
+        assert event.is_set()
+
+        assert AdminInterface().get_user_model(user_in_team).name == "Shared"
+
+    assert UserInterface(user_in_team).get_user_model().name == "Shared"
+
+
+def test_a_failed_call_does_not_spoil_the_rest(user_in_team):
+    with unit_of_work():
+        with pytest.raises(Exception):
+            AdminInterface().get_user_model(None)
+
+        assert UserInterface(user_in_team).get_user_model().id == user_in_team
+
+
+def test_objects_outlive_their_unit_of_work(user_in_team):
+    with unit_of_work():
+        user_interface = UserInterface(user_in_team)
+        user_interface.get_user_model()
+
+    assert user_interface.get_user_model().id == user_in_team
+
+
+@pytest.mark.asyncio
+async def test_offloaded_work_is_one_unit(user_in_team, one_game):
+    def load():
+        UserInterface(user_in_team).get_user_model()
+        AdminInterface().get_scoreboard(one_game)
+        return current_unit_of_work().sessions
+
+    assert await run_in_db_thread(load) == 1
+
+
+class RenamesAPlayer(AdminInterface):
+    """Calls another interface object from inside one of its own calls"""
+
+    @db_scoped
+    def rename(self, user_id, name, then_fail=False):
+        event = asyncio_triggers.get_trigger_event("user", user_id)
+
+        UserInterface(user_id).set_name(name)
+
+        self.triggered_before_commit = event.is_set()
+        if then_fail:
+            raise RuntimeError("The rest of the call failed")
+
+
+def test_nested_call_on_another_object_leaves_the_commit_to_the_outer(user_in_team):
+    event = asyncio_triggers.get_trigger_event("user", user_in_team)
+    admin = RenamesAPlayer()
+
+    with unit_of_work():
+        admin.rename(user_in_team, "Nested")
+
+    # The player's trigger waited for the commit
+    assert not admin.triggered_before_commit
+    assert event.is_set()
+    assert UserInterface(user_in_team).get_user_model().name == "Nested"
+
+
+def test_outer_failure_rolls_back_a_nested_call(user_in_team):
+    name = UserInterface(user_in_team).get_user_model().name
+    event = asyncio_triggers.get_trigger_event("user", user_in_team)
+
+    with unit_of_work():
+        with pytest.raises(RuntimeError):
+            RenamesAPlayer().rename(user_in_team, "Nested", then_fail=True)
+
+    assert UserInterface(user_in_team).get_user_model().name == name
+    assert not event.is_set()